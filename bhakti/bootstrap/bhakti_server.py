@@ -1,20 +1,29 @@
 import argparse
+import asyncio
 import logging
 import datetime
+import multiprocessing
+import socket
 
 import yaml
-from dipamkara import Dipamkara
 
 from bhakti.server import NioServer
 from bhakti.server.pipeline import PipelineStage
 from bhakti.util.async_run import sync
+from dipamkara.embedding import Metric
+
+from bhakti.database.ann_index import AnnIndexType
 from bhakti.database.db_engine import DBEngine
+from bhakti.database.dipamkara_engine import DipamkaraEngine
+from bhakti.database.dipamkara_replica import DipamkaraReplica
+from bhakti.database.flat_engine import FlatEngine
+from bhakti.database.vector_dtype import VectorDtype
 from bhakti.exception.engine_not_support_error import EngineNotSupportError
 from bhakti.handler import (
     StrDecoder,
     StrDataTrim,
     InboundDataLog,
-    DipamkaraHandler,
+    EngineHandler,
     ExceptionNotifier
 )
 from bhakti.const import (
@@ -23,13 +32,78 @@ from bhakti.const import (
     DEFAULT_EOF,
     DEFAULT_EOF_STR,
     DEFAULT_TIMEOUT,
+    DEFAULT_IDLE_TIMEOUT,
     DEFAULT_BUFFER_SIZE,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_MAX_FRAME_SIZE,
+    DEFAULT_THREAD_POOL_SIZE,
+    DEFAULT_WORKERS,
+    DEFAULT_WAL_COMMIT_INTERVAL,
+    DEFAULT_WAL_COMMIT_SIZE,
+    DEFAULT_SNAPSHOT_INTERVAL,
+    DEFAULT_HNSW_M,
+    DEFAULT_HNSW_EF_CONSTRUCTION,
+    DEFAULT_HNSW_EF_SEARCH,
+    DEFAULT_IVF_NLIST,
+    DEFAULT_IVF_NPROBE,
+    DEFAULT_PQ_M,
+    DEFAULT_RERANK,
+    DEFAULT_FILTER_CACHE_SIZE,
+    DEFAULT_RESULT_CACHE_MB,
+    DEFAULT_RESULT_CACHE_TTL,
+    DEFAULT_DOC_CACHE_MB,
     UTF_8
 )
 
 __VERSION__ = "0.2.19"
 __AUTHOR__ = "Vortez Wohl"
 log = logging.getLogger("bhakti")
+# the writer process listens here for writes forwarded by workers
+WRITER_HOST = '127.0.0.1'
+
+
+def set_log_level(verbose: bool):
+    if verbose:
+        log.setLevel(logging.DEBUG)
+        logging.getLogger('dipamkara').setLevel(logging.DEBUG)
+    else:
+        log.setLevel(logging.INFO)
+        logging.getLogger('dipamkara').setLevel(logging.INFO)
+
+
+def build_pipeline() -> list[PipelineStage]:
+    pipeline: list[PipelineStage] = list()
+    pipeline.append(InboundDataLog())
+    pipeline.append(StrDecoder())
+    pipeline.append(StrDataTrim())
+    pipeline.append(EngineHandler())
+    pipeline.append(ExceptionNotifier())
+    return pipeline
+
+
+# entry of a spawned worker process, it serves the shared port with a replica of the archive
+def run_worker(server: NioServer, replica: dict, verbose: bool):
+    set_log_level(verbose)
+    server.context = DipamkaraReplica(**replica)
+    log.debug(f'Worker process {multiprocessing.current_process().name} serving')
+    serve_while_parent_alive(server)
+
+
+# a worker outliving the writer would keep the port while failing every write
+@sync
+async def serve_while_parent_alive(server: NioServer):
+    loop = asyncio.get_running_loop()
+    orphaned = loop.create_future()
+    sentinel = multiprocessing.parent_process().sentinel
+
+    def on_parent_exit():
+        loop.remove_reader(sentinel)
+        orphaned.set_result(None)
+
+    loop.add_reader(sentinel, on_parent_exit)
+    serving = asyncio.ensure_future(server.run())
+    await asyncio.wait({serving, orphaned}, return_when=asyncio.FIRST_COMPLETED)
+    serving.cancel()
 
 
 class BhaktiServer:
@@ -44,6 +118,31 @@ class BhaktiServer:
             eof: bytes = DEFAULT_EOF,
             timeout: float = DEFAULT_TIMEOUT,
             buffer_size: int = DEFAULT_BUFFER_SIZE,
+            keep_alive: bool = True,
+            idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+            max_frame_size: int = DEFAULT_MAX_FRAME_SIZE,
+            thread_pool_size: int = DEFAULT_THREAD_POOL_SIZE,
+            workers: int = DEFAULT_WORKERS,
+            wal: bool = True,
+            wal_commit_interval: float = DEFAULT_WAL_COMMIT_INTERVAL,
+            wal_commit_size: int = DEFAULT_WAL_COMMIT_SIZE,
+            snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+            vector_index: AnnIndexType = AnnIndexType.NONE,
+            vector_index_metric: Metric = Metric.EUCLIDEAN,
+            hnsw_m: int = DEFAULT_HNSW_M,
+            hnsw_ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+            hnsw_ef_search: int = DEFAULT_HNSW_EF_SEARCH,
+            ivf_nlist: int = DEFAULT_IVF_NLIST,
+            ivf_nprobe: int = DEFAULT_IVF_NPROBE,
+            pq_m: int = DEFAULT_PQ_M,
+            rerank: int = DEFAULT_RERANK,
+            dtype: VectorDtype | None = None,
+            convert_dtype: bool = False,
+            filter_cache_size: int = DEFAULT_FILTER_CACHE_SIZE,
+            result_cache_mb: float = DEFAULT_RESULT_CACHE_MB,
+            result_cache_ttl: float = DEFAULT_RESULT_CACHE_TTL,
+            doc_cache_mb: float = DEFAULT_DOC_CACHE_MB,
             verbose: bool = False
     ):
         self._dimension = dimension
@@ -55,12 +154,33 @@ class BhaktiServer:
         self._eof = eof
         self._timeout = timeout
         self._buffer_size = buffer_size
-        if verbose:
-            log.setLevel(logging.DEBUG)
-            logging.getLogger('dipamkara').setLevel(logging.DEBUG)
-        else:
-            log.setLevel(logging.INFO)
-            logging.getLogger('dipamkara').setLevel(logging.INFO)
+        self._keep_alive = keep_alive
+        self._idle_timeout = idle_timeout
+        self._max_in_flight = max_in_flight
+        self._max_frame_size = max_frame_size
+        self._thread_pool_size = thread_pool_size
+        self._workers = workers
+        self._wal = wal
+        self._wal_commit_interval = wal_commit_interval
+        self._wal_commit_size = wal_commit_size
+        self._snapshot_interval = snapshot_interval
+        self._vector_index = vector_index
+        self._vector_index_metric = vector_index_metric
+        self._hnsw_m = hnsw_m
+        self._hnsw_ef_construction = hnsw_ef_construction
+        self._hnsw_ef_search = hnsw_ef_search
+        self._ivf_nlist = ivf_nlist
+        self._ivf_nprobe = ivf_nprobe
+        self._pq_m = pq_m
+        self._rerank = rerank
+        self._dtype = dtype
+        self._convert_dtype = convert_dtype
+        self._filter_cache_size = filter_cache_size
+        self._result_cache_mb = result_cache_mb
+        self._result_cache_ttl = result_cache_ttl
+        self._doc_cache_mb = doc_cache_mb
+        self._verbose = verbose
+        set_log_level(verbose)
 
     @sync
     async def run(self):
@@ -69,35 +189,170 @@ class BhaktiServer:
         log.debug(f'IO timeout: {self._timeout} seconds')
         log.debug(f'Buffer size: {self._buffer_size} bytes')
         log.debug(f'EOF: {self._eof}')
+        log.debug(f'Keep alive: {self._keep_alive}')
+        if self._keep_alive:
+            log.debug(f'Idle timeout: {self._idle_timeout} seconds')
+        log.debug(f'Max in-flight requests per connection: {self._max_in_flight}')
+        log.debug(f'Max frame size: {self._max_frame_size} bytes')
+        log.debug(f'Engine threads: {self._thread_pool_size}')
+        log.debug(f'Write-ahead log: {self._wal}')
+        if self._wal:
+            log.debug(f'Group commit window: {self._wal_commit_interval} seconds or {self._wal_commit_size} bytes')
+        if self._snapshot_interval > 0:
+            log.debug(f'Snapshot interval: {self._snapshot_interval} seconds')
         log.info(f'Database engine: {self._db_engine}')
+        if self._vector_index != AnnIndexType.NONE:
+            log.info(f'Vector index: {self._vector_index} on {self._vector_index_metric}')
+            if self._vector_index == AnnIndexType.HNSW:
+                log.debug(f'HNSW: M={self._hnsw_m}, efConstruction={self._hnsw_ef_construction}, '
+                          f'efSearch={self._hnsw_ef_search}')
+            if self._vector_index == AnnIndexType.IVF:
+                log.debug(f'IVF: nlist={self._ivf_nlist}, nprobe={self._ivf_nprobe}')
+            if self._vector_index == AnnIndexType.PQ:
+                log.debug(f'PQ: m={self._pq_m}')
+            if self._vector_index in (AnnIndexType.SQ8, AnnIndexType.PQ):
+                log.debug(f'Exact rerank: {self._rerank} candidates per result')
+            if self._db_engine != DBEngine.FLAT:
+                log.warning(f'DBEngine {self._db_engine} has no vector index, queries scan every vector')
+        log.debug(f'Filter cache: {self._filter_cache_size} compiled filters')
+        if self._result_cache_mb > 0:
+            log.info(f'Result cache: {self._result_cache_mb} MB')
+            if self._result_cache_ttl > 0:
+                log.debug(f'Result cache TTL: {self._result_cache_ttl} seconds')
+        if self._doc_cache_mb > 0:
+            if self._db_engine == DBEngine.DIPAMKARA:
+                log.info(f'Document cache: {self._doc_cache_mb} MB')
+            else:
+                log.warning(f'DBEngine {self._db_engine} keeps every document in memory, DOC_CACHE_MB is ignored')
         log.info(f'Database path: {self._db_path}')
         log.info(f'Dimension: {self._dimension}')
+        workers = self._workers
+        if workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+            log.warning('SO_REUSEPORT is not supported on this platform, serving with a single process')
+            workers = 1
+        if workers > 1 and self._db_engine != DBEngine.DIPAMKARA:
+            log.warning(f'DBEngine {self._db_engine} has no replicas, serving with a single process')
+            workers = 1
+        log.info(f'Worker processes: {workers}')
+        # spawned rather than forked, workers must not inherit the running event loop
+        mp_context = multiprocessing.get_context('spawn')
+        version = mp_context.Value('Q', 0) if workers > 1 else None
         if self._db_engine == DBEngine.DIPAMKARA:
-            _db_engine = Dipamkara(
+            _db_engine = DipamkaraEngine(
+                dimension=self._dimension,
+                archive_path=self._db_path,
+                cached=self._cached,
+                thread_pool_size=self._thread_pool_size,
+                version=version,
+                wal=self._wal,
+                wal_commit_interval=self._wal_commit_interval,
+                wal_commit_size=self._wal_commit_size,
+                filter_cache_size=self._filter_cache_size,
+                result_cache_mb=self._result_cache_mb,
+                result_cache_ttl=self._result_cache_ttl,
+                doc_cache_mb=self._doc_cache_mb,
+                dtype=self._dtype,
+                convert_dtype=self._convert_dtype
+            )
+        elif self._db_engine == DBEngine.FLAT:
+            _db_engine = FlatEngine(
                 dimension=self._dimension,
                 archive_path=self._db_path,
-                cached=self._cached
+                thread_pool_size=self._thread_pool_size,
+                wal=self._wal,
+                wal_commit_interval=self._wal_commit_interval,
+                wal_commit_size=self._wal_commit_size,
+                vector_index=self._vector_index,
+                vector_index_metric=self._vector_index_metric,
+                hnsw_m=self._hnsw_m,
+                hnsw_ef_construction=self._hnsw_ef_construction,
+                hnsw_ef_search=self._hnsw_ef_search,
+                ivf_nlist=self._ivf_nlist,
+                ivf_nprobe=self._ivf_nprobe,
+                pq_m=self._pq_m,
+                rerank=self._rerank,
+                dtype=self._dtype,
+                convert_dtype=self._convert_dtype,
+                filter_cache_size=self._filter_cache_size,
+                result_cache_mb=self._result_cache_mb,
+                result_cache_ttl=self._result_cache_ttl
             )
         else:
             raise EngineNotSupportError(f"DBEngine {self._db_engine} not supported")
-        pipeline: list[PipelineStage] = list()
-        pipeline.append(InboundDataLog())
-        pipeline.append(StrDecoder())
-        pipeline.append(StrDataTrim())
-        pipeline.append(DipamkaraHandler())
-        pipeline.append(ExceptionNotifier())
+        log.info(f'Vector dtype: {_db_engine.dtype}')
+        await _db_engine.recover()
+        # held so the scheduled snapshots are not garbage collected
+        snapshots = asyncio.create_task(_db_engine.save_periodically(self._snapshot_interval)) \
+            if self._snapshot_interval > 0 else None
         server = NioServer(
             host=self._host,
             port=self._port,
             eof=self._eof,
             timeout=self._timeout,
             buffer_size=self._buffer_size,
-            pipeline=pipeline,
+            keep_alive=self._keep_alive,
+            idle_timeout=self._idle_timeout,
+            max_in_flight=self._max_in_flight,
+            max_frame_size=self._max_frame_size,
+            reuse_port=workers > 1,
+            pipeline=build_pipeline(),
+            context=None if workers > 1 else _db_engine
+        )
+        if workers == 1:
+            end = datetime.datetime.now().timestamp()
+            log.info(f'Bhakti built in {((end - start) * 1000):.2f} ms:\n{server}')
+            await server.run()
+            return
+        # this process owns the archive and applies every write, workers serve the port
+        writer = NioServer(
+            host=WRITER_HOST,
+            port=0,
+            eof=self._eof,
+            timeout=self._timeout,
+            buffer_size=self._buffer_size,
+            keep_alive=True,
+            idle_timeout=self._idle_timeout,
+            max_in_flight=self._max_in_flight,
+            max_frame_size=self._max_frame_size,
+            pipeline=build_pipeline(),
             context=_db_engine
         )
+        writer_server = await writer.start()
+        log.debug(f'Writer listening on {WRITER_HOST}:{writer.port}')
+        replica = {
+            'dimension': self._dimension,
+            'archive_path': self._db_path,
+            'version': version,
+            'writer_host': WRITER_HOST,
+            'writer_port': writer.port,
+            'cached': self._cached,
+            'thread_pool_size': self._thread_pool_size,
+            'timeout': self._timeout,
+            'filter_cache_size': self._filter_cache_size,
+            'result_cache_mb': self._result_cache_mb,
+            'result_cache_ttl': self._result_cache_ttl,
+            'doc_cache_mb': self._doc_cache_mb,
+            'dtype': _db_engine.dtype
+        }
+        processes = [
+            mp_context.Process(
+                target=run_worker,
+                args=(server, replica, self._verbose),
+                name=f'bhakti-worker-{_i}',
+                daemon=True
+            )
+            for _i in range(workers)
+        ]
+        for process in processes:
+            process.start()
         end = datetime.datetime.now().timestamp()
         log.info(f'Bhakti built in {((end - start) * 1000):.2f} ms:\n{server}')
-        await server.run()
+        try:
+            async with writer_server:
+                await writer_server.serve_forever()
+        finally:
+            for process in processes:
+                process.terminate()
 
 
 def start_bhakti_server_shell(**kwargs):
@@ -105,6 +360,10 @@ def start_bhakti_server_shell(**kwargs):
     for engine in DBEngine:
         if engine.value == kwargs['db_engine']:
             kwargs['db_engine'] = engine
+    kwargs['vector_index'] = AnnIndexType(kwargs['vector_index'])
+    kwargs['vector_index_metric'] = Metric(kwargs['vector_index_metric'])
+    if kwargs['dtype'] is not None:
+        kwargs['dtype'] = VectorDtype(kwargs['dtype'])
     BhaktiServer(
         dimension=kwargs['dimension'],
         db_path=kwargs['db_path'],
@@ -115,6 +374,31 @@ def start_bhakti_server_shell(**kwargs):
         eof=kwargs['eof'],
         timeout=kwargs['timeout'],
         buffer_size=kwargs['buffer_size'],
+        keep_alive=kwargs['keep_alive'],
+        idle_timeout=kwargs['idle_timeout'],
+        max_in_flight=kwargs['max_in_flight'],
+        max_frame_size=kwargs['max_frame_size'],
+        thread_pool_size=kwargs['thread_pool_size'],
+        workers=kwargs['workers'],
+        wal=kwargs['wal'],
+        wal_commit_interval=kwargs['wal_commit_interval'],
+        wal_commit_size=kwargs['wal_commit_size'],
+        snapshot_interval=kwargs['snapshot_interval'],
+        vector_index=kwargs['vector_index'],
+        vector_index_metric=kwargs['vector_index_metric'],
+        hnsw_m=kwargs['hnsw_m'],
+        hnsw_ef_construction=kwargs['hnsw_ef_construction'],
+        hnsw_ef_search=kwargs['hnsw_ef_search'],
+        ivf_nlist=kwargs['ivf_nlist'],
+        ivf_nprobe=kwargs['ivf_nprobe'],
+        pq_m=kwargs['pq_m'],
+        rerank=kwargs['rerank'],
+        dtype=kwargs['dtype'],
+        convert_dtype=kwargs['convert_dtype'],
+        filter_cache_size=kwargs['filter_cache_size'],
+        result_cache_mb=kwargs['result_cache_mb'],
+        result_cache_ttl=kwargs['result_cache_ttl'],
+        doc_cache_mb=kwargs['doc_cache_mb'],
         verbose=kwargs['verbose']
     ).run()
 
@@ -140,5 +424,30 @@ def bhakti_entry_point():
         eof=config.get('eof'.upper(), DEFAULT_EOF_STR),
         timeout=config.get('timeout'.upper(), DEFAULT_TIMEOUT),
         buffer_size=config.get('buffer_size'.upper(), DEFAULT_BUFFER_SIZE),
+        keep_alive=config.get('keep_alive'.upper(), True),
+        idle_timeout=config.get('idle_timeout'.upper(), DEFAULT_IDLE_TIMEOUT),
+        max_in_flight=config.get('max_in_flight'.upper(), DEFAULT_MAX_IN_FLIGHT),
+        max_frame_size=config.get('max_frame_size'.upper(), DEFAULT_MAX_FRAME_SIZE),
+        thread_pool_size=config.get('thread_pool_size'.upper(), DEFAULT_THREAD_POOL_SIZE),
+        workers=config.get('workers'.upper(), DEFAULT_WORKERS),
+        wal=config.get('wal'.upper(), True),
+        wal_commit_interval=config.get('wal_commit_interval'.upper(), DEFAULT_WAL_COMMIT_INTERVAL),
+        wal_commit_size=config.get('wal_commit_size'.upper(), DEFAULT_WAL_COMMIT_SIZE),
+        snapshot_interval=config.get('snapshot_interval'.upper(), DEFAULT_SNAPSHOT_INTERVAL),
+        vector_index=config.get('vector_index'.upper(), AnnIndexType.NONE.value),
+        vector_index_metric=config.get('vector_index_metric'.upper(), Metric.EUCLIDEAN.value),
+        hnsw_m=config.get('hnsw_m'.upper(), DEFAULT_HNSW_M),
+        hnsw_ef_construction=config.get('hnsw_ef_construction'.upper(), DEFAULT_HNSW_EF_CONSTRUCTION),
+        hnsw_ef_search=config.get('hnsw_ef_search'.upper(), DEFAULT_HNSW_EF_SEARCH),
+        ivf_nlist=config.get('ivf_nlist'.upper(), DEFAULT_IVF_NLIST),
+        ivf_nprobe=config.get('ivf_nprobe'.upper(), DEFAULT_IVF_NPROBE),
+        pq_m=config.get('pq_m'.upper(), DEFAULT_PQ_M),
+        rerank=config.get('rerank'.upper(), DEFAULT_RERANK),
+        dtype=config.get('dtype'.upper(), None),
+        convert_dtype=config.get('convert_dtype'.upper(), False),
+        filter_cache_size=config.get('filter_cache_size'.upper(), DEFAULT_FILTER_CACHE_SIZE),
+        result_cache_mb=config.get('result_cache_mb'.upper(), DEFAULT_RESULT_CACHE_MB),
+        result_cache_ttl=config.get('result_cache_ttl'.upper(), DEFAULT_RESULT_CACHE_TTL),
+        doc_cache_mb=config.get('doc_cache_mb'.upper(), DEFAULT_DOC_CACHE_MB),
         verbose=config.get('verbose'.upper(), False),
     )
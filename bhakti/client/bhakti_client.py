@@ -2,7 +2,18 @@ import logging
 
 from bhakti.client.bhakti_reactive_client import BhaktiReactiveClient
 from bhakti.database.db_engine import DBEngine
-from bhakti.const import DEFAULT_TIMEOUT, DEFAULT_BUFFER_SIZE, DEFAULT_PORT, DEFAULT_EOF
+from bhakti.database.vector_dtype import VectorDtype
+from bhakti.const import (
+    DEFAULT_TIMEOUT,
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_PORT,
+    DEFAULT_EOF,
+    DEFAULT_PROTOCOL,
+    DEFAULT_POOL_MAX_SIZE,
+    DEFAULT_POOL_MAX_IDLE,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    DEFAULT_MAX_FRAME_SIZE
+)
 
 log = logging.getLogger("bhakti.client")
 
@@ -16,6 +27,17 @@ class BhaktiClient(BhaktiReactiveClient):
             timeout: float = DEFAULT_TIMEOUT,
             buffer_size: int = DEFAULT_BUFFER_SIZE,
             db_engine: DBEngine = DBEngine.DEFAULT_ENGINE,
+            keep_alive: bool = True,
+            protocol: int = DEFAULT_PROTOCOL,
+            binary: bool = True,
+            dtype: VectorDtype | None = None,
+            pool_min_size: int = 0,
+            pool_max_size: int = DEFAULT_POOL_MAX_SIZE,
+            pool_acquire_timeout: float = DEFAULT_TIMEOUT,
+            pool_max_idle: float = DEFAULT_POOL_MAX_IDLE,
+            compression: bool = False,
+            compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+            max_frame_size: int = DEFAULT_MAX_FRAME_SIZE,
             verbose: bool = False
     ):
         super().__init__(
@@ -24,7 +46,18 @@ class BhaktiClient(BhaktiReactiveClient):
             eof=eof,
             timeout=timeout,
             buffer_size=buffer_size,
-            db_engine=db_engine
+            db_engine=db_engine,
+            keep_alive=keep_alive,
+            protocol=protocol,
+            binary=binary,
+            dtype=dtype,
+            pool_min_size=pool_min_size,
+            pool_max_size=pool_max_size,
+            pool_acquire_timeout=pool_acquire_timeout,
+            pool_max_idle=pool_max_idle,
+            compression=compression,
+            compression_threshold=compression_threshold,
+            max_frame_size=max_frame_size
         )
         if verbose:
             log.setLevel(logging.DEBUG)
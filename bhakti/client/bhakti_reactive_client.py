@@ -1,5 +1,7 @@
+import contextlib
 import json
 import logging
+from typing import AsyncIterator
 
 import numpy
 from dipamkara.embedding import Metric
@@ -10,17 +12,32 @@ from bhakti.exception.bhakti_connection_refused_error import BhaktiConnectionRef
 from bhakti.client.simple_reactive_client import (
     SimpleReactiveClient,
     READ_TIMEOUT,
-    CONNECTION_REFUSED
+    CONNECTION_REFUSED,
+    POOL_TIMEOUT
 )
 from bhakti.const import (
     DEFAULT_EOF,
     EMPTY_LIST,
+    EMPTY_DICT,
     UTF_8,
     DEFAULT_TIMEOUT,
     DEFAULT_BUFFER_SIZE,
-    DEFAULT_PORT
+    DEFAULT_PORT,
+    DEFAULT_PROTOCOL,
+    DEFAULT_POOL_MAX_SIZE,
+    DEFAULT_POOL_MAX_IDLE,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    DEFAULT_MAX_FRAME_SIZE,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHUNK_SIZE,
+    PROTOCOL_EOF
 )
 from bhakti.database.db_engine import DBEngine
+from bhakti.database.projection import PROJECTION_VECTOR, PROJECTION_DISTANCE
+from bhakti.database.range_index import IndexKind
+from bhakti.database.vector_dtype import VectorDtype
+from bhakti.util.envelope import pack_envelope, unpack_envelope
+from bhakti.util.frame import FRAME_FLAG_ENVELOPE
 
 log = logging.getLogger('bhakti.client')
 
@@ -29,6 +46,14 @@ def parseTupleOfNdarrayFloat64(_list: list):
     return numpy.asarray(_list[0]), numpy.float64(_list[1])
 
 
+def parseProjectedResult(_dict: dict):
+    if PROJECTION_VECTOR in _dict.keys():
+        _dict[PROJECTION_VECTOR] = numpy.asarray(_dict[PROJECTION_VECTOR])
+    if PROJECTION_DISTANCE in _dict.keys():
+        _dict[PROJECTION_DISTANCE] = numpy.float64(_dict[PROJECTION_DISTANCE])
+    return _dict
+
+
 class BhaktiReactiveClient(SimpleReactiveClient):
     def __init__(
             self,
@@ -37,24 +62,126 @@ class BhaktiReactiveClient(SimpleReactiveClient):
             eof: bytes = DEFAULT_EOF,
             timeout: float = DEFAULT_TIMEOUT,
             buffer_size: int = DEFAULT_BUFFER_SIZE,
-            db_engine: DBEngine = DBEngine.DEFAULT_ENGINE
+            db_engine: DBEngine = DBEngine.DEFAULT_ENGINE,
+            keep_alive: bool = True,
+            protocol: int = DEFAULT_PROTOCOL,
+            binary: bool = True,
+            dtype: VectorDtype | None = None,
+            pool_min_size: int = 0,
+            pool_max_size: int = DEFAULT_POOL_MAX_SIZE,
+            pool_acquire_timeout: float = DEFAULT_TIMEOUT,
+            pool_max_idle: float = DEFAULT_POOL_MAX_IDLE,
+            compression: bool = False,
+            compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+            max_frame_size: int = DEFAULT_MAX_FRAME_SIZE
     ):
-        super().__init__(server=server, port=port, eof=eof, timeout=timeout, buffer_size=buffer_size)
+        super().__init__(
+            server=server,
+            port=port,
+            eof=eof,
+            timeout=timeout,
+            buffer_size=buffer_size,
+            keep_alive=keep_alive,
+            protocol=protocol,
+            pool_min_size=pool_min_size,
+            pool_max_size=pool_max_size,
+            pool_acquire_timeout=pool_acquire_timeout,
+            pool_max_idle=pool_max_idle,
+            compression=compression,
+            compression_threshold=compression_threshold,
+            max_frame_size=max_frame_size
+        )
         self.__db_engine: DBEngine = db_engine
         self.__eof = eof
+        # vectors travel as raw buffers inside envelopes, which need the frame protocol
+        self.__binary = binary
+        # binary vectors are cast to it before sending, the server's DTYPE halves the bytes of float64 ones
+        self.__dtype = numpy.dtype(dtype.value) if dtype is not None else None
+
+    @property
+    def binary(self) -> bool:
+        return self.__binary and self.protocol != PROTOCOL_EOF
 
     def _response_post_process(self, response: bytes) -> str:
-        return response.decode(UTF_8)[:-1 * len(self.__eof)]
+        if self.protocol == PROTOCOL_EOF:
+            return response.decode(UTF_8)[:-1 * len(self.__eof)]
+        return response.decode(UTF_8)
+
+    # projected queries answer with dicts holding only the fields asked for,
+    # see bhakti.database.projection
+    @staticmethod
+    def _projection_param(projection: list[str] | None) -> dict:
+        if projection is None:
+            return EMPTY_DICT()
+        return {"projection": projection}
+
+    # candidates an hnsw index keeps while searching, cells an ivf index scans,
+    # more is slower and more accurate, the server's defaults apply when not given, see bhakti.database.ann_index
+    @staticmethod
+    def _search_param(ef_search: int | None, nprobe: int | None) -> dict:
+        param = EMPTY_DICT()
+        if ef_search is not None:
+            param["ef_search"] = ef_search
+        if nprobe is not None:
+            param["nprobe"] = nprobe
+        return param
+
+    # values of $1, $2, ... in the query, strings or numbers, see bhakti.database.filter
+    @staticmethod
+    def _query_params_param(query_params: list | None) -> dict:
+        if query_params is None:
+            return EMPTY_DICT()
+        return {"query_params": list(query_params)}
+
+    def _encode_vector(self, vector: numpy.ndarray) -> numpy.ndarray | list:
+        if self.binary:
+            return vector if self.__dtype is None else numpy.asarray(vector, dtype=self.__dtype)
+        return vector.tolist()
+
+    # vectors encoded before the protocol was settled are sent as lists if it fell back to <eof>
+    @staticmethod
+    def _json_default(value: any) -> any:
+        if isinstance(value, numpy.ndarray):
+            return value.tolist()
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
 
     async def _make_request(self, request: dict) -> any:
-        _resp_bytes_or_resp_code = await super().send_receive(
-            message=json.dumps(request, ensure_ascii=False).encode(UTF_8)
-        )
+        await self.negotiate()
+        if self.binary:
+            _resp_bytes_or_resp_code = await super().send_receive(
+                message=pack_envelope(request),
+                flags=FRAME_FLAG_ENVELOPE
+            )
+        else:
+            _resp_bytes_or_resp_code = await super().send_receive(
+                message=json.dumps(request, ensure_ascii=False, default=self._json_default).encode(UTF_8)
+            )
+        return self._parse_response(_resp_bytes_or_resp_code)
+
+    # data of every chunk of a streamed response
+    async def _make_stream_request(self, request: dict) -> AsyncIterator[any]:
+        await self.negotiate()
+        if self.binary:
+            chunks = super().send_receive_stream(message=pack_envelope(request), flags=FRAME_FLAG_ENVELOPE)
+        else:
+            chunks = super().send_receive_stream(
+                message=json.dumps(request, ensure_ascii=False, default=self._json_default).encode(UTF_8)
+            )
+        async with contextlib.aclosing(chunks):
+            async for _resp_bytes_or_resp_code in chunks:
+                yield self._parse_response(_resp_bytes_or_resp_code)
+
+    def _parse_response(self, _resp_bytes_or_resp_code: bytes | int) -> any:
         if _resp_bytes_or_resp_code == READ_TIMEOUT:
             raise BhaktiReadTimeoutError(message='Read timeout')
         elif _resp_bytes_or_resp_code == CONNECTION_REFUSED:
             raise BhaktiConnectionRefusedError(message='Connection refused')
-        _resp = json.loads(self._response_post_process(response=_resp_bytes_or_resp_code))
+        elif _resp_bytes_or_resp_code == POOL_TIMEOUT:
+            raise BhaktiReadTimeoutError(message='No pooled connection available')
+        if self.binary:
+            _resp = unpack_envelope(_resp_bytes_or_resp_code)
+        else:
+            _resp = json.loads(self._response_post_process(response=_resp_bytes_or_resp_code))
         if _resp['state'] == 'Exception':
             raise BhaktiRemoteError(message=_resp['message'])
         return _resp['data']
@@ -78,29 +205,76 @@ class BhaktiReactiveClient(SimpleReactiveClient):
             "opt": "create",
             "cmd": "create",
             "param": {
-                "vector": vector.tolist(),
+                "vector": self._encode_vector(vector),
                 "document": document,
                 "indices": indices,
                 "cached": cached
             }
         })
 
-    async def create_index(self, index: str, detailed: bool = False) -> dict | None:
+    # large inputs are split into requests of batch_size vectors,
+    # the status of every item is returned in input order
+    async def create_many(
+            self,
+            vectors: numpy.ndarray,
+            documents: list[dict[str, any]],
+            indices: list[str] = EMPTY_LIST(),
+            cached: bool = False,
+            batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> list[bool] | None:
+        if len(vectors) != len(documents):
+            raise ValueError(f'{len(vectors)} vectors given for {len(documents)} documents')
+        vectors = numpy.asarray(vectors)
+        status = EMPTY_LIST()
+        for _offset in range(0, len(vectors), batch_size):
+            status.extend(await self._make_request({
+                "db_engine": self.__db_engine.value,
+                "opt": "create",
+                "cmd": "create_many",
+                "param": {
+                    "vectors": self._encode_vector(vectors[_offset:_offset + batch_size]),
+                    "documents": documents[_offset:_offset + batch_size],
+                    "indices": indices,
+                    "cached": cached
+                }
+            }))
+        return status
+
+    # a range index answers >, >=, <, <= and == on numbers by binary search, an inverted index may be made one
+    async def create_index(
+            self,
+            index: str,
+            detailed: bool = False,
+            kind: IndexKind | str = IndexKind.DEFAULT_KIND
+    ) -> dict | None:
         return await self._make_request({
             "db_engine": self.__db_engine.value,
             "opt": "create",
             "cmd": "create_index",
             "param": {
                 "index": index,
-                "detailed": detailed
+                "detailed": detailed,
+                "kind": IndexKind(kind).value
             }
         })
 
-    async def save(self) -> bool | None:
+    # trains the server's approximate index on the vectors stored now, False if it has none to train
+    async def train_index(self) -> bool | None:
+        return await self._make_request({
+            "db_engine": self.__db_engine.value,
+            "opt": "update",
+            "cmd": "train_index",
+            "param": {}
+        })
+
+    async def save(self, wait: bool = True) -> bool | None:
         return await self._make_request({
             "db_engine": self.__db_engine.value,
             "opt": "save",
-            "cmd": "save"
+            "cmd": "save",
+            "param": {
+                "wait": wait
+            }
         })
 
     async def invalidate_cached_document_by_vector(self, vector: numpy.ndarray) -> bool | None:
@@ -109,7 +283,7 @@ class BhaktiReactiveClient(SimpleReactiveClient):
             "opt": "delete",
             "cmd": "invalidate_cached_doc_by_vector",
             "param": {
-                "vector": vector.tolist()
+                "vector": self._encode_vector(vector)
             }
         })
 
@@ -119,17 +293,18 @@ class BhaktiReactiveClient(SimpleReactiveClient):
             "opt": "delete",
             "cmd": "remove_by_vector",
             "param": {
-                "vector": vector.tolist()
+                "vector": self._encode_vector(vector)
             }
         })
 
-    async def indexed_remove(self, query: str) -> bool | None:
+    async def indexed_remove(self, query: str, query_params: list | None = None) -> bool | None:
         return await self._make_request({
             "db_engine": self.__db_engine.value,
             "opt": "delete",
             "cmd": "indexed_remove",
             "param": {
-                "query": query
+                "query": query,
+                **self._query_params_param(query_params)
             }
         })
 
@@ -149,7 +324,7 @@ class BhaktiReactiveClient(SimpleReactiveClient):
             "opt": "update",
             "cmd": "mod_doc_by_vector",
             "param": {
-                "vector": vector.tolist(),
+                "vector": self._encode_vector(vector),
                 "key": key,
                 "value": value
             }
@@ -159,82 +334,196 @@ class BhaktiReactiveClient(SimpleReactiveClient):
             self,
             vector: numpy.ndarray,
             metric: Metric,
-            top_k: int
-    ) -> list[tuple[numpy.ndarray, numpy.float64]] | None:
+            top_k: int,
+            projection: list[str] | None = None,
+            ef_search: int | None = None,
+            nprobe: int | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]] | list[dict] | None:
         response = await self._make_request({
             "db_engine": self.__db_engine.value,
             "opt": "read",
             "cmd": "vector_query",
             "param": {
-                "vector": vector.tolist(),
+                "vector": self._encode_vector(vector),
                 "metric_value": metric.value,
-                "top_k": top_k
+                "top_k": top_k,
+                **self._projection_param(projection),
+                **self._search_param(ef_search, nprobe)
             }
         })
         if response is None:
             return response
+        if projection is not None:
+            return list(map(parseProjectedResult, response))
         return list(map(parseTupleOfNdarrayFloat64, response))
 
+    async def vector_query_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: list[str] | None = None,
+            ef_search: int | None = None,
+            nprobe: int | None = None
+    ) -> list[list[tuple[numpy.ndarray, numpy.float64]]] | list[list[dict]] | None:
+        response = await self._make_request({
+            "db_engine": self.__db_engine.value,
+            "opt": "read",
+            "cmd": "vector_query_batch",
+            "param": {
+                "vectors": self._encode_vector(numpy.asarray(vectors)),
+                "metric_value": metric.value,
+                "top_k": top_k,
+                **self._projection_param(projection),
+                **self._search_param(ef_search, nprobe)
+            }
+        })
+        if response is None:
+            return response
+        if projection is not None:
+            return [list(map(parseProjectedResult, _response)) for _response in response]
+        return [list(map(parseTupleOfNdarrayFloat64, _response)) for _response in response]
+
     async def vector_query_indexed(
             self,
             query: str,
             vector: numpy.ndarray,
             metric: Metric,
-            top_k: int
-    ) -> list[tuple[numpy.ndarray, numpy.float64]] | None:
+            top_k: int,
+            projection: list[str] | None = None,
+            ef_search: int | None = None,
+            nprobe: int | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]] | list[dict] | None:
         response = await self._make_request({
             "db_engine": self.__db_engine.value,
             "opt": "read",
             "cmd": "indexed_vector_query",
             "param": {
                 "query": query,
-                "vector": vector.tolist(),
+                "vector": self._encode_vector(vector),
                 "metric_value": metric.value,
-                "top_k": top_k
+                "top_k": top_k,
+                **self._projection_param(projection),
+                **self._search_param(ef_search, nprobe),
+                **self._query_params_param(query_params)
             }
         })
         if response is None:
             return response
+        if projection is not None:
+            return list(map(parseProjectedResult, response))
         return list(map(parseTupleOfNdarrayFloat64, response))
 
     async def find_documents_by_vector(
             self,
             vector: numpy.ndarray,
             metric: Metric,
-            top_k: int
-    ) -> list[tuple[dict[str, any], numpy.float64]] | None:
+            top_k: int,
+            projection: list[str] | None = None,
+            ef_search: int | None = None,
+            nprobe: int | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]] | list[dict] | None:
         response = await self._make_request({
             "db_engine": self.__db_engine.value,
             "opt": "read",
             "cmd": "find_documents_by_vector",
             "param": {
-                "vector": vector.tolist(),
+                "vector": self._encode_vector(vector),
                 "metric_value": metric.value,
-                "top_k": top_k
+                "top_k": top_k,
+                **self._projection_param(projection),
+                **self._search_param(ef_search, nprobe)
             }
         })
         if response is None:
             return response
+        if projection is not None:
+            return list(map(parseProjectedResult, response))
         return list(map(lambda ls: tuple[dict, numpy.float64](ls), response))
 
+    # results arrive in chunks of chunk_size as the server produces them,
+    # neither side holds the whole result set
+    async def iter_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            ef_search: int | None = None,
+            nprobe: int | None = None
+    ) -> AsyncIterator[tuple[dict[str, any], numpy.float64]]:
+        chunks = self._make_stream_request({
+            "db_engine": self.__db_engine.value,
+            "opt": "read",
+            "cmd": "find_documents_by_vector",
+            "param": {
+                "vector": self._encode_vector(vector),
+                "metric_value": metric.value,
+                "top_k": top_k,
+                "chunk_size": chunk_size,
+                **self._search_param(ef_search, nprobe)
+            }
+        })
+        async with contextlib.aclosing(chunks):
+            async for chunk in chunks:
+                for document, distance in chunk or EMPTY_LIST():
+                    yield document, numpy.float64(distance)
+
+    async def find_documents_by_vector_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: list[str] | None = None,
+            ef_search: int | None = None,
+            nprobe: int | None = None
+    ) -> list[list[tuple[dict[str, any], numpy.float64]]] | list[list[dict]] | None:
+        response = await self._make_request({
+            "db_engine": self.__db_engine.value,
+            "opt": "read",
+            "cmd": "find_documents_by_vector_batch",
+            "param": {
+                "vectors": self._encode_vector(numpy.asarray(vectors)),
+                "metric_value": metric.value,
+                "top_k": top_k,
+                **self._projection_param(projection),
+                **self._search_param(ef_search, nprobe)
+            }
+        })
+        if response is None:
+            return response
+        if projection is not None:
+            return [list(map(parseProjectedResult, _response)) for _response in response]
+        return [list(map(lambda ls: tuple[dict, numpy.float64](ls), _response)) for _response in response]
+
     async def find_documents_by_vector_indexed(
             self,
             query: str,
             vector: numpy.ndarray,
             metric: Metric,
-            top_k: int
-    ) -> list[tuple[dict[str, any], numpy.float64]] | None:
+            top_k: int,
+            projection: list[str] | None = None,
+            ef_search: int | None = None,
+            nprobe: int | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]] | list[dict] | None:
         response = await self._make_request({
             "db_engine": self.__db_engine.value,
             "opt": "read",
             "cmd": "find_documents_by_vector_indexed",
             "param": {
                 "query": query,
-                "vector": vector.tolist(),
+                "vector": self._encode_vector(vector),
                 "metric_value": metric.value,
-                "top_k": top_k
+                "top_k": top_k,
+                **self._projection_param(projection),
+                **self._search_param(ef_search, nprobe),
+                **self._query_params_param(query_params)
             }
         })
         if response is None:
             return response
+        if projection is not None:
+            return list(map(parseProjectedResult, response))
         return list(map(lambda ls: tuple[dict, numpy.float64](ls), response))
@@ -0,0 +1,314 @@
+import asyncio
+import itertools
+import json
+import logging
+from typing import AsyncIterator
+
+from bhakti.const import (
+    DEFAULT_EOF,
+    DEFAULT_TIMEOUT,
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_PROTOCOL,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    DEFAULT_MAX_FRAME_SIZE,
+    DEFAULT_HELLO_TIMEOUT,
+    EMPTY_LIST,
+    UTF_8,
+    PROTOCOL_EOF,
+    PROTOCOL_FRAME_V2
+)
+from bhakti.util.readsuntil import readsuntil
+from bhakti.util.frame import (
+    FRAME_MAGIC,
+    FRAME_FLAG_MORE,
+    FRAME_FLAG_HELLO,
+    FRAME_FLAG_COMPRESSED,
+    pack_frame,
+    pack_frame_header,
+    readframe
+)
+from bhakti.util.compression import (
+    available_codecs,
+    decompress_payload,
+    HELLO_COMPRESSION,
+    HELLO_COMPRESSION_THRESHOLD
+)
+from bhakti.exception.bhakti_protocol_error import BhaktiProtocolError
+
+log = logging.getLogger("bhakti.client")
+
+REQUEST_ID_MASK = 0xffffffff
+
+
+class Connection:
+    def __init__(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+            eof: bytes = DEFAULT_EOF,
+            timeout: float = DEFAULT_TIMEOUT,
+            buffer_size: int = DEFAULT_BUFFER_SIZE,
+            protocol: int = DEFAULT_PROTOCOL,
+            codec: str | None = None,
+            max_frame_size: int = DEFAULT_MAX_FRAME_SIZE
+    ):
+        self.__reader = reader
+        self.__writer = writer
+        self.__eof = eof
+        self.__timeout = timeout
+        self.__buffer_size = buffer_size
+        self.__protocol = protocol
+        # response compression negotiated with the server
+        self.__codec = codec
+        self.__max_frame_size = max_frame_size
+        # without request ids the channel carries one exchange at a time
+        self.__exchange_lock = asyncio.Lock()
+        # python 3.10 allows a single drain waiter per stream
+        self.__drain_lock = asyncio.Lock()
+        # request id => frames received for it, (payload, flags) or the error ending the channel
+        self.__pending: dict[int, asyncio.Queue] = dict()
+        self.__request_ids = itertools.count(1)
+        self.__requested = False
+        self.__receiver: asyncio.Task | None = None
+        if self.multiplexed:
+            self.__receiver = asyncio.create_task(self.__receive())
+
+    @staticmethod
+    async def open(
+            server: str,
+            port: int,
+            eof: bytes = DEFAULT_EOF,
+            timeout: float = DEFAULT_TIMEOUT,
+            buffer_size: int = DEFAULT_BUFFER_SIZE,
+            protocol: int = DEFAULT_PROTOCOL,
+            compression: bool = False,
+            compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+            max_frame_size: int = DEFAULT_MAX_FRAME_SIZE,
+            probe: bool = False
+    ):
+        reader, writer = await asyncio.open_connection(host=server, port=port, limit=buffer_size)
+        log.debug(f'Connected to {server}:{port}')
+        codec = None
+        # a probe says hello whether or not it offers compression, to learn the server answers frames
+        if (compression or probe) and protocol != PROTOCOL_EOF:
+            try:
+                codec = await Connection.__hello(
+                    reader=reader,
+                    writer=writer,
+                    timeout=min(timeout, DEFAULT_HELLO_TIMEOUT) if probe else timeout,
+                    protocol=protocol,
+                    codecs=available_codecs() if compression else EMPTY_LIST(),
+                    compression_threshold=compression_threshold,
+                    max_frame_size=max_frame_size
+                )
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, BhaktiProtocolError) as error:
+                writer.close()
+                if not probe:
+                    raise
+                raise BhaktiProtocolError(f'Server {server}:{port} does not answer frames') from error
+            except BaseException:
+                writer.close()
+                raise
+        return Connection(
+            reader=reader,
+            writer=writer,
+            eof=eof,
+            timeout=timeout,
+            buffer_size=buffer_size,
+            protocol=protocol,
+            codec=codec,
+            max_frame_size=max_frame_size
+        )
+
+    # offers the codecs given, servers predating the hello answer with an error and get none,
+    # servers predating frames do not answer at all
+    @staticmethod
+    async def __hello(
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+            timeout: float,
+            protocol: int,
+            codecs: list[str],
+            compression_threshold: int,
+            max_frame_size: int
+    ) -> str | None:
+        writer.write(pack_frame(
+            payload=json.dumps({
+                HELLO_COMPRESSION: codecs,
+                HELLO_COMPRESSION_THRESHOLD: compression_threshold
+            }).encode(UTF_8),
+            flags=FRAME_FLAG_HELLO,
+            version=protocol
+        ))
+        await writer.drain()
+        data, _, flags, _ = await readframe(reader=reader, timeout=timeout, max_size=max_frame_size)
+        if not flags & FRAME_FLAG_HELLO:
+            return None
+        codec = json.loads(data).get(HELLO_COMPRESSION)
+        log.debug(f'Compression negotiated: {codec}')
+        return codec
+
+    @property
+    def multiplexed(self) -> bool:
+        return self.__protocol >= PROTOCOL_FRAME_V2
+
+    # whether the connection has carried a request before
+    @property
+    def requested(self) -> bool:
+        return self.__requested
+
+    @property
+    def codec(self) -> str | None:
+        return self.__codec
+
+    @property
+    def in_flight(self) -> int:
+        if self.multiplexed:
+            return len(self.__pending)
+        return int(self.__exchange_lock.locked())
+
+    def is_closing(self) -> bool:
+        return self.__writer.is_closing() or (self.__receiver is not None and self.__receiver.done())
+
+    async def close(self):
+        if self.__receiver is not None:
+            self.__receiver.cancel()
+        self.__writer.close()
+        try:
+            await self.__writer.wait_closed()
+        except ConnectionError:
+            pass
+        log.debug('Connection closed')
+
+    async def request(self, message: bytes, flags: int = 0) -> bytes:
+        self.__requested = True
+        if self.multiplexed:
+            return await self.__request_multiplexed(message, flags)
+        async with self.__exchange_lock:
+            try:
+                self.__send(message, flags)
+                await self.__writer.drain()
+                data, _ = await self.__receive_one()
+                return data
+            except asyncio.TimeoutError:
+                # a late response would desynchronize the channel
+                await self.close()
+                raise
+
+    # yields the payload of every frame of a streamed response,
+    # the <eof> protocol cannot stream and yields its single response
+    async def stream(self, message: bytes, flags: int = 0) -> AsyncIterator[bytes]:
+        self.__requested = True
+        if self.multiplexed:
+            async for data in self.__stream_multiplexed(message, flags):
+                yield data
+            return
+        async with self.__exchange_lock:
+            completed = False
+            try:
+                self.__send(message, flags)
+                await self.__writer.drain()
+                while not completed:
+                    data, _flags = await self.__receive_one()
+                    completed = self.__protocol == PROTOCOL_EOF or not _flags & FRAME_FLAG_MORE
+                    yield data
+            finally:
+                # frames left unread would desynchronize the channel
+                if not completed:
+                    await self.close()
+
+    def __send(self, message: bytes, flags: int, request_id: int = 0):
+        if self.__protocol == PROTOCOL_EOF:
+            self.__writer.write(message + self.__eof)
+            return
+        self.__writer.write(pack_frame_header(
+            length=len(message),
+            flags=flags,
+            version=self.__protocol,
+            request_id=request_id
+        ))
+        self.__writer.write(message)
+
+    async def __receive_one(self) -> tuple[bytes, int]:
+        if self.__protocol == PROTOCOL_EOF:
+            data = await readsuntil(
+                reader=self.__reader,
+                buffer_size=self.__buffer_size,
+                until=self.__eof,
+                timeout=self.__timeout
+            )
+            flags = 0
+        else:
+            data, _, flags, _ = await readframe(
+                reader=self.__reader,
+                timeout=self.__timeout,
+                max_size=self.__max_frame_size
+            )
+            if flags & FRAME_FLAG_COMPRESSED:
+                data = decompress_payload(data)
+        log.debug(f'Data received: {data}')
+        return data, flags
+
+    async def __open_request(self, message: bytes, flags: int) -> tuple[int, asyncio.Queue]:
+        request_id = next(self.__request_ids) & REQUEST_ID_MASK
+        responses = asyncio.Queue()
+        self.__pending[request_id] = responses
+        self.__send(message, flags, request_id)
+        async with self.__drain_lock:
+            await self.__writer.drain()
+        return request_id, responses
+
+    async def __next_response(self, responses: asyncio.Queue) -> tuple[bytes, int]:
+        # a response arriving after the timeout is dropped by the receiver,
+        # the channel stays usable
+        response = await asyncio.wait_for(responses.get(), self.__timeout)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def __request_multiplexed(self, message: bytes, flags: int) -> bytes:
+        request_id = None
+        try:
+            request_id, responses = await self.__open_request(message, flags)
+            data, _ = await self.__next_response(responses)
+            return data
+        finally:
+            self.__pending.pop(request_id, None)
+
+    async def __stream_multiplexed(self, message: bytes, flags: int) -> AsyncIterator[bytes]:
+        request_id = None
+        try:
+            request_id, responses = await self.__open_request(message, flags)
+            while True:
+                data, _flags = await self.__next_response(responses)
+                yield data
+                if not _flags & FRAME_FLAG_MORE:
+                    break
+        finally:
+            self.__pending.pop(request_id, None)
+
+    # dispatches responses to their requests in whatever order the server completes them
+    async def __receive(self):
+        error: Exception = ConnectionResetError('Connection closed')
+        try:
+            while True:
+                magic = await self.__reader.readexactly(len(FRAME_MAGIC))
+                data, _, flags, request_id = await readframe(
+                    reader=self.__reader,
+                    timeout=self.__timeout,
+                    magic=magic,
+                    max_size=self.__max_frame_size
+                )
+                if flags & FRAME_FLAG_COMPRESSED:
+                    data = decompress_payload(data)
+                log.debug(f'Data received for request {request_id}: {data}')
+                responses = self.__pending.get(request_id)
+                if responses is not None:
+                    responses.put_nowait((data, flags))
+        except asyncio.CancelledError:
+            raise
+        except Exception as _error:
+            error = _error
+        finally:
+            for responses in self.__pending.values():
+                responses.put_nowait(error)
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+
+from bhakti.const import (
+    DEFAULT_TIMEOUT,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_POOL_MAX_SIZE,
+    DEFAULT_POOL_MAX_IDLE
+)
+from bhakti.client.connection import Connection
+
+log = logging.getLogger("bhakti.client")
+
+
+class ConnectionPool:
+    def __init__(
+            self,
+            connect: callable,
+            min_size: int = 0,
+            max_size: int = DEFAULT_POOL_MAX_SIZE,
+            acquire_timeout: float = DEFAULT_TIMEOUT,
+            max_idle: float = DEFAULT_POOL_MAX_IDLE,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f'Invalid pool size [{min_size}, {max_size}]')
+        # async () -> Connection
+        self.__connect = connect
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__acquire_timeout = acquire_timeout
+        self.__max_idle = max_idle
+        # requests one multiplexed connection takes before another one is opened
+        self.__max_in_flight = max_in_flight
+        # connection => (leases, last released at)
+        self.__connections: dict[Connection, list[int | float]] = dict()
+        self.__connecting = 0
+        self.__condition = asyncio.Condition()
+        self.__stats = {
+            'created': 0,
+            'closed': 0,
+            'acquired': 0,
+            'waited': 0,
+            'timeouts': 0,
+            'health_check_failures': 0
+        }
+
+    @property
+    def stats(self) -> dict:
+        leases = sum(lease for lease, _ in self.__connections.values())
+        return {
+            'size': len(self.__connections),
+            'idle': sum(1 for lease, _ in self.__connections.values() if lease == 0),
+            'in_use': leases,
+            'min_size': self.__min_size,
+            'max_size': self.__max_size,
+            **self.__stats
+        }
+
+    def __capacity(self, connection: Connection) -> int:
+        return self.__max_in_flight if connection.multiplexed else 1
+
+    def __healthy(self, connection: Connection, leases: int, released_at: float) -> bool:
+        if connection.is_closing():
+            return False
+        # servers drop channels idling beyond their idle timeout
+        return leases > 0 or time.monotonic() - released_at < self.__max_idle
+
+    async def __open(self) -> Connection:
+        connection = await self.__connect()
+        self.__stats['created'] += 1
+        return connection
+
+    async def __close(self, connection: Connection):
+        self.__stats['closed'] += 1
+        await connection.close()
+
+    def __evict(self) -> list[Connection]:
+        evicted = list()
+        for connection, (leases, released_at) in list(self.__connections.items()):
+            if not self.__healthy(connection, leases, released_at):
+                if not connection.is_closing() and len(self.__connections) <= self.__min_size:
+                    continue
+                del self.__connections[connection]
+                evicted.append(connection)
+                if connection.is_closing():
+                    self.__stats['health_check_failures'] += 1
+        return evicted
+
+    def __pick(self) -> Connection | None:
+        # least loaded first, so multiplexed requests spread over open connections
+        candidates = [
+            (leases, connection) for connection, (leases, _) in self.__connections.items()
+            if leases < self.__capacity(connection)
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate[0])[1]
+
+    # dials a connection reserved through __connecting, outside the lock
+    # so other acquirers may keep leasing meanwhile
+    async def __admit(self, leases: int) -> Connection:
+        connection = None
+        try:
+            connection = await self.__open()
+        finally:
+            async with self.__condition:
+                self.__connecting -= 1
+                if connection is not None:
+                    self.__connections[connection] = [leases, time.monotonic()]
+                self.__condition.notify_all()
+        return connection
+
+    async def fill(self):
+        async with self.__condition:
+            missing = self.__min_size - len(self.__connections) - self.__connecting
+            if missing <= 0:
+                return
+            self.__connecting += missing
+        for dialed in range(missing):
+            try:
+                await self.__admit(leases=0)
+            except BaseException:
+                # give back reservations never dialed
+                async with self.__condition:
+                    self.__connecting -= missing - dialed - 1
+                raise
+
+    async def acquire(self) -> Connection:
+        deadline = time.monotonic() + self.__acquire_timeout
+        waited = False
+        async with self.__condition:
+            while True:
+                for connection in self.__evict():
+                    await self.__close(connection)
+                connection = self.__pick()
+                if connection is not None:
+                    self.__connections[connection][0] += 1
+                    self.__stats['acquired'] += 1
+                    return connection
+                if len(self.__connections) + self.__connecting < self.__max_size:
+                    self.__connecting += 1
+                    break
+                if not waited:
+                    waited = True
+                    self.__stats['waited'] += 1
+                try:
+                    await asyncio.wait_for(self.__condition.wait(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    self.__stats['timeouts'] += 1
+                    raise
+        connection = await self.__admit(leases=1)
+        self.__stats['acquired'] += 1
+        return connection
+
+    async def release(self, connection: Connection, discard: bool = False):
+        async with self.__condition:
+            if connection not in self.__connections:
+                # discarded already through another lease
+                connection = None
+            else:
+                self.__connections[connection][0] -= 1
+                self.__connections[connection][1] = time.monotonic()
+                if discard or connection.is_closing():
+                    del self.__connections[connection]
+                else:
+                    connection = None
+            self.__condition.notify_all()
+        if connection is not None:
+            await self.__close(connection)
+
+    async def close(self):
+        async with self.__condition:
+            connections = list(self.__connections.keys())
+            self.__connections.clear()
+            self.__condition.notify_all()
+        for connection in connections:
+            await self.__close(connection)
@@ -1,13 +1,29 @@
 import asyncio
+import contextlib
 import logging
+from typing import AsyncIterator
 
-from bhakti.const import DEFAULT_EOF, DEFAULT_TIMEOUT, DEFAULT_BUFFER_SIZE, DEFAULT_PORT
-from bhakti.util.readsuntil import readsuntil
+from bhakti.const import (
+    DEFAULT_EOF,
+    DEFAULT_TIMEOUT,
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_PORT,
+    DEFAULT_PROTOCOL,
+    DEFAULT_POOL_MAX_SIZE,
+    DEFAULT_POOL_MAX_IDLE,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    DEFAULT_MAX_FRAME_SIZE,
+    PROTOCOL_EOF
+)
+from bhakti.client.connection import Connection
+from bhakti.client.connection_pool import ConnectionPool
+from bhakti.exception.bhakti_protocol_error import BhaktiProtocolError
 
 log = logging.getLogger("bhakti.client")
 
 READ_TIMEOUT = 0
 CONNECTION_REFUSED = 1
+POOL_TIMEOUT = 2
 
 
 class SimpleReactiveClient:
@@ -17,36 +33,177 @@ class SimpleReactiveClient:
             port: int = DEFAULT_PORT,
             eof: bytes = DEFAULT_EOF,
             timeout: float = DEFAULT_TIMEOUT,
-            buffer_size: int = DEFAULT_BUFFER_SIZE
+            buffer_size: int = DEFAULT_BUFFER_SIZE,
+            keep_alive: bool = True,
+            protocol: int = DEFAULT_PROTOCOL,
+            pool_min_size: int = 0,
+            pool_max_size: int = DEFAULT_POOL_MAX_SIZE,
+            pool_acquire_timeout: float = DEFAULT_TIMEOUT,
+            pool_max_idle: float = DEFAULT_POOL_MAX_IDLE,
+            compression: bool = False,
+            compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+            max_frame_size: int = DEFAULT_MAX_FRAME_SIZE
     ):
         self.__server = server
         self.__port = port
         self.__eof = eof
         self.__timeout = timeout
         self.__buffer_size = buffer_size
+        self.__keep_alive = keep_alive
+        self.__protocol = protocol
+        # frames are offered once before the first request, servers not answering them get <eof> messages
+        self.__negotiated = protocol == PROTOCOL_EOF
+        self.__compression = compression
+        self.__compression_threshold = compression_threshold
+        self.__max_frame_size = max_frame_size
+        # kept-alive connections are pooled and shared by every call, multiplexed from protocol 2 on
+        self.__pool: ConnectionPool | None = None
+        self.__pool_loop: asyncio.AbstractEventLoop | None = None
+        self.__pool_sizes = (pool_min_size, pool_max_size, pool_acquire_timeout, pool_max_idle)
+        if keep_alive:
+            self.__pool = self.__new_pool()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def __connect(self, probe: bool = False) -> Connection:
+        return await Connection.open(
+            server=self.__server,
+            port=self.__port,
+            eof=self.__eof,
+            timeout=self.__timeout,
+            buffer_size=self.__buffer_size,
+            protocol=self.__protocol,
+            compression=self.__compression,
+            compression_threshold=self.__compression_threshold,
+            max_frame_size=self.__max_frame_size,
+            probe=probe
+        )
+
+    # the protocol messages are encoded for, <eof> once the server turned out to predate frames
+    @property
+    def protocol(self) -> int:
+        return self.__protocol
+
+    # settles the protocol before a message is encoded for it,
+    # a server not reachable yet is probed again by the next request
+    async def negotiate(self):
+        if self.__negotiated:
+            return
+        try:
+            connection = await self.__connect(probe=True)
+        except BhaktiProtocolError as error:
+            log.warning(f'{error}, falling back to <eof> terminated messages')
+            self.__protocol = PROTOCOL_EOF
+        except (OSError, asyncio.TimeoutError) as error:
+            log.debug(f'Protocol not negotiated: {error}')
+            return
+        else:
+            await connection.close()
+        self.__negotiated = True
+
+    # connections belong to the event loop they were opened on,
+    # a client called again under another loop (e.g. through sync) starts a new pool
+    def __pooled(self) -> ConnectionPool:
+        loop = asyncio.get_running_loop()
+        if self.__pool_loop is not None and self.__pool_loop is not loop:
+            self.__pool = self.__new_pool()
+        self.__pool_loop = loop
+        return self.__pool
+
+    def __new_pool(self) -> ConnectionPool:
+        min_size, max_size, acquire_timeout, max_idle = self.__pool_sizes
+        return ConnectionPool(
+            connect=self.__connect,
+            min_size=min_size,
+            max_size=max_size,
+            acquire_timeout=acquire_timeout,
+            max_idle=max_idle
+        )
+
+    @property
+    def pool_stats(self) -> dict | None:
+        if self.__pool is None:
+            return None
+        return self.__pool.stats
+
+    async def close(self):
+        if self.__pool is not None and self.__pool_loop in (None, asyncio.get_running_loop()):
+            await self.__pool.close()
 
     # 读取超时或连接被拒绝时返回 None
-    async def send_receive(self, message: bytes) -> bytes | int:
+    # flags only apply to the frame protocol
+    async def send_receive(self, message: bytes, flags: int = 0) -> bytes | int:
+        if self.__keep_alive:
+            return await self.__send_receive_kept_alive(message, flags)
         try:
-            reader, writer = await asyncio.open_connection(
-                host=self.__server, port=self.__port, limit=self.__buffer_size)
-            log.debug(f'Connected to {self.__server}:{self.__port}')
+            connection = await self.__connect()
             try:
-                writer.write(message + self.__eof)
-                await writer.drain()
-                data = await readsuntil(
-                    reader=reader,
-                    buffer_size=self.__buffer_size,
-                    until=self.__eof,
-                    timeout=self.__timeout
-                )
-                log.debug(f'Data received: {data}')
-                return data
+                return await connection.request(message, flags)
             except asyncio.TimeoutError:
                 return READ_TIMEOUT
             finally:
-                writer.close()
-                await writer.wait_closed()
-                log.debug('Connection closed')
+                await connection.close()
         except ConnectionRefusedError:
             return CONNECTION_REFUSED
+
+    async def __send_receive_kept_alive(self, message: bytes, flags: int) -> bytes | int:
+        pool = self.__pooled()
+        try:
+            await pool.fill()
+            try:
+                connection = await pool.acquire()
+            except asyncio.TimeoutError:
+                return POOL_TIMEOUT
+            # a fresh connection has no history that could explain a failure
+            reused = connection.requested
+            try:
+                return await connection.request(message, flags)
+            except (asyncio.IncompleteReadError, ConnectionError) as error:
+                await pool.release(connection, discard=True)
+                connection = None
+                # the server may have dropped the channel while it sat idle,
+                # retry once on a fresh one if nothing has been answered on it
+                if not reused or (isinstance(error, asyncio.IncompleteReadError) and error.partial):
+                    raise
+                log.debug('Kept-alive connection lost, reconnecting')
+                connection = await pool.acquire()
+                return await connection.request(message, flags)
+            finally:
+                if connection is not None:
+                    await pool.release(connection)
+        except asyncio.TimeoutError:
+            return READ_TIMEOUT
+        except ConnectionRefusedError:
+            return CONNECTION_REFUSED
+
+    # yields the chunks of a streamed response, a code ends the stream on failure
+    async def send_receive_stream(self, message: bytes, flags: int = 0) -> AsyncIterator[bytes | int]:
+        connection = None
+        pool = self.__pooled() if self.__keep_alive else None
+        try:
+            if pool is not None:
+                await pool.fill()
+                try:
+                    connection = await pool.acquire()
+                except asyncio.TimeoutError:
+                    yield POOL_TIMEOUT
+                    return
+            else:
+                connection = await self.__connect()
+            async with contextlib.aclosing(connection.stream(message, flags)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        except asyncio.TimeoutError:
+            yield READ_TIMEOUT
+        except ConnectionRefusedError:
+            yield CONNECTION_REFUSED
+        finally:
+            if connection is not None:
+                if pool is not None:
+                    await pool.release(connection)
+                else:
+                    await connection.close()
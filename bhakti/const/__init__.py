@@ -5,7 +5,54 @@ DEFAULT_EOF = DEFAULT_EOF_STR.encode(UTF_8)
 DEFAULT_HOST = '0.0.0.0'
 DEFAULT_PORT = 23860
 DEFAULT_TIMEOUT = 4.0
+DEFAULT_IDLE_TIMEOUT = 60.0
 DEFAULT_BUFFER_SIZE = 256
+# wire protocol versions, 0 is the <eof> terminated protocol
+PROTOCOL_EOF = 0
+PROTOCOL_FRAME_V1 = 1
+# frames carry request ids, responses may come back out of order
+PROTOCOL_FRAME_V2 = 2
+DEFAULT_PROTOCOL = PROTOCOL_FRAME_V2
+# frames announcing a larger payload are refused before any of it is read
+DEFAULT_MAX_FRAME_SIZE = 64 << 20
+DEFAULT_MAX_IN_FLIGHT = 64
+# servers predating frames never answer the hello a client opens with, it falls back to <eof> after this long
+DEFAULT_HELLO_TIMEOUT = 1.0
+# engine threads running queries and writes off the event loop
+DEFAULT_THREAD_POOL_SIZE = 4
+# server processes sharing the port, more than one forwards writes to a writer process
+DEFAULT_WORKERS = 1
+# write-ahead log records appended within this window, or until this size, share one fsync,
+# with no window records appended while the previous fsync runs share the next one
+DEFAULT_WAL_COMMIT_INTERVAL = 0.0
+DEFAULT_WAL_COMMIT_SIZE = 1 << 20
+DEFAULT_SNAPSHOT_INTERVAL = 60.0
+# hnsw links per node, candidates kept while linking a node, and while searching unless a query says otherwise
+DEFAULT_HNSW_M = 16
+DEFAULT_HNSW_EF_CONSTRUCTION = 100
+DEFAULT_HNSW_EF_SEARCH = 64
+# ivf cells the vectors are clustered into, and cells scanned per query unless a query says otherwise
+DEFAULT_IVF_NLIST = 256
+DEFAULT_IVF_NPROBE = 8
+# pq subvectors, one byte each, and candidates per result re-scored exactly after a lossy index scored them
+DEFAULT_PQ_M = 8
+DEFAULT_RERANK = 4
+# compiled filter expressions kept by every engine, least recently used dropped first
+DEFAULT_FILTER_CACHE_SIZE = 1024
+# query results kept by every engine, in megabytes, 0 disables it, and seconds one is served for, 0 until a write
+DEFAULT_RESULT_CACHE_MB = 0
+DEFAULT_RESULT_CACHE_TTL = 0.0
+# documents kept by the dipamkara engine, in megabytes, least recently used dropped first, 0 leaves it to CACHED
+DEFAULT_DOC_CACHE_MB = 0
+DEFAULT_POOL_MAX_SIZE = 8
+# below the server's idle timeout, so pooled connections are retired before the server drops them
+DEFAULT_POOL_MAX_IDLE = 30.0
+# vectors sent per create_many request
+DEFAULT_BATCH_SIZE = 1024
+# results per chunk of a streamed response
+DEFAULT_CHUNK_SIZE = 64
+# negotiated compression applies to payloads from this size up
+DEFAULT_COMPRESSION_THRESHOLD = 4096
 
 
 def EMPTY_STR():
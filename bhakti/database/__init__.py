@@ -1,2 +1,18 @@
 from .db_engine import DBEngine
+from .engine import Engine
+from .dipamkara_engine import DipamkaraEngine
+from .flat_engine import FlatEngine
+from .ann_index import AnnIndex, AnnIndexType, SearchOptions
+from .hnsw_index import HnswIndex
+from .ivf_index import IvfIndex
+from .vector_dtype import VectorDtype
+from .quantized_index import QuantizedIndex, ScalarQuantizedIndex, ProductQuantizedIndex
 from dipamkara.embedding.metric import Metric
+from .range_index import IndexKind, RangeIndex
+from .projection import (
+    PROJECTION_ID,
+    PROJECTION_DISTANCE,
+    PROJECTION_VECTOR,
+    PROJECTION_DOCUMENT,
+    PROJECTION_DOCUMENT_KEY_PREFIX
+)
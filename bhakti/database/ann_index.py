@@ -0,0 +1,114 @@
+import abc
+import enum
+
+import numpy
+from dipamkara.embedding import Metric
+
+# per query knobs of approximate indices
+SEARCH_EF_SEARCH = 'ef_search'
+SEARCH_NPROBE = 'nprobe'
+
+
+class AnnIndexType(enum.Enum):
+    NONE = 'none'
+    HNSW = 'hnsw'
+    IVF = 'ivf'
+    SQ8 = 'sq8'
+    PQ = 'pq'
+
+
+class SearchOptions:
+    def __init__(self, options: dict[str, any] | None = None):
+        options = options or dict()
+        self.ef_search: int | None = self.__positive(options, SEARCH_EF_SEARCH)
+        self.nprobe: int | None = self.__positive(options, SEARCH_NPROBE)
+
+    @staticmethod
+    def __positive(options: dict[str, any], key: str) -> int | None:
+        value = options.get(key)
+        if value is not None and (not isinstance(value, int) or value < 1):
+            raise ValueError(f'{key} should be a positive integer, not {value}')
+        return value
+
+
+# approximate nearest neighbours of vectors labelled by document id,
+# built for a single metric, queries of other metrics are answered by exact scans
+class AnnIndex(abc.ABC):
+    @property
+    @abc.abstractmethod
+    def type(self) -> AnnIndexType:
+        pass
+
+    @property
+    @abc.abstractmethod
+    def metric(self) -> Metric:
+        pass
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abc.abstractmethod
+    def __contains__(self, label: int) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def add(self, labels: numpy.ndarray, vectors: numpy.ndarray):
+        pass
+
+    @abc.abstractmethod
+    def remove(self, label: int):
+        pass
+
+    # per query: [(label, distance)], nearest first, only labels allowed if given
+    @abc.abstractmethod
+    def search(
+            self,
+            queries: numpy.ndarray,
+            top_k: int,
+            options: SearchOptions,
+            allowed: set[int] | None = None
+    ) -> list[list[tuple[int, float]]]:
+        pass
+
+    # a copy of the index as arrays, numpy.savez writes it
+    @abc.abstractmethod
+    def dump(self) -> dict[str, numpy.ndarray]:
+        pass
+
+    # search knobs of the configuration, an index loaded from an archive keeps them in place of those it was saved with
+    def configure(self, options: SearchOptions):
+        pass
+
+    # distances are computed on compressed vectors, the engine re-scores candidates exactly
+    @property
+    def lossy(self) -> bool:
+        return False
+
+    # indices learning from the data (e.g. clustering) are trained in two steps:
+    # fit computes a model from sample vectors without touching the index, so it may run while the index serves,
+    # refit then applies it to every vector stored, holding the writers off
+    @property
+    def trainable(self) -> bool:
+        return False
+
+    # an untrained index answers no queries, the engine scans exactly instead
+    @property
+    def trained(self) -> bool:
+        return True
+
+    # the index is worth training again, e.g. it grew or its data no longer fits the model
+    @property
+    def drifted(self) -> bool:
+        return False
+
+    # vectors fit wants, the engine samples that many for it
+    @property
+    def training_size(self) -> int:
+        return 0
+
+    def fit(self, vectors: numpy.ndarray) -> any:
+        raise NotImplementedError(f'{self.type.value} index is not trainable')
+
+    def refit(self, model: any, labels: numpy.ndarray, vectors: numpy.ndarray):
+        raise NotImplementedError(f'{self.type.value} index is not trainable')
@@ -0,0 +1,207 @@
+import numpy
+from dipamkara.dipamkara_dsl import DipamkaraDsl
+from dipamkara.exception import DipamkaraSyntaxError
+
+from bhakti.const import EMPTY_DICT, EMPTY_LIST, EMPTY_STR
+from bhakti.database.filter import Filter, FILTER_AND
+from bhakti.database.range_index import RangeIndex, RANGE_COMPARISONS
+
+# kind of every cell
+CELL_ABSENT = 0
+CELL_NUMBER = 1
+CELL_STRING = 2
+# anything the dsl does not compare as a number or a string, e.g. null, lists, or ints a float64 cannot hold
+CELL_OTHER = 3
+CELL_MAX_EXACT_INT = 1 << 53
+COLUMN_COMPARISONS = {
+    '>': numpy.greater,
+    '>=': numpy.greater_equal,
+    '<': numpy.less,
+    '<=': numpy.less_equal
+}
+
+
+# one indexed key of every document, row aligned with the vectors:
+# numbers as float64, strings as codes into a dictionary of the distinct strings seen
+class Column:
+    def __init__(self, capacity: int):
+        self.kinds = numpy.zeros(capacity, dtype=numpy.uint8)
+        self.numbers = numpy.zeros(capacity, dtype=numpy.float64)
+        self.codes = numpy.zeros(capacity, dtype=numpy.int32)
+        self.strings: list[str] = EMPTY_LIST()
+        self.__code_of: dict[str, int] = EMPTY_DICT()
+        # cells of every kind, a column of a single kind compares without the dsl
+        self.counts = [capacity, 0, 0, 0]
+        # rows by value, for a key indexed as a range
+        self.ranged: RangeIndex | None = None
+
+    def grow(self, capacity: int, count: int):
+        self.counts[CELL_ABSENT] += capacity - len(self.kinds)
+        for _name in ('kinds', 'numbers', 'codes'):
+            _array = getattr(self, _name)
+            _grown = numpy.zeros(capacity, dtype=_array.dtype)
+            _grown[:count] = _array[:count]
+            setattr(self, _name, _grown)
+
+    def set(self, row: int, document: dict[str, any], key: str):
+        self.clear(row)
+        kind = CELL_ABSENT
+        if key in document.keys():
+            value = document[key]
+            if isinstance(value, str):
+                kind = CELL_STRING
+                code = self.__code_of.get(value)
+                if code is None:
+                    code = len(self.strings)
+                    self.__code_of[value] = code
+                    self.strings.append(value)
+                self.codes[row] = code
+            elif isinstance(value, float) or (isinstance(value, int) and abs(value) <= CELL_MAX_EXACT_INT):
+                kind = CELL_NUMBER
+                self.numbers[row] = value
+            else:
+                kind = CELL_OTHER
+        self.kinds[row] = kind
+        self.counts[CELL_ABSENT] -= 1
+        self.counts[kind] += 1
+        if self.ranged is not None and kind != CELL_ABSENT:
+            self.ranged.set(row, document[key])
+
+    def clear(self, row: int):
+        self.counts[self.kinds[row]] -= 1
+        self.kinds[row] = CELL_ABSENT
+        self.counts[CELL_ABSENT] += 1
+        if self.ranged is not None:
+            self.ranged.clear(row)
+
+    # the source row is left empty
+    def move(self, source: int, target: int):
+        self.clear(target)
+        self.kinds[target] = self.kinds[source]
+        self.numbers[target] = self.numbers[source]
+        self.codes[target] = self.codes[source]
+        self.kinds[source] = CELL_ABSENT
+        if self.ranged is not None:
+            self.ranged.move(source, target)
+
+    # orders the numbers held in rows [0, count)
+    def rank(self, count: int):
+        self.ranged = RangeIndex()
+        rows = numpy.flatnonzero(self.kinds[:count] == CELL_NUMBER)
+        for _row, _value in zip(rows.tolist(), self.numbers[rows].tolist()):
+            self.ranged.set(_row, _value)
+
+
+# indexed keys stored column-wise, a filter becomes a boolean mask over the rows,
+# conditions the columns cannot answer as the dsl would, e.g. over mixed types, are left to the dsl
+class ColumnStore:
+    def __init__(self, capacity: int):
+        self.__capacity = capacity
+        self.__columns: dict[str, Column] = EMPTY_DICT()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__columns.keys()
+
+    def add(self, key: str, documents: list[dict[str, any]]):
+        column = Column(self.__capacity)
+        for _row, _document in enumerate(documents):
+            column.set(_row, _document, key)
+        self.__columns[key] = column
+
+    def remove(self, key: str):
+        del self.__columns[key]
+
+    # the key is kept in order of value too, range comparisons on it become binary searches
+    def rank(self, key: str, count: int):
+        self.__columns[key].rank(count)
+
+    def ranked(self, key: str) -> bool:
+        return key in self.__columns.keys() and self.__columns[key].ranged is not None
+
+    def grow(self, capacity: int, count: int):
+        for _column in self.__columns.values():
+            _column.grow(capacity, count)
+        self.__capacity = capacity
+
+    def set(self, row: int, document: dict[str, any]):
+        for _key, _column in self.__columns.items():
+            _column.set(row, document, _key)
+
+    def move(self, source: int, target: int):
+        for _column in self.__columns.values():
+            _column.move(source, target)
+
+    def clear(self, row: int):
+        for _column in self.__columns.values():
+            _column.clear(row)
+
+    # rows [0, count) matching, the inverted index and row of every document id serve the dsl
+    def mask(
+            self,
+            query: Filter,
+            params: list | None,
+            count: int,
+            inverted_index: dict[str, dict[str, any]],
+            row_of_id: dict[int, int]
+    ) -> numpy.ndarray:
+        mask = numpy.zeros(count, dtype=bool)
+        for _connective, _tokens, _literal in query.bind(params):
+            _mask = self.__atomic(_tokens, _literal, count, inverted_index, row_of_id)
+            mask = mask & _mask if _connective == FILTER_AND else mask | _mask
+        return mask
+
+    def __atomic(
+            self,
+            tokens: list[str],
+            literal: float | str | Exception | None,
+            count: int,
+            inverted_index: dict[str, dict[str, any]],
+            row_of_id: dict[int, int]
+    ) -> numpy.ndarray:
+        key = tokens[0]
+        if key not in self.__columns.keys():
+            raise DipamkaraSyntaxError(message=f"Index \"{key}\" not exist")
+        column = self.__columns[key]
+        numbers, strings = column.counts[CELL_NUMBER], column.counts[CELL_STRING]
+        if numbers + strings + column.counts[CELL_OTHER] == 0:
+            return numpy.zeros(count, dtype=bool)
+        if isinstance(literal, Exception):
+            raise literal
+        op = tokens[1] if len(tokens) > 2 else None
+        if strings == 0 and column.counts[CELL_OTHER] == 0 and isinstance(literal, float):
+            if column.ranged is not None and op in RANGE_COMPARISONS:
+                mask = numpy.zeros(count, dtype=bool)
+                mask[column.ranged.select(op, literal)] = True
+                return mask
+            return (column.kinds[:count] == CELL_NUMBER) & self.__compare(column.numbers[:count], op, literal)
+        if numbers == 0 and column.counts[CELL_OTHER] == 0 and literal is not None:
+            # a number against strings is compared as the string of its float
+            if isinstance(literal, float):
+                literal = str(literal)
+            if len(column.strings) == 0:
+                return numpy.zeros(count, dtype=bool)
+            table = self.__compare(numpy.asarray(column.strings, dtype=object), op, literal).astype(bool)
+            return (column.kinds[:count] == CELL_STRING) & table[column.codes[:count]]
+        mask = numpy.zeros(count, dtype=bool)
+        for _doc_id in DipamkaraDsl(expr=EMPTY_STR(), inverted_index=inverted_index).process_atomic(tokens):
+            # a reader may know a document before its row
+            _row = row_of_id.get(int(_doc_id))
+            if _row is not None:
+                mask[_row] = True
+        return mask
+
+    @staticmethod
+    def __compare(values: numpy.ndarray, op: str, literal: float | str) -> numpy.ndarray:
+        if op in COLUMN_COMPARISONS.keys():
+            return COLUMN_COMPARISONS[op](values, literal)
+        if op in ('==', '!='):
+            if isinstance(literal, str):
+                matched = numpy.fromiter(
+                    (DipamkaraDsl.equals_likely(None, literal, _value) for _value in values.tolist()),
+                    dtype=bool,
+                    count=len(values)
+                )
+            else:
+                matched = values == literal
+            return matched if op == '==' else ~matched
+        return numpy.zeros(len(values), dtype=bool)
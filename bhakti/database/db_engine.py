@@ -3,4 +3,5 @@ import enum
 
 class DBEngine(enum.Enum):
     DIPAMKARA = 'dipamkara'
+    FLAT = 'flat'
     DEFAULT_ENGINE = DIPAMKARA
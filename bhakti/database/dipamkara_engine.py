@@ -0,0 +1,1298 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.sharedctypes import Synchronized
+from typing import AsyncIterator, Coroutine
+
+import numpy
+from dipamkara import Dipamkara
+from dipamkara.dipamkara_dsl import find_keywords_of_dipamkara_dsl
+from dipamkara.embedding import Metric
+from dipamkara.exception.dipamkara_dimension_error import DipamkaraDimensionError
+from dipamkara.exception.dipamkara_index_error import DipamkaraIndexError
+from dipamkara.exception.dipamkara_index_existence_error import DipamkaraIndexExistenceError
+from dipamkara.exception.dipamkara_vector_error import DipamkaraVectorError
+from dipamkara.exception.dipamkara_vector_existence_error import DipamkaraVectorExistenceError
+
+from bhakti.const import (
+    EMPTY_LIST,
+    EMPTY_DICT,
+    UTF_8,
+    DEFAULT_THREAD_POOL_SIZE,
+    DEFAULT_WAL_COMMIT_INTERVAL,
+    DEFAULT_WAL_COMMIT_SIZE,
+    DEFAULT_FILTER_CACHE_SIZE,
+    DEFAULT_RESULT_CACHE_MB,
+    DEFAULT_RESULT_CACHE_TTL,
+    DEFAULT_DOC_CACHE_MB
+)
+from bhakti.database.distance import find_distances, refine_nearest, top_k_nearest
+from bhakti.database.document_cache import DocumentCache
+from bhakti.database.projection import (
+    Projection,
+    PROJECTION_ID,
+    PROJECTION_DISTANCE,
+    PROJECTION_VECTOR,
+    PROJECTION_DOCUMENT
+)
+from bhakti.database.ann_index import SearchOptions
+from bhakti.database.db_engine import DBEngine
+from bhakti.database.engine import Engine
+from bhakti.database.column_store import ColumnStore
+from bhakti.database.filter import FilterCache
+from bhakti.database.range_index import IndexKind
+from bhakti.database.result_cache import ResultCache
+from bhakti.database.mmap_store import MmapVectorStore, MMAP_STORE_FILE, MMAP_MIN_CAPACITY, DOC_ID_REMOVED
+from bhakti.database.snapshot import Snapshot, Segment
+from bhakti.database.vector_dtype import VectorDtype
+from bhakti.database.wal import WriteAheadLog, WAL_FILE, WAL_OP
+from bhakti.util.rwlock import RWLock
+
+log = logging.getLogger("dipamkara")
+
+# bytes of the digest a vector is told apart by
+VECTOR_KEY_SIZE = 16
+
+
+# Dipamkara lays the archive out (.dim, a document file per id in zen) and numbers the documents,
+# the engine keeps everything else itself, keyed by document id:
+# vectors live in a memory-mapped store (see bhakti.database.mmap_store), one row each, in the dtype of the archive,
+# and are told apart by a digest of their bytes in that dtype, so no copy of them is held in memory,
+# archives keyed by vector strings (.vec and .inv) are converted once, at startup, keeping float64,
+# an archive is only converted to another dtype when asked to, and not at all if vectors would merge
+#
+# engine work runs on a thread pool, off the event loop:
+# reads run in parallel under the read lock,
+# writes are coroutines driven to completion under the write lock, where they never suspend
+#
+# a version shared with other processes is odd while a write is under way and even once it is on disk,
+# replicas in those processes catch up with the archive when it moves (see bhakti.database.dipamkara_replica)
+#
+# with a write-ahead log, writes are acknowledged once logged instead of rewriting the archive,
+# save snapshots the archive and drops the log before it, recover replays it after a restart
+#
+# snapshots rewrite only the segments writes touched since the last one (see bhakti.database.snapshot),
+# their content is copied under the write lock and written out in the background,
+# rows of removed vectors stay in the store until a snapshot no longer holds them,
+# queries always scan the store exactly, search options meant for approximate indices are ignored,
+# distances are computed in the stored precision, float16 in float32
+#
+# single vector queries may be answered from a result cache (see bhakti.database.result_cache),
+# every write moves the version its results belong to, and so does every reload of a replica
+#
+# documents are cached in a document cache (see bhakti.database.document_cache) in place of dipamkara's dict,
+# with a budget every document read or written is cached and the least recently used are dropped,
+# without one, cached and the cached flag of writes decide as before
+#
+# indexed keys are stored column-wise by row of the store as well (see bhakti.database.column_store),
+# filters become boolean masks over the rows and restrict the scan, keys indexed as ranges are kept
+# in order of value too and compared by binary search, writes update the rows they touch
+#
+# the archive path, dimension and archive dipamkara loads are read from its private attributes,
+# which is why setup.py and requirements.txt pin dipamkara to the release they were read from
+class DipamkaraEngine(Dipamkara, Engine):
+    def __init__(
+            self,
+            dimension: int,
+            archive_path: str,
+            cached: bool = False,
+            thread_pool_size: int = DEFAULT_THREAD_POOL_SIZE,
+            version: Synchronized | None = None,
+            wal: bool = False,
+            wal_commit_interval: float = DEFAULT_WAL_COMMIT_INTERVAL,
+            wal_commit_size: int = DEFAULT_WAL_COMMIT_SIZE,
+            read_only: bool = False,
+            filter_cache_size: int = DEFAULT_FILTER_CACHE_SIZE,
+            result_cache_mb: float = DEFAULT_RESULT_CACHE_MB,
+            result_cache_ttl: float = DEFAULT_RESULT_CACHE_TTL,
+            doc_cache_mb: float = DEFAULT_DOC_CACHE_MB,
+            dtype: VectorDtype | None = None,
+            convert_dtype: bool = False
+    ):
+        # a bounded cache is filled as documents are read rather than loaded whole
+        super().__init__(dimension=dimension, archive_path=archive_path, cached=cached and doc_cache_mb <= 0)
+        self.__documents = DocumentCache(doc_cache_mb, self._Dipamkara__document)
+        self._Dipamkara__document = self.__documents
+        if self.__documents.bounded:
+            self._Dipamkara__cached = True
+        self.__executor = ThreadPoolExecutor(max_workers=thread_pool_size, thread_name_prefix='bhakti-engine')
+        self.__rwlock = RWLock()
+        self.__filters = FilterCache(filter_cache_size)
+        self.__results = ResultCache(result_cache_mb, result_cache_ttl)
+        # moved by every write in this process, unlike the shared version
+        self.__writes = 0
+        # set on a worker thread while it drives a write, nested calls then run inline
+        self.__local = threading.local()
+        self.__version = version
+        self.__wal: WriteAheadLog | None = None
+        if wal:
+            self.__wal = WriteAheadLog(
+                path=os.path.join(self._Dipamkara__archive_path, WAL_FILE),
+                commit_interval=wal_commit_interval,
+                commit_size=wal_commit_size
+            )
+        self.__recovering = False
+        self.__snapshot = Snapshot(self._Dipamkara__archive_path)
+        # documents of every segment, and what changed since the last snapshot
+        self.__members: list[set[int]] = [set() for _ in range(self.__snapshot.segments)]
+        self.__touched: set[int] = set()
+        self.__dirty: set[int] = set()
+        self.__generation = self.__snapshot.generation
+        # files of the snapshot loaded, a replica reads only segments moved since
+        self.__files: dict[str, int] = EMPTY_DICT()
+        self.__snapshotting = asyncio.Lock()
+        self.__snapshots: set[asyncio.Task] = set()
+        # vector key => document id, document id => vector key, document id => row in the store
+        self.__keys: dict[bytes, int] = EMPTY_DICT()
+        self.__key_of_id: dict[int, bytes] = EMPTY_DICT()
+        self.__rows: dict[int, int] = EMPTY_DICT()
+        # document id of every row seen, DOC_ID_REMOVED for rows removed or of no document loaded
+        self.__row_ids = numpy.full(MMAP_MIN_CAPACITY, DOC_ID_REMOVED, dtype=numpy.int64)
+        self.__count = 0
+        # rows removed since the last snapshot, marked removed in the store once one no longer holds them
+        self.__removed: set[int] = set()
+        # index => {document id => value}, as the dipamkara dsl evaluates it
+        self.__inverted_index: dict[str, dict[int, any]] = EMPTY_DICT()
+        # values of every index by row, rows of no document hold none
+        self.__columns = ColumnStore(MMAP_MIN_CAPACITY)
+        # a replica maps the store its writer keeps up to date
+        self.__read_only = read_only
+        # the dtype a snapshot or a vector string archive was written in, none for a new archive
+        archived = VectorDtype(self.__snapshot.dtype) if self.__snapshot.exists or self._Dipamkara__vector else None
+        dtype = dtype or archived or VectorDtype.DEFAULT_DTYPE
+        if archived is not None and dtype != archived and not read_only and not convert_dtype:
+            raise ValueError(f'Archive {self._Dipamkara__archive_path} stores vectors as {archived.value}, '
+                             f'convert_dtype converts it to {dtype.value}')
+        # loaded as archived, converted once loaded
+        self.__dtype = numpy.dtype((archived or dtype).value)
+        self.__compute_dtype = self.__compute_dtype_of(self.__dtype)
+        self.__store = MmapVectorStore(
+            path=os.path.join(self._Dipamkara__archive_path, MMAP_STORE_FILE),
+            dimension=self._Dipamkara__dimension,
+            writable=not read_only,
+            dtype=self.__dtype
+        )
+        # rows of documents not loaded yet, a replica may see rows before the snapshot holding them
+        self.__orphans: dict[int, int] = EMPTY_DICT()
+        # vectors parsed from an archive keyed by vector strings, for a replica that cannot convert it
+        self.__parsed: numpy.ndarray | None = None
+        # (matrix of the rows seen, document id of every row, rows to skip) for queries
+        self.__matrix: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray] | None = None
+        if self.__snapshot.exists and self.__snapshot.keyed_by_id:
+            self.__files, segments, indices, ranges = self.__snapshot.load_changed(EMPTY_DICT())
+            self.__merge(segments, indices)
+            self.__map_rows()
+            self.__build_columns(ranges)
+        else:
+            # .vec and .inv, or a snapshot keyed by vector strings, go into the next snapshot whole
+            vectors, inverted_index, ranges = self.__snapshot.load() if self.__snapshot.exists else (
+                self._Dipamkara__vector, self._Dipamkara__inverted_index, EMPTY_LIST()
+            )
+            self.__convert(vectors, inverted_index, ranges)
+        if self.__dtype.name != dtype.value and not read_only:
+            self.__convert_dtype(numpy.dtype(dtype.value))
+        self._Dipamkara__vector = EMPTY_DICT()
+        self._Dipamkara__inverted_index = EMPTY_DICT()
+
+    @property
+    def dtype(self) -> VectorDtype:
+        return VectorDtype(self.__dtype.name)
+
+    # distances are computed in the stored precision, float16 in float32
+    @staticmethod
+    def __compute_dtype_of(dtype: numpy.dtype) -> numpy.dtype:
+        return numpy.dtype(numpy.float64 if dtype == numpy.float64 else numpy.float32)
+
+    # vectors are told apart by a digest of their bytes as stored
+    def __key_of(self, vector: numpy.ndarray | str, dtype: numpy.dtype | None = None) -> bytes:
+        if isinstance(vector, str):
+            vector = json.loads(vector)
+        elif not isinstance(vector, numpy.ndarray):
+            raise DipamkaraVectorError(f'Value {vector} is not a vector')
+        return hashlib.blake2b(
+            numpy.ascontiguousarray(vector, dtype=dtype or self.__dtype).tobytes(), digest_size=VECTOR_KEY_SIZE
+        ).digest()
+
+    def __doc_id_of(self, vector: numpy.ndarray | str) -> int | None:
+        return self.__keys.get(self.__key_of(vector))
+
+    # documents, their vector keys and index values of a snapshot keyed by document id
+    def __adopt(self, keys: dict[int, str], inverted_index: dict[str, dict[int, any]]):
+        self.__key_of_id = {_doc_id: bytes.fromhex(_key) for _doc_id, _key in keys.items()}
+        self.__keys = {_key: _doc_id for _doc_id, _key in self.__key_of_id.items()}
+        self.__inverted_index = inverted_index
+        self.__members = [set() for _ in range(self.__snapshot.segments)]
+        for _doc_id in self.__key_of_id.keys():
+            self.__members[self.__snapshot.segment_of(_doc_id)].add(_doc_id)
+
+    # segments of a snapshot replace what is known of their documents, returns the documents they hold or held
+    def __merge(self, segments: dict[int, Segment], indices: list[str]) -> set[int]:
+        for _index in list(self.__inverted_index.keys()):
+            if _index not in indices:
+                del self.__inverted_index[_index]
+        for _index in indices:
+            self.__inverted_index.setdefault(_index, EMPTY_DICT())
+        changed: set[int] = set()
+        for _segment, (_keys, _indices) in segments.items():
+            _members = set(_keys.keys())
+            for _doc_id in self.__members[_segment] - _members:
+                self.__keys.pop(self.__key_of_id.pop(_doc_id), None)
+                _row = self.__rows.pop(_doc_id, None)
+                if _row is not None:
+                    self.__row_ids[_row] = DOC_ID_REMOVED
+                    self.__columns.clear(_row)
+            for _doc_id, _key in _keys.items():
+                _key = bytes.fromhex(_key)
+                self.__keys[_key] = _doc_id
+                self.__key_of_id[_doc_id] = _key
+            _changed = self.__members[_segment] | _members
+            for _index, _values in self.__inverted_index.items():
+                for _doc_id in _changed:
+                    _values.pop(_doc_id, None)
+                _values.update(_indices.get(_index, EMPTY_DICT()))
+            self.__members[_segment] = _members
+            changed.update(_changed)
+        return changed
+
+    # rows of the store holding the documents loaded, rows of any other document were appended
+    # after the snapshot by a run that stopped before the next one, the writer marks them removed
+    def __map_rows(self):
+        ids = numpy.array(self.__store.ids)
+        self.__count = len(ids)
+        self.__row_ids = numpy.full(max(MMAP_MIN_CAPACITY, 2 * len(ids)), DOC_ID_REMOVED, dtype=numpy.int64)
+        self.__rows = EMPTY_DICT()
+        self.__orphans = EMPTY_DICT()
+        for _row, _doc_id in enumerate(ids.tolist()):
+            if _doc_id in self.__key_of_id.keys() and _doc_id not in self.__rows.keys():
+                self.__rows[_doc_id] = _row
+                self.__row_ids[_row] = _doc_id
+            elif _doc_id != DOC_ID_REMOVED and not self.__read_only:
+                self.__store.remove(_row)
+            elif _doc_id != DOC_ID_REMOVED:
+                self.__orphans[_doc_id] = _row
+        self.__matrix = None
+        if self.__read_only or len(self.__rows) == len(self.__key_of_id):
+            return
+        lost = [_doc_id for _doc_id in self.__key_of_id.keys() if _doc_id not in self.__rows.keys()]
+        log.error(f'Vector store {self.__store.path} misses the vectors of {len(lost)} documents, they are dropped')
+        for _doc_id in lost:
+            self.__keys.pop(self.__key_of_id.pop(_doc_id), None)
+            for _values in self.__inverted_index.values():
+                _values.pop(_doc_id, None)
+            self.__touched.add(_doc_id)
+
+    # rows appended since the store was last mapped, and rows seen earlier of documents loaded since
+    def __map_new_rows(self, doc_ids: set[int]):
+        first, count = self.__count, self.__store.count
+        self.__grow_rows(count)
+        for _row, _doc_id in enumerate(self.__store.ids[first:count].tolist(), start=first):
+            if _doc_id != DOC_ID_REMOVED:
+                self.__orphans[_doc_id] = _row
+        self.__count = count
+        for _doc_id in doc_ids:
+            if _doc_id in self.__key_of_id.keys() and _doc_id not in self.__rows.keys():
+                _row = self.__orphans.pop(_doc_id, None)
+                if _row is not None:
+                    self.__rows[_doc_id] = _row
+                    self.__row_ids[_row] = _doc_id
+        self.__matrix = None
+
+    def __grow_rows(self, count: int):
+        if count > len(self.__row_ids):
+            row_ids = numpy.full(max(2 * len(self.__row_ids), count), DOC_ID_REMOVED, dtype=numpy.int64)
+            row_ids[:self.__count] = self.__row_ids[:self.__count]
+            self.__row_ids = row_ids
+            self.__columns.grow(len(row_ids), self.__count)
+
+    # values of the indices given in every row, as the columns take them
+    def __row_values(self, indices: list[str]) -> list[dict[str, any]]:
+        return [
+            {
+                _index: self.__inverted_index[_index][_doc_id]
+                for _index in indices if _doc_id in self.__inverted_index[_index].keys()
+            }
+            for _doc_id in self.__row_ids[:self.__count].tolist()
+        ]
+
+    def __row_values_of(self, doc_id: int) -> dict[str, any]:
+        return {_index: _values[doc_id] for _index, _values in self.__inverted_index.items() if doc_id in _values.keys()}
+
+    # columns of every index over the rows mapped, the ones given ranked
+    def __build_columns(self, ranges: list[str]):
+        self.__columns = ColumnStore(len(self.__row_ids))
+        values = self.__row_values(list(self.__inverted_index.keys()))
+        for _index in self.__inverted_index.keys():
+            self.__columns.add(_index, values)
+            if _index in ranges:
+                self.__columns.rank(_index, self.__count)
+
+    def __ranges(self) -> list[str]:
+        return [_index for _index in self.__inverted_index.keys() if self.__columns.ranked(_index)]
+
+    # the store and the keys of every vector in another dtype, written by the next snapshot,
+    # nothing changes if two vectors could no longer be told apart
+    def __convert_dtype(self, dtype: numpy.dtype):
+        matrix = self.__store.matrix
+        keys: dict[bytes, int] = EMPTY_DICT()
+        for _doc_id, _row in sorted(self.__rows.items()):
+            _key = self.__key_of(matrix[_row], dtype)
+            if _key in keys.keys():
+                raise ValueError(f'Documents {keys[_key]} and {_doc_id} have vectors {dtype} cannot tell apart, '
+                                 f'archive {self._Dipamkara__archive_path} is left as {self.__dtype}')
+            keys[_key] = _doc_id
+        log.warning(f'Converting {len(keys)} vectors stored as {self.__dtype} to {dtype}')
+        self.__store.convert(dtype)
+        self.__dtype = dtype
+        self.__compute_dtype = self.__compute_dtype_of(dtype)
+        self.__keys = keys
+        self.__key_of_id = {_doc_id: _key for _key, _doc_id in keys.items()}
+        self.__dirty.update(range(self.__snapshot.segments))
+        self.__matrix = None
+
+    # an archive keyed by vector strings: the store is kept if it holds the vectors of exactly its documents,
+    # as an earlier version of this engine left it, or rebuilt from the parsed vector strings
+    def __convert(self, vectors: dict[str, int], inverted_index: dict[str, dict[str, any]], ranges: list[str]):
+        if vectors:
+            log.info(f'Converting archive of {len(vectors)} vectors to be keyed by document id')
+        ids = self.__store.ids.tolist()
+        doc_ids = list(vectors.values())
+        if len(ids) - ids.count(DOC_ID_REMOVED) == len(doc_ids) and set(ids) - {DOC_ID_REMOVED} == set(doc_ids):
+            matrix = self.__store.matrix
+        else:
+            log.info(f'Vector store {self.__store.path} does not match the archive, rebuilding')
+            ids = doc_ids
+            matrix = numpy.asarray(json.loads(f'[{",".join(vectors.keys())}]'), dtype=numpy.float64).reshape(
+                len(ids), self._Dipamkara__dimension
+            )
+            if self.__read_only:
+                self.__parsed = matrix.astype(self.__dtype)
+            else:
+                self.__store.reset(matrix, ids)
+                matrix = self.__store.matrix
+        self.__count = len(ids)
+        self.__row_ids = numpy.full(max(MMAP_MIN_CAPACITY, 2 * len(ids)), DOC_ID_REMOVED, dtype=numpy.int64)
+        self.__keys, self.__key_of_id, self.__rows = EMPTY_DICT(), EMPTY_DICT(), EMPTY_DICT()
+        for _row, _doc_id in enumerate(ids):
+            if _doc_id == DOC_ID_REMOVED:
+                continue
+            _key = self.__key_of(matrix[_row])
+            if _key in self.__keys.keys():
+                # e.g. [1, 2] and [1.0, 2.0], told apart by their strings only
+                log.warning(f'Document {_doc_id} has the vector of document {self.__keys[_key]}, it is dropped')
+                continue
+            self.__keys[_key] = _doc_id
+            self.__key_of_id[_doc_id] = _key
+            self.__rows[_doc_id] = _row
+            self.__row_ids[_row] = _doc_id
+        self.__adopt(
+            {_doc_id: _key.hex() for _doc_id, _key in self.__key_of_id.items()},
+            {
+                _index: {
+                    vectors[_vector_str]: _value for _vector_str, _value in _values.items()
+                    if vectors.get(_vector_str) in self.__key_of_id.keys()
+                }
+                for _index, _values in inverted_index.items()
+            }
+        )
+        self.__build_columns(ranges)
+        self.__dirty.update(range(self.__snapshot.segments))
+        self.__matrix = None
+
+    def __vector_matrix(self) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        if self.__matrix is None:
+            row_ids = self.__row_ids[:self.__count]
+            self.__matrix = (
+                numpy.asarray(self.__parsed if self.__parsed is not None else self.__store.matrix[:self.__count]),
+                row_ids,
+                numpy.flatnonzero(row_ids == DOC_ID_REMOVED)
+            )
+        return self.__matrix
+
+    # vector string of every document, as dipamkara keyed them
+    def __vector_strs(self) -> dict[int, str]:
+        matrix = self.__vector_matrix()[0]
+        return {
+            _doc_id: json.dumps(matrix[_row].tolist(), ensure_ascii=True) for _doc_id, _row in self.__rows.items()
+        }
+
+    @property
+    def vectors(self) -> dict[str, int]:
+        return {_vector_str: _doc_id for _doc_id, _vector_str in self.__vector_strs().items()}
+
+    @property
+    def inverted_indices(self) -> dict[str, dict[str, any]]:
+        vector_strs = self.__vector_strs()
+        return {
+            _index: {vector_strs[_doc_id]: _value for _doc_id, _value in _values.items() if _doc_id in vector_strs}
+            for _index, _values in self.__inverted_index.items()
+        }
+
+    def __held(self) -> bool:
+        return getattr(self.__local, 'held', False)
+
+    def __drive(self, coroutine: Coroutine) -> any:
+        self.__local.held = True
+        try:
+            coroutine.send(None)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            self.__local.held = False
+        coroutine.close()
+        raise RuntimeError('Engine write suspended outside the event loop')
+
+    @staticmethod
+    async def __complete(future: asyncio.Future) -> any:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the lock must outlive the worker still touching the engine
+            await asyncio.wait({future})
+            raise
+
+    async def __read(self, function: callable, *args) -> any:
+        if self.__held():
+            return function(*args)
+        async with self.__rwlock.read():
+            return await self.__complete(
+                asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+            )
+
+    def __publish(self):
+        if self.__version is not None:
+            with self.__version.get_lock():
+                self.__version.value += 1
+
+    # a document written or removed goes into the next snapshot
+    def __touch(self, doc_id: int):
+        self.__touched.add(doc_id)
+
+    async def __write(self, coroutine: Coroutine, record: dict | None = None) -> any:
+        if self.__held():
+            return await coroutine
+        committed = None
+        try:
+            async with self.__rwlock.write():
+                self.__publish()
+                try:
+                    result = await self.__complete(
+                        asyncio.get_running_loop().run_in_executor(self.__executor, self.__drive, coroutine)
+                    )
+                    if record is not None:
+                        committed = self.__wal.append(record)
+                finally:
+                    self.__matrix = None
+                    self.__writes += 1
+                    self.__publish()
+        except asyncio.CancelledError:
+            # closing is a no-op once driven, otherwise it was never started
+            coroutine.close()
+            raise
+        # waited for outside the lock, so writes behind this one join the same commit
+        if committed is not None:
+            await committed
+        return result
+
+    # vectors are logged as lists, nothing is logged without a log or while replaying it
+    def __record(self, op: str, **params) -> dict | None:
+        if self.__wal is None or self.__recovering:
+            return None
+        record = {WAL_OP: op}
+        for _key, _value in params.items():
+            record[_key] = _value.tolist() if isinstance(_value, numpy.ndarray) else _value
+        return record
+
+    async def recover(self):
+        records = self.__wal.records() if self.__wal is not None else EMPTY_LIST()
+        if not records:
+            # an archive converted at startup goes into its first snapshot
+            if self.__dirty or self.__touched:
+                await self.save()
+            return
+        log.info(f'Replaying {len(records)} records of write-ahead log {self.__wal.path}')
+        self.__recovering = True
+        try:
+            await self.__write(self.__rewind())
+            for _record in records:
+                try:
+                    await self.__replay(_record)
+                except Exception as error:
+                    # writes already in the checkpoint fail again harmlessly, e.g. creating an existing vector
+                    log.debug(f'Skipped write-ahead log record {_record.get(WAL_OP)}: {error}')
+        finally:
+            self.__recovering = False
+        await self.save()
+
+    # brings documents on disk back to the checkpoint, the log then replays every write after it:
+    # documents removed since are gone, and so are their vectors,
+    # documents of no vector were created since and are created again
+    async def __rewind(self):
+        zen = self._Dipamkara__archive_zen
+        for _doc_id in list(self.__key_of_id.keys()):
+            if not os.path.exists(os.path.join(zen, str(_doc_id))):
+                self.__remove(_doc_id)
+        for _entry in os.listdir(zen):
+            if int(_entry) not in self.__key_of_id.keys():
+                os.remove(os.path.join(zen, _entry))
+                self.__documents.pop(int(_entry), None)
+
+    async def __replay(self, record: dict):
+        params = dict(record)
+        op = params.pop(WAL_OP)
+        if isinstance(params.get('vector'), list):
+            params['vector'] = numpy.asarray(params['vector'], dtype=numpy.float64)
+        if 'vectors' in params.keys():
+            params['vectors'] = numpy.asarray(params['vectors'], dtype=numpy.float64).reshape(
+                -1, self._Dipamkara__dimension
+            )
+        if op == 'create':
+            await self.create(**params)
+        elif op == 'create_many':
+            await self.create_many(**params)
+        elif op == 'remove_by_vector':
+            await self.remove_by_vector(**params)
+        elif op == 'indexed_remove':
+            await self.indexed_remove(**params)
+        elif op == 'create_index':
+            await self.create_index(**params)
+        elif op == 'remove_index':
+            await self.remove_index(**params)
+        elif op == 'mod_doc_by_vector':
+            await self.mod_doc_by_vector(**params)
+        else:
+            raise ValueError(f'Unknown write-ahead log op "{op}"')
+
+    # reads what another process wrote to the archive since the last reload: segments that moved,
+    # and rows appended to the store, unless it was compacted since,
+    # documents of the segments that moved are read from disk again as they are needed
+    async def reload(self):
+        return await self.__write(self.__reload())
+
+    async def __reload(self):
+        if self.__parsed is not None:
+            # the writer converted the archive since
+            self.__parsed = None
+            self.__store.open()
+            self.__files, segments, indices, ranges = self.__snapshot.load_changed(EMPTY_DICT())
+            self.__keys, self.__key_of_id, self.__inverted_index = EMPTY_DICT(), EMPTY_DICT(), EMPTY_DICT()
+            self.__members = [set() for _ in range(self.__snapshot.segments)]
+            self.__merge(segments, indices)
+            self.__documents.clear()
+            self.__map_rows()
+            self.__build_columns(ranges)
+            return
+        # loaded whole before touching any state, a snapshot superseded while loading raises
+        # and leaves the state as it was
+        files, segments, indices, ranges = self.__snapshot.load_changed(self.__files)
+        # columns are built again when indices come or go, or are ranked
+        rebuilt = indices != list(self.__inverted_index.keys()) or ranges != self.__ranges()
+        changed = self.__merge(segments, indices)
+        self.__files = files
+        for _doc_id in changed:
+            self.__documents.pop(_doc_id, None)
+        self._Dipamkara__auto_increment_ptr = max(
+            self._Dipamkara__auto_increment_ptr, max(changed & self.__key_of_id.keys(), default=-1) + 1
+        )
+        # mapped after the snapshot, so it holds at least every document loaded
+        if self.__store.refresh():
+            self.__map_rows()
+            rebuilt = True
+        else:
+            self.__map_new_rows(changed)
+        if rebuilt:
+            self.__build_columns(ranges)
+            return
+        for _doc_id in changed:
+            if _doc_id in self.__rows.keys():
+                self.__columns.set(self.__rows[_doc_id], self.__row_values_of(_doc_id))
+
+    @property
+    def db_engine(self) -> DBEngine:
+        return DBEngine.DIPAMKARA
+
+    def __insight(self) -> dict:
+        return {
+            "archive_dir": self.archive_dir,
+            "enable_cache": self.is_fully_cached,
+            "auto_increment": self.latest_id,
+            "vectors": self.vectors,
+            "inverted_indices": self.inverted_indices,
+            "range_indices": self.__ranges(),
+            "cached_docs": self.cached_docs,
+            "doc_cache": self.__documents.stats(),
+            "filter_cache": self.__filters.stats(),
+            "result_cache": self.__results.stats()
+        }
+
+    async def insight(self) -> dict:
+        return await self.__read(self.__insight)
+
+    # copies the segments changed since the last snapshot, under the write lock,
+    # with the rows removed before it
+    def __snapshot_view(self) -> tuple[int, dict[int, Segment], list[str], list[str], set[int]]:
+        for _doc_id in self.__touched:
+            _segment = self.__snapshot.segment_of(_doc_id)
+            self.__dirty.add(_segment)
+            if _doc_id in self.__key_of_id.keys():
+                self.__members[_segment].add(_doc_id)
+            else:
+                self.__members[_segment].discard(_doc_id)
+        self.__touched = set()
+        segments: dict[int, Segment] = EMPTY_DICT()
+        for _segment in self.__dirty:
+            _members = self.__members[_segment]
+            segments[_segment] = (
+                {_doc_id: self.__key_of_id[_doc_id].hex() for _doc_id in _members},
+                {
+                    _index: {_doc_id: _values[_doc_id] for _doc_id in _members if _doc_id in _values}
+                    for _index, _values in self.__inverted_index.items()
+                }
+            )
+        self.__dirty = set()
+        self.__generation += 1
+        removed, self.__removed = self.__removed, set()
+        return self.__generation, segments, list(self.__inverted_index.keys()), self.__ranges(), removed
+
+    def __commit(
+            self,
+            generation: int,
+            segments: dict[int, Segment],
+            indices: list[str],
+            ranges: list[str],
+            durable: bool
+    ):
+        self.__snapshot.commit(
+            generation=generation,
+            segments=segments,
+            indices=indices,
+            ranges=ranges,
+            dtype=self.__dtype.name,
+            durable=durable
+        )
+        # .vec and .inv are left empty once a snapshot holds them
+        for _path in (self._Dipamkara__archive_vec, self._Dipamkara__archive_inv):
+            if os.path.getsize(_path) > 0:
+                with open(_path, 'w', encoding=UTF_8):
+                    pass
+
+    # rows no snapshot holds any longer are marked removed in the store,
+    # which drops them once they outnumber the live ones, under the write lock
+    def __release(self, rows: set[int]):
+        for _row in rows:
+            self.__store.remove(_row)
+        if not self.__store.compactable:
+            return
+        kept = self.__store.compact()
+        moved = numpy.full(self.__count, DOC_ID_REMOVED, dtype=numpy.int64)
+        moved[kept] = numpy.arange(len(kept))
+        row_ids = self.__row_ids[kept]
+        self.__count = len(kept)
+        self.__row_ids = numpy.full(max(MMAP_MIN_CAPACITY, 2 * len(kept)), DOC_ID_REMOVED, dtype=numpy.int64)
+        self.__row_ids[:len(kept)] = row_ids
+        self.__rows = {_doc_id: _row for _row, _doc_id in enumerate(row_ids.tolist()) if _doc_id != DOC_ID_REMOVED}
+        self.__removed = {int(moved[_row]) for _row in self.__removed}
+        self.__build_columns(self.__ranges())
+        self.__matrix = None
+
+    async def __take_snapshot(self):
+        loop = asyncio.get_running_loop()
+        async with self.__snapshotting:
+            seq = None
+            async with self.__rwlock.write():
+                generation, segments, indices, ranges, removed = self.__snapshot_view()
+                if not segments:
+                    return
+                if self.__wal is not None:
+                    seq = await self.__wal.rotate()
+            try:
+                # rows written before the snapshot reach the disk ahead of it
+                await loop.run_in_executor(self.__executor, self.__store.flush)
+                await self.__complete(
+                    loop.run_in_executor(self.__executor, self.__commit, generation, segments, indices, ranges, True)
+                )
+            except BaseException:
+                # taken again by the next snapshot
+                async with self.__rwlock.write():
+                    self.__dirty.update(segments.keys())
+                    self.__removed.update(removed)
+                raise
+            if removed:
+                async with self.__rwlock.write():
+                    await self.__complete(loop.run_in_executor(self.__executor, self.__release, removed))
+            if seq is not None:
+                await loop.run_in_executor(None, self.__wal.discard, seq)
+            log.debug(f'Snapshot {generation} wrote {len(segments)} segments')
+
+    def __snapshot_done(self, snapshot: asyncio.Task):
+        self.__snapshots.discard(snapshot)
+        if not snapshot.cancelled() and snapshot.exception() is not None:
+            log.error(f'Snapshot failed: {snapshot.exception()}')
+
+    # triggers a snapshot running in the background, optionally waiting for it
+    async def save(self, wait: bool = True):
+        if self.__held():
+            # a write saving as it goes, the log already made it durable,
+            # replicas in other processes still read the archive
+            if self.__wal is None or self.__version is not None:
+                *view, removed = self.__snapshot_view()
+                self.__commit(*view, durable=False)
+                self.__release(removed)
+            return
+        snapshot = asyncio.ensure_future(self.__take_snapshot())
+        self.__snapshots.add(snapshot)
+        snapshot.add_done_callback(self.__snapshot_done)
+        if wait:
+            await asyncio.shield(snapshot)
+
+    def __check_dimension(self, vectors: numpy.ndarray):
+        dimension = self._Dipamkara__dimension
+        if vectors.ndim != 2 or vectors.shape[1] != dimension:
+            raise DipamkaraDimensionError(f'Vectors of shape {vectors.shape} '
+                                          f'should be of shape (n, {dimension})')
+
+    # documents are written one by one, their vectors appended to the store together,
+    # returns whether each was written
+    def __add(self, vectors: numpy.ndarray, keys: list[bytes], documents: list[dict[str, any]], cached: bool) -> list[bool]:
+        written = EMPTY_LIST()
+        doc_ids = EMPTY_LIST()
+        added = EMPTY_LIST()
+        for _key, _document in zip(keys, documents):
+            _doc_id = self._Dipamkara__auto_increment_ptr
+            _doc_path = os.path.join(self._Dipamkara__archive_zen, str(_doc_id))
+            try:
+                with open(_doc_path, 'wb') as file:
+                    file.write(json.dumps(_document, ensure_ascii=False).encode(UTF_8))
+            except Exception as _error:
+                log.error(f'Failed to write document {_doc_id}: {_error}')
+                if os.path.exists(_doc_path):
+                    os.remove(_doc_path)
+                written.append(False)
+                continue
+            self._Dipamkara__auto_increment_ptr += 1
+            self.__keys[_key] = _doc_id
+            self.__key_of_id[_doc_id] = _key
+            for _index, _values in self.__inverted_index.items():
+                if _index in _document.keys():
+                    _values[_doc_id] = _document[_index]
+            if self._Dipamkara__cached or cached:
+                self.__documents[_doc_id] = _document
+            self.__touch(_doc_id)
+            doc_ids.append(_doc_id)
+            added.append(_document)
+            written.append(True)
+        if not doc_ids:
+            return written
+        first = self.__store.append(vectors[numpy.asarray(written)], doc_ids)
+        count = first + len(doc_ids)
+        self.__grow_rows(count)
+        self.__row_ids[first:count] = doc_ids
+        self.__count = count
+        for _row, (_doc_id, _document) in enumerate(zip(doc_ids, added), start=first):
+            self.__rows[_doc_id] = _row
+            self.__columns.set(_row, _document)
+        return written
+
+    # the row stays in the store until a snapshot no longer holds the document
+    def __remove(self, doc_id: int):
+        self.__keys.pop(self.__key_of_id.pop(doc_id), None)
+        row = self.__rows.pop(doc_id, None)
+        if row is not None:
+            self.__row_ids[row] = DOC_ID_REMOVED
+            self.__columns.clear(row)
+            self.__removed.add(row)
+        doc_path = os.path.join(self._Dipamkara__archive_zen, str(doc_id))
+        if os.path.exists(doc_path):
+            os.remove(doc_path)
+        self.__documents.pop(doc_id, None)
+        for _values in self.__inverted_index.values():
+            _values.pop(doc_id, None)
+        self.__touch(doc_id)
+
+    # the values of an index in every document, read from disk unless cached
+    def __update_index(self, index: str):
+        values = self.__inverted_index[index]
+        for _doc_id in self.__key_of_id.keys():
+            _document = self.__document_of(_doc_id, cached=False)
+            if index in _document.keys():
+                values[_doc_id] = _document[index]
+
+    def __index(self, indices: list[str]):
+        for _index in indices:
+            if not find_keywords_of_dipamkara_dsl(_index) and _index not in self.__inverted_index.keys():
+                self.__inverted_index[_index] = EMPTY_DICT()
+                self.__update_index(_index)
+                self.__columns.add(_index, self.__row_values([_index]))
+                self.__dirty.update(range(self.__snapshot.segments))
+
+    async def __create(
+            self,
+            vector: numpy.ndarray,
+            document: dict[str, any],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> bool:
+        if indices is None:
+            indices = EMPTY_LIST()
+        dimension = self._Dipamkara__dimension
+        if vector.shape[0] != dimension:
+            raise DipamkaraDimensionError(f'Vector {vector} is {vector.shape[0]}-dimensional '
+                                          f'which should be {dimension}-dimensional')
+        key = self.__key_of(vector)
+        if key in self.__keys.keys():
+            raise DipamkaraVectorExistenceError(f'Vector {vector} already exists')
+        for _index in indices:
+            if not find_keywords_of_dipamkara_dsl(_index) and _index not in document.keys():
+                raise DipamkaraIndexError(f'Index "{_index}" is not a key of {document.keys()}, '
+                                          f'try .create_index("{_index}") '
+                                          f'if you want to build index on "{_index}"')
+        # new indices cover the documents stored so far, the document is indexed as it is added
+        self.__index(indices)
+        written, = self.__add(vector[numpy.newaxis, :], [key], [document], cached)
+        await self.save()
+        return written
+
+    async def create(
+            self,
+            vector: numpy.ndarray,
+            document: dict[str, any],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> bool:
+        return await self.__write(
+            self.__create(vector=vector, document=document, indices=indices, cached=cached),
+            record=self.__record('create', vector=vector, document=document, indices=indices, cached=cached)
+        )
+
+    async def __invalidate_cached_doc_by_vector(self, vector: numpy.ndarray | str) -> bool:
+        doc_id = self.__doc_id_of(vector)
+        if doc_id is None:
+            raise DipamkaraVectorExistenceError(f'Vector {vector} not exists')
+        return self.__documents.pop(doc_id, None) is not None
+
+    async def invalidate_cached_doc_by_vector(self, vector: numpy.ndarray | str) -> bool:
+        return await self.__write(self.__invalidate_cached_doc_by_vector(vector=vector))
+
+    async def __remove_by_vector(self, vector: numpy.ndarray | str, insta_save: bool = True) -> bool:
+        doc_id = self.__doc_id_of(vector)
+        if doc_id is None:
+            return False
+        self.__remove(doc_id)
+        if insta_save:
+            await self.save()
+        return True
+
+    async def remove_by_vector(self, vector: numpy.ndarray | str, insta_save: bool = True) -> bool:
+        return await self.__write(
+            self.__remove_by_vector(vector=vector, insta_save=insta_save),
+            record=self.__record('remove_by_vector', vector=vector)
+        )
+
+    async def __indexed_remove(self, query: str, query_params: list | None) -> bool:
+        for _doc_id in self.__row_ids[self.__filtered_rows(query, query_params)].tolist():
+            self.__remove(_doc_id)
+        await self.save()
+        return True
+
+    async def indexed_remove(self, query: str, query_params: list | None = None) -> bool:
+        return await self.__write(
+            self.__indexed_remove(query=query, query_params=query_params),
+            record=self.__record('indexed_remove', query=query, query_params=query_params)
+        )
+
+    # every query is an exact scan, there is no approximate index to train
+    async def train_index(self) -> bool:
+        return False
+
+    # a range index is an inverted one kept in order of value too, an inverted one may be ranked later,
+    # returned keyed by vector string as dipamkara returned it
+    async def __create_index(self, index: str, kind: IndexKind) -> dict:
+        find_keywords_of_dipamkara_dsl(index)
+        if index not in self.__inverted_index.keys():
+            self.__index([index])
+        elif kind != IndexKind.RANGE or self.__columns.ranked(index):
+            raise DipamkaraIndexExistenceError(f'Index "{index}" exists')
+        if kind == IndexKind.RANGE:
+            self.__columns.rank(index, self.__count)
+            # the index is known as a range once saved
+            self.__dirty.update(range(self.__snapshot.segments))
+        await self.save()
+        return self.inverted_indices[index]
+
+    async def create_index(self, index: str, kind: IndexKind | str = IndexKind.DEFAULT_KIND) -> dict:
+        kind = IndexKind(kind)
+        return await self.__write(
+            self.__create_index(index=index, kind=kind),
+            record=self.__record('create_index', index=index, kind=kind.value)
+        )
+
+    async def __remove_index(self, index: str) -> bool:
+        if index not in self.__inverted_index.keys():
+            raise DipamkaraIndexExistenceError(f'Index "{index}" not exists')
+        del self.__inverted_index[index]
+        self.__columns.remove(index)
+        self.__dirty.update(range(self.__snapshot.segments))
+        await self.save()
+        return True
+
+    async def remove_index(self, index: str) -> bool:
+        return await self.__write(
+            self.__remove_index(index=index),
+            record=self.__record('remove_index', index=index)
+        )
+
+    # the document is rewritten on disk, a cached copy is dropped and read again when next needed
+    async def __mod_doc_by_vector(self, vector: numpy.ndarray | str, key: str, value: any) -> bool:
+        doc_id = self.__doc_id_of(vector)
+        if doc_id is None:
+            raise DipamkaraVectorExistenceError(f'Vector {vector} not exists')
+        document = dict(self.__document_of(doc_id, cached=False))
+        if key not in document.keys():
+            raise KeyError(f'Key "{key}" not exists')
+        document[key] = value
+        with open(os.path.join(self._Dipamkara__archive_zen, str(doc_id)), mode='w', encoding=UTF_8) as file:
+            file.write(json.dumps(document, ensure_ascii=False))
+        self.__documents.pop(doc_id, None)
+        if key in self.__inverted_index.keys():
+            self.__inverted_index[key][doc_id] = value
+            if doc_id in self.__rows.keys():
+                self.__columns.set(self.__rows[doc_id], document)
+        self.__touch(doc_id)
+        await self.save()
+        return True
+
+    async def mod_doc_by_vector(self, vector: numpy.ndarray | str, key: str, value: any) -> bool:
+        return await self.__write(
+            self.__mod_doc_by_vector(vector=vector, key=key, value=value),
+            record=self.__record('mod_doc_by_vector', vector=vector, key=key, value=value)
+        )
+
+    # items failing validation are skipped and reported as False,
+    # indices are updated and saved once for the whole batch
+    async def create_many(
+            self,
+            vectors: numpy.ndarray,
+            documents: list[dict[str, any]],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> list[bool]:
+        return await self.__write(
+            self.__create_many(vectors=vectors, documents=documents, indices=indices, cached=cached),
+            record=self.__record('create_many', vectors=vectors, documents=documents, indices=indices, cached=cached)
+        )
+
+    async def __create_many(
+            self,
+            vectors: numpy.ndarray,
+            documents: list[dict[str, any]],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> list[bool]:
+        if indices is None:
+            indices = EMPTY_LIST()
+        if len(vectors) == 0:
+            return EMPTY_LIST()
+        self.__check_dimension(vectors)
+        if len(vectors) != len(documents):
+            raise ValueError(f'{len(vectors)} vectors given for {len(documents)} documents')
+        indices = [_index for _index in indices if not find_keywords_of_dipamkara_dsl(_index)]
+        # prefilter
+        status = EMPTY_LIST()
+        accepted: list[int] = EMPTY_LIST()
+        keys: list[bytes] = EMPTY_LIST()
+        for _i, (_vector, _document) in enumerate(zip(vectors, documents)):
+            _key = self.__key_of(_vector)
+            if _key in self.__keys.keys() or _key in keys:
+                log.debug(f'Vector {_vector} already exists')
+                status.append(False)
+            elif any(_index not in _document.keys() for _index in indices):
+                log.debug(f'Indices {indices} are not all keys of {_document.keys()}')
+                status.append(False)
+            else:
+                accepted.append(_i)
+                keys.append(_key)
+                status.append(True)
+        if not accepted:
+            return status
+        # new indices cover the documents stored so far, the batch is indexed as it is added
+        self.__index(indices)
+        written = self.__add(numpy.asarray(vectors)[accepted], keys, [documents[_i] for _i in accepted], cached)
+        await self.save()
+        # merge write results back into the prefiltered status
+        written = iter(written)
+        return [_status and next(written) for _status in status]
+
+    async def vector_query(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return (await self.__cached(
+            self.__read(self.__vector_query_batch, vectors, metric, top_k),
+            ResultCache.key('vector_query', vectors, metric, top_k)
+        ))[0]
+
+    async def indexed_vector_query(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return await self.__cached(
+            self.__read(self.__vector_query, vectors, metric, top_k, query, query_params),
+            ResultCache.key('vector_query', vectors, metric, top_k, query, query_params)
+        )
+
+    async def find_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return (await self.__cached(
+            self.__read(self.__find_documents_batch, vectors, metric, top_k, cached),
+            ResultCache.key('find_documents', vectors, metric, top_k)
+        ))[0]
+
+    async def find_documents_by_vector_indexed(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return await self.__cached(
+            self.__read(self.__find_documents, vectors, metric, top_k, cached, query, query_params),
+            ResultCache.key('find_documents', vectors, metric, top_k, query, query_params)
+        )
+
+    # one distance matrix and argpartition over the stored vectors for all queries
+    async def vector_query_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[numpy.ndarray, numpy.float64]]]:
+        return await self.__read(self.__vector_query_batch, vectors, metric, top_k)
+
+    async def find_documents_by_vector_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[dict[str, any], numpy.float64]]]:
+        return await self.__read(self.__find_documents_batch, vectors, metric, top_k, cached)
+
+    # yields chunks of (document, distance), nearest first,
+    # documents are read chunk by chunk so memory stays bounded by chunk_size,
+    # documents removed while streaming are skipped
+    async def iter_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            chunk_size: int = 1,
+            search: SearchOptions | None = None
+    ) -> AsyncIterator[list[tuple[dict[str, any], numpy.float64]]]:
+        chunk_size = max(1, chunk_size)
+        (_row,), _ = await self.__read(self.__knn_batch, numpy.asarray(vector)[numpy.newaxis, :], metric, top_k)
+        for _offset in range(0, len(_row), chunk_size):
+            yield await self.__read(self.__read_documents, _row[_offset:_offset + chunk_size], cached)
+
+    # results carry only the projected fields, documents are left unread unless projected
+    async def query_projected(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: Projection,
+            query: str | None = None,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[list[dict[str, any]]]:
+        read = self.__read(self.__query_projected, vectors, metric, top_k, projection, query, cached, query_params)
+        if len(vectors) != 1:
+            return await read
+        return await self.__cached(
+            read, ResultCache.key('query_projected', vectors, metric, top_k, query, query_params, projection)
+        )
+
+    # a result read before a write finished is never kept, the version moved under it
+    async def __cached(self, read: Coroutine, key: tuple) -> any:
+        if not self.__results.enabled:
+            return await read
+        version = self.__writes
+        result = self.__results.get(key, version)
+        if result is not None:
+            read.close()
+            return result
+        result = await read
+        self.__results.put(key, version, result)
+        return result
+
+    # rows matching a dipamkara dsl query, ascending, its $n parameters bound to the params given,
+    # compiled once per text, the shared DIPAMKARA_DSL is not safe across threads, every query evaluates with its own
+    def __filtered_rows(self, query: str, query_params: list | None) -> numpy.ndarray:
+        return numpy.flatnonzero(self.__columns.mask(
+            self.__filters.get(query), query_params, self.__count, self.__inverted_index, self.__rows
+        ))
+
+    def __vector_query(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            query: str,
+            query_params: list | None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        rows, matrix = self.__knn_batch(vectors, metric, top_k, self.__filtered_rows(query, query_params))
+        return [(matrix[_row], distance) for _row, _, distance in rows[0]]
+
+    def __vector_query_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int
+    ) -> list[list[tuple[numpy.ndarray, numpy.float64]]]:
+        rows, matrix = self.__knn_batch(vectors, metric, top_k)
+        return [[(matrix[_row], distance) for _row, _, distance in _rows] for _rows in rows]
+
+    def __find_documents(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool,
+            query: str,
+            query_params: list | None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        rows, _ = self.__knn_batch(vectors, metric, top_k, self.__filtered_rows(query, query_params))
+        return self.__read_documents(rows[0], cached)
+
+    def __find_documents_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool
+    ) -> list[list[tuple[dict[str, any], numpy.float64]]]:
+        rows, _ = self.__knn_batch(vectors, metric, top_k)
+        return [self.__read_documents(_row, cached) for _row in rows]
+
+    def __read_documents(
+            self,
+            row: list[tuple[int, int, numpy.float64]],
+            cached: bool
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        documents = EMPTY_LIST()
+        for _, _doc_id, distance in row:
+            if _doc_id in self.__key_of_id.keys():
+                # 返回深拷贝
+                documents.append((dict(self.__document_of(_doc_id, cached)), distance))
+        return documents
+
+    # looked up and cached in one step each, readers on other threads may drop it in between
+    def __document_of(self, doc_id: int, cached: bool) -> dict[str, any]:
+        document = self.__documents.get(doc_id)
+        if document is None:
+            with open(os.path.join(self._Dipamkara__archive_zen, str(doc_id)), 'r', encoding=UTF_8) as file:
+                document = json.loads(file.read())
+            if self._Dipamkara__cached or cached:
+                self.__documents[doc_id] = document
+        return document
+
+    def __query_projected(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: Projection,
+            query: str | None,
+            cached: bool,
+            query_params: list | None
+    ) -> list[list[dict[str, any]]]:
+        candidates = None
+        if query is not None:
+            candidates = self.__filtered_rows(query, query_params)
+        rows, matrix = self.__knn_batch(vectors, metric, top_k, candidates)
+        results = EMPTY_LIST()
+        for _row in rows:
+            _results = EMPTY_LIST()
+            for _column, _doc_id, distance in _row:
+                _result = EMPTY_DICT()
+                if projection.id:
+                    _result[PROJECTION_ID] = _doc_id
+                if projection.distance:
+                    _result[PROJECTION_DISTANCE] = distance
+                if projection.vector:
+                    _result[PROJECTION_VECTOR] = matrix[_column]
+                if projection.reads_document:
+                    _document = self.__document_of(_doc_id, cached)
+                    if projection.document:
+                        # 返回深拷贝
+                        _result[PROJECTION_DOCUMENT] = dict(_document)
+                    else:
+                        _result[PROJECTION_DOCUMENT] = {
+                            _key: _document[_key] for _key in projection.document_keys if _key in _document.keys()
+                        }
+                _results.append(_result)
+            results.append(_results)
+        return results
+
+    # per query: [(row in matrix, document id, distance)], nearest first,
+    # candidates restrict the search to some rows, those a filter matched
+    def __knn_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            candidates: numpy.ndarray | None = None
+    ) -> tuple[list[list[tuple[int, int, numpy.float64]]], numpy.ndarray]:
+        if len(vectors) == 0:
+            return EMPTY_LIST(), numpy.empty((0, self._Dipamkara__dimension))
+        self.__check_dimension(vectors)
+        matrix, row_ids, dead_rows = self.__vector_matrix()
+        if candidates is None:
+            searched = matrix
+            subset = None
+            top_k = min(top_k, len(self.__rows))
+        else:
+            subset = candidates
+            searched = matrix[subset]
+        queries = numpy.asarray(vectors, dtype=self.__compute_dtype)
+        searched = searched.astype(self.__compute_dtype, copy=False)
+        distances = find_distances(queries=queries, vectors=searched, metric=metric)
+        if subset is None and len(dead_rows):
+            # removed rows sort last and fall outside top k
+            distances[:, dead_rows] = numpy.inf
+        nearest = refine_nearest(queries, searched, distances, top_k_nearest(distances, top_k), metric)
+        rows = EMPTY_LIST()
+        for _query, _columns in enumerate(nearest.tolist()):
+            _rows = _columns if subset is None else subset[_columns].tolist()
+            rows.append([
+                (_row, int(row_ids[_row]), numpy.float64(distances[_query, _column]))
+                for _row, _column in zip(_rows, _columns)
+            ])
+        return rows, matrix
@@ -0,0 +1,249 @@
+import asyncio
+import logging
+from multiprocessing.sharedctypes import Synchronized
+from typing import AsyncIterator
+
+import numpy
+from dipamkara.embedding import Metric
+
+from bhakti.const import (
+    DEFAULT_TIMEOUT,
+    DEFAULT_THREAD_POOL_SIZE,
+    DEFAULT_FILTER_CACHE_SIZE,
+    DEFAULT_RESULT_CACHE_MB,
+    DEFAULT_RESULT_CACHE_TTL,
+    DEFAULT_DOC_CACHE_MB,
+    PROTOCOL_FRAME_V2
+)
+from bhakti.client.bhakti_reactive_client import BhaktiReactiveClient
+from bhakti.database.dipamkara_engine import DipamkaraEngine
+from bhakti.database.ann_index import SearchOptions
+from bhakti.database.projection import Projection
+from bhakti.database.range_index import IndexKind
+from bhakti.database.vector_dtype import VectorDtype
+
+log = logging.getLogger("dipamkara")
+
+
+# serves reads in a worker process from its own copy of the archive,
+# writes are forwarded to the single writer process owning the archive,
+# the copy catches up before reads whenever the writer's shared version has moved,
+# reading only the snapshot segments and store rows written since
+class DipamkaraReplica(DipamkaraEngine):
+    def __init__(
+            self,
+            dimension: int,
+            archive_path: str,
+            version: Synchronized,
+            writer_host: str,
+            writer_port: int,
+            cached: bool = False,
+            thread_pool_size: int = DEFAULT_THREAD_POOL_SIZE,
+            timeout: float = DEFAULT_TIMEOUT,
+            filter_cache_size: int = DEFAULT_FILTER_CACHE_SIZE,
+            result_cache_mb: float = DEFAULT_RESULT_CACHE_MB,
+            result_cache_ttl: float = DEFAULT_RESULT_CACHE_TTL,
+            doc_cache_mb: float = DEFAULT_DOC_CACHE_MB,
+            dtype: VectorDtype | None = None
+    ):
+        super().__init__(
+            dimension=dimension,
+            archive_path=archive_path,
+            cached=cached,
+            thread_pool_size=thread_pool_size,
+            read_only=True,
+            filter_cache_size=filter_cache_size,
+            result_cache_mb=result_cache_mb,
+            result_cache_ttl=result_cache_ttl,
+            doc_cache_mb=doc_cache_mb,
+            dtype=dtype
+        )
+        self.__version = version
+        # version the copy was loaded at, the archive read by __init__ is at least as new as this
+        self.__loaded = version.value & ~1
+        self.__reloading = asyncio.Lock()
+        self.__writer = BhaktiReactiveClient(
+            server=writer_host,
+            port=writer_port,
+            timeout=timeout,
+            keep_alive=True,
+            protocol=PROTOCOL_FRAME_V2
+        )
+
+    async def __catch_up(self):
+        if self.__version.value == self.__loaded:
+            return
+        async with self.__reloading:
+            version = self.__version.value
+            # odd while the writer is mid-write, the current copy is served until it is done
+            if version == self.__loaded or version & 1:
+                return
+            try:
+                await self.reload()
+            except (ValueError, OSError) as error:
+                log.debug(f'Archive changed while reloading, retrying on next read: {error}')
+                return
+            # a write slipping in during the reload is picked up by the next read
+            if self.__version.value == version:
+                self.__loaded = version
+
+    async def __forwarded(self, response: any) -> any:
+        await self.__catch_up()
+        return response
+
+    async def save(self, wait: bool = True):
+        return await self.__forwarded(await self.__writer.save(wait=wait))
+
+    async def create(
+            self,
+            vector: numpy.ndarray,
+            document: dict[str, any],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> bool:
+        return await self.__forwarded(
+            await self.__writer.create(vector=vector, document=document, indices=indices, cached=cached)
+        )
+
+    async def create_many(
+            self,
+            vectors: numpy.ndarray,
+            documents: list[dict[str, any]],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> list[bool]:
+        # a single request, so the writer applies the batch as one write
+        return await self.__forwarded(await self.__writer.create_many(
+            vectors=vectors,
+            documents=documents,
+            indices=indices,
+            cached=cached,
+            batch_size=max(1, len(vectors))
+        ))
+
+    async def remove_by_vector(self, vector: numpy.ndarray | str, insta_save: bool = True) -> bool:
+        return await self.__forwarded(await self.__writer.remove_by_vector(vector=vector))
+
+    async def indexed_remove(self, query: str, query_params: list | None = None) -> bool:
+        return await self.__forwarded(await self.__writer.indexed_remove(query=query, query_params=query_params))
+
+    async def create_index(self, index: str, kind: IndexKind | str = IndexKind.DEFAULT_KIND) -> dict:
+        return await self.__forwarded(await self.__writer.create_index(index=index, detailed=True, kind=kind))
+
+    async def remove_index(self, index: str) -> bool:
+        return await self.__forwarded(await self.__writer.remove_index(index=index))
+
+    async def mod_doc_by_vector(self, vector: numpy.ndarray | str, key: str, value: any) -> bool:
+        return await self.__forwarded(
+            await self.__writer.modify_document_by_vector(vector=vector, key=key, value=value)
+        )
+
+    # invalidate_cached_doc_by_vector stays local, documents are cached per process
+
+    async def insight(self) -> dict:
+        await self.__catch_up()
+        return await super().insight()
+
+    async def vector_query(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        await self.__catch_up()
+        return await super().vector_query(vector=vector, metric=metric, top_k=top_k, search=search)
+
+    async def indexed_vector_query(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        await self.__catch_up()
+        return await super().indexed_vector_query(
+            query=query, vector=vector, metric=metric, top_k=top_k, search=search, query_params=query_params
+        )
+
+    async def find_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        await self.__catch_up()
+        return await super().find_documents_by_vector(vector=vector, metric=metric, top_k=top_k, cached=cached, search=search)
+
+    async def find_documents_by_vector_indexed(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        await self.__catch_up()
+        return await super().find_documents_by_vector_indexed(
+            query=query, vector=vector, metric=metric, top_k=top_k, cached=cached, search=search,
+            query_params=query_params
+        )
+
+    async def vector_query_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[numpy.ndarray, numpy.float64]]]:
+        await self.__catch_up()
+        return await super().vector_query_batch(vectors=vectors, metric=metric, top_k=top_k, search=search)
+
+    async def find_documents_by_vector_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[dict[str, any], numpy.float64]]]:
+        await self.__catch_up()
+        return await super().find_documents_by_vector_batch(vectors=vectors, metric=metric, top_k=top_k, cached=cached, search=search)
+
+    async def iter_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            chunk_size: int = 1,
+            search: SearchOptions | None = None
+    ) -> AsyncIterator[list[tuple[dict[str, any], numpy.float64]]]:
+        await self.__catch_up()
+        async for _chunk in super().iter_documents_by_vector(
+                vector=vector, metric=metric, top_k=top_k, cached=cached, chunk_size=chunk_size, search=search
+        ):
+            yield _chunk
+
+    async def query_projected(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: Projection,
+            query: str | None = None,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[list[dict[str, any]]]:
+        await self.__catch_up()
+        return await super().query_projected(
+            vectors=vectors, metric=metric, top_k=top_k, projection=projection, query=query, cached=cached, search=search,
+            query_params=query_params
+        )
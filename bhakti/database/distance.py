@@ -0,0 +1,112 @@
+import numpy
+from dipamkara.embedding import Metric
+from dipamkara.exception.dipamkara_metric_not_support_error import DipamkaraMetricNotSupportedError
+
+# bounds the (queries, vectors, dimension) temporaries of chebyshev distances
+CHEBYSHEV_CHUNK_ELEMENTS = 1 << 24
+# bounds the (pairs, dimension) differences of refined euclidean distances
+REFINE_CHUNK_ELEMENTS = 1 << 24
+# metrics computed through ||q||^2 + ||v||^2 - 2 q.v
+EXPANDED_METRICS = (Metric.EUCLIDEAN, Metric.EUCLIDEAN_L2, Metric.EUCLIDEAN_Z_SCORE)
+
+
+def l2_normalize_rows(x: numpy.ndarray) -> numpy.ndarray:
+    return x / numpy.sqrt(numpy.sum(x * x, axis=-1, keepdims=True))
+
+
+def z_score_normalize_rows(x: numpy.ndarray) -> numpy.ndarray:
+    return (x - numpy.mean(x, axis=-1, keepdims=True)) / numpy.std(x, axis=-1, keepdims=True)
+
+
+def find_cosine_distances(queries: numpy.ndarray, vectors: numpy.ndarray) -> numpy.ndarray:
+    norms = numpy.outer(
+        numpy.sqrt(numpy.sum(queries * queries, axis=1)),
+        numpy.sqrt(numpy.sum(vectors * vectors, axis=1))
+    )
+    return 1 - (queries @ vectors.T) / norms
+
+
+def find_euclidean_distances(queries: numpy.ndarray, vectors: numpy.ndarray) -> numpy.ndarray:
+    # ||q - v||^2 = ||q||^2 + ||v||^2 - 2 q.v, clipped against rounding below zero
+    squared = (
+        numpy.sum(queries * queries, axis=1)[:, numpy.newaxis] +
+        numpy.sum(vectors * vectors, axis=1)[numpy.newaxis, :] -
+        2 * (queries @ vectors.T)
+    )
+    return numpy.sqrt(numpy.maximum(squared, 0))
+
+
+def find_chebyshev_distances(queries: numpy.ndarray, vectors: numpy.ndarray) -> numpy.ndarray:
+    distances = numpy.empty((len(queries), len(vectors)), dtype=numpy.float64)
+    step = max(1, CHEBYSHEV_CHUNK_ELEMENTS // max(1, vectors.size))
+    for _offset in range(0, len(queries), step):
+        _queries = queries[_offset:_offset + step, numpy.newaxis, :]
+        distances[_offset:_offset + step] = numpy.max(numpy.abs(_queries - vectors[numpy.newaxis, :, :]), axis=2)
+    return distances
+
+
+# distances between every query and every vector, shaped (queries, vectors)
+def find_distances(
+        queries: numpy.ndarray,
+        vectors: numpy.ndarray,
+        metric: Metric = Metric.DEFAULT_METRIC
+) -> numpy.ndarray:
+    if metric == Metric.COSINE:
+        return find_cosine_distances(queries, vectors)
+    elif metric == Metric.EUCLIDEAN:
+        return find_euclidean_distances(queries, vectors)
+    elif metric == Metric.EUCLIDEAN_L2:
+        return find_euclidean_distances(l2_normalize_rows(queries), l2_normalize_rows(vectors))
+    elif metric == Metric.EUCLIDEAN_Z_SCORE:
+        return find_euclidean_distances(z_score_normalize_rows(queries), z_score_normalize_rows(vectors))
+    elif metric == Metric.CHEBYSHEV:
+        return find_chebyshev_distances(queries, vectors)
+    else:
+        raise DipamkaraMetricNotSupportedError(f'Unsupported metric: {metric}')
+
+
+# column indices of the k smallest distances of every row, nearest first
+def top_k_nearest(distances: numpy.ndarray, top_k: int) -> numpy.ndarray:
+    top_k = max(0, min(top_k, distances.shape[1]))
+    if top_k == 0:
+        return numpy.empty((distances.shape[0], 0), dtype=numpy.intp)
+    if top_k < distances.shape[1]:
+        candidates = numpy.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = numpy.broadcast_to(numpy.arange(distances.shape[1]), distances.shape)
+    order = numpy.argsort(numpy.take_along_axis(distances, candidates, axis=1), axis=1, kind='stable')
+    return numpy.take_along_axis(candidates, order, axis=1)
+
+
+# the expansion loses exactness near zero, an exact match scores about 4e-08 instead of 0,
+# so distances of the nearest are computed again from differences and the nearest reordered by them
+def refine_nearest(
+        queries: numpy.ndarray,
+        vectors: numpy.ndarray,
+        distances: numpy.ndarray,
+        nearest: numpy.ndarray,
+        metric: Metric = Metric.DEFAULT_METRIC
+) -> numpy.ndarray:
+    if metric not in EXPANDED_METRICS or nearest.size == 0:
+        return nearest
+    columns = nearest.ravel()
+    queried = numpy.repeat(numpy.arange(len(nearest)), nearest.shape[1])
+    exact = numpy.take_along_axis(distances, nearest, axis=1).ravel().astype(numpy.float64)
+    step = max(1, REFINE_CHUNK_ELEMENTS // max(1, vectors.shape[1]))
+    for _offset in range(0, len(columns), step):
+        _columns = columns[_offset:_offset + step]
+        _queries = queries[queried[_offset:_offset + step]]
+        _vectors = numpy.asarray(vectors[_columns], dtype=_queries.dtype)
+        if metric == Metric.EUCLIDEAN_L2:
+            _queries, _vectors = l2_normalize_rows(_queries), l2_normalize_rows(_vectors)
+        elif metric == Metric.EUCLIDEAN_Z_SCORE:
+            _queries, _vectors = z_score_normalize_rows(_queries), z_score_normalize_rows(_vectors)
+        _exact = numpy.linalg.norm(_queries - _vectors, axis=1)
+        # rows pushed out of reach, e.g. removed ones, stay out of reach
+        _finite = numpy.isfinite(exact[_offset:_offset + step])
+        exact[_offset:_offset + step][_finite] = _exact[_finite]
+    exact = exact.reshape(nearest.shape)
+    order = numpy.argsort(exact, axis=1, kind='stable')
+    nearest = numpy.take_along_axis(nearest, order, axis=1)
+    numpy.put_along_axis(distances, nearest, numpy.take_along_axis(exact, order, axis=1), axis=1)
+    return nearest
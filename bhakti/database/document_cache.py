@@ -0,0 +1,96 @@
+import collections
+import threading
+
+from bhakti.const import DEFAULT_DOC_CACHE_MB
+from bhakti.database.result_cache import MEGABYTE, size_of
+
+
+# documents by id, standing in for dipamkara's own document dict so every read and write of it goes through here:
+# with a budget, the least recently used documents are dropped once their bytes exceed it,
+# without one, it holds whatever is cached, as dipamkara's dict did,
+# readers on several threads share it, each operation holds the lock
+class DocumentCache(dict):
+    def __init__(self, size_mb: float = DEFAULT_DOC_CACHE_MB, documents: dict[int, dict] | None = None):
+        super().__init__()
+        self.__capacity = int(size_mb * MEGABYTE)
+        # document id => bytes, least recently used first
+        self.__sizes: collections.OrderedDict[int, int] = collections.OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.RLock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        for _doc_id, _document in (documents or dict()).items():
+            self[_doc_id] = _document
+
+    @property
+    def bounded(self) -> bool:
+        return self.__capacity > 0
+
+    def __getitem__(self, doc_id: int) -> dict[str, any]:
+        with self.__lock:
+            document = super().__getitem__(doc_id)
+            self.__sizes.move_to_end(doc_id)
+            return document
+
+    def __setitem__(self, doc_id: int, document: dict[str, any]):
+        size = size_of(document)
+        with self.__lock:
+            if super().__contains__(doc_id):
+                self.__forget(doc_id)
+            if self.bounded and size > self.__capacity:
+                return
+            super().__setitem__(doc_id, document)
+            self.__sizes[doc_id] = size
+            self.__bytes += size
+            while self.bounded and self.__bytes > self.__capacity:
+                self.__forget(next(iter(self.__sizes)))
+                self.__evictions += 1
+
+    def __delitem__(self, doc_id: int):
+        with self.__lock:
+            if not super().__contains__(doc_id):
+                raise KeyError(doc_id)
+            self.__forget(doc_id)
+
+    def __forget(self, doc_id: int):
+        super().__delitem__(doc_id)
+        self.__bytes -= self.__sizes.pop(doc_id)
+
+    # a document cached, or default, counted as a hit or a miss
+    def get(self, doc_id: int, default: any = None) -> any:
+        with self.__lock:
+            if not super().__contains__(doc_id):
+                self.__misses += 1
+                return default
+            self.__hits += 1
+            return self[doc_id]
+
+    def pop(self, doc_id: int, *default) -> any:
+        with self.__lock:
+            if not super().__contains__(doc_id):
+                if default:
+                    return default[0]
+                raise KeyError(doc_id)
+            document = super().__getitem__(doc_id)
+            self.__forget(doc_id)
+            return document
+
+    def clear(self):
+        with self.__lock:
+            super().clear()
+            self.__sizes.clear()
+            self.__bytes = 0
+
+    def stats(self) -> dict[str, int | float]:
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                'size': len(self),
+                'bytes': self.__bytes,
+                'capacity': self.__capacity,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'hit_rate': round(self.__hits / lookups, 4) if lookups > 0 else 0.0,
+                'evictions': self.__evictions
+            }
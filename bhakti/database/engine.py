@@ -0,0 +1,186 @@
+import abc
+import asyncio
+import logging
+from typing import AsyncIterator
+
+import numpy
+from dipamkara.embedding import Metric
+
+from bhakti.database.ann_index import SearchOptions
+from bhakti.database.db_engine import DBEngine
+from bhakti.database.projection import Projection
+from bhakti.database.range_index import IndexKind
+
+log = logging.getLogger("dipamkara")
+
+
+# what the handler dispatches to, whichever engine serves the archive
+class Engine(abc.ABC):
+    @property
+    @abc.abstractmethod
+    def db_engine(self) -> DBEngine:
+        pass
+
+    @abc.abstractmethod
+    async def insight(self) -> dict:
+        pass
+
+    # replays what was written since the last save, called once before serving
+    @abc.abstractmethod
+    async def recover(self):
+        pass
+
+    @abc.abstractmethod
+    async def save(self, wait: bool = True):
+        pass
+
+    async def save_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.save(wait=True)
+            except Exception as error:
+                log.error(f'Scheduled snapshot failed: {error}')
+
+    @abc.abstractmethod
+    async def create(
+            self,
+            vector: numpy.ndarray,
+            document: dict[str, any],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> bool:
+        pass
+
+    @abc.abstractmethod
+    async def create_many(
+            self,
+            vectors: numpy.ndarray,
+            documents: list[dict[str, any]],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> list[bool]:
+        pass
+
+    # trains the approximate index again on the vectors stored now, False without a trainable one
+    @abc.abstractmethod
+    async def train_index(self) -> bool:
+        pass
+
+    # a range index also answers >, >=, <, <= and == on numbers by binary search
+    @abc.abstractmethod
+    async def create_index(self, index: str, kind: IndexKind | str = IndexKind.DEFAULT_KIND) -> dict:
+        pass
+
+    @abc.abstractmethod
+    async def remove_index(self, index: str) -> bool:
+        pass
+
+    @abc.abstractmethod
+    async def invalidate_cached_doc_by_vector(self, vector: numpy.ndarray | str) -> bool:
+        pass
+
+    @abc.abstractmethod
+    async def remove_by_vector(self, vector: numpy.ndarray | str, insta_save: bool = True) -> bool:
+        pass
+
+    @abc.abstractmethod
+    async def indexed_remove(self, query: str, query_params: list | None = None) -> bool:
+        pass
+
+    @abc.abstractmethod
+    async def mod_doc_by_vector(self, vector: numpy.ndarray | str, key: str, value: any) -> bool:
+        pass
+
+    @abc.abstractmethod
+    async def vector_query(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        pass
+
+    @abc.abstractmethod
+    async def vector_query_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[numpy.ndarray, numpy.float64]]]:
+        pass
+
+    @abc.abstractmethod
+    async def indexed_vector_query(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        pass
+
+    @abc.abstractmethod
+    async def find_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        pass
+
+    @abc.abstractmethod
+    async def find_documents_by_vector_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[dict[str, any], numpy.float64]]]:
+        pass
+
+    @abc.abstractmethod
+    async def find_documents_by_vector_indexed(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        pass
+
+    @abc.abstractmethod
+    def iter_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            chunk_size: int = 1,
+            search: SearchOptions | None = None
+    ) -> AsyncIterator[list[tuple[dict[str, any], numpy.float64]]]:
+        pass
+
+    @abc.abstractmethod
+    async def query_projected(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: Projection,
+            query: str | None = None,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[list[dict[str, any]]]:
+        pass
@@ -0,0 +1,152 @@
+import collections
+import re
+import threading
+
+import numpy
+from dipamkara.dipamkara_dsl import DipamkaraDsl, DIPAMKARA_DSL
+from dipamkara.exception import DipamkaraSyntaxError
+
+from bhakti.const import EMPTY_DICT, EMPTY_LIST, EMPTY_SET, DEFAULT_FILTER_CACHE_SIZE
+from bhakti.database.range_index import RangeIndex, RANGE_COMPARISONS
+
+FILTER_AND = '&&'
+FILTER_OR = '||'
+# $1, $2, ... in place of a literal, bound to the query params in order
+FILTER_PARAMETER = re.compile(r'^\$([1-9][0-9]*)$')
+
+
+# a dipamkara dsl expression parsed once, tokenized by the dsl itself,
+# clauses apply left to right without precedence as the dsl does, the first one joins the empty set
+class Filter:
+    def __init__(self, expr: str):
+        self.expr = expr
+        # (connective, tokens of the atomic condition)
+        self.clauses: list[tuple[str, list[str]]] = EMPTY_LIST()
+        # literal of every clause, or the error parsing it raises once its index is known
+        self.literals: list[float | str | Exception | None] = EMPTY_LIST()
+        # parameter of every clause, numbered from 0
+        self.parameters: list[int | None] = EMPTY_LIST()
+        for _tokens in DipamkaraDsl(expr=expr, inverted_index=EMPTY_DICT()).tokenize():
+            if len(_tokens) == 3:
+                self.__add(FILTER_OR, _tokens)
+            elif _tokens[0] in (FILTER_AND, FILTER_OR):
+                self.__add(_tokens[0], _tokens[1:])
+        self.__bound = [
+            (_connective, _tokens, _literal)
+            for (_connective, _tokens), _literal in zip(self.clauses, self.literals)
+        ]
+
+    def __add(self, connective: str, tokens: list[str]):
+        self.clauses.append((connective, tokens))
+        parameter = FILTER_PARAMETER.match(tokens[2]) if len(tokens) > 2 else None
+        self.parameters.append(int(parameter.group(1)) - 1 if parameter is not None else None)
+        self.literals.append(self.__literal(tokens[2]) if len(tokens) > 2 and parameter is None else None)
+
+    @staticmethod
+    def __literal(token: str) -> float | str | Exception:
+        if DIPAMKARA_DSL.is_number(token):
+            try:
+                return float(token)
+            except ValueError as error:
+                return error
+        if token.startswith('"') and token.endswith('"'):
+            return token.replace('"', '', 2)
+        return DipamkaraSyntaxError(message='String value should be surrounded by " "')
+
+    # a number param binds a number literal, a string param a string literal without the quotes
+    @staticmethod
+    def __parameter(value: any) -> tuple[float | str, str]:
+        if isinstance(value, str):
+            if '"' in value:
+                raise ValueError(f'Query parameter {value!r} should not contain \'"\'')
+            return value, f'"{value}"'
+        if isinstance(value, int | float) and not isinstance(value, bool) and numpy.isfinite(value):
+            return float(value), numpy.format_float_positional(float(value), trim='-')
+        raise ValueError(f'Query parameter {value!r} should be a string or a finite number')
+
+    # (connective, tokens, literal) of every clause, parameters replaced by the values given
+    def bind(self, params: list | None = None) -> list[tuple[str, list[str], float | str | Exception | None]]:
+        if not any(_parameter is not None for _parameter in self.parameters):
+            return self.__bound
+        params = params or EMPTY_LIST()
+        bound = EMPTY_LIST()
+        for (_connective, _tokens, _literal), _parameter in zip(self.__bound, self.parameters):
+            if _parameter is not None:
+                if _parameter >= len(params):
+                    raise ValueError(f'Query parameter ${_parameter + 1} is not given, {len(params)} given')
+                _literal, _token = self.__parameter(params[_parameter])
+                _tokens = [*_tokens[:2], _token, *_tokens[3:]]
+            bound.append((_connective, _tokens, _literal))
+        return bound
+
+    # the expression with its parameters written in, for evaluators taking text
+    def render(self, params: list | None = None) -> str:
+        if not any(_parameter is not None for _parameter in self.parameters):
+            return self.expr
+        clauses = EMPTY_LIST()
+        for _i, (_connective, _tokens, _) in enumerate(self.bind(params)):
+            if any(_character.isspace() for _character in _tokens[2]):
+                raise ValueError(f'Query parameter {_tokens[2]} should not contain spaces')
+            clauses.append(' '.join(_tokens if _i == 0 else [_connective, *_tokens]))
+        return ' '.join(clauses)
+
+    # document keys of the inverted index matching, as the dsl would find them,
+    # comparisons on keys ranged by numbers alone are answered by their range index
+    def matches(
+            self,
+            inverted_index: dict[str, dict[str, any]],
+            params: list | None = None,
+            ranges: dict[str, RangeIndex] | None = None
+    ) -> set[str]:
+        dsl = DipamkaraDsl(expr=self.expr, inverted_index=inverted_index)
+        matched: set[str] = EMPTY_SET()
+        for _connective, _tokens, _literal in self.bind(params):
+            _ranged = ranges.get(_tokens[0]) if ranges else None
+            if (_ranged is not None and _ranged.exact and len(_tokens) == 3
+                    and _tokens[1] in RANGE_COMPARISONS and isinstance(_literal, float)):
+                _matched = set(_ranged.select(_tokens[1], _literal).tolist())
+            else:
+                _matched = dsl.process_atomic(_tokens)
+            if _connective == FILTER_AND:
+                matched &= _matched
+            else:
+                matched |= _matched
+        return matched
+
+
+# bounded lru of compiled filters keyed by their text, shared by the threads querying an engine,
+# a parameterized text serves every binding of it
+class FilterCache:
+    def __init__(self, size: int = DEFAULT_FILTER_CACHE_SIZE):
+        self.__size = size
+        self.__filters: collections.OrderedDict[str, Filter] = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, expr: str) -> Filter:
+        with self.__lock:
+            compiled = self.__filters.get(expr)
+            if compiled is not None:
+                self.__filters.move_to_end(expr)
+                self.__hits += 1
+                return compiled
+            self.__misses += 1
+        # parsed outside the lock, two threads missing the same text both parse it
+        compiled = Filter(expr)
+        if self.__size > 0:
+            with self.__lock:
+                self.__filters[expr] = compiled
+                self.__filters.move_to_end(expr)
+                while len(self.__filters) > self.__size:
+                    self.__filters.popitem(last=False)
+        return compiled
+
+    def stats(self) -> dict[str, int]:
+        with self.__lock:
+            return {
+                'size': len(self.__filters),
+                'capacity': self.__size,
+                'hits': self.__hits,
+                'misses': self.__misses
+            }
@@ -0,0 +1,1065 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Coroutine
+
+import numpy
+from dipamkara.dipamkara_dsl import find_keywords_of_dipamkara_dsl
+from dipamkara.embedding import Metric
+from dipamkara.exception.dipamkara_dimension_error import DipamkaraDimensionError
+from dipamkara.exception.dipamkara_index_error import DipamkaraIndexError
+from dipamkara.exception.dipamkara_index_existence_error import DipamkaraIndexExistenceError
+from dipamkara.exception.dipamkara_vector_existence_error import DipamkaraVectorExistenceError
+
+from bhakti.const import (
+    NULL,
+    EMPTY_LIST,
+    EMPTY_DICT,
+    UTF_8,
+    DEFAULT_THREAD_POOL_SIZE,
+    DEFAULT_WAL_COMMIT_INTERVAL,
+    DEFAULT_WAL_COMMIT_SIZE,
+    DEFAULT_HNSW_M,
+    DEFAULT_HNSW_EF_CONSTRUCTION,
+    DEFAULT_HNSW_EF_SEARCH,
+    DEFAULT_IVF_NLIST,
+    DEFAULT_IVF_NPROBE,
+    DEFAULT_PQ_M,
+    DEFAULT_RERANK,
+    DEFAULT_FILTER_CACHE_SIZE,
+    DEFAULT_RESULT_CACHE_MB,
+    DEFAULT_RESULT_CACHE_TTL
+)
+from bhakti.database.ann_index import AnnIndex, AnnIndexType, SearchOptions, SEARCH_EF_SEARCH, SEARCH_NPROBE
+from bhakti.database.column_store import ColumnStore
+from bhakti.database.db_engine import DBEngine
+from bhakti.database.distance import find_distances, refine_nearest, top_k_nearest
+from bhakti.database.engine import Engine
+from bhakti.database.filter import FilterCache
+from bhakti.database.hnsw_index import HnswIndex
+from bhakti.database.ivf_index import IvfIndex
+from bhakti.database.projection import (
+    Projection,
+    PROJECTION_ID,
+    PROJECTION_DISTANCE,
+    PROJECTION_VECTOR,
+    PROJECTION_DOCUMENT
+)
+from bhakti.database.quantized_index import ScalarQuantizedIndex, ProductQuantizedIndex
+from bhakti.database.range_index import IndexKind
+from bhakti.database.result_cache import ResultCache
+from bhakti.database.snapshot import write_file
+from bhakti.database.vector_dtype import VectorDtype
+from bhakti.database.wal import WriteAheadLog, WAL_FILE, WAL_OP
+from bhakti.util.rwlock import RWLock
+
+log = logging.getLogger("dipamkara")
+
+FLAT_DIR = '.flat'
+FLAT_MANIFEST = 'manifest'
+FLAT_MIN_CAPACITY = 1024
+# scratch copy of the vectors behind a lossy index, the saved generations stay the durable one
+FLAT_VECTORS_MMAP = 'vectors.mmap'
+# rows of a float16 matrix are widened to float32 this many at a time, numpy has no float16 matrix product
+FLAT_CHUNK_ROWS = 65536
+# a filtered query searches the approximate index only if this share of the documents match,
+# a more selective filter leaves few enough to scan exactly
+FLAT_ANN_MIN_SELECTIVITY = 0.1
+ANN_INDICES = {
+    AnnIndexType.HNSW: HnswIndex,
+    AnnIndexType.IVF: IvfIndex,
+    AnnIndexType.SQ8: ScalarQuantizedIndex,
+    AnnIndexType.PQ: ProductQuantizedIndex
+}
+
+
+# every vector in one contiguous matrix of the dtype of the archive with its norms precomputed,
+# a query is a single matrix product against it and an argpartition for the top k,
+# documents and indices live in memory, keyed by document id, indexed keys also column-wise by row,
+# so a filter is a vectorized mask restricting the scan to the rows matching it,
+# keys indexed as ranges are kept in order of value as well, comparing them is a binary search,
+# distances are computed in the stored precision, float16 in float32,
+# an archive is only converted to another dtype when asked to, and not at all if vectors would merge
+#
+# writes are logged to a write-ahead log, save writes the whole state aside under a new generation
+# and commits it by replacing the manifest, recover replays the log after a restart,
+# without the log, writes since the last save are lost on a crash
+#
+# an approximate index (see bhakti.database.ann_index) answers queries of the metric it was built for,
+# it is maintained by every write and saved with the rest, or rebuilt from the vectors if it does not match them,
+# a trainable one is trained again in the background whenever writes leave it drifted, or on train_index,
+# the candidates it finds are re-scored exactly against the vectors before the nearest are returned,
+# a lossy one keeps only compressed codes in memory, the full vectors are memory-mapped from disk
+#
+# single vector queries may be answered from a result cache (see bhakti.database.result_cache),
+# every write and every training moves the version its results belong to
+class FlatEngine(Engine):
+    def __init__(
+            self,
+            dimension: int,
+            archive_path: str,
+            thread_pool_size: int = DEFAULT_THREAD_POOL_SIZE,
+            wal: bool = False,
+            wal_commit_interval: float = DEFAULT_WAL_COMMIT_INTERVAL,
+            wal_commit_size: int = DEFAULT_WAL_COMMIT_SIZE,
+            vector_index: AnnIndexType = AnnIndexType.NONE,
+            vector_index_metric: Metric = Metric.EUCLIDEAN,
+            hnsw_m: int = DEFAULT_HNSW_M,
+            hnsw_ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+            hnsw_ef_search: int = DEFAULT_HNSW_EF_SEARCH,
+            ivf_nlist: int = DEFAULT_IVF_NLIST,
+            ivf_nprobe: int = DEFAULT_IVF_NPROBE,
+            pq_m: int = DEFAULT_PQ_M,
+            rerank: int = DEFAULT_RERANK,
+            dtype: VectorDtype | None = None,
+            convert_dtype: bool = False,
+            filter_cache_size: int = DEFAULT_FILTER_CACHE_SIZE,
+            result_cache_mb: float = DEFAULT_RESULT_CACHE_MB,
+            result_cache_ttl: float = DEFAULT_RESULT_CACHE_TTL
+    ):
+        self.__dimension = dimension
+        # none for the dtype of the archive, saved vectors of another dtype are converted only if asked to
+        self.__requested_dtype = dtype
+        self.__convert_dtype = convert_dtype
+        self.__converted = False
+        self.__dtype = numpy.dtype((dtype or VectorDtype.DEFAULT_DTYPE).value)
+        self.__compute_dtype = self.__compute_dtype_of(self.__dtype)
+        self.__archive_path = archive_path
+        self.__path = os.path.join(archive_path, FLAT_DIR)
+        os.makedirs(self.__path, exist_ok=True)
+        self.__vector_index = vector_index
+        self.__vector_index_metric = vector_index_metric
+        self.__hnsw_m = hnsw_m
+        self.__hnsw_ef_construction = hnsw_ef_construction
+        self.__hnsw_ef_search = hnsw_ef_search
+        self.__ivf_nlist = ivf_nlist
+        self.__ivf_nprobe = ivf_nprobe
+        self.__pq_m = pq_m
+        self.__rerank = rerank
+        self.__ann: AnnIndex | None = self.__new_ann_index()
+        self.__training = asyncio.Lock()
+        self.__trainings: set[asyncio.Task] = set()
+        # rows [0, count) are live, a removed row is filled with the last one
+        self.__count = 0
+        self.__matrix = self.__new_matrix(FLAT_MIN_CAPACITY)
+        self.__norms = numpy.empty(FLAT_MIN_CAPACITY, dtype=self.__compute_dtype)
+        self.__ids = numpy.empty(FLAT_MIN_CAPACITY, dtype=numpy.int64)
+        # vector bytes => row, document id => row
+        self.__rows_of: dict[bytes, int] = EMPTY_DICT()
+        self.__row_of_id: dict[int, int] = EMPTY_DICT()
+        self.__documents: dict[int, dict[str, any]] = EMPTY_DICT()
+        # index => {document id string => value}, as the dipamkara dsl evaluates it
+        self.__inverted_index: dict[str, dict[str, any]] = EMPTY_DICT()
+        self.__columns = ColumnStore(FLAT_MIN_CAPACITY)
+        self.__filters = FilterCache(filter_cache_size)
+        self.__results = ResultCache(result_cache_mb, result_cache_ttl)
+        self.__version = 0
+        self.__auto_increment = NULL + 1
+        self.__generation = 0
+        self.__executor = ThreadPoolExecutor(max_workers=thread_pool_size, thread_name_prefix='bhakti-engine')
+        self.__rwlock = RWLock()
+        self.__saving = asyncio.Lock()
+        self.__snapshots: set[asyncio.Task] = set()
+        self.__committing = threading.Lock()
+        self.__recovering = False
+        self.__wal: WriteAheadLog | None = None
+        if wal:
+            self.__wal = WriteAheadLog(
+                path=os.path.join(archive_path, WAL_FILE),
+                commit_interval=wal_commit_interval,
+                commit_size=wal_commit_size
+            )
+        self.__load()
+
+    @property
+    def db_engine(self) -> DBEngine:
+        return DBEngine.FLAT
+
+    @property
+    def dimension(self) -> int:
+        return self.__dimension
+
+    @property
+    def dtype(self) -> VectorDtype:
+        return VectorDtype(self.__dtype.name)
+
+    @staticmethod
+    def __compute_dtype_of(dtype: numpy.dtype) -> numpy.dtype:
+        return numpy.dtype(numpy.float64 if dtype == numpy.float64 else numpy.float32)
+
+    def __new_ann_index(self) -> AnnIndex | None:
+        if self.__vector_index == AnnIndexType.HNSW:
+            return HnswIndex(
+                dimension=self.__dimension,
+                metric=self.__vector_index_metric,
+                m=self.__hnsw_m,
+                ef_construction=self.__hnsw_ef_construction,
+                ef_search=self.__hnsw_ef_search
+            )
+        if self.__vector_index == AnnIndexType.IVF:
+            return IvfIndex(
+                dimension=self.__dimension,
+                metric=self.__vector_index_metric,
+                nlist=self.__ivf_nlist,
+                nprobe=self.__ivf_nprobe
+            )
+        if self.__vector_index == AnnIndexType.SQ8:
+            return ScalarQuantizedIndex(dimension=self.__dimension, metric=self.__vector_index_metric)
+        if self.__vector_index == AnnIndexType.PQ:
+            return ProductQuantizedIndex(dimension=self.__dimension, metric=self.__vector_index_metric, m=self.__pq_m)
+        return None
+
+    # in memory, or memory-mapped from a scratch file behind a lossy index,
+    # a grown one replaces the file while the old mapping lives on until it is dropped
+    def __new_matrix(self, capacity: int) -> numpy.ndarray:
+        if self.__ann is None or not self.__ann.lossy:
+            return numpy.empty((capacity, self.__dimension), dtype=self.__dtype)
+        path = os.path.join(self.__path, FLAT_VECTORS_MMAP)
+        matrix = numpy.memmap(f'{path}.tmp', dtype=self.__dtype, mode='w+', shape=(capacity, self.__dimension))
+        os.replace(f'{path}.tmp', path)
+        return matrix
+
+    def __load_ann_index(self, generation: int):
+        if self.__ann is None:
+            return
+        path = os.path.join(self.__path, f'ann.{generation}.npz')
+        if os.path.exists(path):
+            with numpy.load(path) as arrays:
+                arrays = dict(arrays)
+            if str(arrays['type']) == self.__ann.type.value and str(arrays['metric']) == self.__ann.metric.value:
+                ann = ANN_INDICES[self.__ann.type].load(arrays)
+                if len(ann) == self.__count and all(_doc_id in ann for _doc_id in self.__row_of_id.keys()):
+                    ann.configure(SearchOptions({
+                        SEARCH_EF_SEARCH: self.__hnsw_ef_search, SEARCH_NPROBE: self.__ivf_nprobe
+                    }))
+                    self.__ann = ann
+                    return
+        log.info(f'Building {self.__ann.type.value} index of {self.__count} vectors')
+        self.__ann = self.__new_ann_index()
+        self.__ann.add(self.__ids[:self.__count], self.__matrix[:self.__count])
+
+    def __load(self):
+        manifest_path = os.path.join(self.__path, FLAT_MANIFEST)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, 'r', encoding=UTF_8) as file:
+            manifest = json.loads(file.read())
+        if manifest['dimension'] != self.__dimension:
+            log.warning(f'Dimension has been corrected to {manifest["dimension"]} '
+                        f'instead of {self.__dimension} based on existing data.')
+            self.__dimension = manifest['dimension']
+        generation = manifest['generation']
+        matrix = numpy.load(os.path.join(self.__path, f'vectors.{generation}.npy'), mmap_mode='r')
+        ids = numpy.load(os.path.join(self.__path, f'ids.{generation}.npy'))
+        if self.__requested_dtype is None:
+            self.__dtype = matrix.dtype
+            self.__compute_dtype = self.__compute_dtype_of(self.__dtype)
+        elif matrix.dtype != self.__dtype:
+            self.__check_conversion(matrix, ids)
+            log.warning(f'Converting {len(ids)} vectors saved as {matrix.dtype} to {self.__dtype}')
+            self.__converted = True
+        with open(os.path.join(self.__path, f'documents.{generation}'), 'r', encoding=UTF_8) as file:
+            documents = json.loads(file.read())
+        self.__generation = generation
+        self.__auto_increment = manifest['auto_increment']
+        self.__matrix = self.__new_matrix(max(FLAT_MIN_CAPACITY, 2 * len(ids)))
+        self.__norms = numpy.empty(len(self.__matrix), dtype=self.__compute_dtype)
+        self.__ids = numpy.empty(len(self.__matrix), dtype=numpy.int64)
+        self.__columns = ColumnStore(len(self.__matrix))
+        self.__count = len(ids)
+        self.__matrix[:self.__count] = matrix.reshape(self.__count, self.__dimension)
+        self.__norms[:self.__count] = self.__norms_of(self.__matrix[:self.__count])
+        self.__ids[:self.__count] = ids
+        self.__documents = {int(_doc_id): _document for _doc_id, _document in documents.items()}
+        for _row, _doc_id in enumerate(ids.tolist()):
+            self.__rows_of[self.__matrix[_row].tobytes()] = _row
+            self.__row_of_id[_doc_id] = _row
+        for _index in manifest['indices']:
+            self.__inverted_index[_index] = EMPTY_DICT()
+            self.__update_index(_index)
+        for _index in manifest.get('ranges', EMPTY_LIST()):
+            self.__columns.rank(_index, self.__count)
+        self.__load_ann_index(generation)
+
+    # vectors saved in another dtype are converted only if asked to, and only if they still tell apart
+    def __check_conversion(self, matrix: numpy.ndarray, ids: numpy.ndarray):
+        if not self.__convert_dtype:
+            raise ValueError(f'Archive {self.__archive_path} stores vectors as {matrix.dtype}, '
+                             f'convert_dtype converts it to {self.__dtype}')
+        doc_ids: dict[bytes, int] = EMPTY_DICT()
+        for _row, _doc_id in enumerate(ids.tolist()):
+            _key = self.__key_of(matrix[_row])
+            if _key in doc_ids.keys():
+                raise ValueError(f'Documents {doc_ids[_key]} and {_doc_id} have vectors {self.__dtype} cannot tell apart, '
+                                 f'archive {self.__archive_path} is left as {matrix.dtype}')
+            doc_ids[_key] = _doc_id
+
+    def __update_index(self, index: str):
+        values = self.__inverted_index[index]
+        for _doc_id, _document in self.__documents.items():
+            if index in _document.keys():
+                values[str(_doc_id)] = _document[index]
+        self.__columns.add(index, [self.__documents[_doc_id] for _doc_id in self.__ids[:self.__count].tolist()])
+
+    def __key_of(self, vector: numpy.ndarray | str) -> bytes:
+        if isinstance(vector, str):
+            vector = json.loads(vector)
+        return numpy.ascontiguousarray(vector, dtype=self.__dtype).tobytes()
+
+    def __check_dimension(self, vectors: numpy.ndarray):
+        if vectors.ndim != 2 or vectors.shape[1] != self.__dimension:
+            raise DipamkaraDimensionError(f'Vectors of shape {vectors.shape} '
+                                          f'should be of shape (n, {self.__dimension})')
+
+    @staticmethod
+    async def __complete(future: asyncio.Future) -> any:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the lock must outlive the worker still touching the engine
+            await asyncio.wait({future})
+            raise
+
+    async def __read(self, function: callable, *args) -> any:
+        async with self.__rwlock.read():
+            return await self.__complete(
+                asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+            )
+
+    async def __write(self, function: callable, *args, record: dict | None = None) -> any:
+        committed = None
+        async with self.__rwlock.write():
+            try:
+                result = await self.__complete(
+                    asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+                )
+            finally:
+                self.__version += 1
+            if record is not None:
+                committed = self.__wal.append(record)
+        self.__train_if_drifted()
+        # waited for outside the lock, so writes behind this one join the same commit
+        if committed is not None:
+            await committed
+        return result
+
+    def __train_if_drifted(self):
+        if self.__ann is not None and self.__ann.drifted and not self.__training.locked():
+            training = asyncio.ensure_future(self.__train(forced=False))
+            self.__trainings.add(training)
+            training.add_done_callback(self.__training_done)
+
+    def __training_done(self, training: asyncio.Task):
+        self.__trainings.discard(training)
+        if not training.cancelled() and training.exception() is not None:
+            log.error(f'Training {self.__ann.type.value} index failed: {training.exception()}')
+
+    def __training_sample(self) -> numpy.ndarray:
+        if self.__count <= self.__ann.training_size:
+            return self.__matrix[:self.__count].copy()
+        return self.__matrix[numpy.sort(numpy.random.default_rng().choice(self.__count, self.__ann.training_size, replace=False))]
+
+    # fits a sample copied under the read lock while reads and writes go on,
+    # only applying the model holds the writers off
+    async def __train(self, forced: bool) -> bool:
+        loop = asyncio.get_running_loop()
+        async with self.__training:
+            if not forced and not self.__ann.drifted:
+                return False
+            start = loop.time()
+            sample = await self.__read(self.__training_sample)
+            model = await self.__complete(loop.run_in_executor(self.__executor, self.__ann.fit, sample))
+            async with self.__rwlock.write():
+                try:
+                    await self.__complete(loop.run_in_executor(
+                        self.__executor, self.__ann.refit, model, self.__ids[:self.__count], self.__matrix[:self.__count]
+                    ))
+                finally:
+                    self.__version += 1
+            log.info(f'Trained {self.__ann.type.value} index on {len(sample)} vectors '
+                     f'in {round(loop.time() - start, 3)} seconds')
+            return True
+
+    async def train_index(self) -> bool:
+        if self.__ann is None or not self.__ann.trainable:
+            return False
+        return await self.__train(forced=True)
+
+    # vectors are logged as lists, nothing is logged without a log or while replaying it
+    def __record(self, op: str, **params) -> dict | None:
+        if self.__wal is None or self.__recovering:
+            return None
+        record = {WAL_OP: op}
+        for _key, _value in params.items():
+            record[_key] = _value.tolist() if isinstance(_value, numpy.ndarray) else _value
+        return record
+
+    async def recover(self):
+        self.__train_if_drifted()
+        records = self.__wal.records() if self.__wal is not None else EMPTY_LIST()
+        if not records:
+            # an archive converted to another dtype is saved in it
+            if self.__converted:
+                await self.save()
+            return
+        log.info(f'Replaying {len(records)} records of write-ahead log {self.__wal.path}')
+        self.__recovering = True
+        try:
+            for _record in records:
+                params = dict(_record)
+                op = params.pop(WAL_OP)
+                if 'vector' in params.keys():
+                    params['vector'] = numpy.asarray(params['vector'], dtype=numpy.float64)
+                if 'vectors' in params.keys():
+                    params['vectors'] = numpy.asarray(params['vectors'], dtype=numpy.float64).reshape(-1, self.__dimension)
+                try:
+                    if op == 'create':
+                        await self.create(**params)
+                    elif op == 'create_many':
+                        await self.create_many(**params)
+                    elif op == 'remove_by_vector':
+                        await self.remove_by_vector(**params)
+                    elif op == 'indexed_remove':
+                        await self.indexed_remove(**params)
+                    elif op == 'create_index':
+                        await self.create_index(**params)
+                    elif op == 'remove_index':
+                        await self.remove_index(**params)
+                    elif op == 'mod_doc_by_vector':
+                        await self.mod_doc_by_vector(**params)
+                    else:
+                        raise ValueError(f'Unknown write-ahead log op "{op}"')
+                except Exception as error:
+                    # writes already saved fail again harmlessly, e.g. creating an existing vector
+                    log.debug(f'Skipped write-ahead log record {op}: {error}')
+        finally:
+            self.__recovering = False
+        await self.save()
+
+    def __insight(self) -> dict:
+        return {
+            "archive_dir": self.__archive_path,
+            "enable_cache": True,
+            "auto_increment": self.__auto_increment,
+            "vectors": {
+                json.dumps(self.__matrix[_row].astype(numpy.float64).tolist(), ensure_ascii=True): int(self.__ids[_row])
+                for _row in range(self.__count)
+            },
+            "inverted_indices": self.__inverted_index,
+            "range_indices": self.__ranges(),
+            "cached_docs": self.__documents,
+            "filter_cache": self.__filters.stats(),
+            "result_cache": self.__results.stats()
+        }
+
+    async def insight(self) -> dict:
+        return await self.__read(self.__insight)
+
+    # copies the state under the write lock, written out in the background
+    async def save(self, wait: bool = True):
+        snapshot = asyncio.ensure_future(self.__take_snapshot())
+        self.__snapshots.add(snapshot)
+        snapshot.add_done_callback(self.__snapshot_done)
+        if wait:
+            await asyncio.shield(snapshot)
+
+    def __snapshot_done(self, snapshot: asyncio.Task):
+        self.__snapshots.discard(snapshot)
+        if not snapshot.cancelled() and snapshot.exception() is not None:
+            log.error(f'Snapshot failed: {snapshot.exception()}')
+
+    async def __take_snapshot(self):
+        loop = asyncio.get_running_loop()
+        async with self.__saving:
+            seq = None
+            async with self.__rwlock.write():
+                self.__generation += 1
+                # documents are replaced rather than modified in place, a shallow copy holds them
+                state = (
+                    self.__generation,
+                    self.__matrix[:self.__count].copy(),
+                    self.__ids[:self.__count].copy(),
+                    dict(self.__documents),
+                    list(self.__inverted_index.keys()),
+                    self.__ranges(),
+                    self.__auto_increment,
+                    self.__ann.dump() if self.__ann is not None else None
+                )
+                if self.__wal is not None:
+                    seq = await self.__wal.rotate()
+            await self.__complete(loop.run_in_executor(self.__executor, self.__commit, *state))
+            if seq is not None:
+                await loop.run_in_executor(None, self.__wal.discard, seq)
+
+    def __commit(
+            self,
+            generation: int,
+            matrix: numpy.ndarray,
+            ids: numpy.ndarray,
+            documents: dict[int, dict[str, any]],
+            indices: list[str],
+            ranges: list[str],
+            auto_increment: int,
+            ann: dict[str, numpy.ndarray] | None
+    ):
+        with self.__committing:
+            for _name, _array in ((f'vectors.{generation}.npy', matrix), (f'ids.{generation}.npy', ids)):
+                with open(os.path.join(self.__path, f'{_name}.tmp'), 'wb') as file:
+                    numpy.save(file, _array)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(os.path.join(self.__path, f'{_name}.tmp'), os.path.join(self.__path, _name))
+            if ann is not None:
+                with open(os.path.join(self.__path, f'ann.{generation}.npz.tmp'), 'wb') as file:
+                    numpy.savez(file, **ann)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(
+                    os.path.join(self.__path, f'ann.{generation}.npz.tmp'),
+                    os.path.join(self.__path, f'ann.{generation}.npz')
+                )
+            write_file(
+                os.path.join(self.__path, f'documents.{generation}'),
+                json.dumps(documents, ensure_ascii=False),
+                durable=True
+            )
+            write_file(
+                os.path.join(self.__path, FLAT_MANIFEST),
+                json.dumps({
+                    'dimension': self.__dimension,
+                    'generation': generation,
+                    'auto_increment': auto_increment,
+                    'indices': indices,
+                    'ranges': ranges
+                }, ensure_ascii=False),
+                durable=True
+            )
+            for _entry in os.listdir(self.__path):
+                _parts = _entry.split('.')
+                if len(_parts) > 1 and _parts[1].isdigit() and int(_parts[1]) < generation:
+                    os.remove(os.path.join(self.__path, _entry))
+
+    def __grown(self, array: numpy.ndarray, capacity: int) -> numpy.ndarray:
+        grown = numpy.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:self.__count] = array[:self.__count]
+        return grown
+
+    # without the squared copy of the matrix numpy.linalg.norm makes, accumulated in the compute precision
+    def __norms_of(self, matrix: numpy.ndarray) -> numpy.ndarray:
+        return numpy.sqrt(numpy.einsum('ij,ij->i', matrix, matrix, dtype=self.__compute_dtype))
+
+    # appends validated vectors, growing the matrix by doubling
+    def __append(self, vectors: numpy.ndarray, documents: list[dict[str, any]], keys: list[bytes]):
+        count = self.__count + len(vectors)
+        if count > len(self.__matrix):
+            capacity = max(2 * len(self.__matrix), count)
+            matrix = self.__new_matrix(capacity)
+            matrix[:self.__count] = self.__matrix[:self.__count]
+            self.__matrix = matrix
+            self.__norms = self.__grown(self.__norms, capacity)
+            self.__ids = self.__grown(self.__ids, capacity)
+            self.__columns.grow(capacity, self.__count)
+        rows = slice(self.__count, count)
+        self.__matrix[rows] = vectors
+        self.__norms[rows] = self.__norms_of(self.__matrix[rows])
+        for _row, _key, _document in zip(range(self.__count, count), keys, documents):
+            doc_id = self.__auto_increment
+            self.__auto_increment += 1
+            self.__ids[_row] = doc_id
+            self.__rows_of[_key] = _row
+            self.__row_of_id[doc_id] = _row
+            self.__documents[doc_id] = _document
+            self.__columns.set(_row, _document)
+            for _index, _values in self.__inverted_index.items():
+                if _index in _document.keys():
+                    _values[str(doc_id)] = _document[_index]
+        self.__count = count
+        if self.__ann is not None:
+            self.__ann.add(self.__ids[rows], self.__matrix[rows])
+
+    def __index(self, indices: list[str]):
+        for _index in indices:
+            if not find_keywords_of_dipamkara_dsl(_index) and _index not in self.__inverted_index.keys():
+                self.__inverted_index[_index] = EMPTY_DICT()
+                self.__update_index(_index)
+
+    def __create(self, vector: numpy.ndarray, document: dict[str, any], indices: list[str]) -> bool:
+        self.__check_dimension(vector[numpy.newaxis, :])
+        key = self.__key_of(vector)
+        if key in self.__rows_of.keys():
+            raise DipamkaraVectorExistenceError(f'Vector {vector} already exists')
+        for _index in indices:
+            if not find_keywords_of_dipamkara_dsl(_index) and _index not in document.keys():
+                raise DipamkaraIndexError(f'Index "{_index}" is not a key of {document.keys()}, '
+                                          f'try .create_index("{_index}") '
+                                          f'if you want to build index on "{_index}"')
+        self.__append(vector[numpy.newaxis, :], [document], [key])
+        self.__index(indices)
+        return True
+
+    async def create(
+            self,
+            vector: numpy.ndarray,
+            document: dict[str, any],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> bool:
+        indices = indices or EMPTY_LIST()
+        return await self.__write(
+            self.__create, vector, document, indices,
+            record=self.__record('create', vector=vector, document=document, indices=indices)
+        )
+
+    # items failing validation are skipped and reported as False
+    def __create_many(self, vectors: numpy.ndarray, documents: list[dict[str, any]], indices: list[str]) -> list[bool]:
+        if len(vectors) == 0:
+            return EMPTY_LIST()
+        self.__check_dimension(vectors)
+        if len(vectors) != len(documents):
+            raise ValueError(f'{len(vectors)} vectors given for {len(documents)} documents')
+        indices = [_index for _index in indices if not find_keywords_of_dipamkara_dsl(_index)]
+        status = EMPTY_LIST()
+        accepted: list[int] = EMPTY_LIST()
+        keys: list[bytes] = EMPTY_LIST()
+        batch_keys = set()
+        for _i, (_vector, _document) in enumerate(zip(vectors, documents)):
+            _key = self.__key_of(_vector)
+            if _key in self.__rows_of.keys() or _key in batch_keys:
+                log.debug(f'Vector {_vector.tolist()} already exists')
+                status.append(False)
+            elif any(_index not in _document.keys() for _index in indices):
+                log.debug(f'Indices {indices} are not all keys of {_document.keys()}')
+                status.append(False)
+            else:
+                batch_keys.add(_key)
+                accepted.append(_i)
+                keys.append(_key)
+                status.append(True)
+        if accepted:
+            self.__append(vectors[accepted], [documents[_i] for _i in accepted], keys)
+            self.__index(indices)
+        return status
+
+    async def create_many(
+            self,
+            vectors: numpy.ndarray,
+            documents: list[dict[str, any]],
+            indices: list[str] = None,
+            cached: bool = False
+    ) -> list[bool]:
+        indices = indices or EMPTY_LIST()
+        return await self.__write(
+            self.__create_many, vectors, documents, indices,
+            record=self.__record('create_many', vectors=vectors, documents=documents, indices=indices)
+        )
+
+    def __ranges(self) -> list[str]:
+        return [_index for _index in self.__inverted_index.keys() if self.__columns.ranked(_index)]
+
+    # a range index is an inverted one kept in order of value too, an inverted one may be ranked later
+    def __create_index(self, index: str, kind: IndexKind) -> dict:
+        if find_keywords_of_dipamkara_dsl(index):
+            return EMPTY_DICT()
+        if index in self.__inverted_index.keys() and (kind != IndexKind.RANGE or self.__columns.ranked(index)):
+            raise DipamkaraIndexExistenceError(f'Index "{index}" exists')
+        if index not in self.__inverted_index.keys():
+            self.__inverted_index[index] = EMPTY_DICT()
+            self.__update_index(index)
+        if kind == IndexKind.RANGE:
+            self.__columns.rank(index, self.__count)
+        return dict(self.__inverted_index[index])
+
+    async def create_index(self, index: str, kind: IndexKind | str = IndexKind.DEFAULT_KIND) -> dict:
+        kind = IndexKind(kind)
+        return await self.__write(
+            self.__create_index, index, kind, record=self.__record('create_index', index=index, kind=kind.value)
+        )
+
+    def __remove_index(self, index: str) -> bool:
+        if index not in self.__inverted_index.keys():
+            raise DipamkaraIndexExistenceError(f'Index "{index}" not exists')
+        del self.__inverted_index[index]
+        self.__columns.remove(index)
+        return True
+
+    async def remove_index(self, index: str) -> bool:
+        return await self.__write(self.__remove_index, index, record=self.__record('remove_index', index=index))
+
+    # every document is held in memory, there is no cache to invalidate
+    def __invalidate_cached_doc_by_vector(self, vector: numpy.ndarray | str) -> bool:
+        if self.__key_of(vector) not in self.__rows_of.keys():
+            raise DipamkaraVectorExistenceError(f'Vector {vector} not exists')
+        return False
+
+    async def invalidate_cached_doc_by_vector(self, vector: numpy.ndarray | str) -> bool:
+        return await self.__read(self.__invalidate_cached_doc_by_vector, vector)
+
+    def __remove_row(self, row: int):
+        doc_id = int(self.__ids[row])
+        del self.__rows_of[self.__matrix[row].tobytes()]
+        del self.__row_of_id[doc_id]
+        del self.__documents[doc_id]
+        for _values in self.__inverted_index.values():
+            _values.pop(str(doc_id), None)
+        if self.__ann is not None:
+            self.__ann.remove(doc_id)
+        last = self.__count - 1
+        self.__columns.clear(row)
+        if row != last:
+            self.__columns.move(last, row)
+            self.__matrix[row] = self.__matrix[last]
+            self.__norms[row] = self.__norms[last]
+            self.__ids[row] = self.__ids[last]
+            self.__rows_of[self.__matrix[row].tobytes()] = row
+            self.__row_of_id[int(self.__ids[row])] = row
+        self.__count = last
+
+    def __remove_by_vector(self, vector: numpy.ndarray | str) -> bool:
+        row = self.__rows_of.get(self.__key_of(vector))
+        if row is None:
+            return False
+        self.__remove_row(row)
+        return True
+
+    async def remove_by_vector(self, vector: numpy.ndarray | str, insta_save: bool = True) -> bool:
+        return await self.__write(
+            self.__remove_by_vector, vector, record=self.__record('remove_by_vector', vector=vector)
+        )
+
+    def __indexed_remove(self, query: str, query_params: list | None) -> bool:
+        # rows move as others are removed, the documents do not
+        for _doc_id in self.__ids[self.__filtered_rows(query, query_params)].tolist():
+            self.__remove_row(self.__row_of_id[_doc_id])
+        return True
+
+    async def indexed_remove(self, query: str, query_params: list | None = None) -> bool:
+        return await self.__write(
+            self.__indexed_remove, query, query_params,
+            record=self.__record('indexed_remove', query=query, query_params=query_params)
+        )
+
+    def __mod_doc_by_vector(self, vector: numpy.ndarray | str, key: str, value: any) -> bool:
+        row = self.__rows_of.get(self.__key_of(vector))
+        if row is None:
+            raise DipamkaraVectorExistenceError(f'Vector {vector} not exists')
+        doc_id = int(self.__ids[row])
+        if key not in self.__documents[doc_id].keys():
+            raise KeyError(f'Key "{key}" not exists')
+        # replaced rather than modified, snapshots in flight hold the old one
+        self.__documents[doc_id] = {**self.__documents[doc_id], key: value}
+        if key in self.__inverted_index.keys():
+            self.__inverted_index[key][str(doc_id)] = value
+            self.__columns.set(row, self.__documents[doc_id])
+        return True
+
+    async def mod_doc_by_vector(self, vector: numpy.ndarray | str, key: str, value: any) -> bool:
+        return await self.__write(
+            self.__mod_doc_by_vector, vector, key, value,
+            record=self.__record('mod_doc_by_vector', vector=vector, key=key, value=value)
+        )
+
+    async def vector_query(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return (await self.__cached(
+            self.__read(self.__vector_query, vectors, metric, top_k, None, search),
+            ResultCache.key('vector_query', vectors, metric, top_k, search=search)
+        ))[0]
+
+    async def vector_query_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[numpy.ndarray, numpy.float64]]]:
+        return await self.__read(self.__vector_query, vectors, metric, top_k, None, search)
+
+    async def indexed_vector_query(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[numpy.ndarray, numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return (await self.__cached(
+            self.__read(self.__vector_query, vectors, metric, top_k, query, search, query_params),
+            ResultCache.key('vector_query', vectors, metric, top_k, query, query_params, search=search)
+        ))[0]
+
+    async def find_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return (await self.__cached(
+            self.__read(self.__find_documents, vectors, metric, top_k, None, search),
+            ResultCache.key('find_documents', vectors, metric, top_k, search=search)
+        ))[0]
+
+    async def find_documents_by_vector_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None
+    ) -> list[list[tuple[dict[str, any], numpy.float64]]]:
+        return await self.__read(self.__find_documents, vectors, metric, top_k, None, search)
+
+    async def find_documents_by_vector_indexed(
+            self,
+            query: str,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[tuple[dict[str, any], numpy.float64]]:
+        vectors = numpy.asarray(vector)[numpy.newaxis, :]
+        return (await self.__cached(
+            self.__read(self.__find_documents, vectors, metric, top_k, query, search, query_params),
+            ResultCache.key('find_documents', vectors, metric, top_k, query, query_params, search=search)
+        ))[0]
+
+    async def iter_documents_by_vector(
+            self,
+            vector: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            cached: bool = False,
+            chunk_size: int = 1,
+            search: SearchOptions | None = None
+    ) -> AsyncIterator[list[tuple[dict[str, any], numpy.float64]]]:
+        chunk_size = max(1, chunk_size)
+        (ids,) = await self.__read(self.__knn_ids, numpy.asarray(vector)[numpy.newaxis, :], metric, top_k, search)
+        for _offset in range(0, len(ids), chunk_size):
+            yield await self.__read(self.__read_documents, ids[_offset:_offset + chunk_size])
+
+    async def query_projected(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: Projection,
+            query: str | None = None,
+            cached: bool = False,
+            search: SearchOptions | None = None,
+            query_params: list | None = None
+    ) -> list[list[dict[str, any]]]:
+        read = self.__read(self.__query_projected, vectors, metric, top_k, projection, query, search, query_params)
+        if len(vectors) != 1:
+            return await read
+        return await self.__cached(
+            read, ResultCache.key('query_projected', vectors, metric, top_k, query, query_params, projection, search)
+        )
+
+    # a result read before a write finished is never kept, the version moved under it
+    async def __cached(self, read: Coroutine, key: tuple) -> any:
+        if not self.__results.enabled:
+            return await read
+        version = self.__version
+        result = self.__results.get(key, version)
+        if result is not None:
+            read.close()
+            return result
+        result = await read
+        self.__results.put(key, version, result)
+        return result
+
+    # rows matching a dipamkara dsl query, ascending, its $n parameters bound to the params given
+    def __filtered_rows(self, query: str, query_params: list | None) -> numpy.ndarray:
+        return numpy.flatnonzero(self.__columns.mask(
+            self.__filters.get(query), query_params, self.__count, self.__inverted_index, self.__row_of_id
+        ))
+
+    def __vector_query(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            query: str | None,
+            search: SearchOptions | None,
+            query_params: list | None = None
+    ) -> list[list[tuple[numpy.ndarray, numpy.float64]]]:
+        return [
+            [(self.__matrix[_row].copy(), distance) for _row, distance in _rows]
+            for _rows in self.__knn_batch(vectors, metric, top_k, query, search, query_params)
+        ]
+
+    def __find_documents(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            query: str | None,
+            search: SearchOptions | None,
+            query_params: list | None = None
+    ) -> list[list[tuple[dict[str, any], numpy.float64]]]:
+        return [
+            [(dict(self.__documents[int(self.__ids[_row])]), distance) for _row, distance in _rows]
+            for _rows in self.__knn_batch(vectors, metric, top_k, query, search, query_params)
+        ]
+
+    # rows move on writes, document ids do not
+    def __knn_ids(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            search: SearchOptions | None
+    ) -> list[list[tuple[int, numpy.float64]]]:
+        return [
+            [(int(self.__ids[_row]), distance) for _row, distance in _rows]
+            for _rows in self.__knn_batch(vectors, metric, top_k, None, search)
+        ]
+
+    # documents removed since their ids were found are skipped
+    def __read_documents(self, ids: list[tuple[int, numpy.float64]]) -> list[tuple[dict[str, any], numpy.float64]]:
+        return [
+            (dict(self.__documents[_doc_id]), distance) for _doc_id, distance in ids if _doc_id in self.__documents.keys()
+        ]
+
+    def __query_projected(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            projection: Projection,
+            query: str | None,
+            search: SearchOptions | None,
+            query_params: list | None
+    ) -> list[list[dict[str, any]]]:
+        results = EMPTY_LIST()
+        for _rows in self.__knn_batch(vectors, metric, top_k, query, search, query_params):
+            _results = EMPTY_LIST()
+            for _row, distance in _rows:
+                _result = EMPTY_DICT()
+                doc_id = int(self.__ids[_row])
+                if projection.id:
+                    _result[PROJECTION_ID] = doc_id
+                if projection.distance:
+                    _result[PROJECTION_DISTANCE] = distance
+                if projection.vector:
+                    _result[PROJECTION_VECTOR] = self.__matrix[_row].copy()
+                if projection.reads_document:
+                    _document = self.__documents[doc_id]
+                    if projection.document:
+                        _result[PROJECTION_DOCUMENT] = dict(_document)
+                    else:
+                        _result[PROJECTION_DOCUMENT] = {
+                            _key: _document[_key] for _key in projection.document_keys if _key in _document.keys()
+                        }
+                _results.append(_result)
+            results.append(_results)
+        return results
+
+    # per query: [(row, distance)], nearest first, a query restricts the search to the documents matching it
+    def __knn_batch(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            query: str | None,
+            search: SearchOptions | None,
+            query_params: list | None = None
+    ) -> list[list[tuple[int, numpy.float64]]]:
+        vectors = numpy.asarray(vectors)
+        if len(vectors) == 0:
+            return EMPTY_LIST()
+        self.__check_dimension(vectors)
+        subset = self.__filtered_rows(query, query_params) if query is not None else None
+        if (
+                self.__ann is not None and self.__ann.trained and self.__ann.metric == metric and
+                (subset is None or len(subset) >= FLAT_ANN_MIN_SELECTIVITY * self.__count)
+        ):
+            matched = set(self.__ids[subset].tolist()) if subset is not None else None
+            if self.__ann.lossy and self.__rerank == 0:
+                return [
+                    [(self.__row_of_id[_doc_id], numpy.float64(_distance)) for _doc_id, _distance in _labels]
+                    for _labels in self.__ann.search(vectors, top_k, search or SearchOptions(), matched)
+                ]
+            # distances an index computes are not those of a scan, candidates are re-scored exactly,
+            # a lossy index finds rerank of them per result
+            candidates = top_k * self.__rerank if self.__ann.lossy else top_k
+            return self.__reranked(
+                numpy.asarray(vectors, dtype=self.__compute_dtype), metric, top_k,
+                self.__ann.search(vectors, candidates, search or SearchOptions(), matched)
+            )
+        matrix = self.__matrix[:self.__count]
+        norms = self.__norms[:self.__count]
+        if subset is not None:
+            matrix = matrix[subset]
+            norms = norms[subset]
+        queries = numpy.asarray(vectors, dtype=self.__compute_dtype)
+        distances = self.__distances(queries, matrix, norms, metric)
+        nearest = refine_nearest(queries, matrix, distances, top_k_nearest(distances, top_k), metric)
+        rows = EMPTY_LIST()
+        for _query, _columns in enumerate(nearest.tolist()):
+            _rows = _columns if subset is None else subset[_columns].tolist()
+            rows.append([
+                (_row, numpy.float64(distances[_query, _column])) for _row, _column in zip(_rows, _columns)
+            ])
+        return rows
+
+    # exact distances to the candidates an index found, behind a lossy one only their rows are read from disk
+    def __reranked(
+            self,
+            vectors: numpy.ndarray,
+            metric: Metric,
+            top_k: int,
+            candidates: list[list[tuple[int, float]]]
+    ) -> list[list[tuple[int, numpy.float64]]]:
+        rows = EMPTY_LIST()
+        for _vector, _labels in zip(vectors, candidates):
+            _rows = numpy.fromiter((self.__row_of_id[_doc_id] for _doc_id, _ in _labels), dtype=numpy.intp)
+            _vectors = self.__matrix[_rows]
+            _distances = self.__distances(_vector[numpy.newaxis, :], _vectors, self.__norms[_rows], metric)
+            _order = refine_nearest(
+                _vector[numpy.newaxis, :], _vectors, _distances, top_k_nearest(_distances, top_k), metric
+            )[0]
+            _distances = _distances[0]
+            rows.append([(int(_rows[_i]), numpy.float64(_distances[_i])) for _i in _order.tolist()])
+        return rows
+
+    @staticmethod
+    def __products(queries: numpy.ndarray, matrix: numpy.ndarray) -> numpy.ndarray:
+        if matrix.dtype == queries.dtype:
+            return queries @ matrix.T
+        products = numpy.empty((len(queries), len(matrix)), dtype=queries.dtype)
+        for _offset in range(0, len(matrix), FLAT_CHUNK_ROWS):
+            _rows = matrix[_offset:_offset + FLAT_CHUNK_ROWS].astype(queries.dtype)
+            products[:, _offset:_offset + len(_rows)] = queries @ _rows.T
+        return products
+
+    # one matrix product against the stored vectors, their norms are already known
+    def __distances(self, queries: numpy.ndarray, matrix: numpy.ndarray, norms: numpy.ndarray, metric: Metric) -> numpy.ndarray:
+        if metric not in (Metric.EUCLIDEAN, Metric.COSINE, Metric.EUCLIDEAN_L2):
+            return find_distances(queries=queries, vectors=matrix.astype(queries.dtype, copy=False), metric=metric)
+        products = self.__products(queries, matrix)
+        query_norms = numpy.linalg.norm(queries, axis=1)
+        if metric == Metric.EUCLIDEAN:
+            # ||q - v||^2 = ||q||^2 + ||v||^2 - 2 q.v, clipped against rounding below zero
+            squared = (query_norms * query_norms)[:, numpy.newaxis] + (norms * norms)[numpy.newaxis, :] - 2 * products
+            return numpy.sqrt(numpy.maximum(squared, 0))
+        cosines = products / numpy.outer(query_norms, norms)
+        if metric == Metric.COSINE:
+            return 1 - cosines
+        # between unit vectors ||q - v||^2 = 2 - 2 cos
+        return numpy.sqrt(numpy.maximum(2 - 2 * cosines, 0))
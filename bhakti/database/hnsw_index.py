@@ -0,0 +1,365 @@
+import math
+
+import numpy
+from dipamkara.embedding import Metric
+
+from bhakti.const import EMPTY_LIST, EMPTY_DICT, DEFAULT_HNSW_M, DEFAULT_HNSW_EF_CONSTRUCTION, DEFAULT_HNSW_EF_SEARCH
+from bhakti.database.ann_index import AnnIndex, AnnIndexType, SearchOptions
+
+HNSW_MIN_CAPACITY = 1024
+HNSW_MAX_LEVEL = 16
+HNSW_METRICS = (Metric.EUCLIDEAN, Metric.COSINE)
+NO_LINK = -1
+# candidates expanded per step of a layer search, their links are gathered and scored as one batch
+HNSW_EXPANSION = 16
+
+
+# hierarchical navigable small world graph (Malkov & Yashunin), kept by the flat engine only,
+# the dipamkara engine always scans its store exactly
+# links live in fixed width arrays padded with NO_LINK, layer 0 for every node, upper layers for the few nodes reaching them,
+# removed nodes stay in the graph as waypoints until they outnumber the live ones and the graph is rebuilt
+#
+# searches and neighbour selection work on numpy arrays rather than heaps and sets of nodes,
+# a layer search expands its nearest few candidates at a time and scores all their links in one product
+#
+# euclidean graphs compare squared distances, cosine graphs unit vectors
+class HnswIndex(AnnIndex):
+    def __init__(
+            self,
+            dimension: int,
+            metric: Metric = Metric.EUCLIDEAN,
+            m: int = DEFAULT_HNSW_M,
+            ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+            ef_search: int = DEFAULT_HNSW_EF_SEARCH
+    ):
+        if metric not in HNSW_METRICS:
+            raise ValueError(f'HNSW supports {[_metric.value for _metric in HNSW_METRICS]}, not {metric.value}')
+        self.__dimension = dimension
+        self.__metric = metric
+        self.__m = m
+        self.__m0 = 2 * m
+        self.__ef_construction = ef_construction
+        self.__ef_search = ef_search
+        self.__ml = 1 / math.log(max(m, 2))
+        self.__rng = numpy.random.default_rng()
+        self.__vectors = numpy.empty((HNSW_MIN_CAPACITY, dimension), dtype=numpy.float32)
+        self.__labels = numpy.empty(HNSW_MIN_CAPACITY, dtype=numpy.int64)
+        self.__levels = numpy.zeros(HNSW_MIN_CAPACITY, dtype=numpy.int8)
+        self.__links0 = numpy.full((HNSW_MIN_CAPACITY, self.__m0), NO_LINK, dtype=numpy.int32)
+        # node => (level, m) links of layers 1..level
+        self.__upper: dict[int, numpy.ndarray] = EMPTY_DICT()
+        self.__count = 0
+        self.__node_of: dict[int, int] = EMPTY_DICT()
+        self.__removed: set[int] = set()
+        self.__entry = NO_LINK
+        self.__max_level = -1
+
+    @property
+    def type(self) -> AnnIndexType:
+        return AnnIndexType.HNSW
+
+    @property
+    def metric(self) -> Metric:
+        return self.__metric
+
+    def __len__(self) -> int:
+        return len(self.__node_of)
+
+    def __contains__(self, label: int) -> bool:
+        return label in self.__node_of.keys()
+
+    def __prepare(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        vectors = numpy.asarray(vectors, dtype=numpy.float32).reshape(-1, self.__dimension)
+        if self.__metric == Metric.COSINE:
+            norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / numpy.where(norms > 0, norms, 1)
+        return vectors
+
+    def __distances(self, query: numpy.ndarray, nodes: numpy.ndarray | list[int]) -> numpy.ndarray:
+        vectors = self.__vectors[nodes]
+        if self.__metric == Metric.COSINE:
+            return 1 - vectors @ query
+        differences = vectors - query
+        return numpy.einsum('ij,ij->i', differences, differences)
+
+    def __pairwise(self, nodes: numpy.ndarray) -> numpy.ndarray:
+        vectors = self.__vectors[nodes]
+        products = vectors @ vectors.T
+        if self.__metric == Metric.COSINE:
+            return 1 - products
+        squared = numpy.einsum('ij,ij->i', vectors, vectors)
+        return squared[:, numpy.newaxis] + squared[numpy.newaxis, :] - 2 * products
+
+    def __reported(self, distance: float) -> float:
+        return math.sqrt(max(distance, 0)) if self.__metric == Metric.EUCLIDEAN else distance
+
+    def __links(self, node: int, level: int) -> numpy.ndarray:
+        links = self.__links0[node] if level == 0 else self.__upper[node][level - 1]
+        return links[links != NO_LINK]
+
+    def __link(self, node: int, level: int, neighbours: numpy.ndarray | list[int]):
+        links = self.__links0[node] if level == 0 else self.__upper[node][level - 1]
+        links[:] = NO_LINK
+        links[:len(neighbours)] = neighbours
+
+    # links of several nodes of a layer at once
+    def __links_of(self, nodes: numpy.ndarray, level: int) -> numpy.ndarray:
+        if level == 0:
+            links = self.__links0[nodes].ravel()
+        else:
+            links = numpy.concatenate([self.__upper[_node][level - 1] for _node in nodes.tolist()])
+        return links[links != NO_LINK]
+
+    # descends the layers above level, moving to the nearest link for as long as one is nearer
+    def __greedy(self, query: numpy.ndarray, level: int) -> numpy.ndarray:
+        node = self.__entry
+        distance = self.__distances(query, [node])[0]
+        for _level in range(self.__max_level, level, -1):
+            while True:
+                _links = self.__links(node, _level)
+                if len(_links) == 0:
+                    break
+                _distances = self.__distances(query, _links)
+                _nearest = int(numpy.argmin(_distances))
+                if _distances[_nearest] >= distance:
+                    break
+                node, distance = int(_links[_nearest]), _distances[_nearest]
+        return numpy.array([node])
+
+    # best first search of a layer, (distances, nodes) of the ef nearest, nearest first,
+    # admit masks the nodes the results may hold, every node is still a waypoint
+    def __search_layer(
+            self,
+            query: numpy.ndarray,
+            entries: numpy.ndarray,
+            ef: int,
+            level: int,
+            admit: callable = None
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        # position of every node visited in the batch it was first seen in, -1 for nodes not visited
+        visited = numpy.full(self.__count, -1, dtype=numpy.int32)
+        visited[entries] = 0
+        candidate_distances = self.__distances(query, entries)
+        candidates = entries
+        admitted = numpy.ones(len(entries), dtype=bool) if admit is None else admit(entries)
+        result_distances, results = candidate_distances[admitted], entries[admitted]
+        bound = numpy.inf
+        while len(candidates) > 0:
+            if len(results) > ef:
+                _kept = numpy.argpartition(result_distances, ef - 1)[:ef]
+                result_distances, results = result_distances[_kept], results[_kept]
+            if len(results) >= ef:
+                bound = result_distances.max()
+            # the nearest candidates, any farther than every result found is never expanded
+            if len(candidates) > HNSW_EXPANSION:
+                _nearest = numpy.argpartition(candidate_distances, HNSW_EXPANSION - 1)
+                _expanded, _left = _nearest[:HNSW_EXPANSION], _nearest[HNSW_EXPANSION:]
+            else:
+                _expanded, _left = slice(None), slice(0, 0)
+            _within = candidate_distances[_expanded] <= bound
+            if not _within.any():
+                break
+            _expanded_nodes = candidates[_expanded][_within]
+            candidate_distances, candidates = candidate_distances[_left], candidates[_left]
+            _nodes = self.__links_of(_expanded_nodes, level)
+            _nodes = _nodes[visited[_nodes] < 0]
+            if len(_nodes) == 0:
+                continue
+            # a node linked from several expanded ones is kept once
+            _positions = numpy.arange(len(_nodes), dtype=numpy.int32)
+            visited[_nodes] = _positions
+            _nodes = _nodes[visited[_nodes] == _positions]
+            _distances = self.__distances(query, _nodes)
+            _near = _distances < bound
+            _nodes, _distances = _nodes[_near], _distances[_near]
+            candidate_distances = numpy.concatenate((candidate_distances, _distances))
+            candidates = numpy.concatenate((candidates, _nodes))
+            if admit is not None:
+                _admitted = admit(_nodes)
+                _nodes, _distances = _nodes[_admitted], _distances[_admitted]
+            result_distances = numpy.concatenate((result_distances, _distances))
+            results = numpy.concatenate((results, _nodes))
+        order = numpy.argsort(result_distances, kind='stable')[:ef]
+        return result_distances[order], results[order]
+
+    # keeps a candidate only if it is nearer to the base than to every neighbour kept,
+    # so links spread out in all directions instead of clustering,
+    # candidates come nearest first and each one kept prunes those nearer to it than to the base
+    def __select(self, distances: numpy.ndarray, nodes: numpy.ndarray, m: int) -> numpy.ndarray:
+        if len(nodes) <= m:
+            return nodes
+        pairwise = self.__pairwise(nodes)
+        pruned = numpy.zeros(len(nodes), dtype=bool)
+        kept = EMPTY_LIST()
+        while len(kept) < m:
+            _i = int(numpy.argmin(pruned))
+            if pruned[_i]:
+                break
+            kept.append(_i)
+            pruned |= pairwise[_i] <= distances
+            pruned[_i] = True
+        return nodes[kept]
+
+    def __grow(self, count: int):
+        capacity = max(2 * len(self.__labels), count)
+        vectors = numpy.empty((capacity, self.__dimension), dtype=numpy.float32)
+        vectors[:self.__count] = self.__vectors[:self.__count]
+        labels = numpy.empty(capacity, dtype=numpy.int64)
+        labels[:self.__count] = self.__labels[:self.__count]
+        levels = numpy.zeros(capacity, dtype=numpy.int8)
+        levels[:self.__count] = self.__levels[:self.__count]
+        links0 = numpy.full((capacity, self.__m0), NO_LINK, dtype=numpy.int32)
+        links0[:self.__count] = self.__links0[:self.__count]
+        self.__vectors, self.__labels, self.__levels, self.__links0 = vectors, labels, levels, links0
+
+    def add(self, labels: numpy.ndarray, vectors: numpy.ndarray):
+        vectors = self.__prepare(vectors)
+        if self.__count + len(vectors) > len(self.__labels):
+            self.__grow(self.__count + len(vectors))
+        for _label, _vector in zip(numpy.asarray(labels).tolist(), vectors):
+            self.__insert(_label, _vector)
+
+    def __insert(self, label: int, vector: numpy.ndarray):
+        node = self.__count
+        level = min(int(-math.log(1 - self.__rng.random()) * self.__ml), HNSW_MAX_LEVEL)
+        self.__vectors[node] = vector
+        self.__labels[node] = label
+        self.__levels[node] = level
+        if level > 0:
+            self.__upper[node] = numpy.full((level, self.__m), NO_LINK, dtype=numpy.int32)
+        self.__count += 1
+        self.__node_of[label] = node
+        if self.__entry == NO_LINK:
+            self.__entry, self.__max_level = node, level
+            return
+        entries = self.__greedy(vector, level)
+        for _level in range(min(level, self.__max_level), -1, -1):
+            distances, nearest = self.__search_layer(vector, entries, self.__ef_construction, _level)
+            m_max = self.__m0 if _level == 0 else self.__m
+            neighbours = self.__select(distances, nearest, self.__m)
+            self.__link(node, _level, neighbours)
+            self.__link_back(node, neighbours, _level, m_max)
+            entries = nearest
+        if level > self.__max_level:
+            self.__entry, self.__max_level = node, level
+
+    # neighbours with a free link take the node in it, full ones select their links again among it and theirs
+    def __link_back(self, node: int, neighbours: numpy.ndarray, level: int, m_max: int):
+        full = neighbours
+        if level == 0:
+            free = self.__links0[neighbours] == NO_LINK
+            linkable = free.any(axis=1)
+            self.__links0[neighbours[linkable], free[linkable].argmax(axis=1)] = node
+            full = neighbours[~linkable]
+        for _neighbour in full.tolist():
+            _links = numpy.append(self.__links(_neighbour, level), node)
+            if len(_links) > m_max:
+                _distances = self.__distances(self.__vectors[_neighbour], _links)
+                _order = numpy.argsort(_distances, kind='stable')
+                _links = self.__select(_distances[_order], _links[_order], m_max)
+            self.__link(_neighbour, level, _links)
+
+    def remove(self, label: int):
+        node = self.__node_of.pop(label, None)
+        if node is None:
+            return
+        self.__removed.add(node)
+        if 2 * len(self.__removed) > self.__count and len(self.__removed) >= HNSW_MIN_CAPACITY:
+            self.__rebuild()
+
+    def __rebuild(self):
+        nodes = sorted(self.__node_of.values())
+        labels = self.__labels[nodes].copy()
+        vectors = self.__vectors[nodes].copy()
+        self.__init__(
+            dimension=self.__dimension,
+            metric=self.__metric,
+            m=self.__m,
+            ef_construction=self.__ef_construction,
+            ef_search=self.__ef_search
+        )
+        self.add(labels, vectors)
+
+    def configure(self, options: SearchOptions):
+        self.__ef_search = options.ef_search or self.__ef_search
+
+    def search(
+            self,
+            queries: numpy.ndarray,
+            top_k: int,
+            options: SearchOptions,
+            allowed: set[int] | None = None
+    ) -> list[list[tuple[int, float]]]:
+        ef = max(options.ef_search or self.__ef_search, top_k)
+        labels = self.__labels
+        removed = numpy.fromiter(self.__removed, dtype=numpy.int64, count=len(self.__removed))
+        allowed_labels = numpy.fromiter(allowed, dtype=numpy.int64, count=len(allowed)) if allowed is not None else None
+
+        def admit(_nodes: numpy.ndarray) -> numpy.ndarray:
+            admitted = ~numpy.isin(_nodes, removed)
+            if allowed_labels is not None:
+                admitted &= numpy.isin(labels[_nodes], allowed_labels)
+            return admitted
+
+        results = EMPTY_LIST()
+        for _query in self.__prepare(queries):
+            if top_k <= 0 or not self.__node_of:
+                results.append(EMPTY_LIST())
+                continue
+            entries = self.__greedy(_query, 0)
+            distances, nearest = self.__search_layer(
+                _query, entries, ef, 0, admit if len(removed) > 0 or allowed is not None else None
+            )
+            results.append([
+                (int(labels[_node]), self.__reported(_distance))
+                for _distance, _node in zip(distances[:top_k].tolist(), nearest[:top_k].tolist())
+            ])
+        return results
+
+    def dump(self) -> dict[str, numpy.ndarray]:
+        upper_nodes = sorted(self.__upper.keys())
+        return {
+            'type': numpy.array(self.type.value),
+            'metric': numpy.array(self.__metric.value),
+            'parameters': numpy.array(
+                [self.__dimension, self.__m, self.__ef_construction, self.__ef_search, self.__entry, self.__max_level]
+            ),
+            'vectors': self.__vectors[:self.__count].copy(),
+            'labels': self.__labels[:self.__count].copy(),
+            'levels': self.__levels[:self.__count].copy(),
+            'links0': self.__links0[:self.__count].copy(),
+            'upper_nodes': numpy.asarray(upper_nodes, dtype=numpy.int64),
+            'upper_links': numpy.concatenate(
+                [self.__upper[_node].reshape(-1) for _node in upper_nodes] or [numpy.empty(0, dtype=numpy.int32)]
+            ),
+            'removed': numpy.asarray(sorted(self.__removed), dtype=numpy.int64)
+        }
+
+    @staticmethod
+    def load(arrays: dict[str, numpy.ndarray]) -> 'HnswIndex':
+        dimension, m, ef_construction, ef_search, entry, max_level = arrays['parameters'].tolist()
+        index = HnswIndex(
+            dimension=dimension,
+            metric=Metric(str(arrays['metric'])),
+            m=m,
+            ef_construction=ef_construction,
+            ef_search=ef_search
+        )
+        count = len(arrays['labels'])
+        index.__grow(count)
+        index.__count = count
+        index.__vectors[:count] = arrays['vectors']
+        index.__labels[:count] = arrays['labels']
+        index.__levels[:count] = arrays['levels']
+        index.__links0[:count] = arrays['links0']
+        offset = 0
+        for _node in arrays['upper_nodes'].tolist():
+            _level = int(index.__levels[_node])
+            index.__upper[_node] = arrays['upper_links'][offset:offset + _level * m].reshape(_level, m).copy()
+            offset += _level * m
+        index.__removed = set(arrays['removed'].tolist())
+        index.__node_of = {
+            int(_label): _node for _node, _label in enumerate(arrays['labels'].tolist()) if _node not in index.__removed
+        }
+        index.__entry, index.__max_level = entry, max_level
+        return index
@@ -0,0 +1,286 @@
+import numpy
+from dipamkara.embedding import Metric
+
+from bhakti.const import EMPTY_LIST, EMPTY_DICT, DEFAULT_IVF_NLIST, DEFAULT_IVF_NPROBE
+from bhakti.database.ann_index import AnnIndex, AnnIndexType, SearchOptions
+
+IVF_MIN_CAPACITY = 1024
+IVF_METRICS = (Metric.EUCLIDEAN, Metric.COSINE)
+# k-means is trained on a sample of this many vectors per cell, once there are enough for this many per cell
+IVF_TRAINING_PER_CELL = 256
+IVF_MIN_TRAINING_PER_CELL = 8
+IVF_KMEANS_ITERATIONS = 20
+# trained again once the vectors have grown this much since,
+# or the vectors added since sit this much farther from their centroids than the ones trained on
+IVF_DRIFT_GROWTH = 2.0
+IVF_DRIFT_ERROR = 1.5
+IVF_DRIFT_MIN_ADDED = 1024
+# bounds the (vectors, centroids) distance temporaries
+IVF_CHUNK_ELEMENTS = 1 << 24
+
+
+# inverted file index: vectors are clustered by k-means into nlist cells,
+# a query scans only the nprobe cells whose centroids are nearest to it,
+# until trained every vector sits in a single cell and queries scan them all
+#
+# euclidean cells compare squared distances, cosine cells unit vectors (spherical k-means)
+class IvfIndex(AnnIndex):
+    def __init__(
+            self,
+            dimension: int,
+            metric: Metric = Metric.EUCLIDEAN,
+            nlist: int = DEFAULT_IVF_NLIST,
+            nprobe: int = DEFAULT_IVF_NPROBE
+    ):
+        if metric not in IVF_METRICS:
+            raise ValueError(f'IVF supports {[_metric.value for _metric in IVF_METRICS]}, not {metric.value}')
+        self.__dimension = dimension
+        self.__metric = metric
+        self.__nlist = nlist
+        self.__nprobe = nprobe
+        self.__rng = numpy.random.default_rng()
+        self.__centroids = numpy.empty((0, dimension), dtype=numpy.float32)
+        # nodes [0, count) are live, a removed node is filled with the last one
+        self.__vectors = numpy.empty((IVF_MIN_CAPACITY, dimension), dtype=numpy.float32)
+        self.__labels = numpy.empty(IVF_MIN_CAPACITY, dtype=numpy.int64)
+        self.__cells = numpy.zeros(IVF_MIN_CAPACITY, dtype=numpy.int32)
+        self.__count = 0
+        self.__node_of: dict[int, int] = EMPTY_DICT()
+        # (offset of every cell, nodes ordered by cell), regrouped by the first search after a write
+        self.__lists: tuple[numpy.ndarray, numpy.ndarray] | None = None
+        self.__trained_count = 0
+        self.__trained_error = 0.0
+        self.__added = 0
+        self.__added_error = 0.0
+
+    @property
+    def type(self) -> AnnIndexType:
+        return AnnIndexType.IVF
+
+    @property
+    def metric(self) -> Metric:
+        return self.__metric
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __contains__(self, label: int) -> bool:
+        return label in self.__node_of.keys()
+
+    @property
+    def trained(self) -> bool:
+        return len(self.__centroids) > 0
+
+    @property
+    def trainable(self) -> bool:
+        return True
+
+    @property
+    def drifted(self) -> bool:
+        if not self.trained:
+            return self.__count >= self.__nlist * IVF_MIN_TRAINING_PER_CELL
+        return (
+            self.__count > IVF_DRIFT_GROWTH * self.__trained_count or
+            (
+                self.__added >= IVF_DRIFT_MIN_ADDED and
+                self.__added_error > IVF_DRIFT_ERROR * self.__trained_error * self.__added
+            )
+        )
+
+    # a sample of the vectors is enough to place the centroids
+    @property
+    def training_size(self) -> int:
+        return self.__nlist * IVF_TRAINING_PER_CELL
+
+    def __prepare(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        vectors = numpy.asarray(vectors, dtype=numpy.float32).reshape(-1, self.__dimension)
+        if self.__metric == Metric.COSINE:
+            norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / numpy.where(norms > 0, norms, 1)
+        return vectors
+
+    def __distances(self, queries: numpy.ndarray, vectors: numpy.ndarray) -> numpy.ndarray:
+        products = queries @ vectors.T
+        if self.__metric == Metric.COSINE:
+            return 1 - products
+        squared = (
+            numpy.einsum('ij,ij->i', queries, queries)[:, numpy.newaxis] +
+            numpy.einsum('ij,ij->i', vectors, vectors)[numpy.newaxis, :] -
+            2 * products
+        )
+        return numpy.maximum(squared, 0)
+
+    # nearest centroid of every vector and the distance to it
+    def __assign(self, vectors: numpy.ndarray, centroids: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        cells = numpy.zeros(len(vectors), dtype=numpy.int32)
+        errors = numpy.zeros(len(vectors), dtype=numpy.float32)
+        if len(centroids) == 0:
+            return cells, errors
+        step = max(1, IVF_CHUNK_ELEMENTS // len(centroids))
+        for _offset in range(0, len(vectors), step):
+            _distances = self.__distances(vectors[_offset:_offset + step], centroids)
+            _cells = numpy.argmin(_distances, axis=1)
+            cells[_offset:_offset + step] = _cells
+            errors[_offset:_offset + step] = _distances[numpy.arange(len(_cells)), _cells]
+        return cells, errors
+
+    def __grow(self, count: int):
+        capacity = max(2 * len(self.__labels), count)
+        vectors = numpy.empty((capacity, self.__dimension), dtype=numpy.float32)
+        vectors[:self.__count] = self.__vectors[:self.__count]
+        labels = numpy.empty(capacity, dtype=numpy.int64)
+        labels[:self.__count] = self.__labels[:self.__count]
+        cells = numpy.zeros(capacity, dtype=numpy.int32)
+        cells[:self.__count] = self.__cells[:self.__count]
+        self.__vectors, self.__labels, self.__cells = vectors, labels, cells
+
+    def add(self, labels: numpy.ndarray, vectors: numpy.ndarray):
+        vectors = self.__prepare(vectors)
+        labels = numpy.asarray(labels, dtype=numpy.int64)
+        count = self.__count + len(vectors)
+        if count > len(self.__labels):
+            self.__grow(count)
+        cells, errors = self.__assign(vectors, self.__centroids)
+        nodes = slice(self.__count, count)
+        self.__vectors[nodes] = vectors
+        self.__labels[nodes] = labels
+        self.__cells[nodes] = cells
+        for _node, _label in enumerate(labels.tolist(), start=self.__count):
+            self.__node_of[_label] = _node
+        self.__count = count
+        if self.trained:
+            self.__added += len(vectors)
+            self.__added_error += float(errors.sum())
+        self.__lists = None
+
+    def remove(self, label: int):
+        node = self.__node_of.pop(label, None)
+        if node is None:
+            return
+        last = self.__count - 1
+        if node != last:
+            self.__vectors[node] = self.__vectors[last]
+            self.__labels[node] = self.__labels[last]
+            self.__cells[node] = self.__cells[last]
+            self.__node_of[int(self.__labels[node])] = node
+        self.__count = last
+        self.__lists = None
+
+    # lloyd's k-means from centroids sampled among the vectors, a cell left empty is reseeded with a random vector
+    def fit(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        vectors = self.__prepare(vectors)
+        if len(vectors) > self.training_size:
+            vectors = vectors[self.__rng.choice(len(vectors), self.training_size, replace=False)]
+        nlist = min(self.__nlist, len(vectors))
+        if nlist == 0:
+            return self.__centroids[:0].copy()
+        centroids = vectors[self.__rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(IVF_KMEANS_ITERATIONS):
+            cells, _ = self.__assign(vectors, centroids)
+            sizes = numpy.bincount(cells, minlength=nlist)
+            empty = sizes == 0
+            # vectors grouped by cell, summed a group at a time
+            order = numpy.argsort(cells, kind='stable')
+            starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))[~empty]
+            sums = numpy.add.reduceat(vectors[order].astype(numpy.float64), starts, axis=0)
+            moved = (sums / sizes[~empty, numpy.newaxis]).astype(numpy.float32)
+            if self.__metric == Metric.COSINE:
+                moved = self.__prepare(moved)
+            shift = float(numpy.abs(moved - centroids[~empty]).max()) if len(moved) else 0.0
+            centroids[~empty] = moved
+            if empty.any():
+                centroids[empty] = vectors[self.__rng.choice(len(vectors), int(empty.sum()), replace=False)]
+            elif shift == 0:
+                break
+        return centroids
+
+    def refit(self, model: numpy.ndarray, labels: numpy.ndarray, vectors: numpy.ndarray):
+        self.__centroids = numpy.asarray(model, dtype=numpy.float32)
+        self.__count = 0
+        self.__node_of = EMPTY_DICT()
+        self.add(labels, vectors)
+        self.__trained_count = self.__count
+        self.__trained_error = self.__added_error / self.__count if self.__count > 0 else 0.0
+        self.__added = 0
+        self.__added_error = 0.0
+
+    def configure(self, options: SearchOptions):
+        self.__nprobe = options.nprobe or self.__nprobe
+
+    def __grouped(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        lists = self.__lists
+        if lists is None:
+            order = numpy.argsort(self.__cells[:self.__count], kind='stable')
+            offsets = numpy.searchsorted(self.__cells[:self.__count][order], numpy.arange(max(1, len(self.__centroids)) + 1))
+            lists = self.__lists = (offsets, order)
+        return lists
+
+    def search(
+            self,
+            queries: numpy.ndarray,
+            top_k: int,
+            options: SearchOptions,
+            allowed: set[int] | None = None
+    ) -> list[list[tuple[int, float]]]:
+        nprobe = options.nprobe or self.__nprobe
+        queries = self.__prepare(queries)
+        offsets, order = self.__grouped()
+        allowed_labels = numpy.fromiter(allowed, dtype=numpy.int64, count=len(allowed)) if allowed is not None else None
+        probes = numpy.argsort(self.__distances(queries, self.__centroids), axis=1) \
+            if self.trained else numpy.zeros((len(queries), 1), dtype=numpy.intp)
+        results = EMPTY_LIST()
+        for _query, _probes in zip(queries, probes):
+            if top_k <= 0 or self.__count == 0:
+                results.append(EMPTY_LIST())
+                continue
+            # past nprobe cells only while a filter has left fewer than top_k candidates
+            nodes = EMPTY_LIST()
+            found = 0
+            for _probed, _cell in enumerate(_probes.tolist()):
+                if _probed >= nprobe and found >= top_k:
+                    break
+                _nodes = order[offsets[_cell]:offsets[_cell + 1]]
+                if allowed_labels is not None:
+                    _nodes = _nodes[numpy.isin(self.__labels[_nodes], allowed_labels)]
+                nodes.append(_nodes)
+                found += len(_nodes)
+            nodes = numpy.concatenate(nodes)
+            if len(nodes) == 0:
+                results.append(EMPTY_LIST())
+                continue
+            distances = self.__distances(_query[numpy.newaxis, :], self.__vectors[nodes])[0]
+            k = min(top_k, len(nodes))
+            nearest = numpy.argpartition(distances, k - 1)[:k]
+            nearest = nearest[numpy.argsort(distances[nearest], kind='stable')]
+            if self.__metric == Metric.EUCLIDEAN:
+                distances = numpy.sqrt(distances)
+            results.append([(int(self.__labels[nodes[_i]]), float(distances[_i])) for _i in nearest.tolist()])
+        return results
+
+    def dump(self) -> dict[str, numpy.ndarray]:
+        return {
+            'type': numpy.array(self.type.value),
+            'metric': numpy.array(self.__metric.value),
+            'parameters': numpy.array([self.__dimension, self.__nlist, self.__nprobe, self.__trained_count, self.__added]),
+            'errors': numpy.array([self.__trained_error, self.__added_error]),
+            'centroids': self.__centroids.copy(),
+            'vectors': self.__vectors[:self.__count].copy(),
+            'labels': self.__labels[:self.__count].copy(),
+            'cells': self.__cells[:self.__count].copy()
+        }
+
+    @staticmethod
+    def load(arrays: dict[str, numpy.ndarray]) -> 'IvfIndex':
+        dimension, nlist, nprobe, trained_count, added = arrays['parameters'].tolist()
+        index = IvfIndex(dimension=dimension, metric=Metric(str(arrays['metric'])), nlist=nlist, nprobe=nprobe)
+        count = len(arrays['labels'])
+        index.__grow(count)
+        index.__count = count
+        index.__vectors[:count] = arrays['vectors']
+        index.__labels[:count] = arrays['labels']
+        index.__cells[:count] = arrays['cells']
+        index.__node_of = {_label: _node for _node, _label in enumerate(arrays['labels'].tolist())}
+        index.__centroids = arrays['centroids'].astype(numpy.float32)
+        index.__trained_count, index.__added = trained_count, added
+        index.__trained_error, index.__added_error = arrays['errors'].tolist()
+        return index
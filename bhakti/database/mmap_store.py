@@ -0,0 +1,188 @@
+import logging
+import os
+
+import numpy
+
+log = logging.getLogger("dipamkara")
+
+MMAP_STORE_FILE = '.mat'
+# header := [dimension, capacity, count, epoch, itemsize], then capacity doc ids, then capacity rows of floats,
+# the epoch moves whenever rows are renumbered, stores of no itemsize hold float64
+MMAP_HEADER = 8
+MMAP_DIMENSION = 0
+MMAP_CAPACITY = 1
+MMAP_COUNT = 2
+MMAP_EPOCH = 3
+MMAP_ITEMSIZE = 4
+MMAP_MIN_CAPACITY = 1024
+# removed rows are compacted away once they outnumber the live ones
+MMAP_COMPACT_MIN_DEAD = 1024
+DOC_ID_REMOVED = -1
+
+
+# vectors as one contiguous on-disk matrix, mapped rather than loaded so startup does not
+# parse them and processes serving the same archive share the page cache,
+# rows are only appended or marked removed in place, growing and compacting write a new file
+# renamed over the old one, so a reader keeps a consistent view of the file it mapped
+class MmapVectorStore:
+    def __init__(self, path: str, dimension: int, writable: bool = True, dtype: numpy.dtype | type = numpy.float64):
+        self.__path = path
+        self.__dimension = dimension
+        self.__writable = writable
+        # a writer converts a store of another dtype, a reader maps it as the writer left it
+        self.__dtype = numpy.dtype(dtype)
+        self.__memmap: numpy.memmap | None = None
+        self.__header = numpy.zeros(MMAP_HEADER, dtype=numpy.int64)
+        self.__ids = numpy.empty(0, dtype=numpy.int64)
+        self.__matrix = numpy.empty((0, dimension), dtype=self.__dtype)
+        self.__dead = 0
+        # file mapped, told apart from the one renamed over it
+        self.__inode: int | None = None
+        self.open()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def count(self) -> int:
+        return int(self.__header[MMAP_COUNT])
+
+    @property
+    def capacity(self) -> int:
+        return int(self.__header[MMAP_CAPACITY])
+
+    @property
+    def epoch(self) -> int:
+        return int(self.__header[MMAP_EPOCH])
+
+    @property
+    def dtype(self) -> numpy.dtype:
+        return self.__matrix.dtype
+
+    @property
+    def dead(self) -> int:
+        return self.__dead
+
+    # doc id of every row, DOC_ID_REMOVED once removed
+    @property
+    def ids(self) -> numpy.ndarray:
+        return self.__ids[:self.count]
+
+    @property
+    def matrix(self) -> numpy.ndarray:
+        return self.__matrix[:self.count]
+
+    @staticmethod
+    def __size_of(dimension: int, capacity: int, itemsize: int) -> int:
+        return 8 * (MMAP_HEADER + capacity) + itemsize * capacity * dimension
+
+    @staticmethod
+    def __itemsize_of(header: numpy.ndarray) -> int:
+        return int(header[MMAP_ITEMSIZE]) or numpy.dtype(numpy.float64).itemsize
+
+    def __map(self, memmap: numpy.memmap):
+        header = memmap[:8 * MMAP_HEADER].view(numpy.int64)
+        capacity = int(header[MMAP_CAPACITY])
+        dtype = numpy.dtype(f'float{8 * self.__itemsize_of(header)}')
+        self.__memmap = memmap
+        self.__header = header
+        self.__ids = memmap[8 * MMAP_HEADER:8 * (MMAP_HEADER + capacity)].view(numpy.int64)
+        self.__matrix = memmap[8 * (MMAP_HEADER + capacity):].view(dtype).reshape(capacity, self.__dimension)
+        self.__dead = int(numpy.count_nonzero(self.ids == DOC_ID_REMOVED))
+
+    # (re)maps the file, a reader calls it again to see what the writer did since
+    def open(self):
+        if not os.path.exists(self.__path):
+            if not self.__writable:
+                return
+            self.__rewrite(numpy.empty((0, self.__dimension)), numpy.empty(0, dtype=numpy.int64), MMAP_MIN_CAPACITY)
+            return
+        # taken before mapping, a file renamed over in between is mapped again by the next refresh
+        inode = os.stat(self.__path).st_ino
+        memmap = numpy.memmap(self.__path, dtype=numpy.uint8, mode='r+' if self.__writable else 'r')
+        header = memmap[:8 * MMAP_HEADER].view(numpy.int64)
+        if (
+                int(header[MMAP_DIMENSION]) != self.__dimension or
+                self.__itemsize_of(header) not in (2, 4, 8) or
+                memmap.size != self.__size_of(self.__dimension, int(header[MMAP_CAPACITY]), self.__itemsize_of(header))
+        ):
+            log.warning(f'Vector store {self.__path} does not match dimension {self.__dimension}, ignored')
+            del memmap
+            if self.__writable:
+                self.__rewrite(numpy.empty((0, self.__dimension)), numpy.empty(0, dtype=numpy.int64), MMAP_MIN_CAPACITY)
+            return
+        self.__map(memmap)
+        self.__inode = inode
+        if self.__writable and self.dtype != self.__dtype:
+            log.warning(f'Vectors stored as {self.dtype} are converted to {self.__dtype}')
+            self.__rewrite(self.matrix, self.ids, self.capacity, renumbered=False)
+
+    # maps the file again only if the writer renamed another over it, rows appended in place are seen anyway,
+    # returns whether rows were renumbered since
+    def refresh(self) -> bool:
+        epoch = self.epoch
+        if os.path.exists(self.__path) and os.stat(self.__path).st_ino != self.__inode:
+            self.open()
+        return self.epoch != epoch
+
+    def __rewrite(self, matrix: numpy.ndarray, ids: numpy.ndarray, capacity: int, renumbered: bool = True):
+        header = numpy.zeros(MMAP_HEADER, dtype=numpy.int64)
+        header[MMAP_EPOCH] = self.epoch + 1 if renumbered else self.epoch
+        header[MMAP_DIMENSION] = self.__dimension
+        header[MMAP_CAPACITY] = capacity
+        header[MMAP_COUNT] = len(ids)
+        header[MMAP_ITEMSIZE] = self.__dtype.itemsize
+        # written aside and renamed over, readers of the old file keep their mapping
+        with open(f'{self.__path}.tmp', 'wb') as file:
+            file.truncate(self.__size_of(self.__dimension, capacity, self.__dtype.itemsize))
+        memmap = numpy.memmap(f'{self.__path}.tmp', dtype=numpy.uint8, mode='r+')
+        memmap[:8 * MMAP_HEADER] = header.view(numpy.uint8)
+        memmap[8 * MMAP_HEADER:8 * (MMAP_HEADER + len(ids))] = numpy.asarray(ids, dtype=numpy.int64).view(numpy.uint8)
+        offset = 8 * (MMAP_HEADER + capacity)
+        memmap[offset:offset + self.__dtype.itemsize * matrix.size] = numpy.ascontiguousarray(
+            matrix, dtype=self.__dtype
+        ).reshape(-1).view(numpy.uint8)
+        memmap.flush()
+        os.replace(f'{self.__path}.tmp', self.__path)
+        self.__map(memmap)
+        self.__inode = os.stat(self.__path).st_ino
+
+    # replaces everything stored, e.g. when the store turns out not to match the archive
+    def reset(self, matrix: numpy.ndarray, ids: list[int]):
+        self.__rewrite(matrix, numpy.asarray(ids, dtype=numpy.int64), max(MMAP_MIN_CAPACITY, 2 * len(ids)))
+
+    # returns the first row appended
+    def append(self, matrix: numpy.ndarray, ids: list[int]) -> int:
+        count = self.count
+        if count + len(ids) > self.capacity:
+            self.__rewrite(self.matrix, self.ids, max(2 * self.capacity, count + len(ids)), renumbered=False)
+        self.__matrix[count:count + len(ids)] = matrix
+        self.__ids[count:count + len(ids)] = ids
+        # counted in last, a reader never maps a row not written yet
+        self.__header[MMAP_COUNT] = count + len(ids)
+        return count
+
+    def remove(self, row: int):
+        if self.__ids[row] != DOC_ID_REMOVED:
+            self.__ids[row] = DOC_ID_REMOVED
+            self.__dead += 1
+
+    @property
+    def compactable(self) -> bool:
+        return self.__dead >= MMAP_COMPACT_MIN_DEAD and 2 * self.__dead > self.count
+
+    # drops removed rows, returns the old row of every row kept
+    def compact(self) -> numpy.ndarray:
+        kept = numpy.flatnonzero(self.ids != DOC_ID_REMOVED)
+        self.__rewrite(self.matrix[kept], self.ids[kept], max(MMAP_MIN_CAPACITY, 2 * len(kept)))
+        return kept
+
+    # stores every row in another dtype from now on, rows keep their numbers
+    def convert(self, dtype: numpy.dtype | type):
+        self.__dtype = numpy.dtype(dtype)
+        self.__rewrite(self.matrix, self.ids, self.capacity, renumbered=False)
+
+    def flush(self):
+        if self.__memmap is not None and self.__writable:
+            self.__memmap.flush()
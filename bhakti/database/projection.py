@@ -0,0 +1,36 @@
+from bhakti.const import EMPTY_LIST
+
+# fields a projected query returns per result
+PROJECTION_ID = 'id'
+PROJECTION_DISTANCE = 'distance'
+PROJECTION_VECTOR = 'vector'
+PROJECTION_DOCUMENT = 'document'
+# document.<key> picks single keys out of the document
+PROJECTION_DOCUMENT_KEY_PREFIX = 'document.'
+
+
+class Projection:
+    def __init__(self, fields: list[str]):
+        self.id = False
+        self.distance = False
+        self.vector = False
+        self.document = False
+        self.document_keys: list[str] = EMPTY_LIST()
+        for field in fields:
+            if field == PROJECTION_ID:
+                self.id = True
+            elif field == PROJECTION_DISTANCE:
+                self.distance = True
+            elif field == PROJECTION_VECTOR:
+                self.vector = True
+            elif field == PROJECTION_DOCUMENT:
+                self.document = True
+            elif field.startswith(PROJECTION_DOCUMENT_KEY_PREFIX):
+                self.document_keys.append(field[len(PROJECTION_DOCUMENT_KEY_PREFIX):])
+            else:
+                raise ValueError(f'Unknown projection field "{field}"')
+
+    # documents are only read when some of their content is projected
+    @property
+    def reads_document(self) -> bool:
+        return self.document or len(self.document_keys) > 0
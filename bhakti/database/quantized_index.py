@@ -0,0 +1,374 @@
+import abc
+
+import numpy
+from dipamkara.embedding import Metric
+
+from bhakti.const import EMPTY_LIST, EMPTY_DICT, DEFAULT_PQ_M
+from bhakti.database.ann_index import AnnIndex, AnnIndexType, SearchOptions
+
+QUANTIZED_MIN_CAPACITY = 1024
+QUANTIZED_METRICS = (Metric.EUCLIDEAN, Metric.COSINE)
+# trained once there are this many vectors, on a sample of at most that many
+QUANTIZED_MIN_TRAINING = 4096
+QUANTIZED_TRAINING = 65536
+# trained again once the vectors have grown this much since,
+# or the vectors added since are encoded this much worse than the ones trained on
+QUANTIZED_DRIFT_GROWTH = 2.0
+QUANTIZED_DRIFT_ERROR = 1.5
+QUANTIZED_DRIFT_MIN_ADDED = 1024
+# codes scored at once, bounds the decoded temporaries
+QUANTIZED_CHUNK_ROWS = 65536
+PQ_CENTROIDS = 256
+PQ_KMEANS_ITERATIONS = 20
+
+
+# vectors kept only as compact codes, every query scores all of them (or the ones allowed),
+# the distances are approximate and the engine re-scores the best candidates against the full vectors
+#
+# euclidean codes compare squared distances, cosine codes unit vectors
+class QuantizedIndex(AnnIndex):
+    def __init__(self, dimension: int, metric: Metric, code_size: int):
+        if metric not in QUANTIZED_METRICS:
+            raise ValueError(f'{self.type.value} supports {[_metric.value for _metric in QUANTIZED_METRICS]}, '
+                             f'not {metric.value}')
+        self._dimension = dimension
+        self.__metric = metric
+        self.__code_size = code_size
+        self._rng = numpy.random.default_rng()
+        # nodes [0, count) are live, a removed node is filled with the last one
+        self.__codes = numpy.zeros((QUANTIZED_MIN_CAPACITY, code_size), dtype=numpy.uint8)
+        self.__labels = numpy.empty(QUANTIZED_MIN_CAPACITY, dtype=numpy.int64)
+        self.__count = 0
+        self.__node_of: dict[int, int] = EMPTY_DICT()
+        self.__trained_count = 0
+        self.__trained_error = 0.0
+        self.__added = 0
+        self.__added_error = 0.0
+
+    @property
+    def metric(self) -> Metric:
+        return self.__metric
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __contains__(self, label: int) -> bool:
+        return label in self.__node_of.keys()
+
+    @property
+    def lossy(self) -> bool:
+        return True
+
+    @property
+    def trainable(self) -> bool:
+        return True
+
+    @property
+    def drifted(self) -> bool:
+        if not self.trained:
+            return self.__count >= QUANTIZED_MIN_TRAINING
+        return (
+            self.__count > QUANTIZED_DRIFT_GROWTH * self.__trained_count or
+            (
+                self.__added >= QUANTIZED_DRIFT_MIN_ADDED and
+                self.__added_error > QUANTIZED_DRIFT_ERROR * self.__trained_error * self.__added
+            )
+        )
+
+    @property
+    def training_size(self) -> int:
+        return QUANTIZED_TRAINING
+
+    def _prepare(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        vectors = numpy.asarray(vectors, dtype=numpy.float32).reshape(-1, self._dimension)
+        if self.__metric == Metric.COSINE:
+            norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / numpy.where(norms > 0, norms, 1)
+        return vectors
+
+    # codes of prepared vectors and the squared error of encoding every one
+    @abc.abstractmethod
+    def _encode(self, vectors: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        pass
+
+    # squared euclidean distances, or cosine distances, between prepared queries and codes
+    @abc.abstractmethod
+    def _score(self, queries: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        pass
+
+    @abc.abstractmethod
+    def _fit_prepared(self, vectors: numpy.ndarray) -> any:
+        pass
+
+    @abc.abstractmethod
+    def _apply(self, model: any):
+        pass
+
+    @abc.abstractmethod
+    def _dump_model(self) -> dict[str, numpy.ndarray]:
+        pass
+
+    def add(self, labels: numpy.ndarray, vectors: numpy.ndarray):
+        labels = numpy.asarray(labels, dtype=numpy.int64)
+        count = self.__count + len(labels)
+        if count > len(self.__labels):
+            capacity = max(2 * len(self.__labels), count)
+            codes = numpy.zeros((capacity, self.__code_size), dtype=numpy.uint8)
+            codes[:self.__count] = self.__codes[:self.__count]
+            grown = numpy.empty(capacity, dtype=numpy.int64)
+            grown[:self.__count] = self.__labels[:self.__count]
+            self.__codes, self.__labels = codes, grown
+        nodes = slice(self.__count, count)
+        # untrained, the labels are kept to know when to train
+        if self.trained:
+            codes, errors = self._encode(self._prepare(vectors))
+            self.__codes[nodes] = codes
+            self.__added += len(labels)
+            self.__added_error += float(errors.sum())
+        self.__labels[nodes] = labels
+        for _node, _label in enumerate(labels.tolist(), start=self.__count):
+            self.__node_of[_label] = _node
+        self.__count = count
+
+    def remove(self, label: int):
+        node = self.__node_of.pop(label, None)
+        if node is None:
+            return
+        last = self.__count - 1
+        if node != last:
+            self.__codes[node] = self.__codes[last]
+            self.__labels[node] = self.__labels[last]
+            self.__node_of[int(self.__labels[node])] = node
+        self.__count = last
+
+    def fit(self, vectors: numpy.ndarray) -> any:
+        vectors = self._prepare(vectors)
+        if len(vectors) > self.training_size:
+            vectors = vectors[self._rng.choice(len(vectors), self.training_size, replace=False)]
+        return self._fit_prepared(vectors)
+
+    def refit(self, model: any, labels: numpy.ndarray, vectors: numpy.ndarray):
+        self._apply(model)
+        self.__count = 0
+        self.__node_of = EMPTY_DICT()
+        self.__added = 0
+        self.__added_error = 0.0
+        for _offset in range(0, len(labels), QUANTIZED_CHUNK_ROWS):
+            self.add(labels[_offset:_offset + QUANTIZED_CHUNK_ROWS], vectors[_offset:_offset + QUANTIZED_CHUNK_ROWS])
+        self.__trained_count = self.__count
+        self.__trained_error = self.__added_error / self.__count if self.__count > 0 else 0.0
+        self.__added = 0
+        self.__added_error = 0.0
+
+    def search(
+            self,
+            queries: numpy.ndarray,
+            top_k: int,
+            options: SearchOptions,
+            allowed: set[int] | None = None
+    ) -> list[list[tuple[int, float]]]:
+        queries = self._prepare(queries)
+        nodes = numpy.arange(self.__count)
+        if allowed is not None:
+            allowed_labels = numpy.fromiter(allowed, dtype=numpy.int64, count=len(allowed))
+            nodes = nodes[numpy.isin(self.__labels[:self.__count], allowed_labels)]
+        k = min(top_k, len(nodes))
+        if k <= 0:
+            return [EMPTY_LIST() for _ in queries]
+        distances = numpy.empty((len(queries), len(nodes)), dtype=numpy.float32)
+        for _offset in range(0, len(nodes), QUANTIZED_CHUNK_ROWS):
+            _nodes = nodes[_offset:_offset + QUANTIZED_CHUNK_ROWS]
+            distances[:, _offset:_offset + len(_nodes)] = self._score(queries, self.__codes[_nodes])
+        nearest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = EMPTY_LIST()
+        for _query, _nearest in enumerate(nearest):
+            _nearest = _nearest[numpy.argsort(distances[_query, _nearest], kind='stable')]
+            _distances = distances[_query, _nearest]
+            if self.__metric == Metric.EUCLIDEAN:
+                _distances = numpy.sqrt(numpy.maximum(_distances, 0))
+            results.append([
+                (int(_label), float(_distance))
+                for _label, _distance in zip(self.__labels[nodes[_nearest]].tolist(), _distances.tolist())
+            ])
+        return results
+
+    def dump(self) -> dict[str, numpy.ndarray]:
+        return {
+            'type': numpy.array(self.type.value),
+            'metric': numpy.array(self.__metric.value),
+            'counters': numpy.array([self.__trained_count, self.__added]),
+            'errors': numpy.array([self.__trained_error, self.__added_error]),
+            'dimension': numpy.array(self._dimension),
+            'codes': self.__codes[:self.__count].copy(),
+            'labels': self.__labels[:self.__count].copy(),
+            **self._dump_model()
+        }
+
+    def _restore(self, arrays: dict[str, numpy.ndarray]):
+        count = len(arrays['labels'])
+        self.__codes = numpy.zeros((max(QUANTIZED_MIN_CAPACITY, count), self.__code_size), dtype=numpy.uint8)
+        self.__labels = numpy.empty(len(self.__codes), dtype=numpy.int64)
+        self.__codes[:count] = arrays['codes']
+        self.__labels[:count] = arrays['labels']
+        self.__count = count
+        self.__node_of = {_label: _node for _node, _label in enumerate(arrays['labels'].tolist())}
+        self.__trained_count, self.__added = arrays['counters'].tolist()
+        self.__trained_error, self.__added_error = arrays['errors'].tolist()
+
+
+# every component as one byte over its trained [min, max], a quarter of float32
+class ScalarQuantizedIndex(QuantizedIndex):
+    def __init__(self, dimension: int, metric: Metric = Metric.EUCLIDEAN):
+        # (min, step) of every component
+        self.__model: tuple[numpy.ndarray, numpy.ndarray] | None = None
+        super().__init__(dimension=dimension, metric=metric, code_size=dimension)
+
+    @property
+    def type(self) -> AnnIndexType:
+        return AnnIndexType.SQ8
+
+    @property
+    def trained(self) -> bool:
+        return self.__model is not None
+
+    def __decode(self, codes: numpy.ndarray) -> numpy.ndarray:
+        low, step = self.__model
+        return low + codes.astype(numpy.float32) * step
+
+    def _encode(self, vectors: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        low, step = self.__model
+        codes = numpy.clip(numpy.rint((vectors - low) / step), 0, 255).astype(numpy.uint8)
+        differences = vectors - self.__decode(codes)
+        return codes, numpy.einsum('ij,ij->i', differences, differences)
+
+    def _score(self, queries: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        decoded = self.__decode(codes)
+        products = queries @ decoded.T
+        if self.metric == Metric.COSINE:
+            return 1 - products
+        return (
+            numpy.einsum('ij,ij->i', queries, queries)[:, numpy.newaxis] +
+            numpy.einsum('ij,ij->i', decoded, decoded)[numpy.newaxis, :] -
+            2 * products
+        )
+
+    def _fit_prepared(self, vectors: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        return low, numpy.maximum(high - low, numpy.finfo(numpy.float32).eps) / 255
+
+    def _apply(self, model: tuple[numpy.ndarray, numpy.ndarray]):
+        self.__model = (numpy.asarray(model[0], dtype=numpy.float32), numpy.asarray(model[1], dtype=numpy.float32))
+
+    def _dump_model(self) -> dict[str, numpy.ndarray]:
+        if self.__model is None:
+            return EMPTY_DICT()
+        return {'low': self.__model[0], 'step': self.__model[1]}
+
+    @staticmethod
+    def load(arrays: dict[str, numpy.ndarray]) -> 'ScalarQuantizedIndex':
+        index = ScalarQuantizedIndex(dimension=int(arrays['dimension']), metric=Metric(str(arrays['metric'])))
+        if 'low' in arrays.keys():
+            index._apply((arrays['low'], arrays['step']))
+        index._restore(arrays)
+        return index
+
+
+# the vector split into m subvectors, each one byte naming the nearest of 256 centroids of its subspace,
+# queries are scored by table lookups of their distances to every centroid
+class ProductQuantizedIndex(QuantizedIndex):
+    def __init__(self, dimension: int, metric: Metric = Metric.EUCLIDEAN, m: int = DEFAULT_PQ_M):
+        if dimension % m != 0:
+            raise ValueError(f'Dimension {dimension} is not divisible into {m} subvectors')
+        self.__m = m
+        self.__subdimension = dimension // m
+        # (m, 256, dimension / m) centroids
+        self.__codebooks: numpy.ndarray | None = None
+        super().__init__(dimension=dimension, metric=metric, code_size=m)
+
+    @property
+    def type(self) -> AnnIndexType:
+        return AnnIndexType.PQ
+
+    @property
+    def trained(self) -> bool:
+        return self.__codebooks is not None
+
+    def __split(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        # (m, n, dimension / m)
+        return vectors.reshape(len(vectors), self.__m, self.__subdimension).transpose(1, 0, 2)
+
+    @staticmethod
+    def __nearest(vectors: numpy.ndarray, centroids: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        distances = (
+            numpy.einsum('ij,ij->i', vectors, vectors)[:, numpy.newaxis] +
+            numpy.einsum('ij,ij->i', centroids, centroids)[numpy.newaxis, :] -
+            2 * (vectors @ centroids.T)
+        )
+        nearest = numpy.argmin(distances, axis=1)
+        return nearest, numpy.maximum(distances[numpy.arange(len(vectors)), nearest], 0)
+
+    def _encode(self, vectors: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        codes = numpy.empty((len(vectors), self.__m), dtype=numpy.uint8)
+        errors = numpy.zeros(len(vectors), dtype=numpy.float32)
+        for _j, _subvectors in enumerate(self.__split(vectors)):
+            _nearest, _errors = self.__nearest(_subvectors, self.__codebooks[_j])
+            codes[:, _j] = _nearest
+            errors += _errors
+        return codes, errors
+
+    def _score(self, queries: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        scores = numpy.zeros((len(queries), len(codes)), dtype=numpy.float32)
+        for _j, _subqueries in enumerate(self.__split(queries)):
+            _codebook = self.__codebooks[_j]
+            # (queries, 256) table of this subspace, looked up by every code
+            if self.metric == Metric.COSINE:
+                _table = -(_subqueries @ _codebook.T)
+            else:
+                _table = (
+                    numpy.einsum('ij,ij->i', _subqueries, _subqueries)[:, numpy.newaxis] +
+                    numpy.einsum('ij,ij->i', _codebook, _codebook)[numpy.newaxis, :] -
+                    2 * (_subqueries @ _codebook.T)
+                )
+            scores += _table[:, codes[:, _j]]
+        return 1 + scores if self.metric == Metric.COSINE else scores
+
+    # k-means of every subspace, a centroid left empty is reseeded with a random subvector
+    def _fit_prepared(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        centroids = min(PQ_CENTROIDS, len(vectors))
+        codebooks = numpy.zeros((self.__m, PQ_CENTROIDS, self.__subdimension), dtype=numpy.float32)
+        for _j, _subvectors in enumerate(self.__split(vectors)):
+            _codebook = _subvectors[self._rng.choice(len(_subvectors), centroids, replace=False)].copy()
+            for _ in range(PQ_KMEANS_ITERATIONS):
+                _nearest, _ = self.__nearest(_subvectors, _codebook)
+                _sizes = numpy.bincount(_nearest, minlength=centroids)
+                _empty = _sizes == 0
+                _order = numpy.argsort(_nearest, kind='stable')
+                _starts = numpy.concatenate(([0], numpy.cumsum(_sizes)[:-1]))[~_empty]
+                _sums = numpy.add.reduceat(_subvectors[_order].astype(numpy.float64), _starts, axis=0)
+                _codebook[~_empty] = _sums / _sizes[~_empty, numpy.newaxis]
+                if _empty.any():
+                    _codebook[_empty] = _subvectors[self._rng.choice(len(_subvectors), int(_empty.sum()), replace=False)]
+            # fewer subvectors than centroids, the codebook repeats them
+            codebooks[_j] = _codebook[numpy.arange(PQ_CENTROIDS) % centroids]
+        return codebooks
+
+    def _apply(self, model: numpy.ndarray):
+        self.__codebooks = numpy.asarray(model, dtype=numpy.float32)
+
+    def _dump_model(self) -> dict[str, numpy.ndarray]:
+        if self.__codebooks is None:
+            return EMPTY_DICT()
+        return {'codebooks': self.__codebooks}
+
+    @staticmethod
+    def load(arrays: dict[str, numpy.ndarray]) -> 'ProductQuantizedIndex':
+        index = ProductQuantizedIndex(
+            dimension=int(arrays['dimension']),
+            metric=Metric(str(arrays['metric'])),
+            m=arrays['codes'].shape[1]
+        )
+        if 'codebooks' in arrays.keys():
+            index._apply(arrays['codebooks'])
+        index._restore(arrays)
+        return index
@@ -0,0 +1,117 @@
+import enum
+import threading
+
+import numpy
+
+from bhakti.const import EMPTY_DICT, EMPTY_LIST
+
+# ints beyond it lose precision as float64, they are left to the dsl like any value the index cannot order
+RANGE_MAX_EXACT_INT = 1 << 53
+RANGE_COMPARISONS = ('>', '>=', '<', '<=', '==')
+
+
+class IndexKind(enum.Enum):
+    INVERTED = 'inverted'
+    RANGE = 'range'
+    DEFAULT_KIND = INVERTED
+
+
+# the numeric values of one indexed key in ascending order, with the label (e.g. row) holding each,
+# a comparison is two binary searches and a slice,
+# writes are queued and merged into the sorted arrays by the next comparison, so a batch costs a single pass
+class RangeIndex:
+    def __init__(self, dtype: numpy.dtype | type = numpy.int64):
+        self.__values = numpy.empty(0, dtype=numpy.float64)
+        self.__labels = numpy.empty(0, dtype=dtype)
+        # label => value of every label holding a number, nan included though it is never found
+        self.__value_of: dict[any, float] = EMPTY_DICT()
+        # labels holding values the index cannot order, comparisons on them are left to the dsl
+        self.__unordered: set = set()
+        # writes not merged yet: label => value to insert, label => value to delete
+        self.__inserted: dict[any, float] = EMPTY_DICT()
+        self.__deleted: dict[any, float] = EMPTY_DICT()
+        # readers on several threads may merge, writers are kept off by the engine
+        self.__merging = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__value_of) + len(self.__unordered)
+
+    # every value is a number, comparisons are answered as the dsl would answer them
+    @property
+    def exact(self) -> bool:
+        return len(self.__unordered) == 0
+
+    @staticmethod
+    def orderable(value: any) -> bool:
+        return isinstance(value, float) or (isinstance(value, int) and abs(value) <= RANGE_MAX_EXACT_INT)
+
+    def set(self, label: any, value: any):
+        self.clear(label)
+        if not self.orderable(value):
+            self.__unordered.add(label)
+            return
+        value = float(value)
+        self.__value_of[label] = value
+        if not numpy.isnan(value):
+            self.__inserted[label] = value
+
+    def clear(self, label: any):
+        self.__unordered.discard(label)
+        value = self.__value_of.pop(label, None)
+        if value is None or numpy.isnan(value):
+            return
+        if label in self.__inserted.keys():
+            del self.__inserted[label]
+        else:
+            self.__deleted[label] = value
+
+    # the label of a value changes, e.g. a row filled with the last one
+    def move(self, source: any, target: any):
+        unordered = source in self.__unordered
+        value = self.__value_of.get(source)
+        self.clear(source)
+        self.clear(target)
+        if unordered:
+            self.__unordered.add(target)
+        elif value is not None:
+            self.set(target, value)
+
+    def __merge(self):
+        if self.__deleted:
+            positions = EMPTY_LIST()
+            for _label, _value in self.__deleted.items():
+                _start = int(numpy.searchsorted(self.__values, _value, side='left'))
+                _end = int(numpy.searchsorted(self.__values, _value, side='right'))
+                _found = numpy.flatnonzero(self.__labels[_start:_end] == _label)
+                positions.append(_start + int(_found[0]))
+            self.__values = numpy.delete(self.__values, positions)
+            self.__labels = numpy.delete(self.__labels, positions)
+            self.__deleted = EMPTY_DICT()
+        if self.__inserted:
+            values = numpy.fromiter(self.__inserted.values(), dtype=numpy.float64, count=len(self.__inserted))
+            labels = numpy.asarray(list(self.__inserted.keys()), dtype=self.__labels.dtype)
+            order = numpy.argsort(values, kind='stable')
+            values, labels = values[order], labels[order]
+            positions = numpy.searchsorted(self.__values, values, side='right')
+            self.__values = numpy.insert(self.__values, positions, values)
+            self.__labels = numpy.insert(self.__labels, positions, labels)
+            self.__inserted = EMPTY_DICT()
+
+    # labels whose value compares true against the literal, in ascending order of value
+    def select(self, op: str, literal: float) -> numpy.ndarray:
+        with self.__merging:
+            self.__merge()
+            values, labels = self.__values, self.__labels
+        if op == '>':
+            return labels[numpy.searchsorted(values, literal, side='right'):]
+        if op == '>=':
+            return labels[numpy.searchsorted(values, literal, side='left'):]
+        if op == '<':
+            return labels[:numpy.searchsorted(values, literal, side='left')]
+        if op == '<=':
+            return labels[:numpy.searchsorted(values, literal, side='right')]
+        if op == '==':
+            return labels[
+                numpy.searchsorted(values, literal, side='left'):numpy.searchsorted(values, literal, side='right')
+            ]
+        raise ValueError(f'Range index cannot compare by {op}')
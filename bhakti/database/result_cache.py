@@ -0,0 +1,120 @@
+import collections
+import copy
+import hashlib
+import sys
+import time
+
+import numpy
+
+from bhakti.const import DEFAULT_RESULT_CACHE_MB, DEFAULT_RESULT_CACHE_TTL
+from bhakti.database.ann_index import SearchOptions
+from bhakti.database.projection import Projection
+
+MEGABYTE = 1 << 20
+
+
+# bytes a result holds, estimated from the arrays, containers and scalars in it
+def size_of(result: any) -> int:
+    if isinstance(result, numpy.ndarray):
+        return sys.getsizeof(result) + (0 if result.base is None else result.nbytes)
+    if isinstance(result, dict):
+        return sys.getsizeof(result) + sum(size_of(_key) + size_of(_value) for _key, _value in result.items())
+    if isinstance(result, list | tuple | set):
+        return sys.getsizeof(result) + sum(size_of(_item) for _item in result)
+    return sys.getsizeof(result)
+
+
+# results of read queries, bounded by the bytes they hold, least recently used dropped first,
+# results belong to the version of the collection they were read at:
+# engines move their version with every write, which drops every result read before it,
+# used from the event loop only, results are copied in and out since callers may change them
+class ResultCache:
+    def __init__(self, size_mb: float = DEFAULT_RESULT_CACHE_MB, ttl: float = DEFAULT_RESULT_CACHE_TTL):
+        self.__capacity = int(size_mb * MEGABYTE)
+        self.__ttl = ttl
+        self.__version = 0
+        # key => (expiry, size, result)
+        self.__results: collections.OrderedDict[tuple, tuple[float, int, any]] = collections.OrderedDict()
+        self.__bytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.__capacity > 0
+
+    # everything deciding a result, vectors by a digest of their bytes
+    @staticmethod
+    def key(
+            command: str,
+            vectors: numpy.ndarray,
+            metric: any,
+            top_k: int,
+            query: str | None = None,
+            query_params: list | None = None,
+            projection: Projection | None = None,
+            search: SearchOptions | None = None
+    ) -> tuple:
+        vectors = numpy.ascontiguousarray(vectors, dtype=numpy.float64)
+        return (
+            command,
+            vectors.shape,
+            hashlib.blake2b(vectors.tobytes(), digest_size=16).digest(),
+            metric,
+            top_k,
+            query,
+            None if query_params is None else repr(query_params),
+            None if projection is None else (
+                projection.id, projection.distance, projection.vector, projection.document,
+                tuple(projection.document_keys)
+            ),
+            None if search is None else (search.ef_search, search.nprobe)
+        )
+
+    # results of older versions are dropped once a newer one is seen
+    def __advance(self, version: int):
+        if version > self.__version:
+            self.__version = version
+            self.__results.clear()
+            self.__bytes = 0
+
+    def get(self, key: tuple, version: int) -> any:
+        self.__advance(version)
+        entry = self.__results.get(key)
+        if entry is not None:
+            _expiry, _, _result = entry
+            if self.__ttl <= 0 or time.monotonic() < _expiry:
+                self.__results.move_to_end(key)
+                self.__hits += 1
+                return copy.deepcopy(_result)
+            self.__drop(key)
+        self.__misses += 1
+        return None
+
+    # version is the one the result was read at, a write since makes it stale already
+    def put(self, key: tuple, version: int, result: any):
+        self.__advance(version)
+        size = size_of(result)
+        if version < self.__version or size > self.__capacity:
+            return
+        if key in self.__results.keys():
+            self.__drop(key)
+        self.__results[key] = (time.monotonic() + self.__ttl, size, copy.deepcopy(result))
+        self.__bytes += size
+        while self.__bytes > self.__capacity:
+            self.__drop(next(iter(self.__results)))
+            self.__evictions += 1
+
+    def __drop(self, key: tuple):
+        self.__bytes -= self.__results.pop(key)[1]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self.__results),
+            'bytes': self.__bytes,
+            'capacity': self.__capacity,
+            'hits': self.__hits,
+            'misses': self.__misses,
+            'evictions': self.__evictions
+        }
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+
+from bhakti.const import UTF_8, EMPTY_DICT, EMPTY_LIST
+
+log = logging.getLogger("dipamkara")
+
+SNAPSHOT_DIR = '.snapshot'
+SNAPSHOT_MANIFEST = 'manifest'
+# documents are spread over segments by id, a snapshot rewrites only segments touched since the last one
+SNAPSHOT_SEGMENTS = 256
+# 2: segments keyed by document id, the vectors themselves are in the vector store,
+# snapshots without a format are keyed by vector string, {vector string: document id} in place of the vector keys
+SNAPSHOT_FORMAT = 2
+
+# vector keys are digests of vectors in the dtype they are stored in, float64 for snapshots of no dtype
+SNAPSHOT_DEFAULT_DTYPE = 'float64'
+
+# segment := ({document id: vector key}, {index: {document id: value}})
+Segment = tuple[dict[int, str], dict[str, dict[int, any]]]
+
+
+def write_file(path: str, content: str, durable: bool):
+    # written aside and renamed over, so a crash or a reader never sees it half written
+    with open(f'{path}.tmp', 'w', encoding=UTF_8) as file:
+        file.write(content)
+        if durable:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(f'{path}.tmp', path)
+
+
+# segment files are immutable and named <segment>.<generation>,
+# a snapshot commits by replacing the manifest naming the live file of every segment
+class Snapshot:
+    def __init__(self, archive_path: str):
+        self.__path = os.path.join(archive_path, SNAPSHOT_DIR)
+        self.__manifest_path = os.path.join(self.__path, SNAPSHOT_MANIFEST)
+        self.__manifest: dict[str, any] = {
+            'format': SNAPSHOT_FORMAT,
+            'segments': SNAPSHOT_SEGMENTS,
+            'generation': 0,
+            'indices': EMPTY_LIST(),
+            'ranges': EMPTY_LIST(),
+            'files': EMPTY_DICT()
+        }
+        if os.path.exists(self.__manifest_path):
+            self.__manifest = self.__read_manifest()
+        # background and inline snapshots may commit concurrently
+        self.__committing = threading.Lock()
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.__manifest_path)
+
+    @property
+    def segments(self) -> int:
+        return self.__manifest['segments']
+
+    @property
+    def generation(self) -> int:
+        return self.__manifest['generation']
+
+    @property
+    def dtype(self) -> str:
+        return self.__manifest.get('dtype', SNAPSHOT_DEFAULT_DTYPE)
+
+    @property
+    def keyed_by_id(self) -> bool:
+        return self.__manifest.get('format', 1) >= SNAPSHOT_FORMAT
+
+    def segment_of(self, doc_id: int) -> int:
+        return doc_id % self.segments
+
+    def __read_manifest(self) -> dict[str, any]:
+        with open(self.__manifest_path, 'r', encoding=UTF_8) as file:
+            return json.loads(file.read())
+
+    def __read_segment(self, segment: str, generation: int, keyed_by_id: bool) -> Segment:
+        with open(os.path.join(self.__path, f'{segment}.{generation}'), 'r', encoding=UTF_8) as file:
+            members, indices = json.loads(file.read())
+        if not keyed_by_id:
+            return members, indices
+        # json keys are strings
+        return {int(_doc_id): _key for _doc_id, _key in members.items()}, {
+            _index: {int(_doc_id): _value for _doc_id, _value in _values.items()}
+            for _index, _values in indices.items()
+        }
+
+    # vector keys, inverted indices and indices kept as ranges of the last committed snapshot,
+    # keyed by document id, or by vector string in a snapshot of no format
+    def load(self) -> tuple[dict[int | str, str | int], dict[str, dict[int | str, any]], list[str]]:
+        manifest = self.__read_manifest()
+        keyed_by_id = manifest.get('format', 1) >= SNAPSHOT_FORMAT
+        members: dict[int | str, str | int] = EMPTY_DICT()
+        inverted_index: dict[str, dict[int | str, any]] = {_index: EMPTY_DICT() for _index in manifest['indices']}
+        for _segment, _generation in manifest['files'].items():
+            _members, _indices = self.__read_segment(_segment, _generation, keyed_by_id)
+            members.update(_members)
+            for _index, _values in _indices.items():
+                if _index in inverted_index.keys():
+                    inverted_index[_index].update(_values)
+        return members, inverted_index, manifest.get('ranges', EMPTY_LIST())
+
+    # segments of the last committed snapshot whose generation differs from the files given,
+    # with the files of that snapshot, its indices and its indices kept as ranges
+    def load_changed(
+            self,
+            files: dict[str, int]
+    ) -> tuple[dict[str, int], dict[int, Segment], list[str], list[str]]:
+        manifest = self.__read_manifest()
+        if manifest.get('format', 1) < SNAPSHOT_FORMAT:
+            raise ValueError(f'Snapshot {self.__path} is not keyed by document id')
+        segments: dict[int, Segment] = {
+            int(_segment): self.__read_segment(_segment, _generation, True)
+            for _segment, _generation in manifest['files'].items() if files.get(_segment) != _generation
+        }
+        return manifest['files'], segments, manifest['indices'], manifest.get('ranges', EMPTY_LIST())
+
+    # a snapshot taken later may commit first, segments only ever move to newer generations
+    def commit(
+            self,
+            generation: int,
+            segments: dict[int, Segment],
+            indices: list[str],
+            ranges: list[str],
+            dtype: str,
+            durable: bool
+    ):
+        os.makedirs(self.__path, exist_ok=True)
+        with self.__committing:
+            files: dict[str, int] = dict(self.__manifest['files'])
+            superseded = EMPTY_LIST()
+            for _segment, _content in segments.items():
+                _name = str(_segment)
+                if files.get(_name, -1) > generation:
+                    continue
+                write_file(
+                    os.path.join(self.__path, f'{_name}.{generation}'),
+                    json.dumps(_content, ensure_ascii=False),
+                    durable=durable
+                )
+                if _name in files.keys() and files[_name] != generation:
+                    superseded.append(f'{_name}.{files[_name]}')
+                files[_name] = generation
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'dtype': dtype,
+                'segments': self.segments,
+                'generation': max(generation, self.generation),
+                'indices': indices if generation >= self.generation else self.__manifest['indices'],
+                'ranges': ranges if generation >= self.generation else self.__manifest.get('ranges', EMPTY_LIST()),
+                'files': files
+            }
+            write_file(self.__manifest_path, json.dumps(manifest, ensure_ascii=False), durable=durable)
+            self.__manifest = manifest
+            for _file in superseded:
+                os.remove(os.path.join(self.__path, _file))
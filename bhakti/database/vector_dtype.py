@@ -0,0 +1,9 @@
+import enum
+
+
+# precision vectors are stored, saved and sent back in
+class VectorDtype(enum.Enum):
+    FLOAT16 = 'float16'
+    FLOAT32 = 'float32'
+    FLOAT64 = 'float64'
+    DEFAULT_DTYPE = FLOAT32
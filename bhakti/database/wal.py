@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import os
+
+from bhakti.const import UTF_8, EMPTY_LIST, DEFAULT_WAL_COMMIT_INTERVAL, DEFAULT_WAL_COMMIT_SIZE
+
+log = logging.getLogger("dipamkara")
+
+WAL_FILE = '.wal'
+WAL_OP = 'op'
+
+
+# append only, one json record per line,
+# records appended within a commit window share a single fsync (group commit),
+# the log is a sequence of files <path>.<seq>, a snapshot rotates to a new one and drops the older
+class WriteAheadLog:
+    def __init__(
+            self,
+            path: str,
+            commit_interval: float = DEFAULT_WAL_COMMIT_INTERVAL,
+            commit_size: int = DEFAULT_WAL_COMMIT_SIZE
+    ):
+        self.__path = path
+        self.__commit_interval = commit_interval
+        self.__commit_size = commit_size
+        self.__seq = max(self.__sequence(), default=0)
+        self.__file = open(self.__file_of(self.__seq), 'ab')
+        # appended but not yet on disk, with the writers waiting for them
+        self.__buffer = bytearray()
+        self.__waiters: list[asyncio.Future] = EMPTY_LIST()
+        self.__timer: asyncio.Task | None = None
+        self.__flushing = asyncio.Lock()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def __file_of(self, seq: int) -> str:
+        return f'{self.__path}.{seq}'
+
+    def __sequence(self) -> list[int]:
+        directory, name = os.path.split(self.__path)
+        return sorted(
+            int(_entry[len(name) + 1:]) for _entry in os.listdir(directory)
+            if _entry.startswith(f'{name}.') and _entry[len(name) + 1:].isdigit()
+        )
+
+    # records left by the last run, oldest first, a torn last line of a crash mid-append ends a file
+    def records(self) -> list[dict]:
+        records = EMPTY_LIST()
+        for _seq in self.__sequence():
+            with open(self.__file_of(_seq), 'rb') as file:
+                for _line in file:
+                    try:
+                        records.append(json.loads(_line))
+                    except ValueError:
+                        log.warning(f'Write-ahead log {self.__file_of(_seq)} ends with a torn record, ignored')
+                        break
+        return records
+
+    # resolves once the record is on disk
+    def append(self, record: dict) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        self.__buffer += json.dumps(record, ensure_ascii=False).encode(UTF_8) + b'\n'
+        committed = loop.create_future()
+        self.__waiters.append(committed)
+        if len(self.__buffer) >= self.__commit_size:
+            loop.create_task(self.flush())
+        elif self.__timer is None:
+            self.__timer = loop.create_task(self.__flush_later())
+        return committed
+
+    async def __flush_later(self):
+        await asyncio.sleep(self.__commit_interval)
+        self.__timer = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.__flushing:
+            buffer, waiters = self.__buffer, self.__waiters
+            self.__buffer, self.__waiters = bytearray(), EMPTY_LIST()
+            if not waiters:
+                return
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.__write, bytes(buffer))
+            except Exception as error:
+                log.error(f'Failed to commit write-ahead log {self.__path}: {error}')
+                for _waiter in waiters:
+                    if not _waiter.done():
+                        _waiter.set_exception(error)
+                return
+            for _waiter in waiters:
+                if not _waiter.done():
+                    _waiter.set_result(None)
+
+    def __write(self, data: bytes):
+        self.__file.write(data)
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    # records appended from here on go to a new file, the returned seq marks where a snapshot begins
+    async def rotate(self) -> int:
+        await self.flush()
+        async with self.__flushing:
+            await asyncio.get_running_loop().run_in_executor(None, self.__rotate)
+        return self.__seq
+
+    def __rotate(self):
+        self.__file.close()
+        self.__seq += 1
+        self.__file = open(self.__file_of(self.__seq), 'ab')
+
+    # once a snapshot holds their records, older files are dropped
+    def discard(self, before: int):
+        for _seq in self.__sequence():
+            if _seq < before:
+                os.remove(self.__file_of(_seq))
@@ -2,3 +2,4 @@ from .bhakti_read_timeout_error import BhaktiReadTimeoutError
 from .bhakti_connection_refused_error import BhaktiConnectionRefusedError
 from .bhakti_remote_error import BhaktiRemoteError
 from .engine_not_support_error import EngineNotSupportError
+from .bhakti_protocol_error import BhaktiProtocolError
@@ -1,6 +1,8 @@
 from .str_decoder import StrDecoder
 from .str_encoder import StrEncoder
 from .inbound_data_log import InboundDataLog
-from .dipamkara_handler import DipamkaraHandler
+from .engine_handler import EngineHandler
+# kept for code built on the previous name
+from .engine_handler import EngineHandler as DipamkaraHandler
 from .str_data_trim import StrDataTrim
 from .exception_notifier import ExceptionNotifier
@@ -0,0 +1,620 @@
+import asyncio
+import json
+import logging
+
+import numpy
+from dipamkara.embedding import Metric
+
+from bhakti.const import EMPTY_STR, UTF_8, EMPTY_LIST, EMPTY_DICT
+from bhakti.server.pipeline import PipelineStage
+from bhakti.database.ann_index import SearchOptions
+from bhakti.database.engine import Engine
+from bhakti.exception.engine_not_support_error import EngineNotSupportError
+from bhakti.database.projection import Projection, PROJECTION_VECTOR
+from bhakti.database.range_index import IndexKind
+from bhakti.util.envelope import pack_envelope, unpack_envelope
+from bhakti.util.frame import FRAME_FLAG_ENVELOPE, FrameWriter
+
+log = logging.getLogger("dipamkara")
+
+
+# numpy values left in a json response, e.g. distances in the stored precision
+def json_default(value: any) -> any:
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+# response
+# state in ("Exception", "OK")
+# binary responses are envelopes carrying ndarrays as raw buffers
+def generate_response(state: str, message: str, data: any, eof: bytes, binary: bool = False) -> bytes:
+    response = {
+        'state': state,
+        'message': message,
+        'data': data
+    }
+    if binary:
+        return pack_envelope(response) + eof
+    return json.dumps(response, ensure_ascii=False, default=json_default).encode(UTF_8) + eof
+
+
+def parse_metric(metric: str) -> Metric:
+    for _metric in Metric:
+        if _metric.value == metric:
+            return _metric
+    return Metric.DEFAULT_METRIC
+
+
+STATE_EXCEPTION = "Exception"
+STATE_OK = "OK"
+# meta
+DB_ENGINE_FIELD = 'db_engine'
+DB_OPT_FIELD = 'opt'
+# option
+DB_OPT_INSIGHT = 'insight'
+DB_OPT_CREATE = 'create'
+DB_OPT_READ = 'read'
+DB_OPT_UPDATE = 'update'
+DB_OPT_DELETE = 'delete'
+DB_OPT_SAVE = 'save'
+
+DB_CMD_FIELD = 'cmd'
+# method
+DB_CMD_INSIGHT = 'insight'
+DB_CMD_CREATE = 'create'
+DB_CMD_CREATE_MANY = 'create_many'
+DB_CMD_CREATE_INDEX = 'create_index'
+DB_CMD_SAVE = 'save'
+DB_CMD_INVALIDATE_CACHED_DOC_BY_VECTOR = 'invalidate_cached_doc_by_vector'
+DB_CMD_REMOVE_BY_VECTOR = 'remove_by_vector'
+DB_CMD_INDEXED_REMOVE = 'indexed_remove'
+DB_CMD_REMOVE_INDEX = 'remove_index'
+DB_CMD_MOD_DOC_BY_VECTOR = 'mod_doc_by_vector'
+DB_CMD_TRAIN_INDEX = 'train_index'
+DB_CMD_VECTOR_QUERY = 'vector_query'
+DB_CMD_VECTOR_QUERY_BATCH = 'vector_query_batch'
+DB_CMD_INDEXED_VECTOR_QUERY = 'indexed_vector_query'
+DB_CMD_FIND_DOCUMENTS_BY_VECTOR = 'find_documents_by_vector'
+DB_CMD_FIND_DOCUMENTS_BY_VECTOR_BATCH = 'find_documents_by_vector_batch'
+DB_CMD_FIND_DOCUMENTS_BY_VECTOR_INDEXED = 'find_documents_by_vector_indexed'
+
+DB_PARAM_FIELD = 'param'
+# param
+DB_PARAM_VECTOR = 'vector'
+DB_PARAM_VECTORS = 'vectors'
+DB_PARAM_DOCUMENT = 'document'
+DB_PARAM_DOCUMENTS = 'documents'
+DB_PARAM_INDICES = 'indices'
+DB_PARAM_INDEX = 'index'
+DB_PARAM_DETAILED = 'detailed'
+DB_PARAM_KIND = 'kind'
+DB_PARAM_CACHED = 'cached'
+DB_PARAM_QUERY = 'query'
+DB_PARAM_QUERY_PARAMS = 'query_params'
+DB_PARAM_KEY = 'key'
+DB_PARAM_VALUE = 'value'
+DB_PARAM_METRIC_VALUE = 'metric_value'
+DB_PARAM_TOP_K = 'top_k'
+DB_PARAM_CHUNK_SIZE = 'chunk_size'
+DB_PARAM_PROJECTION = 'projection'
+DB_PARAM_WAIT = 'wait'
+# read commands answering with projected results when given a projection
+DB_CMDS_PROJECTABLE = (
+    DB_CMD_VECTOR_QUERY,
+    DB_CMD_INDEXED_VECTOR_QUERY,
+    DB_CMD_VECTOR_QUERY_BATCH,
+    DB_CMD_FIND_DOCUMENTS_BY_VECTOR,
+    DB_CMD_FIND_DOCUMENTS_BY_VECTOR_INDEXED,
+    DB_CMD_FIND_DOCUMENTS_BY_VECTOR_BATCH
+)
+DB_CMDS_INDEXED = (DB_CMD_INDEXED_VECTOR_QUERY, DB_CMD_FIND_DOCUMENTS_BY_VECTOR_INDEXED)
+DB_CMDS_BATCH = (DB_CMD_VECTOR_QUERY_BATCH, DB_CMD_FIND_DOCUMENTS_BY_VECTOR_BATCH)
+
+
+# noinspection DuplicatedCode
+# dispatches commands to whichever engine serves the archive
+class EngineHandler(PipelineStage):
+    def __init__(self, name: str = 'engine_handler'):
+        super().__init__(name)
+
+    async def do(
+            self,
+            data: bytes | str,
+            fire: bool,
+            errors: list[Exception],
+            io_context: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None,
+            eof: bytes,
+            extra_context: Engine
+    ) -> tuple[any, any, list[Exception], bool]:
+        # requests sent as envelopes are answered with envelopes
+        binary = bool(getattr(io_context[1], 'flags', 0) & FRAME_FLAG_ENVELOPE)
+        try:
+            engine_message = unpack_envelope(data) if binary else json.loads(data)
+            if engine_message.get(DB_ENGINE_FIELD, EMPTY_STR()) != extra_context.db_engine.value:
+                raise EngineNotSupportError(f'DBEngine "{engine_message.get(DB_ENGINE_FIELD, EMPTY_STR())}" is not served, '
+                                            f'the server runs {extra_context.db_engine.value}')
+            else:
+                if (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_INSIGHT and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_INSIGHT
+                ):
+                    try:
+                        insight = await extra_context.insight()
+                        io_context[1].write(generate_response(
+                            state=STATE_OK,
+                            message=EMPTY_STR(),
+                            data=insight,
+                            eof=eof,
+                            binary=binary
+                        ))
+                    except Exception as _error:
+                        io_context[1].write(generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                        errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_CREATE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_CREATE
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        document = params.get(DB_PARAM_DOCUMENT, EMPTY_STR())
+                        indices = params.get(DB_PARAM_INDICES, EMPTY_STR())
+                        cached = params.get(DB_PARAM_CACHED, EMPTY_STR())
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.create(
+                                    vector=vector,
+                                    document=document,
+                                    indices=indices,
+                                    cached=cached
+                                ),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_CREATE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_CREATE_MANY
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vectors = numpy.asarray(params.get(DB_PARAM_VECTORS, EMPTY_LIST()))
+                        documents = params.get(DB_PARAM_DOCUMENTS, EMPTY_LIST())
+                        indices = params.get(DB_PARAM_INDICES, EMPTY_STR())
+                        cached = params.get(DB_PARAM_CACHED, EMPTY_STR())
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.create_many(
+                                    vectors=vectors,
+                                    documents=documents,
+                                    indices=indices,
+                                    cached=cached
+                                ),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_CREATE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_CREATE_INDEX
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        index = params.get(DB_PARAM_INDEX, EMPTY_STR())
+                        detailed = params.get(DB_PARAM_DETAILED, EMPTY_STR())
+                        kind = params.get(DB_PARAM_KIND, IndexKind.DEFAULT_KIND.value)
+                        try:
+                            _result = await extra_context.create_index(index=index, kind=kind)
+                            if not detailed:
+                                _result = True
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=_result,
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            if not detailed:
+                                io_context[1].write(generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                            else:
+                                io_context[1].write(generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_SAVE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_SAVE
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_DICT())
+                    try:
+                        # the snapshot is taken in the background, waiting for it is optional
+                        await extra_context.save(wait=params.get(DB_PARAM_WAIT, True))
+                        io_context[1].write(generate_response(
+                            state=STATE_OK,
+                            message=EMPTY_STR(),
+                            data=True,
+                            eof=eof,
+                            binary=binary
+                        ))
+                    except Exception as _error:
+                        io_context[1].write(
+                            generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                        errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_DELETE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_INVALIDATE_CACHED_DOC_BY_VECTOR
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.invalidate_cached_doc_by_vector(vector=vector),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_DELETE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_REMOVE_BY_VECTOR
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.remove_by_vector(vector=vector, insta_save=True),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_DELETE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_INDEXED_REMOVE
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        query = params.get(DB_PARAM_QUERY, EMPTY_STR())
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.indexed_remove(
+                                    query=query,
+                                    query_params=params.get(DB_PARAM_QUERY_PARAMS)
+                                ),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_DELETE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_REMOVE_INDEX
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        index = params.get(DB_PARAM_INDEX, EMPTY_STR())
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.remove_index(index=index),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_UPDATE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_MOD_DOC_BY_VECTOR
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        key = params.get(DB_PARAM_KEY, EMPTY_STR())
+                        value = params.get(DB_PARAM_VALUE, EMPTY_STR())
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.mod_doc_by_vector(vector=vector, key=key, value=value),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_UPDATE and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_TRAIN_INDEX
+                ):
+                    try:
+                        io_context[1].write(generate_response(
+                            state=STATE_OK,
+                            message=EMPTY_STR(),
+                            data=await extra_context.train_index(),
+                            eof=eof,
+                            binary=binary
+                        ))
+                    except Exception as _error:
+                        io_context[1].write(
+                            generate_response(state=STATE_EXCEPTION, message=str(_error), data=False, eof=eof, binary=binary))
+                        errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_READ and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) in DB_CMDS_PROJECTABLE and
+                        engine_message.get(DB_PARAM_FIELD, EMPTY_DICT()).get(DB_PARAM_PROJECTION) is not None
+                ):
+                    command = engine_message.get(DB_CMD_FIELD, EMPTY_STR())
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    try:
+                        if command in DB_CMDS_BATCH:
+                            vectors = numpy.asarray(params.get(DB_PARAM_VECTORS, EMPTY_LIST()))
+                        else:
+                            vectors = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))[numpy.newaxis, :]
+                        projection = Projection(params.get(DB_PARAM_PROJECTION))
+                        _result_sets = await extra_context.query_projected(
+                            vectors=vectors,
+                            metric=parse_metric(params.get(DB_PARAM_METRIC_VALUE, EMPTY_STR())),
+                            top_k=params.get(DB_PARAM_TOP_K, EMPTY_STR()),
+                            projection=projection,
+                            query=params.get(DB_PARAM_QUERY, EMPTY_STR()) if command in DB_CMDS_INDEXED else None,
+                            cached=params.get(DB_PARAM_CACHED, EMPTY_STR()),
+                            search=SearchOptions(params),
+                            query_params=params.get(DB_PARAM_QUERY_PARAMS) if command in DB_CMDS_INDEXED else None
+                        )
+                        if projection.vector and not binary:
+                            for _result_set in _result_sets:
+                                for _result in _result_set:
+                                    _result[PROJECTION_VECTOR] = _result[PROJECTION_VECTOR].tolist()
+                        io_context[1].write(generate_response(
+                            state=STATE_OK,
+                            message=EMPTY_STR(),
+                            data=_result_sets if command in DB_CMDS_BATCH else _result_sets[0],
+                            eof=eof,
+                            binary=binary
+                        ))
+                    except Exception as _error:
+                        io_context[1].write(
+                            generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                        errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_READ and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_VECTOR_QUERY
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        metric = parse_metric(params.get(DB_PARAM_METRIC_VALUE, EMPTY_STR()))
+                        top_k = params.get(DB_PARAM_TOP_K, EMPTY_STR())
+                        _result_set_ndarray = await extra_context.vector_query(
+                            vector=vector,
+                            metric=metric,
+                            top_k=top_k,
+                            search=SearchOptions(params)
+                        )
+                        _result_set_list = EMPTY_LIST()
+                        for _ndarray, _distance in _result_set_ndarray:
+                            _result_set_list.append((_ndarray if binary else _ndarray.tolist(), _distance))
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=_result_set_list,
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_READ and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_VECTOR_QUERY_BATCH
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vectors = numpy.asarray(params.get(DB_PARAM_VECTORS, EMPTY_LIST()))
+                        metric = parse_metric(params.get(DB_PARAM_METRIC_VALUE, EMPTY_STR()))
+                        top_k = params.get(DB_PARAM_TOP_K, EMPTY_STR())
+                        try:
+                            _result_sets = EMPTY_LIST()
+                            for _result_set_ndarray in await extra_context.vector_query_batch(
+                                vectors=vectors,
+                                metric=metric,
+                                top_k=top_k,
+                                search=SearchOptions(params)
+                            ):
+                                _result_set_list = EMPTY_LIST()
+                                for _ndarray, _distance in _result_set_ndarray:
+                                    _result_set_list.append((_ndarray if binary else _ndarray.tolist(), _distance))
+                                _result_sets.append(_result_set_list)
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=_result_sets,
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_READ and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_INDEXED_VECTOR_QUERY
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        query = params.get(DB_PARAM_QUERY, EMPTY_STR())
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        metric = parse_metric(params.get(DB_PARAM_METRIC_VALUE, EMPTY_STR()))
+                        top_k = params.get(DB_PARAM_TOP_K, EMPTY_STR())
+                        _result_set_ndarray = await extra_context.indexed_vector_query(
+                            query=query,
+                            vector=vector,
+                            metric=metric,
+                            top_k=top_k,
+                            search=SearchOptions(params),
+                            query_params=params.get(DB_PARAM_QUERY_PARAMS)
+                        )
+                        _result_set_list = EMPTY_LIST()
+                        for _ndarray, _distance in _result_set_ndarray:
+                            _result_set_list.append((_ndarray if binary else _ndarray.tolist(), _distance))
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=_result_set_list,
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_READ and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_FIND_DOCUMENTS_BY_VECTOR
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        metric = parse_metric(params.get(DB_PARAM_METRIC_VALUE, EMPTY_STR()))
+                        top_k = params.get(DB_PARAM_TOP_K, EMPTY_STR())
+                        cached = params.get(DB_PARAM_CACHED, EMPTY_STR())
+                        chunk_size = params.get(DB_PARAM_CHUNK_SIZE, None)
+                        try:
+                            # framed channels may stream results in chunks,
+                            # every chunk is a complete response flagged more but the last
+                            if chunk_size and isinstance(io_context[1], FrameWriter):
+                                async for _chunk in extra_context.iter_documents_by_vector(
+                                    vector=vector,
+                                    metric=metric,
+                                    top_k=top_k,
+                                    cached=cached,
+                                    chunk_size=chunk_size,
+                                    search=SearchOptions(params)
+                                ):
+                                    io_context[1].write(generate_response(
+                                        state=STATE_OK,
+                                        message=EMPTY_STR(),
+                                        data=_chunk,
+                                        eof=eof,
+                                        binary=binary
+                                    ), more=True)
+                                    await io_context[1].drain()
+                                io_context[1].write(generate_response(
+                                    state=STATE_OK,
+                                    message=EMPTY_STR(),
+                                    data=EMPTY_LIST(),
+                                    eof=eof,
+                                    binary=binary
+                                ))
+                            else:
+                                io_context[1].write(generate_response(
+                                    state=STATE_OK,
+                                    message=EMPTY_STR(),
+                                    data=await extra_context.find_documents_by_vector(
+                                        vector=vector,
+                                        metric=metric,
+                                        top_k=top_k,
+                                        cached=cached,
+                                        search=SearchOptions(params)
+                                    ),
+                                    eof=eof,
+                                    binary=binary
+                                ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_READ and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_FIND_DOCUMENTS_BY_VECTOR_BATCH
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        vectors = numpy.asarray(params.get(DB_PARAM_VECTORS, EMPTY_LIST()))
+                        metric = parse_metric(params.get(DB_PARAM_METRIC_VALUE, EMPTY_STR()))
+                        top_k = params.get(DB_PARAM_TOP_K, EMPTY_STR())
+                        cached = params.get(DB_PARAM_CACHED, EMPTY_STR())
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.find_documents_by_vector_batch(
+                                    vectors=vectors,
+                                    metric=metric,
+                                    top_k=top_k,
+                                    cached=cached,
+                                    search=SearchOptions(params)
+                                ),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+                elif (
+                        engine_message.get(DB_OPT_FIELD, EMPTY_STR()) == DB_OPT_READ and
+                        engine_message.get(DB_CMD_FIELD, EMPTY_STR()) == DB_CMD_FIND_DOCUMENTS_BY_VECTOR_INDEXED
+                ):
+                    params = engine_message.get(DB_PARAM_FIELD, EMPTY_STR())
+                    if params != EMPTY_STR():
+                        query = params.get(DB_PARAM_QUERY, EMPTY_STR())
+                        vector = numpy.asarray(params.get(DB_PARAM_VECTOR, EMPTY_STR()))
+                        metric = parse_metric(params.get(DB_PARAM_METRIC_VALUE, EMPTY_STR()))
+                        top_k = params.get(DB_PARAM_TOP_K, EMPTY_STR())
+                        cached = params.get(DB_PARAM_CACHED, EMPTY_STR())
+                        try:
+                            io_context[1].write(generate_response(
+                                state=STATE_OK,
+                                message=EMPTY_STR(),
+                                data=await extra_context.find_documents_by_vector_indexed(
+                                    query=query,
+                                    vector=vector,
+                                    metric=metric,
+                                    top_k=top_k,
+                                    cached=cached,
+                                    search=SearchOptions(params),
+                                    query_params=params.get(DB_PARAM_QUERY_PARAMS)
+                                ),
+                                eof=eof,
+                                binary=binary
+                            ))
+                        except Exception as _error:
+                            io_context[1].write(
+                                generate_response(state=STATE_EXCEPTION, message=str(_error), data=None, eof=eof, binary=binary))
+                            errors.append(_error)
+        except Exception as error:
+            io_context[1].write(generate_response(state=STATE_EXCEPTION, message=str(error), data=None, eof=eof, binary=binary))
+            errors.append(error)
+        return data, extra_context, errors, fire
@@ -1,7 +1,6 @@
 import asyncio
 
 from bhakti.server.pipeline import PipelineStage
-from bhakti.const import DEFAULT_EOF_STR
 
 
 class StrDataTrim(PipelineStage):
@@ -17,5 +16,6 @@ class StrDataTrim(PipelineStage):
             eof: bytes,
             extra_context: any
     ) -> tuple[any, any, list[Exception], bool]:
-        return data[:-1*(len(DEFAULT_EOF_STR))], extra_context, errors, fire
+        # framed messages carry no eof
+        return data[:len(data) - len(eof)], extra_context, errors, fire
 
@@ -2,6 +2,7 @@ import asyncio
 
 from bhakti.server.pipeline import PipelineStage
 from bhakti.const import UTF_8
+from bhakti.util.frame import FRAME_FLAG_ENVELOPE
 
 
 class StrDecoder(PipelineStage):
@@ -17,7 +18,10 @@ class StrDecoder(PipelineStage):
             eof: bytes,
             extra_context: any
     ) -> tuple[any, any, list[Exception], bool]:
-        if isinstance(data, bytes):
+        # envelopes are binary, the handler unpacks them
+        if getattr(io_context[1], 'flags', 0) & FRAME_FLAG_ENVELOPE:
+            return data, extra_context, errors, fire
+        if isinstance(data, bytes | bytearray):
             return data.decode(UTF_8), extra_context, errors, fire
         else:
             return data, extra_context, errors, fire
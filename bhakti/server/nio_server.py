@@ -1,4 +1,5 @@
 import asyncio
+import json
 import logging
 
 import colorama
@@ -9,11 +10,21 @@ from bhakti.const import (
     DEFAULT_HOST,
     DEFAULT_PORT,
     DEFAULT_TIMEOUT,
-    DEFAULT_BUFFER_SIZE
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_MAX_FRAME_SIZE,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    UTF_8,
+    PROTOCOL_EOF,
+    PROTOCOL_FRAME_V2
 )
 from bhakti.const.bhakti_logo import COLORED_BHAKTI_LOGO
 from bhakti.server.pipeline import PipelineStage, Pipeline
 from bhakti.util.readsuntil import readsuntil
+from bhakti.util.frame import FRAME_MAGIC, FRAME_FLAG_ENVELOPE, FRAME_FLAG_HELLO, FrameWriter, readframe
+from bhakti.util.compression import parse_hello, HELLO_COMPRESSION
+from bhakti.exception.bhakti_protocol_error import BhaktiProtocolError
 
 log = logging.getLogger("bhakti")
 
@@ -26,6 +37,11 @@ class NioServer:
             eof: bytes = DEFAULT_EOF,
             timeout: float = DEFAULT_TIMEOUT,
             buffer_size: int = DEFAULT_BUFFER_SIZE,
+            keep_alive: bool = True,
+            idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+            max_frame_size: int = DEFAULT_MAX_FRAME_SIZE,
+            reuse_port: bool = False,
             pipeline: list[PipelineStage] = EMPTY_LIST,
             context: any = None
     ):
@@ -35,6 +51,12 @@ class NioServer:
         self.eof = eof
         self.timeout = timeout
         self.buffer_size = buffer_size
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.max_frame_size = max_frame_size
+        # lets several worker processes listen on the same port
+        self.reuse_port = reuse_port
         self.pipeline = pipeline
 
     def __str__(self):
@@ -47,40 +69,172 @@ class NioServer:
                 f'{colorama.Style.RESET_ALL}')
         return _str
 
+    async def serve(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter | FrameWriter,
+            eof: bytes,
+            data: bytes,
+            drain_lock: asyncio.Lock
+    ):
+        res = await Pipeline(
+            queue=self.pipeline,
+            io_context=(reader, writer),
+            eof=eof,
+            extra_context=self.context,
+            data=data
+        ).launch()
+        # extra context
+        self.context = res[1]
+        if isinstance(writer, FrameWriter):
+            await writer.drain()
+        else:
+            # python 3.10 allows a single drain waiter per stream
+            async with drain_lock:
+                await writer.drain()
+
+    async def serve_detached(
+            self,
+            reader: asyncio.StreamReader,
+            writer: FrameWriter,
+            data: bytes,
+            drain_lock: asyncio.Lock,
+            in_flight: asyncio.Semaphore
+    ):
+        peer = writer.get_extra_info('peername')
+        try:
+            await self.serve(reader=reader, writer=writer, eof=b'', data=data, drain_lock=drain_lock)
+        except ConnectionError as error:
+            log.warning(f'Channel {peer[0]}:{peer[1]} lost: {error}')
+        except Exception as error:
+            log.error(f'Request {writer.request_id} failed on channel {peer[0]}:{peer[1]}: {error}')
+        finally:
+            in_flight.release()
+
     async def channel_handler(
             self,
             reader: asyncio.StreamReader,
             writer: asyncio.StreamWriter
     ):
         peer = writer.get_extra_info('peername')
-        log.info(f'Receiving data from {peer[0]}:{peer[1]}')
+        # a kept-alive channel may sit idle between messages for up to idle_timeout
+        first_read_timeout = self.idle_timeout if self.keep_alive else self.timeout
+        drain_lock = asyncio.Lock()
+        # multiplexed requests being served on this channel
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        detached: set[asyncio.Task] = set()
+        # negotiated through a hello frame
+        codec, compression_threshold = None, DEFAULT_COMPRESSION_THRESHOLD
         try:
-            data = await readsuntil(
-                reader=reader,
-                buffer_size=self.buffer_size,
-                until=self.eof,
-                timeout=self.timeout
-            )
-            res = await Pipeline(
-                queue=self.pipeline,
-                io_context=(reader, writer),
-                eof=self.eof,
-                extra_context=self.context,
-                data=data
-            ).launch()
-            # extra context
-            self.context = res[1]
-        except TimeoutError:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readexactly(len(FRAME_MAGIC)), first_read_timeout)
+                except asyncio.TimeoutError:
+                    # a channel still owing responses is not idle
+                    if detached:
+                        continue
+                    if self.keep_alive:
+                        log.debug(f'Idle timeout on channel {peer[0]}:{peer[1]}')
+                    else:
+                        log.warning(f'Read timeout on channel {peer[0]}:{peer[1]}')
+                    break
+                except asyncio.IncompleteReadError as error:
+                    # peer closed the channel between messages
+                    if error.partial:
+                        raise
+                    break
+                log.info(f'Receiving data from {peer[0]}:{peer[1]}')
+                # the protocol is negotiated per message, framed messages are answered with frames
+                if head == FRAME_MAGIC:
+                    data, version, flags, request_id = await readframe(
+                        reader=reader,
+                        timeout=self.timeout,
+                        magic=head,
+                        max_size=self.max_frame_size
+                    )
+                    if flags & FRAME_FLAG_HELLO:
+                        try:
+                            codec, compression_threshold = parse_hello(data)
+                            log.debug(f'Compression {codec} negotiated on channel {peer[0]}:{peer[1]}')
+                        except ValueError as error:
+                            # answered with no codec, the channel goes on uncompressed
+                            codec, compression_threshold = None, DEFAULT_COMPRESSION_THRESHOLD
+                            log.warning(f'Malformed hello on channel {peer[0]}:{peer[1]}, no compression: {error}')
+                        hello_writer = FrameWriter(
+                            writer=writer,
+                            version=version,
+                            flags=FRAME_FLAG_HELLO,
+                            request_id=request_id,
+                            drain_lock=drain_lock
+                        )
+                        hello_writer.write(json.dumps({HELLO_COMPRESSION: codec}).encode(UTF_8))
+                        await hello_writer.drain()
+                        continue
+                    channel_writer = FrameWriter(
+                        writer=writer,
+                        version=version,
+                        flags=flags & FRAME_FLAG_ENVELOPE,
+                        request_id=request_id,
+                        drain_lock=drain_lock,
+                        codec=codec,
+                        compression_threshold=compression_threshold
+                    )
+                    eof = b''
+                else:
+                    data = await readsuntil(
+                        reader=reader,
+                        buffer_size=self.buffer_size,
+                        until=self.eof,
+                        timeout=self.timeout,
+                        initial=head
+                    )
+                    version, channel_writer, eof = PROTOCOL_EOF, writer, self.eof
+                # requests carrying ids are served concurrently and answered as they complete,
+                # older protocols keep strict request-response order
+                if version >= PROTOCOL_FRAME_V2:
+                    await in_flight.acquire()
+                    task = asyncio.create_task(self.serve_detached(
+                        reader=reader,
+                        writer=channel_writer,
+                        data=data,
+                        drain_lock=drain_lock,
+                        in_flight=in_flight
+                    ))
+                    detached.add(task)
+                    task.add_done_callback(detached.discard)
+                else:
+                    await self.serve(reader=reader, writer=channel_writer, eof=eof, data=data, drain_lock=drain_lock)
+                if not self.keep_alive:
+                    break
+        except asyncio.TimeoutError:
             log.warning(f'Read timeout on channel {peer[0]}:{peer[1]}')
+        except asyncio.IncompleteReadError:
+            log.warning(f'Channel {peer[0]}:{peer[1]} closed before message completed')
+        except BhaktiProtocolError as error:
+            log.warning(f'Protocol error on channel {peer[0]}:{peer[1]}: {error}')
+        except ConnectionError as error:
+            log.warning(f'Channel {peer[0]}:{peer[1]} lost: {error}')
         finally:
+            if detached:
+                await asyncio.gather(*detached, return_exceptions=True)
             writer.close()
-            await writer.wait_closed()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
 
-    async def run(self):
+    async def start(self) -> asyncio.Server:
         server = await asyncio.start_server(
             self.channel_handler,
             self.host,
-            self.port
+            self.port,
+            reuse_port=self.reuse_port
         )
+        # port 0 binds an ephemeral port
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    async def run(self):
+        server = await self.start()
         async with server:
             await server.serve_forever()
@@ -0,0 +1,70 @@
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from bhakti.const import EMPTY_LIST, DEFAULT_COMPRESSION_THRESHOLD
+from bhakti.exception.bhakti_protocol_error import BhaktiProtocolError
+
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_LZ4 = 'lz4'
+COMPRESSION_ZLIB = 'zlib'
+# compressed payload := codec id(1) compressed data
+# codec name => (id, compress, decompress)
+CODECS: dict[str, tuple[int, callable, callable]] = dict()
+if zstandard is not None:
+    CODECS[COMPRESSION_ZSTD] = (2, lambda data: zstandard.ZstdCompressor().compress(data),
+                                lambda data: zstandard.ZstdDecompressor().decompress(data))
+if lz4 is not None:
+    CODECS[COMPRESSION_LZ4] = (3, lz4.frame.compress, lz4.frame.decompress)
+CODECS[COMPRESSION_ZLIB] = (1, lambda data: zlib.compress(data, 1), zlib.decompress)
+CODEC_IDS: dict[int, callable] = {_id: _decompress for _id, _, _decompress in CODECS.values()}
+# hello fields, the offer carries both, the answer names the codec picked or null
+HELLO_COMPRESSION = 'compression'
+HELLO_COMPRESSION_THRESHOLD = 'compression_threshold'
+
+
+# codecs installed here, most preferred first
+def available_codecs() -> list[str]:
+    return list(CODECS.keys())
+
+
+def negotiate_codec(offered: list[str]) -> str | None:
+    for codec in offered:
+        if codec in CODECS:
+            return codec
+    return None
+
+
+# (codec picked, compression threshold) for a hello offer, ValueError if it is malformed,
+# which covers payloads that are not json or not utf-8
+def parse_hello(data: bytes | bytearray) -> tuple[str | None, int]:
+    hello = json.loads(data)
+    if not isinstance(hello, dict):
+        raise ValueError(f'Hello should be an object, not {type(hello).__name__}')
+    offered = hello.get(HELLO_COMPRESSION, EMPTY_LIST())
+    if not isinstance(offered, list) or not all(isinstance(_codec, str) for _codec in offered):
+        raise ValueError(f'Offered codecs should be a list of names, not {offered}')
+    threshold = hello.get(HELLO_COMPRESSION_THRESHOLD, DEFAULT_COMPRESSION_THRESHOLD)
+    if not isinstance(threshold, int) or isinstance(threshold, bool) or threshold < 0:
+        raise ValueError(f'Compression threshold should be a non-negative integer, not {threshold}')
+    return negotiate_codec(offered), threshold
+
+
+def compress_payload(data: bytes, codec: str) -> bytes:
+    _id, _compress, _ = CODECS[codec]
+    return bytes((_id,)) + _compress(data)
+
+
+def decompress_payload(payload: bytes | bytearray) -> bytearray:
+    if not payload or payload[0] not in CODEC_IDS:
+        raise BhaktiProtocolError(f'Unknown compression codec {payload[0] if payload else None}')
+    # writable, so ndarrays unpacked from it stay writable
+    return bytearray(CODEC_IDS[payload[0]](memoryview(payload)[1:]))
@@ -0,0 +1,65 @@
+import json
+import math
+import struct
+
+import numpy
+
+from bhakti.const import UTF_8
+
+# envelope := json length(4) json blob
+# ndarrays found in the message travel in the blob as raw little-endian buffers,
+# the json keeps a {"__ndarray__": [offset, dtype, shape]} marker in their place
+ENVELOPE_JSON_LENGTH = struct.Struct('>I')
+NDARRAY_MARKER = '__ndarray__'
+# keeps every buffer aligned for its dtype once the envelope sits in a fresh buffer
+ENVELOPE_ALIGNMENT = 8
+
+
+def _padding(length: int) -> bytes:
+    return b'\x00' * (-length % ENVELOPE_ALIGNMENT)
+
+
+def pack_envelope(message: any) -> bytes:
+    buffers: list = list()
+    offset = 0
+
+    def encode_ndarray(obj: any) -> any:
+        nonlocal offset
+        if isinstance(obj, numpy.ndarray):
+            _ndarray = numpy.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder('<'))
+            marker = {NDARRAY_MARKER: [offset, _ndarray.dtype.str, list(_ndarray.shape)]}
+            buffers.append(_ndarray.data)
+            buffers.append(_padding(_ndarray.nbytes))
+            offset += _ndarray.nbytes + len(buffers[-1])
+            return marker
+        if isinstance(obj, numpy.generic):
+            return obj.item()
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    text = json.dumps(message, ensure_ascii=False, default=encode_ndarray).encode(UTF_8)
+    # json tolerates trailing whitespace, use it to align the blob
+    text += b' ' * (-(ENVELOPE_JSON_LENGTH.size + len(text)) % ENVELOPE_ALIGNMENT)
+    return b''.join([ENVELOPE_JSON_LENGTH.pack(len(text)), text, *buffers])
+
+
+# ndarrays are views over the payload, nothing is copied
+def unpack_envelope(payload: bytes | bytearray | memoryview) -> any:
+    view = memoryview(payload)
+    (length,) = ENVELOPE_JSON_LENGTH.unpack_from(view)
+    blob = view[ENVELOPE_JSON_LENGTH.size + length:]
+
+    def decode_ndarray(obj: dict) -> any:
+        if len(obj) == 1 and NDARRAY_MARKER in obj:
+            offset, dtype, shape = obj[NDARRAY_MARKER]
+            return numpy.frombuffer(
+                blob,
+                dtype=numpy.dtype(dtype),
+                count=math.prod(shape),
+                offset=offset
+            ).reshape(shape)
+        return obj
+
+    return json.loads(
+        bytes(view[ENVELOPE_JSON_LENGTH.size:ENVELOPE_JSON_LENGTH.size + length]),
+        object_hook=decode_ndarray
+    )
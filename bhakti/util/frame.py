@@ -0,0 +1,122 @@
+import asyncio
+import struct
+from asyncio import StreamReader, StreamWriter
+
+from bhakti.const import PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2, DEFAULT_MAX_FRAME_SIZE
+from bhakti.exception.bhakti_protocol_error import BhaktiProtocolError
+from bhakti.util.compression import compress_payload
+
+# frame := magic(2) version(1) header(version specific) payload
+# magic never starts a <eof> terminated message, which is always utf-8 json
+FRAME_MAGIC = b'\xbbK'
+FRAME_HEADERS: dict[int, struct.Struct] = {
+    # flags, payload length
+    PROTOCOL_FRAME_V1: struct.Struct('>BI'),
+    # flags, request id, payload length
+    PROTOCOL_FRAME_V2: struct.Struct('>BII')
+}
+# flags
+FRAME_FLAG_ENVELOPE = 0x01
+# more frames of the same response follow
+FRAME_FLAG_MORE = 0x02
+# per-connection handshake, the client offers codecs and the server picks one
+FRAME_FLAG_HELLO = 0x04
+# payload is compressed with the codec named by its first byte
+FRAME_FLAG_COMPRESSED = 0x08
+
+
+def pack_frame_header(
+        length: int,
+        flags: int = 0,
+        version: int = PROTOCOL_FRAME_V1,
+        request_id: int = 0
+) -> bytes:
+    if version >= PROTOCOL_FRAME_V2:
+        return FRAME_MAGIC + bytes((version,)) + FRAME_HEADERS[version].pack(flags, request_id, length)
+    return FRAME_MAGIC + bytes((version,)) + FRAME_HEADERS[version].pack(flags, length)
+
+
+def pack_frame(
+        payload: bytes,
+        flags: int = 0,
+        version: int = PROTOCOL_FRAME_V1,
+        request_id: int = 0
+) -> bytes:
+    return pack_frame_header(length=len(payload), flags=flags, version=version, request_id=request_id) + payload
+
+
+async def readframe(
+        reader: StreamReader,
+        timeout: float,
+        magic: bytes | None = None,
+        max_size: int = DEFAULT_MAX_FRAME_SIZE
+) -> tuple[bytearray, int, int, int]:
+    # payload, version, flags, request id
+    if magic is None:
+        magic = await asyncio.wait_for(reader.readexactly(len(FRAME_MAGIC)), timeout)
+    if magic != FRAME_MAGIC:
+        raise BhaktiProtocolError(f'Bad frame magic {magic}')
+    version = (await asyncio.wait_for(reader.readexactly(1), timeout))[0]
+    if version not in FRAME_HEADERS:
+        raise BhaktiProtocolError(f'Unsupported protocol version {version}')
+    header = FRAME_HEADERS[version]
+    fields = header.unpack(await asyncio.wait_for(reader.readexactly(header.size), timeout))
+    if version >= PROTOCOL_FRAME_V2:
+        flags, request_id, length = fields
+    else:
+        (flags, length), request_id = fields, 0
+    if length > max_size:
+        raise BhaktiProtocolError(f'Frame of {length} bytes exceeds {max_size} bytes')
+    # the buffer grows as the payload arrives, a header alone never reserves the length it announces
+    payload = bytearray()
+    while len(payload) < length:
+        block = await asyncio.wait_for(reader.read(n=length - len(payload)), timeout)
+        if not block:
+            raise asyncio.IncompleteReadError(partial=bytes(payload), expected=length)
+        payload += block
+    return payload, version, flags, request_id
+
+
+# every write() goes out as exactly one frame,
+# so pipeline stages keep writing whole messages regardless of the protocol
+class FrameWriter:
+    def __init__(
+            self,
+            writer: StreamWriter,
+            version: int = PROTOCOL_FRAME_V1,
+            flags: int = 0,
+            request_id: int = 0,
+            drain_lock: asyncio.Lock | None = None,
+            codec: str | None = None,
+            compression_threshold: int = 0
+    ):
+        self.writer = writer
+        self.version = version
+        self.flags = flags
+        self.request_id = request_id
+        # negotiated for the channel, payloads from compression_threshold bytes up get compressed
+        self.codec = codec
+        self.compression_threshold = compression_threshold
+        # shared by every frame writer of a channel, python 3.10 allows a single drain waiter per stream
+        self.drain_lock = drain_lock if drain_lock is not None else asyncio.Lock()
+
+    # a streamed response is a run of frames flagged more, closed by one without
+    def write(self, data: bytes, more: bool = False):
+        flags = self.flags | FRAME_FLAG_MORE if more else self.flags
+        if self.codec is not None and len(data) >= self.compression_threshold:
+            data = compress_payload(data, self.codec)
+            flags |= FRAME_FLAG_COMPRESSED
+        self.writer.write(pack_frame_header(
+            length=len(data),
+            flags=flags,
+            version=self.version,
+            request_id=self.request_id
+        ))
+        self.writer.write(data)
+
+    async def drain(self):
+        async with self.drain_lock:
+            await self.writer.drain()
+
+    def __getattr__(self, item):
+        return getattr(self.writer, item)
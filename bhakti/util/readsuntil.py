@@ -2,10 +2,21 @@ import asyncio
 from asyncio import StreamReader
 
 
-async def readsuntil(reader: StreamReader, buffer_size: int, until: bytes, timeout: float) -> bytes:
-    blocks: bytes = bytes(b'')
-    while True:
-        blocks += await asyncio.wait_for(reader.read(n=buffer_size), timeout)
-        if until in blocks:
-            return blocks
-
+async def readsuntil(
+        reader: StreamReader,
+        buffer_size: int,
+        until: bytes,
+        timeout: float,
+        initial: bytes = b''
+) -> bytes:
+    blocks: bytearray = bytearray(initial)
+    # only the tail that arrived since the last scan can complete the terminator
+    searched = 0
+    while blocks.find(until, searched) < 0:
+        searched = max(0, len(blocks) - len(until) + 1)
+        block = await asyncio.wait_for(reader.read(n=buffer_size), timeout)
+        # peer closed the channel before the message was complete
+        if not block:
+            raise asyncio.IncompleteReadError(partial=bytes(blocks), expected=None)
+        blocks += block
+    return bytes(blocks)
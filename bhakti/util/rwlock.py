@@ -0,0 +1,49 @@
+import asyncio
+import contextlib
+
+
+# many readers or a single writer, waiting writers hold new readers back so writes are not starved
+class RWLock:
+    def __init__(self):
+        self.__readers = 0
+        self.__writing = False
+        self.__writers_waiting = 0
+        self.__condition = asyncio.Condition()
+
+    @property
+    def readers(self) -> int:
+        return self.__readers
+
+    @property
+    def writing(self) -> bool:
+        return self.__writing
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        async with self.__condition:
+            await self.__condition.wait_for(lambda: not self.__writing and self.__writers_waiting == 0)
+            self.__readers += 1
+        try:
+            yield
+        finally:
+            async with self.__condition:
+                self.__readers -= 1
+                self.__condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self.__condition:
+            self.__writers_waiting += 1
+            try:
+                await self.__condition.wait_for(lambda: not self.__writing and self.__readers == 0)
+            finally:
+                self.__writers_waiting -= 1
+                # readers held back by a writer given up on must be woken
+                self.__condition.notify_all()
+            self.__writing = True
+        try:
+            yield
+        finally:
+            async with self.__condition:
+                self.__writing = False
+                self.__condition.notify_all()
@@ -28,7 +28,7 @@ setuptools.setup(
     packages=setuptools.find_packages(where="."),
     python_requires=">=3.10",
     install_requires=[
-        'dipamkara',
+        'dipamkara==0.3.8',
         'colorama>=0.4.6',
         'argparse>=1.4.0',
         'PyYAML>=6.0.2'
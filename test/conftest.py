@@ -0,0 +1,26 @@
+import contextlib
+
+import pytest
+
+from bhakti.bootstrap.bhakti_server import build_pipeline
+from bhakti.server import NioServer
+
+# test_bootstrap.py and test_bhakti_client.py are run by hand against a live server
+collect_ignore = ['test_bootstrap.py', 'test_bhakti_client.py']
+
+
+# serves an engine on an ephemeral port of the running event loop, yields the port
+@contextlib.asynccontextmanager
+async def serve(engine: any, **kwargs):
+    server = NioServer(host='127.0.0.1', port=0, pipeline=build_pipeline(), context=engine, **kwargs)
+    listening = await server.start()
+    try:
+        yield server.port
+    finally:
+        listening.close()
+        await listening.wait_closed()
+
+
+@pytest.fixture
+def serving():
+    return serve
@@ -0,0 +1,94 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric
+
+DIMENSION = 8
+ENGINES = {DBEngine.DIPAMKARA: DipamkaraEngine, DBEngine.FLAT: FlatEngine}
+METRICS = [Metric.EUCLIDEAN, Metric.COSINE, Metric.CHEBYSHEV]
+VECTORS = numpy.random.default_rng(0).standard_normal((200, DIMENSION))
+QUERIES = numpy.random.default_rng(1).standard_normal((30, DIMENSION))
+
+
+async def open_engine(db_engine: DBEngine, path: str) -> DipamkaraEngine | FlatEngine:
+    engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=path)
+    await engine.recover()
+    await engine.create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))])
+    return engine
+
+
+def plain(results: list[tuple[numpy.ndarray, numpy.float64]]) -> list[tuple[list[float], float]]:
+    return [(numpy.asarray(_vector).tolist(), float(_distance)) for _vector, _distance in results]
+
+
+# distances are computed in float32, a different batch shape may round them differently
+@pytest.mark.parametrize('metric', METRICS)
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_batch_is_the_same_as_single_queries(tmp_path, db_engine, metric):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        return (
+            await engine.vector_query_batch(QUERIES, metric, 5),
+            [await engine.vector_query(_query, metric, 5) for _query in QUERIES],
+            await engine.find_documents_by_vector_batch(QUERIES, metric, 5),
+            [await engine.find_documents_by_vector(_query, metric, 5) for _query in QUERIES]
+        )
+
+    batch, single, documents_batch, documents_single = asyncio.run(main())
+    assert len(batch) == len(QUERIES)
+    for _batch, _single in zip(batch, single):
+        _batch, _single = plain(_batch), plain(_single)
+        assert [_vector for _vector, _ in _batch] == [_vector for _vector, _ in _single]
+        assert [_distance for _, _distance in _batch] == pytest.approx(
+            [_distance for _, _distance in _single], abs=1e-6
+        )
+    for _batch, _single in zip(documents_batch, documents_single):
+        assert [_document for _document, _ in _batch] == [_document for _document, _ in _single]
+
+
+# every row holds the k nearest by a brute-force scan, nearest first
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_batch_finds_the_nearest(tmp_path, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        return await engine.find_documents_by_vector_batch(QUERIES, Metric.EUCLIDEAN, 10)
+
+    distances = numpy.linalg.norm(QUERIES[:, numpy.newaxis, :] - VECTORS[numpy.newaxis, :, :], axis=2)
+    for _row, _distances in zip(asyncio.run(main()), distances):
+        assert [_document['i'] for _document, _ in _row] == numpy.argsort(_distances)[:10].tolist()
+        assert [_distance for _, _distance in _row] == pytest.approx(numpy.sort(_distances)[:10].tolist())
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_top_k_beyond_the_collection(tmp_path, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        return await engine.vector_query_batch(QUERIES[:3], Metric.EUCLIDEAN, len(VECTORS) + 10)
+
+    assert [len(_row) for _row in asyncio.run(main())] == [len(VECTORS)] * 3
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_client_batches(tmp_path, serving, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        async with serving(engine) as port:
+            async with BhaktiClient(port=port, db_engine=db_engine) as client:
+                return (
+                    await client.vector_query_batch(QUERIES, Metric.EUCLIDEAN, 3),
+                    await client.find_documents_by_vector_batch(QUERIES, Metric.EUCLIDEAN, 3),
+                    await engine.find_documents_by_vector_batch(QUERIES, Metric.EUCLIDEAN, 3)
+                )
+
+    vectors, documents, expected = asyncio.run(main())
+    assert len(vectors) == len(documents) == len(QUERIES)
+    for _vectors, _documents, _expected in zip(vectors, documents, expected):
+        assert [_document for _document, _ in _documents] == [_document for _document, _ in _expected]
+        numpy.testing.assert_allclose(
+            [_vector for _vector, _ in plain(_vectors)], VECTORS[[_document['i'] for _document, _ in _expected]],
+            rtol=1e-6
+        )
+        assert [_distance for _, _distance in _documents] == pytest.approx([_distance for _, _distance in _expected])
@@ -12,6 +12,9 @@ if __name__ == '__main__':
         eof=b'<eof>',  # optional, default to b'<eof>'
         timeout=4.0,  # optional, default to 4.0 seconds
         buffer_size=256,  # optional, default to 256 bytes
+        keep_alive=True,  # optional, default to true
+        idle_timeout=60.0,  # optional, default to 60.0 seconds
+        max_in_flight=64,  # optional, default to 64 concurrent requests per connection
         verbose=False  # optional, default to false
     )
     # run server
@@ -0,0 +1,105 @@
+import asyncio
+
+import numpy
+import pytest
+from dipamkara.dipamkara_dsl import DipamkaraDsl
+
+from bhakti.database import DipamkaraEngine, FlatEngine, Metric
+from bhakti.database.column_store import ColumnStore
+from bhakti.database.filter import Filter
+
+MIXED = [1, 2.5, 'a', 'b', None, 7, 'female', 3, -1, 10 ** 20, 0.0, 'a b']
+DOCUMENTS = [
+    {'age': _i % 50, 'g': ['male', 'female'][_i % 2], 'm': MIXED[_i % len(MIXED)], 'w': _i / 7}
+    for _i in range(200)
+]
+INDICES = ['age', 'g', 'm', 'w']
+QUERIES = [
+    'age <= 31',
+    'age == 31',
+    'age != 31',
+    'age > 40 || g == "female"',
+    'age <= 31 && g != "female"',
+    'g == "male" && age < 10',
+    'g >= "g"',
+    'w < 3.5 && age >= 2',
+    'w == 1',
+    'm == 1',
+    'm >= 2',
+    'm != "b"',
+    'm == "a" || age > 45',
+    'age < 5 || age > 45 && g == "male"'
+]
+
+
+def inverted_index_of(documents: list[dict]) -> dict[str, dict[int, any]]:
+    return {
+        _index: {_id: _document[_index] for _id, _document in enumerate(documents) if _index in _document.keys()}
+        for _index in INDICES
+    }
+
+
+def columns_of(documents: list[dict]) -> ColumnStore:
+    columns = ColumnStore(len(documents))
+    for _index in INDICES:
+        columns.add(_index, documents)
+    return columns
+
+
+def dsl(expr: str, inverted_index: dict) -> set[int]:
+    return {int(_id) for _id in DipamkaraDsl(expr=expr, inverted_index=inverted_index).process_serialized()}
+
+
+@pytest.mark.parametrize('expr', QUERIES)
+def test_columns_match_the_dsl(expr):
+    inverted_index = inverted_index_of(DOCUMENTS)
+    rows = {_id: _id for _id in range(len(DOCUMENTS))}
+    mask = columns_of(DOCUMENTS).mask(Filter(expr), None, len(DOCUMENTS), inverted_index, rows)
+    assert set(numpy.flatnonzero(mask).tolist()) == dsl(expr, inverted_index)
+
+
+def test_columns_follow_writes():
+    documents = [dict(_document) for _document in DOCUMENTS]
+    columns = columns_of(documents)
+    documents[3]['age'] = 'unknown'
+    columns.set(3, documents[3])
+    del documents[5]['age']
+    columns.set(5, documents[5])
+    # the last row fills the row of a removed one
+    columns.move(len(documents) - 1, 7)
+    documents[7] = documents.pop()
+    inverted_index = inverted_index_of(documents)
+    rows = {_id: _id for _id in range(len(documents))}
+    for _expr in QUERIES:
+        _mask = columns.mask(Filter(_expr), None, len(documents), inverted_index, rows)
+        assert set(numpy.flatnonzero(_mask).tolist()) == dsl(_expr, inverted_index), _expr
+
+
+@pytest.mark.parametrize('engine', [DipamkaraEngine, FlatEngine])
+def test_engines_agree_with_the_dsl(tmp_path, engine):
+    vectors = numpy.random.default_rng(0).standard_normal((len(DOCUMENTS), 4))
+    documents = [dict(_document, i=_i) for _i, _document in enumerate(DOCUMENTS)]
+
+    async def main():
+        database = engine(dimension=4, archive_path=str(tmp_path))
+        await database.recover()
+        await database.create_many(vectors, documents, indices=INDICES)
+        # columns follow removals and modifications
+        await database.remove_by_vector(vectors[4])
+        await database.mod_doc_by_vector(vectors[10], 'age', 31)
+        await database.mod_doc_by_vector(vectors[11], 'g', 7)
+        found = dict()
+        for _expr in QUERIES:
+            _documents = await database.find_documents_by_vector_indexed(
+                _expr, vectors[0], Metric.EUCLIDEAN, len(DOCUMENTS)
+            )
+            found[_expr] = sorted(_document['i'] for _document, _ in _documents)
+        return found
+
+    documents[10]['age'] = 31
+    documents[11]['g'] = 7
+    inverted_index = inverted_index_of(documents)
+    for _index in INDICES:
+        del inverted_index[_index][4]
+    for _expr, _found in asyncio.run(main()).items():
+        assert _found == sorted(dsl(_expr, inverted_index)), _expr
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import numpy
+import pytest
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.client.connection import Connection
+from bhakti.const import UTF_8, PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2, DEFAULT_COMPRESSION_THRESHOLD
+from bhakti.database import DBEngine, DipamkaraEngine, Metric
+from bhakti.exception.bhakti_protocol_error import BhaktiProtocolError
+from bhakti.util.compression import (
+    COMPRESSION_ZLIB, HELLO_COMPRESSION, HELLO_COMPRESSION_THRESHOLD, available_codecs, compress_payload,
+    decompress_payload, negotiate_codec, parse_hello
+)
+from bhakti.util.frame import FRAME_FLAG_COMPRESSED, FRAME_FLAG_HELLO, FRAME_FLAG_MORE, FrameWriter, pack_frame, readframe
+
+DIMENSION = 4
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_round_trip(codec):
+    data = b'{"distance": 0.0}' * 100
+    payload = compress_payload(data, codec)
+    assert len(payload) < len(data) and decompress_payload(payload) == data
+
+
+@pytest.mark.parametrize('payload', [b'', b'\xff' + b'x'])
+def test_unknown_codec(payload):
+    with pytest.raises(BhaktiProtocolError):
+        decompress_payload(payload)
+
+
+def test_negotiation_picks_the_first_codec_offered_and_installed():
+    assert negotiate_codec(['brotli', COMPRESSION_ZLIB]) == COMPRESSION_ZLIB
+    assert negotiate_codec(['brotli']) is None and negotiate_codec([]) is None
+
+
+def test_parse_hello():
+    hello = json.dumps({HELLO_COMPRESSION: ['brotli', COMPRESSION_ZLIB], HELLO_COMPRESSION_THRESHOLD: 16})
+    assert parse_hello(hello.encode(UTF_8)) == (COMPRESSION_ZLIB, 16)
+    assert parse_hello(b'{}') == (None, DEFAULT_COMPRESSION_THRESHOLD)
+
+
+@pytest.mark.parametrize('data', [
+    b'', b'not json', b'\xff\xfe\xfd', b'[]', b'{"compression": "zlib"}', b'{"compression": [1]}',
+    b'{"compression_threshold": -1}', b'{"compression_threshold": "16"}', b'{"compression_threshold": true}'
+])
+def test_malformed_hello(data):
+    with pytest.raises(ValueError):
+        parse_hello(data)
+
+
+# payloads from the threshold up are compressed and flagged, smaller ones are sent as they are
+def test_frame_writer_compresses_from_the_threshold():
+    async def main():
+        reader = asyncio.StreamReader()
+
+        class Sink:
+            @staticmethod
+            def write(data: bytes):
+                reader.feed_data(data)
+
+        writer = FrameWriter(
+            writer=Sink(), version=PROTOCOL_FRAME_V2, request_id=7, codec=COMPRESSION_ZLIB, compression_threshold=64
+        )
+        writer.write(b'a' * 63)
+        writer.write(b'b' * 64, more=True)
+        reader.feed_eof()
+        return [await readframe(reader, timeout=1) for _ in range(2)]
+
+    (small, _, small_flags, _), (large, _, large_flags, request_id) = asyncio.run(main())
+    assert small == b'a' * 63 and small_flags == 0
+    assert large_flags == FRAME_FLAG_COMPRESSED | FRAME_FLAG_MORE and request_id == 7
+    assert len(large) < 64 and decompress_payload(large) == b'b' * 64
+
+
+async def open_engine(path: str) -> DipamkaraEngine:
+    engine = DipamkaraEngine(dimension=DIMENSION, archive_path=path)
+    await engine.recover()
+    await engine.create_many(numpy.arange(40, dtype=numpy.float64).reshape(10, DIMENSION), [{'i': _i} for _i in range(10)])
+    return engine
+
+
+# the server answers a hello it cannot read with no codec and goes on serving the channel
+@pytest.mark.parametrize('hello', [b'not json', b'\xff\xfe', b'[1]', b'{"compression": 1}'])
+def test_malformed_hello_falls_back_to_no_compression(tmp_path, serving, hello):
+    async def main():
+        async with serving(await open_engine(str(tmp_path))) as port:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            try:
+                writer.write(pack_frame(hello, flags=FRAME_FLAG_HELLO, version=PROTOCOL_FRAME_V1))
+                answer = await readframe(reader, timeout=1)
+                request = {'db_engine': DBEngine.DIPAMKARA.value, 'opt': 'insight', 'cmd': 'insight'}
+                writer.write(pack_frame(json.dumps(request).encode(UTF_8), version=PROTOCOL_FRAME_V1))
+                return answer, await readframe(reader, timeout=1)
+            finally:
+                writer.close()
+
+    (data, _, flags, _), (response, _, response_flags, _) = asyncio.run(main())
+    assert flags == FRAME_FLAG_HELLO and json.loads(data) == {HELLO_COMPRESSION: None}
+    assert not response_flags & FRAME_FLAG_COMPRESSED and json.loads(response)['state'] == 'OK'
+
+
+@pytest.mark.parametrize('protocol', [PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2])
+def test_compressed_channel(tmp_path, serving, protocol):
+    async def main():
+        async with serving(await open_engine(str(tmp_path))) as port:
+            connection = await Connection.open(
+                server='127.0.0.1', port=port, protocol=protocol, compression=True, compression_threshold=0
+            )
+            await connection.close()
+            results = list()
+            for _compression in (True, False):
+                async with BhaktiClient(
+                        port=port, protocol=protocol, compression=_compression, compression_threshold=0
+                ) as client:
+                    results.append(await client.find_documents_by_vector(numpy.zeros(DIMENSION), Metric.EUCLIDEAN, 10))
+            return connection.codec, results
+
+    codec, (compressed, plain) = asyncio.run(main())
+    assert codec == available_codecs()[0]
+    assert len(compressed) == 10 and compressed == plain
@@ -0,0 +1,191 @@
+import asyncio
+
+import pytest
+
+from bhakti.client.connection_pool import ConnectionPool
+
+
+# stands in for bhakti.client.connection.Connection
+class FakeConnection:
+    def __init__(self, multiplexed: bool):
+        self.multiplexed = multiplexed
+        self.closing = False
+        self.closed = False
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    async def close(self):
+        self.closing = True
+        self.closed = True
+
+
+def dialer(multiplexed: bool = False):
+    dialed = list()
+
+    async def connect():
+        dialed.append(FakeConnection(multiplexed))
+        return dialed[-1]
+
+    return connect, dialed
+
+
+@pytest.mark.parametrize('sizes', [(0, 0), (-1, 2), (3, 2)])
+def test_invalid_sizes(sizes):
+    with pytest.raises(ValueError):
+        ConnectionPool(dialer()[0], min_size=sizes[0], max_size=sizes[1])
+
+
+def test_released_connection_is_reused():
+    connect, dialed = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=2)
+        first = await pool.acquire()
+        await pool.release(first)
+        second = await pool.acquire()
+        await pool.release(second)
+        return pool, first, second
+
+    pool, first, second = asyncio.run(main())
+    assert first is second
+    assert len(dialed) == 1
+    assert pool.stats['idle'] == 1 and pool.stats['in_use'] == 0 and pool.stats['acquired'] == 2
+
+
+def test_acquire_waits_for_a_release():
+    connect, dialed = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=1, acquire_timeout=5)
+        held = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await pool.release(held)
+        return pool, held, await waiter
+
+    pool, held, acquired = asyncio.run(main())
+    assert held is acquired
+    assert len(dialed) == 1
+    assert pool.stats['waited'] == 1
+
+
+def test_acquire_times_out_at_max_size():
+    connect, _ = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=1, acquire_timeout=0.05)
+        await pool.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.acquire()
+        return pool
+
+    assert asyncio.run(main()).stats['timeouts'] == 1
+
+
+def test_multiplexed_connection_takes_max_in_flight_leases():
+    connect, dialed = dialer(multiplexed=True)
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=2, max_in_flight=3)
+        leases = [await pool.acquire() for _ in range(5)]
+        return pool, leases
+
+    pool, leases = asyncio.run(main())
+    assert len(dialed) == 2
+    # least loaded first once the second one is open
+    assert leases[:3] == [dialed[0]] * 3
+    assert leases[3:] == [dialed[1]] * 2
+    assert pool.stats['in_use'] == 5 and pool.stats['size'] == 2
+
+
+def test_discarded_connection_is_closed():
+    connect, dialed = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=1)
+        await pool.release(await pool.acquire(), discard=True)
+        acquired = await pool.acquire()
+        return pool, acquired
+
+    pool, acquired = asyncio.run(main())
+    assert dialed[0].closed
+    assert acquired is dialed[1]
+    assert pool.stats['closed'] == 1
+
+
+def test_closed_connection_is_evicted():
+    connect, dialed = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=1)
+        await pool.release(await pool.acquire())
+        # the server hung up while idle
+        dialed[0].closing = True
+        return pool, await pool.acquire()
+
+    pool, acquired = asyncio.run(main())
+    assert acquired is dialed[1]
+    assert pool.stats['health_check_failures'] == 1
+
+
+def test_idle_connection_expires_above_min_size():
+    connect, dialed = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=2, max_idle=0)
+        await pool.release(await pool.acquire())
+        return await pool.acquire()
+
+    assert asyncio.run(main()) is dialed[1]
+    assert dialed[0].closed
+
+
+def test_fill_opens_min_size_and_keeps_it():
+    connect, dialed = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, min_size=2, max_size=4, max_idle=0)
+        await pool.fill()
+        await pool.fill()
+        # expired, but the pool does not shrink below min_size
+        await pool.release(await pool.acquire())
+        return pool
+
+    pool = asyncio.run(main())
+    assert len(dialed) == 2
+    assert pool.stats['size'] == 2 and pool.stats['idle'] == 2
+
+
+def test_failed_dial_gives_back_its_reservation():
+    attempts = list()
+
+    async def connect():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise ConnectionRefusedError()
+        return FakeConnection(False)
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=1, acquire_timeout=0.5)
+        with pytest.raises(ConnectionRefusedError):
+            await pool.acquire()
+        return await pool.acquire()
+
+    assert isinstance(asyncio.run(main()), FakeConnection)
+
+
+def test_close_closes_every_connection():
+    connect, dialed = dialer()
+
+    async def main():
+        pool = ConnectionPool(connect, max_size=3)
+        leases = [await pool.acquire() for _ in range(3)]
+        await pool.release(leases[0])
+        await pool.close()
+        return pool
+
+    pool = asyncio.run(main())
+    assert all(_connection.closed for _connection in dialed)
+    assert pool.stats['size'] == 0
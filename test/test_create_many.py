@@ -0,0 +1,104 @@
+import asyncio
+
+import numpy
+import pytest
+from dipamkara.exception.dipamkara_dimension_error import DipamkaraDimensionError
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric
+
+DIMENSION = 4
+ENGINES = {DBEngine.DIPAMKARA: DipamkaraEngine, DBEngine.FLAT: FlatEngine}
+VECTORS = numpy.random.default_rng(0).standard_normal((12, DIMENSION))
+DOCUMENTS = [{'i': _i, 'age': _i % 4} for _i in range(12)]
+
+
+async def open_engine(db_engine: DBEngine, path: str) -> DipamkaraEngine | FlatEngine:
+    engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=path)
+    await engine.recover()
+    return engine
+
+
+async def found(engine: DipamkaraEngine | FlatEngine, query: str | None = None) -> list[int]:
+    if query is None:
+        documents = await engine.find_documents_by_vector(VECTORS[0], Metric.EUCLIDEAN, 100)
+    else:
+        documents = await engine.find_documents_by_vector_indexed(query, VECTORS[0], Metric.EUCLIDEAN, 100)
+    return sorted(_document['i'] for _document, _ in documents)
+
+
+# a vector already stored or repeated in the batch, or a document missing an index key, is refused alone
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_items_refused_alone(tmp_path, db_engine):
+    vectors = numpy.concatenate((VECTORS[:6], VECTORS[2:3], VECTORS[6:]))
+    documents = DOCUMENTS[:6] + [{'i': 100, 'age': 0}] + DOCUMENTS[6:]
+    documents[8] = {'i': 7}
+
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        first = await engine.create_many(VECTORS[:1], DOCUMENTS[:1], indices=['age'])
+        status = await engine.create_many(vectors, documents, indices=['age'])
+        return first, status, await found(engine), await found(engine, 'age == 3')
+
+    first, status, everything, indexed = asyncio.run(main())
+    assert first == [True]
+    assert status == [False] + [True] * 5 + [False, True, False] + [True] * 4
+    assert everything == [_i for _i in range(12) if _i != 7]
+    assert indexed == [3, 11]
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_same_as_creating_one_by_one(tmp_path, db_engine):
+    async def main():
+        many = await open_engine(db_engine, str(tmp_path / 'many'))
+        await many.create_many(VECTORS, DOCUMENTS, indices=['age'])
+        one = await open_engine(db_engine, str(tmp_path / 'one'))
+        for _vector, _document in zip(VECTORS, DOCUMENTS):
+            await one.create(_vector, _document, indices=['age'])
+        return [
+            (
+                await _engine.find_documents_by_vector(VECTORS[5], Metric.COSINE, 5),
+                await _engine.find_documents_by_vector_indexed('age <= 1', VECTORS[5], Metric.EUCLIDEAN, 5)
+            )
+            for _engine in (many, one)
+        ]
+
+    many, one = asyncio.run(main())
+    assert many == one
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_created_documents_survive_a_restart(tmp_path, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        await engine.create_many(VECTORS, DOCUMENTS, indices=['age'])
+        await engine.save()
+        return await found(await open_engine(db_engine, str(tmp_path)), 'age == 2')
+
+    assert asyncio.run(main()) == [2, 6, 10]
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_invalid_batches(tmp_path, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        with pytest.raises(ValueError):
+            await engine.create_many(VECTORS[:3], DOCUMENTS[:2])
+        with pytest.raises(DipamkaraDimensionError):
+            await engine.create_many(VECTORS[:3, :2], DOCUMENTS[:3])
+        return await engine.create_many(VECTORS[:0], list()), await found(engine)
+
+    assert asyncio.run(main()) == ([], [])
+
+
+# the client sends batch_size vectors per request and returns every status in input order
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_client_batches(tmp_path, serving, db_engine):
+    vectors = numpy.concatenate((VECTORS, VECTORS[:2]))
+
+    async def main():
+        async with serving(await open_engine(db_engine, str(tmp_path))) as port:
+            async with BhaktiClient(port=port, db_engine=db_engine) as client:
+                return await client.create_many(vectors, DOCUMENTS + DOCUMENTS[:2], indices=['i'], batch_size=5)
+
+    assert asyncio.run(main()) == [True] * 12 + [False] * 2
@@ -0,0 +1,91 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.database import DipamkaraEngine, Metric
+from bhakti.database.document_cache import DocumentCache
+from bhakti.database.result_cache import MEGABYTE, size_of
+
+DIMENSION = 4
+VECTORS = numpy.random.default_rng(0).standard_normal((200, DIMENSION))
+DOCUMENTS = [{'i': _i, 'text': 'x' * 1000} for _i in range(200)]
+
+
+def test_unbounded_keeps_everything():
+    cache = DocumentCache(0, {_i: DOCUMENTS[_i] for _i in range(100)})
+    assert not cache.bounded and len(cache) == 100
+    assert cache.stats()['bytes'] == 100 * size_of(DOCUMENTS[0]) and cache.stats()['evictions'] == 0
+
+
+# the least recently used documents go first once their bytes pass the budget
+def test_bounded_drops_least_recently_used():
+    cache = DocumentCache(3.5 * size_of(DOCUMENTS[0]) / MEGABYTE)
+    for _i in range(3):
+        cache[_i] = DOCUMENTS[_i]
+    assert cache[0] == DOCUMENTS[0]
+    cache[3] = DOCUMENTS[3]
+    assert sorted(cache.keys()) == [0, 2, 3]
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] <= cache.stats()['capacity']
+    cache[4] = {'text': 'x' * 10000}
+    assert 4 not in cache and sorted(cache.keys()) == [0, 2, 3]
+
+
+def test_stats():
+    cache = DocumentCache(1)
+    cache[0] = DOCUMENTS[0]
+    assert cache.get(0) == DOCUMENTS[0] and cache.get(1) is None and cache.get(1, 'default') == 'default'
+    assert cache.pop(0) == DOCUMENTS[0] and cache.pop(0, None) is None
+    with pytest.raises(KeyError):
+        cache.pop(0)
+    with pytest.raises(KeyError):
+        del cache[0]
+    cache[1] = DOCUMENTS[1]
+    cache.clear()
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 2, round(1 / 3, 4))
+    assert (stats['size'], stats['bytes']) == (0, 0)
+
+
+async def open_engine(path: str, doc_cache_mb: float) -> DipamkaraEngine:
+    engine = DipamkaraEngine(dimension=DIMENSION, archive_path=path, doc_cache_mb=doc_cache_mb)
+    await engine.recover()
+    return engine
+
+
+# documents read are cached within the budget, the rest are read from disk again
+def test_engine_reads_through_a_bounded_cache(tmp_path):
+    budget = 50 * size_of(DOCUMENTS[0]) / MEGABYTE
+
+    async def main():
+        engine = await open_engine(str(tmp_path), budget)
+        await engine.create_many(VECTORS, DOCUMENTS)
+        await engine.save()
+        engine = await open_engine(str(tmp_path), budget)
+        everything = await engine.find_documents_by_vector(VECTORS[0], Metric.EUCLIDEAN, len(VECTORS))
+        nearest = [await engine.find_documents_by_vector(VECTORS[0], Metric.EUCLIDEAN, 10) for _ in range(3)]
+        return everything, nearest, (await engine.insight())['doc_cache']
+
+    everything, nearest, stats = asyncio.run(main())
+    assert sorted(_document['i'] for _document, _ in everything) == list(range(len(VECTORS)))
+    assert all(_document == DOCUMENTS[_document['i']] for _document, _ in everything)
+    assert nearest[0] == nearest[1] == nearest[2] == everything[:10]
+    assert stats['size'] <= 50 and stats['bytes'] <= stats['capacity'] and stats['evictions'] > 0
+    assert stats['hits'] >= 20 and 0 < stats['hit_rate'] < 1
+
+
+# modified documents are read again, removed ones are dropped
+def test_engine_invalidates_cached_documents(tmp_path):
+    async def main():
+        engine = await open_engine(str(tmp_path), 1)
+        await engine.create_many(VECTORS[:10], DOCUMENTS[:10])
+        await engine.find_documents_by_vector(VECTORS[0], Metric.EUCLIDEAN, 10)
+        cached = (await engine.insight())['doc_cache']['size']
+        await engine.mod_doc_by_vector(VECTORS[1], 'text', 'y')
+        await engine.remove_by_vector(VECTORS[2])
+        after = (await engine.insight())['doc_cache']['size']
+        return cached, after, await engine.find_documents_by_vector(VECTORS[1], Metric.EUCLIDEAN, 10)
+
+    cached, after, found = asyncio.run(main())
+    assert cached == 10 and after == 8
+    assert found[0][0] == {'i': 1, 'text': 'y'} and 2 not in [_document['i'] for _document, _ in found]
@@ -0,0 +1,111 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.const import PROTOCOL_EOF, PROTOCOL_FRAME_V2
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric, VectorDtype
+
+DIMENSION = 4
+ENGINES = {DBEngine.DIPAMKARA: DipamkaraEngine, DBEngine.FLAT: FlatEngine}
+
+
+@pytest.mark.parametrize('dtype', [VectorDtype.FLOAT16, VectorDtype.FLOAT32])
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_engine_distances_are_float64(tmp_path, db_engine, dtype):
+    vectors = numpy.arange(12, dtype=numpy.float64).reshape(3, DIMENSION)
+
+    async def main():
+        engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=str(tmp_path), dtype=dtype)
+        await engine.recover()
+        await engine.create_many(vectors, [{'i': _i} for _i in range(3)], indices=['i'])
+        return (
+            await engine.vector_query(vectors[1], Metric.EUCLIDEAN, 3),
+            await engine.find_documents_by_vector_indexed('i >= 0', vectors[1], Metric.EUCLIDEAN, 3)
+        )
+
+    vectors_found, documents_found = asyncio.run(main())
+    assert [type(_distance) for _, _distance in vectors_found + documents_found] == [numpy.float64] * 6
+    assert vectors_found[0][0].dtype == numpy.dtype(dtype.value)
+    assert vectors_found[0][1] == 0 and documents_found[0] == ({'i': 1}, 0)
+
+
+# the <eof> protocol, and frames without envelopes, answer in plain json
+@pytest.mark.parametrize('protocol, binary', [(PROTOCOL_EOF, False), (PROTOCOL_FRAME_V2, False), (PROTOCOL_FRAME_V2, True)])
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_queries_over_every_protocol(tmp_path, serving, db_engine, protocol, binary):
+    vectors = numpy.arange(12, dtype=numpy.float64).reshape(3, DIMENSION)
+
+    async def main():
+        engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=str(tmp_path), dtype=VectorDtype.FLOAT32)
+        await engine.recover()
+        async with serving(engine) as port:
+            async with BhaktiClient(port=port, db_engine=db_engine, protocol=protocol, binary=binary) as client:
+                await client.create_many(vectors, [{'i': _i} for _i in range(3)], indices=['i'])
+                return (
+                    await client.vector_query(vectors[2], Metric.EUCLIDEAN, 2),
+                    await client.vector_query_batch(vectors[:2], Metric.EUCLIDEAN, 1),
+                    await client.find_documents_by_vector(vectors[2], Metric.EUCLIDEAN, 2),
+                    await client.find_documents_by_vector_indexed('i < 2', vectors[2], Metric.EUCLIDEAN, 1),
+                    await client.vector_query(vectors[0], Metric.EUCLIDEAN, 1, projection=['id', 'distance'])
+                )
+
+    nearest, batch, documents, indexed, projected = asyncio.run(main())
+    numpy.testing.assert_array_equal(nearest[0][0], vectors[2])
+    assert nearest[0][1] == 0 and nearest[1][1] == pytest.approx(8)
+    assert [_nearest[0][1] for _nearest in batch] == [0, 0]
+    assert [(_document, float(_distance)) for _document, _distance in documents] == [({'i': 2}, 0), ({'i': 1}, 8)]
+    assert [(_document, float(_distance)) for _document, _distance in indexed] == [({'i': 1}, 8)]
+    assert projected[0]['distance'] == 0 and isinstance(projected[0]['id'], int)
+
+
+def reopen(db_engine: DBEngine, path: str, **kwargs) -> tuple[VectorDtype, list]:
+    async def main():
+        engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=path, **kwargs)
+        await engine.recover()
+        return engine.dtype, await engine.vector_query(numpy.zeros(DIMENSION), Metric.EUCLIDEAN, 10)
+
+    return asyncio.run(main())
+
+
+def archive(db_engine: DBEngine, path: str, vectors: numpy.ndarray, **kwargs):
+    async def main():
+        engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=path, **kwargs)
+        await engine.recover()
+        await engine.create_many(vectors, [{'i': _i} for _i in range(len(vectors))])
+        await engine.save()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_archive_keeps_its_dtype(tmp_path, db_engine):
+    # vectors a float32 archive could not tell apart
+    vectors = numpy.array([[1, 2, 3, 4], [1 + 1e-12, 2, 3, 4]], dtype=numpy.float64)
+    archive(db_engine, str(tmp_path), vectors, dtype=VectorDtype.FLOAT64)
+    dtype, found = reopen(db_engine, str(tmp_path))
+    assert dtype == VectorDtype.FLOAT64 and len(found) == 2
+    assert reopen(db_engine, str(tmp_path / 'new'))[0] == VectorDtype.DEFAULT_DTYPE
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_converting_is_asked_for(tmp_path, db_engine):
+    vectors = numpy.arange(8, dtype=numpy.float64).reshape(2, DIMENSION) / 3
+    archive(db_engine, str(tmp_path), vectors, dtype=VectorDtype.FLOAT64)
+    with pytest.raises(ValueError):
+        reopen(db_engine, str(tmp_path), dtype=VectorDtype.FLOAT32)
+    dtype, found = reopen(db_engine, str(tmp_path), dtype=VectorDtype.FLOAT32, convert_dtype=True)
+    assert dtype == VectorDtype.FLOAT32 and found[0][0].dtype == numpy.float32 and len(found) == 2
+    # saved converted
+    assert reopen(db_engine, str(tmp_path))[0] == VectorDtype.FLOAT32
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_converting_never_drops_documents(tmp_path, db_engine):
+    vectors = numpy.array([[1, 2, 3, 4], [1 + 1e-12, 2, 3, 4]], dtype=numpy.float64)
+    archive(db_engine, str(tmp_path), vectors, dtype=VectorDtype.FLOAT64)
+    with pytest.raises(ValueError):
+        reopen(db_engine, str(tmp_path), dtype=VectorDtype.FLOAT32, convert_dtype=True)
+    dtype, found = reopen(db_engine, str(tmp_path))
+    assert dtype == VectorDtype.FLOAT64 and len(found) == 2
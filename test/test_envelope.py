@@ -0,0 +1,80 @@
+import numpy
+import pytest
+
+from bhakti.util.envelope import pack_envelope, unpack_envelope, ENVELOPE_ALIGNMENT, ENVELOPE_JSON_LENGTH, NDARRAY_MARKER
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'float32', 'float64', 'int8', 'int64', 'uint8', 'bool'])
+def test_ndarray_round_trip(dtype):
+    ndarray = (numpy.arange(15) % 3).astype(dtype).reshape(3, 5)
+    unpacked = unpack_envelope(pack_envelope({'vector': ndarray}))['vector']
+    assert unpacked.dtype == ndarray.dtype
+    assert unpacked.shape == ndarray.shape
+    numpy.testing.assert_array_equal(unpacked, ndarray)
+
+
+def test_nested_message():
+    message = {
+        'cmd': 'create_many',
+        'data': {
+            'vectors': [numpy.ones(3, dtype=numpy.float32), numpy.zeros((0, 4))],
+            'documents': [{'名字': 'ä', 'n': None}, {'ok': True}],
+            'pairs': [[numpy.array([1.5]), 2]]
+        }
+    }
+    unpacked = unpack_envelope(pack_envelope(message))
+    assert unpacked['cmd'] == 'create_many'
+    assert unpacked['data']['documents'] == message['data']['documents']
+    numpy.testing.assert_array_equal(unpacked['data']['vectors'][0], numpy.ones(3, dtype=numpy.float32))
+    assert unpacked['data']['vectors'][1].shape == (0, 4)
+    numpy.testing.assert_array_equal(unpacked['data']['pairs'][0][0], [1.5])
+    assert unpacked['data']['pairs'][0][1] == 2
+
+
+def test_message_without_arrays():
+    assert unpack_envelope(pack_envelope({'a': [1, 'b', None]})) == {'a': [1, 'b', None]}
+
+
+def test_buffers_are_aligned():
+    payload = pack_envelope({'a': numpy.ones(3, dtype=numpy.int8), 'b': numpy.ones(5, dtype=numpy.float64)})
+    assert len(payload) % ENVELOPE_ALIGNMENT == 0
+    (length,) = ENVELOPE_JSON_LENGTH.unpack_from(payload)
+    assert (ENVELOPE_JSON_LENGTH.size + length) % ENVELOPE_ALIGNMENT == 0
+    unpacked = unpack_envelope(bytearray(payload))
+    for _ndarray in unpacked.values():
+        assert _ndarray.__array_interface__['data'][0] % ENVELOPE_ALIGNMENT == 0 or _ndarray.dtype.itemsize == 1
+
+
+def test_arrays_are_views_over_the_payload():
+    payload = bytearray(pack_envelope({'v': numpy.arange(4, dtype=numpy.float64)}))
+    unpacked = unpack_envelope(payload)
+    unpacked['v'][0] = 42
+    assert unpack_envelope(payload)['v'][0] == 42
+
+
+def test_big_endian_arrays_travel_little_endian():
+    ndarray = numpy.arange(4, dtype='>f8')
+    unpacked = unpack_envelope(pack_envelope([ndarray]))[0]
+    assert unpacked.dtype.str == '<f8'
+    numpy.testing.assert_array_equal(unpacked, ndarray)
+
+
+def test_non_contiguous_arrays():
+    ndarray = numpy.arange(20, dtype=numpy.float32).reshape(4, 5)[:, ::2]
+    numpy.testing.assert_array_equal(unpack_envelope(pack_envelope(ndarray)), ndarray)
+
+
+def test_numpy_scalars_become_python_values():
+    unpacked = unpack_envelope(pack_envelope({'d': numpy.float32(0.5), 'i': numpy.int64(3), 'b': numpy.bool_(True)}))
+    assert unpacked == {'d': 0.5, 'i': 3, 'b': True}
+    assert type(unpacked['i']) is int
+
+
+def test_marker_lookalike_dict_with_more_keys_stays_a_dict():
+    message = {NDARRAY_MARKER: 1, 'other': 2}
+    assert unpack_envelope(pack_envelope(message)) == message
+
+
+def test_unserializable_object():
+    with pytest.raises(TypeError):
+        pack_envelope({'x': object()})
@@ -0,0 +1,75 @@
+import pytest
+from dipamkara.dipamkara_dsl import DipamkaraDsl
+
+from bhakti.database.filter import Filter, FilterCache
+
+MIXED = [1, 2.5, 'a', 'b', None, 7, 'female', 3, -1, 10 ** 20, 0.0, 'a b']
+DOCUMENTS = [
+    {'age': _i % 50, 'g': ['male', 'female'][_i % 2], 'm': MIXED[_i % len(MIXED)], 'w': _i / 7}
+    for _i in range(200)
+]
+INDICES = ['age', 'g', 'm', 'w']
+QUERIES = [
+    'age <= 31',
+    'age == 31',
+    'age != 31',
+    'age > 40 || g == "female"',
+    'age <= 31 && g != "female"',
+    'g == "male" && age < 10',
+    'g >= "g"',
+    'w < 3.5 && age >= 2',
+    'w == 1',
+    'm == 1',
+    'm >= 2',
+    'm != "b"',
+    'm == "a" || age > 45',
+    'age < 5 || age > 45 && g == "male"'
+]
+
+
+def inverted_index_of(documents: list[dict]) -> dict[str, dict[int, any]]:
+    return {
+        _index: {_id: _document[_index] for _id, _document in enumerate(documents) if _index in _document.keys()}
+        for _index in INDICES
+    }
+
+
+def dsl(expr: str, inverted_index: dict) -> set[int]:
+    return {int(_id) for _id in DipamkaraDsl(expr=expr, inverted_index=inverted_index).process_serialized()}
+
+
+@pytest.mark.parametrize('expr', QUERIES)
+def test_filter_matches_the_dsl(expr):
+    inverted_index = inverted_index_of(DOCUMENTS)
+    assert Filter(expr).matches(inverted_index) == dsl(expr, inverted_index)
+
+
+@pytest.mark.parametrize('expr, literal, params', [
+    ('age >= $1 && g == $2', 'age >= 12 && g == "female"', [12, 'female']),
+    ('w < $1', 'w < 2.5', [2.5]),
+    ('m == $2 || age == $1', 'm == "a" || age == 3', [3, 'a'])
+])
+def test_parameters_bind_as_literals(expr, literal, params):
+    inverted_index = inverted_index_of(DOCUMENTS)
+    assert Filter(expr).render(params) == literal
+    assert Filter(expr).matches(inverted_index, params) == dsl(literal, inverted_index)
+
+
+@pytest.mark.parametrize('params', [[], [True], ['a"b'], [float('nan')], [[1]]])
+def test_invalid_parameters(params):
+    with pytest.raises(ValueError):
+        Filter('age == $1').bind(params)
+
+
+def test_filter_cache_reuses_compiled_filters():
+    cache = FilterCache(size=1)
+    assert cache.get('age > 1') is cache.get('age > 1')
+    cache.get('age > 2')
+    cache.get('age > 1')
+    assert cache.stats() == {'size': 1, 'capacity': 1, 'hits': 1, 'misses': 3}
+
+
+def test_disabled_filter_cache_keeps_nothing():
+    cache = FilterCache(size=0)
+    assert cache.get('age > 1') is not cache.get('age > 1')
+    assert cache.stats()['size'] == 0
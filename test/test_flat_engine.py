@@ -0,0 +1,147 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric
+
+DIMENSION = 8
+VECTORS = numpy.random.default_rng(0).standard_normal((60, DIMENSION))
+DOCUMENTS = [{'i': _i, 'age': _i % 5, 'name': f'n{_i}'} for _i in range(60)]
+
+
+def documents_of(results: list[tuple[dict, numpy.float64]]) -> list[dict]:
+    return [_document for _document, _ in results]
+
+
+# the same writes and reads, each answered as it is or by the name of the error raised
+async def script(engine: DipamkaraEngine | FlatEngine) -> list:
+    async def outcome(coroutine) -> any:
+        try:
+            return await coroutine
+        except Exception as error:
+            return type(error).__name__
+
+    await engine.recover()
+    return [
+        await outcome(engine.create_many(VECTORS[:50], DOCUMENTS[:50], indices=['age'])),
+        await outcome(engine.create(VECTORS[0], {'i': 0, 'age': 0})),
+        await outcome(engine.create(VECTORS[50], DOCUMENTS[50], indices=['age'])),
+        await outcome(engine.create_index('age')),
+        len(await outcome(engine.create_index('name'))),
+        await outcome(engine.remove_by_vector(VECTORS[3])),
+        await outcome(engine.remove_by_vector(VECTORS[59])),
+        await outcome(engine.indexed_remove('age == 2')),
+        await outcome(engine.mod_doc_by_vector(VECTORS[5], 'age', 9)),
+        await outcome(engine.mod_doc_by_vector(VECTORS[6], 'none', 9)),
+        await outcome(engine.mod_doc_by_vector(VECTORS[59], 'age', 9)),
+        documents_of(await engine.find_documents_by_vector_indexed('age == 9', VECTORS[0], Metric.EUCLIDEAN, 10)),
+        documents_of(await engine.find_documents_by_vector_indexed('name == "n8"', VECTORS[0], Metric.EUCLIDEAN, 10)),
+        await outcome(engine.remove_index('name')),
+        await outcome(engine.remove_index('name')),
+        documents_of(await engine.find_documents_by_vector(VECTORS[10], Metric.EUCLIDEAN, 100)),
+        documents_of(await engine.find_documents_by_vector(VECTORS[10], Metric.COSINE, 5)),
+    ]
+
+
+# the flat engine answers the command surface of the dipamkara engine the same way
+def test_same_answers_as_dipamkara(tmp_path):
+    async def main():
+        return (
+            await script(DipamkaraEngine(dimension=DIMENSION, archive_path=str(tmp_path / 'dipamkara'))),
+            await script(FlatEngine(dimension=DIMENSION, archive_path=str(tmp_path / 'flat')))
+        )
+
+    dipamkara, flat = asyncio.run(main())
+    assert flat == dipamkara
+    assert [_document['i'] for _document in flat[-2]] == [10] + sorted(
+        set(range(51)) - {3} - set(range(2, 51, 5)) - {10},
+        key=lambda _i: numpy.linalg.norm(VECTORS[_i] - VECTORS[10])
+    )
+
+
+@pytest.mark.parametrize('metric', [Metric.EUCLIDEAN, Metric.COSINE, Metric.EUCLIDEAN_L2])
+def test_distances(tmp_path, metric):
+    async def main():
+        engine = FlatEngine(dimension=DIMENSION, archive_path=str(tmp_path))
+        await engine.recover()
+        await engine.create_many(VECTORS, DOCUMENTS)
+        return await engine.vector_query(VECTORS[0] + 0.1, metric, len(VECTORS))
+
+    query = VECTORS[0] + 0.1
+    if metric == Metric.COSINE:
+        expected = 1 - VECTORS @ query / numpy.linalg.norm(VECTORS, axis=1) / numpy.linalg.norm(query)
+    elif metric == Metric.EUCLIDEAN_L2:
+        expected = numpy.linalg.norm(
+            VECTORS / numpy.linalg.norm(VECTORS, axis=1)[:, numpy.newaxis] - query / numpy.linalg.norm(query), axis=1
+        )
+    else:
+        expected = numpy.linalg.norm(VECTORS - query, axis=1)
+    results = asyncio.run(main())
+    assert [_distance for _, _distance in results] == pytest.approx(numpy.sort(expected).tolist(), abs=1e-5)
+
+
+# a removed row is filled with the last one, which must still be found by its own vector
+def test_removing_moves_the_last_row(tmp_path):
+    async def main():
+        engine = FlatEngine(dimension=DIMENSION, archive_path=str(tmp_path))
+        await engine.recover()
+        await engine.create_many(VECTORS, DOCUMENTS, indices=['age'])
+        for _i in range(0, 30):
+            await engine.remove_by_vector(VECTORS[_i])
+        return [
+            (await engine.find_documents_by_vector(VECTORS[_i], Metric.EUCLIDEAN, 1))[0][0]['i']
+            for _i in range(30, len(VECTORS))
+        ], await engine.find_documents_by_vector_indexed('age == 1', VECTORS[0], Metric.EUCLIDEAN, 100)
+
+    nearest, indexed = asyncio.run(main())
+    assert nearest == list(range(30, len(VECTORS)))
+    assert sorted(_document['i'] for _document, _ in indexed) == list(range(31, len(VECTORS), 5))
+
+
+@pytest.mark.parametrize('wal', [False, True])
+def test_state_survives_a_restart(tmp_path, wal):
+    async def main():
+        engine = FlatEngine(dimension=DIMENSION, archive_path=str(tmp_path), wal=wal)
+        await engine.recover()
+        await engine.create_many(VECTORS, DOCUMENTS, indices=['age'])
+        await engine.create_index('i', 'range')
+        await engine.remove_by_vector(VECTORS[1])
+        await engine.mod_doc_by_vector(VECTORS[6], 'name', 'six')
+        # without a write-ahead log only what was saved survives
+        if not wal:
+            await engine.save()
+        expected = await engine.find_documents_by_vector_indexed('i >= 50', VECTORS[0], Metric.EUCLIDEAN, 100)
+        reopened = FlatEngine(dimension=DIMENSION, archive_path=str(tmp_path), wal=wal)
+        await reopened.recover()
+        return (
+            expected,
+            await reopened.find_documents_by_vector_indexed('i >= 50', VECTORS[0], Metric.EUCLIDEAN, 100),
+            await reopened.find_documents_by_vector_indexed('age == 1', VECTORS[6], Metric.EUCLIDEAN, 100)
+        )
+
+    expected, found, indexed = asyncio.run(main())
+    assert found == expected and len(found) == 10
+    assert indexed[0][0] == {'i': 6, 'age': 1, 'name': 'six'}
+    assert sorted(_document['i'] for _document, _ in indexed) == list(range(6, len(VECTORS), 5))
+
+
+# the handler dispatches to whichever engine it serves
+def test_served_through_the_handler(tmp_path, serving):
+    async def main():
+        engine = FlatEngine(dimension=DIMENSION, archive_path=str(tmp_path))
+        await engine.recover()
+        async with serving(engine) as port:
+            async with BhaktiClient(port=port, db_engine=DBEngine.FLAT) as client:
+                created = await client.create(VECTORS[0], DOCUMENTS[0], indices=['age'])
+                await client.create_many(VECTORS[1:20], DOCUMENTS[1:20], indices=['age'])
+                removed = await client.remove_by_vector(VECTORS[0])
+                return created, removed, await client.find_documents_by_vector_indexed(
+                    'age == 3', VECTORS[3], Metric.EUCLIDEAN, 10
+                )
+
+    created, removed, found = asyncio.run(main())
+    assert created and removed
+    assert [_document['i'] for _document, _ in found][0] == 3
+    assert sorted(_document['i'] for _document, _ in found) == [3, 8, 13, 18]
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from bhakti.const import PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2
+from bhakti.exception.bhakti_protocol_error import BhaktiProtocolError
+from bhakti.util.frame import (
+    FRAME_MAGIC, FRAME_HEADERS, FRAME_FLAG_ENVELOPE, FRAME_FLAG_MORE, pack_frame, pack_frame_header, readframe
+)
+
+
+def read(data: bytes, eof: bool = True, **kwargs) -> tuple[bytearray, int, int, int]:
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        if eof:
+            reader.feed_eof()
+        return await readframe(reader, timeout=1, **kwargs)
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('payload', [b'', b'{"cmd": "insight"}', bytes(range(256)) * 64])
+def test_round_trip_v1(payload):
+    assert read(pack_frame(payload, flags=FRAME_FLAG_ENVELOPE)) == (payload, PROTOCOL_FRAME_V1, FRAME_FLAG_ENVELOPE, 0)
+
+
+def test_round_trip_v2():
+    frame = pack_frame(b'abc', flags=FRAME_FLAG_MORE, version=PROTOCOL_FRAME_V2, request_id=2 ** 32 - 1)
+    assert read(frame) == (b'abc', PROTOCOL_FRAME_V2, FRAME_FLAG_MORE, 2 ** 32 - 1)
+
+
+def test_frames_follow_each_other():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(pack_frame(b'one', version=PROTOCOL_FRAME_V2, request_id=1)
+                         + pack_frame(b'two', version=PROTOCOL_FRAME_V2, request_id=2))
+        reader.feed_eof()
+        return [await readframe(reader, timeout=1) for _ in range(2)]
+
+    assert [(_payload, _request_id) for _payload, _, _, _request_id in asyncio.run(main())] == [
+        (b'one', 1), (b'two', 2)
+    ]
+
+
+def test_magic_read_by_the_caller():
+    frame = pack_frame(b'abc')
+    assert read(frame[len(FRAME_MAGIC):], magic=frame[:len(FRAME_MAGIC)])[0] == b'abc'
+
+
+@pytest.mark.parametrize('version', [PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2])
+def test_oversized_frame_is_refused(version):
+    # the header alone is enough to refuse it, the payload never arrives
+    header = pack_frame_header(length=1 << 20, version=version)
+    with pytest.raises(BhaktiProtocolError):
+        read(header, eof=False, max_size=1 << 10)
+
+
+def test_frame_of_max_size_is_accepted():
+    assert read(pack_frame(b'x' * 1024), max_size=1024)[0] == b'x' * 1024
+
+
+@pytest.mark.parametrize('version', [PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2])
+def test_truncated_header(version):
+    header = pack_frame_header(length=3, version=version)
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(header[:len(FRAME_MAGIC) + 1 + FRAME_HEADERS[version].size - 1])
+
+
+def test_truncated_magic():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(FRAME_MAGIC[:1])
+
+
+def test_truncated_payload():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(pack_frame(b'abcdef')[:-2])
+
+
+def test_bad_magic():
+    with pytest.raises(BhaktiProtocolError):
+        read(b'{"cmd": "insight"}')
+
+
+def test_unsupported_version():
+    with pytest.raises(BhaktiProtocolError):
+        read(FRAME_MAGIC + bytes((max(FRAME_HEADERS) + 1,)) + b'\x00' * 16)
+
@@ -0,0 +1,78 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.database import FlatEngine, Metric
+from bhakti.database.ann_index import AnnIndexType, SearchOptions
+from bhakti.database.hnsw_index import HnswIndex
+
+DIMENSION = 32
+VECTORS = numpy.random.default_rng(0).standard_normal((2000, DIMENSION))
+QUERIES = numpy.random.default_rng(1).standard_normal((100, DIMENSION))
+EXACT = numpy.argsort(((QUERIES[:, numpy.newaxis, :] - VECTORS[numpy.newaxis, :, :]) ** 2).sum(axis=2), axis=1)[:, :10]
+
+
+def recall(index: HnswIndex, options: SearchOptions = SearchOptions(), allowed: set[int] | None = None) -> float:
+    found = 0
+    for _labels, _exact in zip(index.search(QUERIES, 10, options, allowed), EXACT):
+        found += len({_label for _label, _ in _labels} & set(_exact.tolist()))
+    return found / EXACT.size
+
+
+@pytest.fixture(scope='module')
+def index() -> HnswIndex:
+    built = HnswIndex(dimension=DIMENSION)
+    built.add(numpy.arange(len(VECTORS)), VECTORS)
+    return built
+
+
+def test_recall(index):
+    assert len(index) == len(VECTORS)
+    assert recall(index) >= 0.95
+    assert recall(index, SearchOptions({'ef_search': 10})) < recall(index)
+    assert recall(index, SearchOptions({'ef_search': 256})) >= 0.99
+
+
+def test_distances_are_sorted_and_euclidean(index):
+    for _query, _labels in zip(QUERIES, index.search(QUERIES, 10, SearchOptions())):
+        _distances = [_distance for _, _distance in _labels]
+        assert _distances == sorted(_distances)
+        numpy.testing.assert_allclose(
+            _distances, numpy.linalg.norm(VECTORS[[_label for _label, _ in _labels]] - _query, axis=1), rtol=1e-4
+        )
+
+
+def test_allowed_labels_only(index):
+    allowed = set(range(0, len(VECTORS), 3))
+    for _labels in index.search(QUERIES, 10, SearchOptions(), allowed):
+        assert len(_labels) == 10 and {_label for _label, _ in _labels} <= allowed
+
+
+def test_removed_labels_are_not_found():
+    index = HnswIndex(dimension=DIMENSION)
+    index.add(numpy.arange(len(VECTORS)), VECTORS)
+    for _label in range(0, len(VECTORS), 2):
+        index.remove(_label)
+    assert len(index) == len(VECTORS) // 2
+    for _labels in index.search(QUERIES, 10, SearchOptions()):
+        assert all(_label % 2 == 1 for _label, _ in _labels)
+
+
+def test_dump_and_load(index):
+    loaded = HnswIndex.load(index.dump())
+    assert index.search(QUERIES, 10, SearchOptions()) == loaded.search(QUERIES, 10, SearchOptions())
+
+
+@pytest.mark.parametrize('metric', [Metric.EUCLIDEAN, Metric.COSINE])
+def test_flat_engine_with_hnsw(tmp_path, metric):
+    async def main():
+        engine = FlatEngine(
+            dimension=DIMENSION, archive_path=str(tmp_path), vector_index=AnnIndexType.HNSW, vector_index_metric=metric
+        )
+        await engine.recover()
+        await engine.create_many(VECTORS[:500], [{'i': _i} for _i in range(500)])
+        return await engine.vector_query_batch(VECTORS[:20], metric, 3)
+
+    for _nearest in asyncio.run(main()):
+        assert _nearest[0][1] == pytest.approx(0, abs=1e-6)
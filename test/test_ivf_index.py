@@ -0,0 +1,76 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.database import FlatEngine, Metric
+from bhakti.database.ann_index import AnnIndexType, SearchOptions
+
+DIMENSION = 16
+VECTORS = numpy.random.default_rng(0).standard_normal((2000, DIMENSION)) * 10
+
+
+async def open_engine(path: str, metric: Metric = Metric.EUCLIDEAN, **kwargs) -> FlatEngine:
+    engine = FlatEngine(
+        dimension=DIMENSION, archive_path=path, vector_index=AnnIndexType.IVF, vector_index_metric=metric,
+        ivf_nlist=32, **kwargs
+    )
+    await engine.recover()
+    return engine
+
+
+# candidates are re-scored exactly, a stored vector is found at distance 0 as a scan finds it,
+# cosine distances of a scan are computed in float32 too
+@pytest.mark.parametrize('metric, tolerance', [(Metric.EUCLIDEAN, 0), (Metric.COSINE, 1e-6)])
+def test_exact_match_scores_zero(tmp_path, metric, tolerance):
+    async def main():
+        engine = await open_engine(str(tmp_path), metric)
+        await engine.create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))])
+        await engine.train_index()
+        return (
+            await engine.vector_query_batch(VECTORS[:50], metric, 5),
+            await engine.find_documents_by_vector(VECTORS[7], metric, 5),
+        )
+
+    batch, documents = asyncio.run(main())
+    assert [_nearest[0][1] for _nearest in batch] == pytest.approx([0] * 50, abs=tolerance)
+    assert documents[0][0] == {'i': 7} and documents[0][1] == pytest.approx(0, abs=tolerance)
+    distances = [_distance for _, _distance in documents]
+    assert distances == sorted(distances)
+
+
+QUERIES = numpy.random.default_rng(1).standard_normal((100, DIMENSION)) * 10
+EXACT = numpy.argsort(((QUERIES[:, numpy.newaxis, :] - VECTORS[numpy.newaxis, :, :]) ** 2).sum(axis=2), axis=1)[:, :10]
+
+
+async def recall(engine: FlatEngine, search: SearchOptions | None = None) -> float:
+    found = 0
+    for _query, _exact in zip(QUERIES, EXACT):
+        _documents = await engine.find_documents_by_vector(_query, Metric.EUCLIDEAN, 10, search=search)
+        found += len({_document['i'] for _document, _ in _documents} & set(_exact.tolist()))
+    return found / EXACT.size
+
+
+def test_recall_grows_with_the_cells_probed(tmp_path):
+    async def main():
+        engine = await open_engine(str(tmp_path))
+        await engine.create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))])
+        await engine.train_index()
+        return [await recall(engine, SearchOptions({'nprobe': _nprobe})) for _nprobe in (2, 8, 16, 32)]
+
+    recalls = asyncio.run(main())
+    assert recalls == sorted(recalls)
+    assert recalls[1] >= 0.7 and recalls[2] >= 0.9 and recalls[3] == 1
+
+
+# the nprobe configured applies to an index loaded from the archive, not the one it was saved with
+def test_configured_nprobe_applies_once_reloaded(tmp_path):
+    async def main():
+        engine = await open_engine(str(tmp_path), ivf_nprobe=1)
+        await engine.create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))])
+        await engine.train_index()
+        await engine.save()
+        return [await recall(await open_engine(str(tmp_path), ivf_nprobe=_nprobe)) for _nprobe in (1, 32)]
+
+    few, every = asyncio.run(main())
+    assert few < 0.6 and every == 1
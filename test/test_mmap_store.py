@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+import numpy
+import pytest
+
+from bhakti.database import DipamkaraEngine, Metric
+from bhakti.database.mmap_store import MmapVectorStore, MMAP_MIN_CAPACITY, MMAP_COMPACT_MIN_DEAD, DOC_ID_REMOVED
+
+DIMENSION = 4
+VECTORS = numpy.random.default_rng(0).standard_normal((3000, DIMENSION))
+
+
+def test_rows_survive_reopening(tmp_path):
+    path = str(tmp_path / 'store')
+    store = MmapVectorStore(path, DIMENSION)
+    assert store.count == 0 and store.capacity == MMAP_MIN_CAPACITY
+    assert store.append(VECTORS[:10], list(range(10))) == 0
+    assert store.append(VECTORS[10:15], list(range(100, 105))) == 10
+    store.flush()
+    reopened = MmapVectorStore(path, DIMENSION)
+    assert reopened.count == 15 and reopened.dtype == numpy.float64
+    assert reopened.ids.tolist() == list(range(10)) + list(range(100, 105))
+    numpy.testing.assert_array_equal(reopened.matrix, VECTORS[:15])
+
+
+# growing rewrites the file, rows keep their numbers so the epoch stays
+def test_growing_keeps_rows(tmp_path):
+    store = MmapVectorStore(str(tmp_path / 'store'), DIMENSION)
+    store.append(VECTORS[:1000], list(range(1000)))
+    store.append(VECTORS[1000:2500], list(range(1000, 2500)))
+    assert store.count == 2500 and store.capacity >= 2500 and store.epoch == 1
+    numpy.testing.assert_array_equal(store.matrix, VECTORS[:2500])
+
+
+def test_compaction_drops_removed_rows(tmp_path):
+    store = MmapVectorStore(str(tmp_path / 'store'), DIMENSION)
+    store.append(VECTORS[:2000], list(range(2000)))
+    for _row in range(0, 2000, 2):
+        store.remove(_row)
+    store.remove(0)
+    assert store.dead == 1000 and not store.compactable
+    for _row in range(1, 2 * (MMAP_COMPACT_MIN_DEAD - 1000) + 1, 2):
+        store.remove(_row)
+    assert store.compactable
+    epoch = store.epoch
+    kept = store.compact()
+    assert kept.tolist() == list(range(2 * (MMAP_COMPACT_MIN_DEAD - 1000) + 1, 2000, 2))
+    assert store.count == len(kept) and store.dead == 0 and store.epoch == epoch + 1
+    assert DOC_ID_REMOVED not in store.ids.tolist()
+    numpy.testing.assert_array_equal(store.matrix, VECTORS[kept])
+
+
+# a reader sees rows appended in place as they are counted in, and a rewritten file once refreshed,
+# told renumbered only when the rows moved
+def test_reader_follows_the_writer(tmp_path):
+    path = str(tmp_path / 'store')
+    assert MmapVectorStore(path, DIMENSION, writable=False).count == 0 and not os.path.exists(path)
+    writer = MmapVectorStore(path, DIMENSION)
+    writer.append(VECTORS[:10], list(range(10)))
+    reader = MmapVectorStore(path, DIMENSION, writable=False)
+    writer.append(VECTORS[10:20], list(range(10, 20)))
+    assert not reader.refresh() and reader.count == 20
+    for _row in range(MMAP_COMPACT_MIN_DEAD):
+        writer.append(VECTORS[_row:_row + 1], [_row + 20])
+    assert not reader.refresh() and reader.count == 20 + MMAP_COMPACT_MIN_DEAD
+    numpy.testing.assert_array_equal(reader.matrix[:20], VECTORS[:20])
+    writer.reset(VECTORS[:5], list(range(5)))
+    assert reader.refresh() and reader.count == 5
+
+
+def test_mismatched_stores_are_ignored(tmp_path):
+    path = str(tmp_path / 'store')
+    MmapVectorStore(path, DIMENSION).append(VECTORS[:10], list(range(10)))
+    assert MmapVectorStore(path, DIMENSION + 1, writable=False).count == 0
+    assert MmapVectorStore(path, DIMENSION).count == 10
+    assert MmapVectorStore(path, DIMENSION + 1).count == 0
+    assert MmapVectorStore(path, DIMENSION + 1, writable=False).capacity == MMAP_MIN_CAPACITY
+
+
+# a writer converts a store of another dtype, a reader maps it as it is
+@pytest.mark.parametrize('dtype', [numpy.float32, numpy.float16])
+def test_dtype_conversion(tmp_path, dtype):
+    path = str(tmp_path / 'store')
+    MmapVectorStore(path, DIMENSION).append(VECTORS[:10], list(range(10)))
+    assert MmapVectorStore(path, DIMENSION, writable=False, dtype=dtype).dtype == numpy.float64
+    converted = MmapVectorStore(path, DIMENSION, dtype=dtype)
+    assert converted.dtype == dtype and converted.epoch == 1
+    numpy.testing.assert_array_equal(converted.matrix, VECTORS[:10].astype(dtype))
+    converted.convert(numpy.float64)
+    assert MmapVectorStore(path, DIMENSION, writable=False).dtype == numpy.float64
+
+
+# removing most documents compacts the store under the engine, which keeps finding the rest
+def test_engine_compacts_its_store(tmp_path):
+    async def main():
+        engine = DipamkaraEngine(dimension=DIMENSION, archive_path=str(tmp_path))
+        await engine.recover()
+        await engine.create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))], indices=['i'])
+        await engine.indexed_remove('i < 2500')
+        await engine.save()
+        found = await engine.find_documents_by_vector(VECTORS[2600], Metric.EUCLIDEAN, 1000)
+        reopened = DipamkaraEngine(dimension=DIMENSION, archive_path=str(tmp_path))
+        await reopened.recover()
+        return found, await reopened.find_documents_by_vector(VECTORS[2600], Metric.EUCLIDEAN, 1000)
+
+    found, reopened = asyncio.run(main())
+    store = MmapVectorStore(str(tmp_path / '.mat'), DIMENSION, writable=False)
+    assert store.count == 500 and store.dead == 0 and store.epoch > 1
+    assert found[0][0] == {'i': 2600} and found == reopened
+    assert sorted(_document['i'] for _document, _ in found) == list(range(2500, 3000))
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import json
+import time
+
+import numpy
+import pytest
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.client.connection import Connection
+from bhakti.const import UTF_8, PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2
+from bhakti.database import DipamkaraEngine, Metric
+from bhakti.server import NioServer
+from bhakti.server.pipeline import PipelineStage
+
+DELAYS = [0.3, 0.0, 0.2, 0.1]
+
+
+# answers each message with itself after the delay it names
+class DelayedEcho(PipelineStage):
+    def __init__(self):
+        super().__init__('DelayedEcho')
+
+    async def do(self, data, fire, errors, io_context, eof, extra_context):
+        await asyncio.sleep(json.loads(data)['delay'])
+        io_context[1].write(bytes(data))
+        return data, extra_context, errors, False
+
+
+@contextlib.asynccontextmanager
+async def echoing(**kwargs):
+    server = NioServer(host='127.0.0.1', port=0, pipeline=[DelayedEcho()], **kwargs)
+    listening = await server.start()
+    try:
+        yield server.port
+    finally:
+        listening.close()
+        await listening.wait_closed()
+
+
+async def request(connection: Connection, delay: float, i: int, answered: list[int]) -> dict:
+    response = json.loads(await connection.request(json.dumps({'delay': delay, 'i': i}).encode(UTF_8)))
+    answered.append(i)
+    return response
+
+
+def test_responses_arrive_as_they_complete():
+    async def main():
+        async with echoing() as port:
+            connection = await Connection.open(server='127.0.0.1', port=port, protocol=PROTOCOL_FRAME_V2)
+            answered = list()
+            start = time.monotonic()
+            responses = await asyncio.gather(*[
+                request(connection, _delay, _i, answered) for _i, _delay in enumerate(DELAYS)
+            ])
+            elapsed = time.monotonic() - start
+            await connection.close()
+            return responses, answered, elapsed
+
+    responses, answered, elapsed = asyncio.run(main())
+    assert [_response['i'] for _response in responses] == list(range(len(DELAYS)))
+    assert answered == sorted(range(len(DELAYS)), key=lambda _i: DELAYS[_i])
+    assert elapsed < sum(DELAYS)
+
+
+def test_requests_without_ids_are_answered_in_order():
+    async def main():
+        async with echoing() as port:
+            connection = await Connection.open(server='127.0.0.1', port=port, protocol=PROTOCOL_FRAME_V1)
+            answered = list()
+            start = time.monotonic()
+            for _i, _delay in enumerate(DELAYS):
+                await request(connection, _delay, _i, answered)
+            elapsed = time.monotonic() - start
+            await connection.close()
+            return answered, elapsed
+
+    answered, elapsed = asyncio.run(main())
+    assert answered == list(range(len(DELAYS))) and elapsed >= sum(DELAYS)
+
+
+def test_requests_in_flight_are_bounded():
+    async def main():
+        async with echoing(max_in_flight=2) as port:
+            connection = await Connection.open(server='127.0.0.1', port=port, protocol=PROTOCOL_FRAME_V2)
+            start = time.monotonic()
+            await asyncio.gather(*[request(connection, 0.1, _i, list()) for _i in range(4)])
+            elapsed = time.monotonic() - start
+            await connection.close()
+            return elapsed
+
+    assert 0.2 <= asyncio.run(main()) < 0.4
+
+
+# concurrent queries of one client share a single multiplexed channel
+def test_client_multiplexes_queries(tmp_path, serving):
+    vectors = numpy.random.default_rng(0).standard_normal((50, 4))
+
+    async def main():
+        engine = DipamkaraEngine(dimension=4, archive_path=str(tmp_path))
+        await engine.recover()
+        await engine.create_many(vectors, [{'i': _i} for _i in range(len(vectors))])
+        async with serving(engine) as port:
+            async with BhaktiClient(port=port, protocol=PROTOCOL_FRAME_V2, pool_max_size=1) as client:
+                return await asyncio.gather(*[
+                    client.find_documents_by_vector(_vector, Metric.EUCLIDEAN, 1) for _vector in vectors
+                ])
+
+    assert [_found[0][0]['i'] for _found in asyncio.run(main())] == list(range(len(vectors)))
@@ -0,0 +1,97 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric
+from bhakti.database.projection import Projection
+
+DIMENSION = 4
+ENGINES = {DBEngine.DIPAMKARA: DipamkaraEngine, DBEngine.FLAT: FlatEngine}
+VECTORS = numpy.random.default_rng(0).standard_normal((40, DIMENSION))
+DOCUMENTS = [{'i': _i, 'age': _i % 4, 'name': f'n{_i}', 'text': 'x' * 100} for _i in range(40)]
+QUERIES = numpy.random.default_rng(1).standard_normal((3, DIMENSION))
+
+
+async def open_engine(db_engine: DBEngine, path: str) -> DipamkaraEngine | FlatEngine:
+    engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=path)
+    await engine.recover()
+    await engine.create_many(VECTORS, DOCUMENTS, indices=['age'])
+    return engine
+
+
+def test_projection_fields():
+    projection = Projection(['id', 'distance', 'document.name', 'document.age'])
+    assert projection.id and projection.distance and not projection.vector and not projection.document
+    assert projection.document_keys == ['name', 'age'] and projection.reads_document
+    assert not Projection(['id', 'vector']).reads_document
+    with pytest.raises(ValueError):
+        Projection(['id', 'score'])
+
+
+# results carry exactly the fields projected, in the order and with the distances of a plain query
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_engine_projects_fields(tmp_path, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        return (
+            await engine.query_projected(QUERIES, Metric.EUCLIDEAN, 5, Projection(['id', 'distance'])),
+            await engine.query_projected(QUERIES, Metric.EUCLIDEAN, 5, Projection(['document.name', 'document.none'])),
+            await engine.query_projected(QUERIES, Metric.EUCLIDEAN, 5, Projection(['vector', 'document'])),
+            await engine.find_documents_by_vector_batch(QUERIES, Metric.EUCLIDEAN, 5)
+        )
+
+    ids, keys, whole, expected = asyncio.run(main())
+    for _ids, _keys, _whole, _expected in zip(ids, keys, whole, expected):
+        assert [set(_result.keys()) for _result in _ids] == [{'id', 'distance'}] * 5
+        assert [_result['distance'] for _result in _ids] == pytest.approx([_distance for _, _distance in _expected])
+        assert len({_result['id'] for _result in _ids}) == 5
+        assert _keys == [{'document': {'name': _document['name']}} for _document, _ in _expected]
+        assert [_result['document'] for _result in _whole] == [_document for _document, _ in _expected]
+        numpy.testing.assert_allclose(
+            [_result['vector'] for _result in _whole], VECTORS[[_document['i'] for _document, _ in _expected]],
+            rtol=1e-6
+        )
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_engine_projects_filtered_queries(tmp_path, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        return await engine.query_projected(
+            QUERIES[:1], Metric.EUCLIDEAN, 100, Projection(['document.i', 'document.age']), query='age == 1'
+        )
+
+    (results,) = asyncio.run(main())
+    assert sorted(_result['document']['i'] for _result in results) == list(range(1, 40, 4))
+    assert {_result['document']['age'] for _result in results} == {1}
+
+
+@pytest.mark.parametrize('binary', [True, False])
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_client_projection(tmp_path, serving, db_engine, binary):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        async with serving(engine) as port:
+            async with BhaktiClient(port=port, db_engine=db_engine, binary=binary) as client:
+                return (
+                    await client.find_documents_by_vector(QUERIES[0], Metric.EUCLIDEAN, 5, projection=['id', 'distance']),
+                    await client.vector_query_batch(QUERIES, Metric.EUCLIDEAN, 5, projection=['vector', 'document.name']),
+                    await client.find_documents_by_vector_indexed(
+                        'age == 2', QUERIES[0], Metric.EUCLIDEAN, 3, projection=['document.i']
+                    ),
+                    await engine.find_documents_by_vector_batch(QUERIES, Metric.EUCLIDEAN, 5)
+                )
+
+    ids, vectors, indexed, expected = asyncio.run(main())
+    assert [set(_result.keys()) for _result in ids] == [{'id', 'distance'}] * 5
+    assert all(isinstance(_result['distance'], numpy.float64) for _result in ids)
+    assert [_result['distance'] for _result in ids] == pytest.approx([_distance for _, _distance in expected[0]])
+    for _vectors, _expected in zip(vectors, expected):
+        assert [_result['document'] for _result in _vectors] == [{'name': _document['name']} for _document, _ in _expected]
+        numpy.testing.assert_allclose(
+            [_result['vector'] for _result in _vectors], VECTORS[[_document['i'] for _document, _ in _expected]],
+            rtol=1e-6
+        )
+    assert len(indexed) == 3 and all(_result['document']['i'] % 4 == 2 for _result in indexed)
@@ -0,0 +1,103 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.database import FlatEngine, Metric
+from bhakti.database.ann_index import AnnIndexType, SearchOptions
+from bhakti.database.quantized_index import ScalarQuantizedIndex, ProductQuantizedIndex, QUANTIZED_MIN_TRAINING
+
+DIMENSION = 32
+VECTORS = numpy.random.default_rng(0).standard_normal((5000, DIMENSION))
+QUERIES = numpy.random.default_rng(1).standard_normal((100, DIMENSION))
+EXACT = numpy.argsort(((QUERIES[:, numpy.newaxis, :] - VECTORS[numpy.newaxis, :, :]) ** 2).sum(axis=2), axis=1)[:, :10]
+LABELS = numpy.arange(len(VECTORS))
+
+
+def recall(found: list[list[int]]) -> float:
+    return sum(len(set(_found) & set(_exact.tolist())) for _found, _exact in zip(found, EXACT)) / EXACT.size
+
+
+def trained(index: ScalarQuantizedIndex | ProductQuantizedIndex) -> ScalarQuantizedIndex | ProductQuantizedIndex:
+    index.add(LABELS, VECTORS)
+    index.refit(index.fit(VECTORS), LABELS, VECTORS)
+    return index
+
+
+def labels_of(results: list[list[tuple[int, float]]]) -> list[list[int]]:
+    return [[_label for _label, _ in _results] for _results in results]
+
+
+# codes take a byte per component, or per subvector, instead of four
+@pytest.mark.parametrize('index, kwargs, code_size, minimum', [
+    (ScalarQuantizedIndex, {}, DIMENSION, 0.9),
+    (ProductQuantizedIndex, {'m': 16}, 16, 0.7),
+])
+def test_recall_and_code_size(index, kwargs, code_size, minimum):
+    index = trained(index(dimension=DIMENSION, **kwargs))
+    assert index.dump()['codes'].shape == (len(VECTORS), code_size)
+    assert recall(labels_of(index.search(QUERIES, 10, SearchOptions()))) >= minimum
+    # the exact neighbours are among a few times more candidates
+    candidates = index.search(QUERIES, 40, SearchOptions())
+    assert recall(labels_of(candidates)) >= 0.95
+    for _results in candidates:
+        _distances = [_distance for _, _distance in _results]
+        assert _distances == sorted(_distances)
+
+
+@pytest.mark.parametrize('index', [ScalarQuantizedIndex, ProductQuantizedIndex])
+def test_trained_once_enough_vectors_are_added(index):
+    index = index(dimension=DIMENSION)
+    index.add(LABELS[:QUANTIZED_MIN_TRAINING - 1], VECTORS[:QUANTIZED_MIN_TRAINING - 1])
+    assert not index.trained and not index.drifted
+    index.add(LABELS[QUANTIZED_MIN_TRAINING - 1:], VECTORS[QUANTIZED_MIN_TRAINING - 1:])
+    assert index.drifted
+    index.refit(index.fit(VECTORS), LABELS, VECTORS)
+    assert index.trained and not index.drifted and len(index) == len(VECTORS)
+
+
+@pytest.mark.parametrize('index', [ScalarQuantizedIndex, ProductQuantizedIndex])
+def test_removed_and_allowed_labels(index):
+    index = trained(index(dimension=DIMENSION))
+    for _label in range(0, len(VECTORS), 2):
+        index.remove(_label)
+    assert len(index) == len(VECTORS) // 2 and 0 not in index and 1 in index
+    for _results in labels_of(index.search(QUERIES, 10, SearchOptions())):
+        assert all(_label % 2 == 1 for _label in _results)
+    allowed = set(range(1, len(VECTORS), 6))
+    for _results in labels_of(index.search(QUERIES, 10, SearchOptions(), allowed)):
+        assert len(_results) == 10 and set(_results) <= allowed
+
+
+@pytest.mark.parametrize('index', [ScalarQuantizedIndex, ProductQuantizedIndex])
+def test_dump_and_load(index):
+    index = trained(index(dimension=DIMENSION, metric=Metric.COSINE))
+    loaded = type(index).load(index.dump())
+    assert loaded.metric == Metric.COSINE
+    assert loaded.search(QUERIES, 10, SearchOptions()) == index.search(QUERIES, 10, SearchOptions())
+
+
+def test_unsupported_settings():
+    with pytest.raises(ValueError):
+        ScalarQuantizedIndex(dimension=DIMENSION, metric=Metric.CHEBYSHEV)
+    with pytest.raises(ValueError):
+        ProductQuantizedIndex(dimension=DIMENSION, m=7)
+
+
+async def engine_recall(path: str, vector_index: AnnIndexType, rerank: int) -> tuple[float, list]:
+    engine = FlatEngine(dimension=DIMENSION, archive_path=path, vector_index=vector_index, pq_m=16, rerank=rerank)
+    await engine.recover()
+    await engine.create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))])
+    await engine.train_index()
+    found = await engine.find_documents_by_vector_batch(QUERIES, Metric.EUCLIDEAN, 10)
+    exact = await engine.vector_query_batch(VECTORS[:20], Metric.EUCLIDEAN, 1)
+    return recall([[_document['i'] for _document, _ in _found] for _found in found]), exact
+
+
+# candidates re-scored against the full vectors come back with exact distances
+@pytest.mark.parametrize('vector_index', [AnnIndexType.SQ8, AnnIndexType.PQ])
+def test_engine_reranks(tmp_path, vector_index):
+    reranked, exact = asyncio.run(engine_recall(str(tmp_path / 'reranked'), vector_index, 4))
+    approximate, _ = asyncio.run(engine_recall(str(tmp_path / 'approximate'), vector_index, 0))
+    assert reranked >= 0.95 and reranked >= approximate
+    assert [_nearest[0][1] for _nearest in exact] == [0] * 20
@@ -0,0 +1,135 @@
+import asyncio
+
+import numpy
+import pytest
+from dipamkara.dipamkara_dsl import DipamkaraDsl
+
+from bhakti.database import DipamkaraEngine, FlatEngine, Metric, RangeIndex, IndexKind
+from bhakti.database.column_store import ColumnStore
+from bhakti.database.filter import Filter
+from bhakti.database.range_index import RANGE_COMPARISONS
+
+COMPARE = {
+    '>': lambda value, literal: value > literal,
+    '>=': lambda value, literal: value >= literal,
+    '<': lambda value, literal: value < literal,
+    '<=': lambda value, literal: value <= literal,
+    '==': lambda value, literal: value == literal
+}
+DOCUMENTS = [{'age': _i % 50, 'w': _i / 7, 'm': [1, 'a', 2.5, None][_i % 4]} for _i in range(200)]
+QUERIES = ['age <= 31', 'age == 31', 'age > 40 || w < 2', 'w >= 3.5 && age < 30', 'm >= 2', 'm == 1 || age == 0']
+
+
+def dsl(expr: str, inverted_index: dict) -> set[int]:
+    return {int(_id) for _id in DipamkaraDsl(expr=expr, inverted_index=inverted_index).process_serialized()}
+
+
+def inverted_index_of(documents: list[dict]) -> dict[str, dict[int, any]]:
+    return {
+        _index: {_id: _document[_index] for _id, _document in enumerate(documents) if _index in _document.keys()}
+        for _index in ('age', 'w', 'm')
+    }
+
+
+@pytest.mark.parametrize('op', RANGE_COMPARISONS)
+def test_select_matches_a_scan_through_writes(op):
+    rng = numpy.random.default_rng(1)
+    index = RangeIndex()
+    values = dict()
+    for _step in range(2000):
+        _label = int(rng.integers(300))
+        _action = rng.random()
+        if _action < 0.6:
+            values[_label] = int(rng.integers(-20, 20)) if rng.random() < 0.5 else float(rng.normal())
+            index.set(_label, values[_label])
+        elif _action < 0.8:
+            values.pop(_label, None)
+            index.clear(_label)
+        else:
+            _target = int(rng.integers(300))
+            if _label in values.keys():
+                values[_target] = values.pop(_label)
+            else:
+                values.pop(_target, None)
+            index.move(_label, _target)
+        if _step % 250 == 0:
+            for _literal in (-3.0, 0.0, 0.5, 7.0):
+                _expected = {_l for _l, _v in values.items() if COMPARE[op](_v, _literal)}
+                assert set(index.select(op, _literal).tolist()) == _expected
+    assert len(index) == len(values)
+
+
+def test_select_is_in_order_of_value():
+    index = RangeIndex()
+    for _label, _value in enumerate([5, -1, 3.5, 2, 9]):
+        index.set(_label, _value)
+    assert index.select('>=', -10).tolist() == [1, 3, 2, 0, 4]
+
+
+def test_values_it_cannot_order_make_it_inexact():
+    index = RangeIndex()
+    index.set(0, 1)
+    index.set(1, 'a')
+    index.set(2, 2 ** 60)
+    assert not index.exact
+    index.clear(1)
+    index.clear(2)
+    assert index.exact
+    index.set(3, float('nan'))
+    assert index.exact and index.select('>=', -1e300).tolist() == [0]
+
+
+@pytest.mark.parametrize('expr', QUERIES)
+def test_filter_with_ranges_matches_the_dsl(expr):
+    inverted_index = inverted_index_of(DOCUMENTS)
+    ranges = dict()
+    for _index, _values in inverted_index.items():
+        ranges[_index] = RangeIndex()
+        for _id, _value in _values.items():
+            ranges[_index].set(_id, _value)
+    assert Filter(expr).matches(inverted_index, ranges=ranges) == dsl(expr, inverted_index)
+
+
+@pytest.mark.parametrize('expr', QUERIES)
+def test_ranked_columns_match_the_dsl(expr):
+    documents = [dict(_document) for _document in DOCUMENTS]
+    columns = ColumnStore(len(documents))
+    for _index in ('age', 'w', 'm'):
+        columns.add(_index, documents)
+        columns.rank(_index, len(documents))
+    documents[3]['age'] = 100
+    columns.set(3, documents[3])
+    columns.move(len(documents) - 1, 7)
+    documents[7] = documents.pop()
+    inverted_index = inverted_index_of(documents)
+    rows = {_id: _id for _id in range(len(documents))}
+    mask = columns.mask(Filter(expr), None, len(documents), inverted_index, rows)
+    assert set(numpy.flatnonzero(mask).tolist()) == dsl(expr, inverted_index)
+
+
+@pytest.mark.parametrize('engine', [DipamkaraEngine, FlatEngine])
+def test_range_index_of_an_engine(tmp_path, engine):
+    vectors = numpy.random.default_rng(0).standard_normal((len(DOCUMENTS), 4))
+    documents = [dict(_document, i=_i) for _i, _document in enumerate(DOCUMENTS)]
+
+    async def main():
+        database = engine(dimension=4, archive_path=str(tmp_path))
+        await database.recover()
+        await database.create_many(vectors, documents, indices=['m'])
+        await database.create_index('age', IndexKind.RANGE)
+        # an inverted index is ranked later
+        await database.create_index('w', 'inverted')
+        await database.create_index('w', IndexKind.RANGE)
+        await database.mod_doc_by_vector(vectors[5], 'age', 44)
+        found = dict()
+        for _expr in QUERIES:
+            _documents = await database.find_documents_by_vector_indexed(
+                _expr, vectors[0], Metric.EUCLIDEAN, len(documents)
+            )
+            found[_expr] = sorted(_document['i'] for _document, _ in _documents)
+        return found
+
+    documents[5]['age'] = 44
+    inverted_index = inverted_index_of(documents)
+    for _expr, _found in asyncio.run(main()).items():
+        assert _found == sorted(dsl(_expr, inverted_index)), _expr
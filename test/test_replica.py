@@ -0,0 +1,150 @@
+import asyncio
+import multiprocessing
+import socket
+
+import numpy
+import pytest
+
+from bhakti.bootstrap.bhakti_server import BhaktiServer
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.database import DBEngine, DipamkaraEngine, Metric
+from bhakti.database.dipamkara_replica import DipamkaraReplica
+
+DIMENSION = 4
+VECTORS = numpy.random.default_rng(0).standard_normal((30, DIMENSION))
+
+
+async def open_writer(path: str, version) -> DipamkaraEngine:
+    engine = DipamkaraEngine(dimension=DIMENSION, archive_path=path, version=version)
+    await engine.recover()
+    await engine.create_many(VECTORS[:10], [{'i': _i} for _i in range(10)], indices=['i'])
+    await engine.save()
+    return engine
+
+
+async def found(engine: DipamkaraEngine) -> list[int]:
+    documents = await engine.find_documents_by_vector(VECTORS[0], Metric.EUCLIDEAN, len(VECTORS))
+    return sorted(_document['i'] for _document, _ in documents)
+
+
+# the replica reads its own copy, and reloads it once the writer's shared version moves
+def test_replica_catches_up_with_the_writer(tmp_path, serving):
+    version = multiprocessing.get_context('spawn').Value('Q', 0)
+
+    async def main():
+        writer = await open_writer(str(tmp_path), version)
+        async with serving(writer) as port:
+            replica = DipamkaraReplica(
+                dimension=DIMENSION, archive_path=str(tmp_path), version=version, writer_host='127.0.0.1',
+                writer_port=port
+            )
+            await replica.recover()
+            loaded = await found(replica)
+            await writer.create(VECTORS[10], {'i': 10}, indices=['i'])
+            created = await found(replica)
+            await writer.remove_by_vector(VECTORS[0])
+            await writer.mod_doc_by_vector(VECTORS[1], 'i', 100)
+            return loaded, created, await found(replica), await replica.find_documents_by_vector_indexed(
+                'i == 100', VECTORS[1], Metric.EUCLIDEAN, 1
+            )
+
+    loaded, created, changed, indexed = asyncio.run(main())
+    assert loaded == list(range(10)) and created == list(range(11))
+    assert changed == [2, 3, 4, 5, 6, 7, 8, 9, 10, 100] and indexed[0][0] == {'i': 100}
+    assert version.value % 2 == 0 and version.value > 0
+
+
+# writes made through the replica are applied by the writer, the replica reads them back at once
+def test_replica_forwards_writes(tmp_path, serving):
+    version = multiprocessing.get_context('spawn').Value('Q', 0)
+
+    async def main():
+        writer = await open_writer(str(tmp_path), version)
+        async with serving(writer) as port:
+            replica = DipamkaraReplica(
+                dimension=DIMENSION, archive_path=str(tmp_path), version=version, writer_host='127.0.0.1',
+                writer_port=port
+            )
+            await replica.recover()
+            status = await replica.create_many(VECTORS[10:20], [{'i': _i} for _i in range(10, 20)], indices=['i'])
+            removed = await replica.remove_by_vector(VECTORS[19])
+            return status, removed, await found(replica), await found(writer)
+
+    status, removed, by_replica, by_writer = asyncio.run(main())
+    assert status == [True] * 10 and removed
+    assert by_replica == by_writer == list(range(19))
+
+
+# an odd version marks a write in progress, the copy already loaded keeps being served
+def test_replica_waits_for_writes_in_progress(tmp_path):
+    version = multiprocessing.get_context('spawn').Value('Q', 0)
+
+    async def main():
+        writer = await open_writer(str(tmp_path), version)
+        replica = DipamkaraReplica(
+            dimension=DIMENSION, archive_path=str(tmp_path), version=version, writer_host='127.0.0.1', writer_port=1
+        )
+        await replica.recover()
+        await writer.create(VECTORS[10], {'i': 10})
+        with version.get_lock():
+            version.value += 1
+        in_progress = await found(replica)
+        with version.get_lock():
+            version.value += 1
+        return in_progress, await found(replica)
+
+    in_progress, done = asyncio.run(main())
+    assert in_progress == list(range(10)) and done == list(range(11))
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def run_server(path: str, port: int):
+    BhaktiServer(
+        dimension=DIMENSION, db_path=path, db_engine=DBEngine.DIPAMKARA, host='127.0.0.1', port=port, workers=2
+    ).run()
+
+
+async def wait_listening(port: int):
+    for _ in range(400):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise TimeoutError(f'Nothing is listening on {port}')
+
+
+# workers share the port, a write through any of them is read back through every other one
+@pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason='SO_REUSEPORT is not supported')
+def test_workers_share_the_port(tmp_path):
+    port = free_port()
+    process = multiprocessing.get_context('spawn').Process(target=run_server, args=(str(tmp_path), port))
+    process.start()
+
+    async def main():
+        await wait_listening(port)
+        clients = [BhaktiClient(port=port, db_engine=DBEngine.DIPAMKARA, pool_max_size=1) for _ in range(8)]
+        try:
+            status = await clients[0].create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))])
+            await clients[1].remove_by_vector(VECTORS[0])
+            return status, [
+                await _client.find_documents_by_vector(VECTORS[0], Metric.EUCLIDEAN, len(VECTORS)) for _client in clients
+            ]
+        finally:
+            for _client in clients:
+                await _client.close()
+
+    try:
+        status, results = asyncio.run(main())
+    finally:
+        process.terminate()
+        process.join()
+    assert status == [True] * len(VECTORS)
+    for _documents in results:
+        assert sorted(_document['i'] for _document, _ in _documents) == list(range(1, len(VECTORS)))
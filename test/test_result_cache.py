@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import numpy
+import pytest
+
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric
+from bhakti.database.ann_index import SearchOptions
+from bhakti.database.projection import Projection
+from bhakti.database.result_cache import ResultCache, MEGABYTE, size_of
+
+DIMENSION = 4
+ENGINES = {DBEngine.DIPAMKARA: DipamkaraEngine, DBEngine.FLAT: FlatEngine}
+VECTORS = numpy.random.default_rng(0).standard_normal((20, DIMENSION))
+
+
+def key(vector: numpy.ndarray = VECTORS[0], **kwargs) -> tuple:
+    return ResultCache.key('find_documents', vector[numpy.newaxis, :], Metric.EUCLIDEAN, 3, **kwargs)
+
+
+def test_disabled_without_a_budget():
+    assert not ResultCache(0).enabled and ResultCache(1).enabled
+
+
+def test_hits_are_copies():
+    cache = ResultCache(1)
+    assert cache.get(key(), 0) is None
+    result = [({'i': 0}, 0.0)]
+    cache.put(key(), 0, result)
+    result[0][0]['i'] = 1
+    hit = cache.get(key(), 0)
+    assert hit == [({'i': 0}, 0.0)]
+    hit[0][0]['i'] = 2
+    assert cache.get(key(), 0) == [({'i': 0}, 0.0)]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (2, 1, 1)
+
+
+# a newer version drops every result, one read at an older version is never kept
+def test_versions_invalidate():
+    cache = ResultCache(1)
+    cache.put(key(), 0, 'old')
+    assert cache.get(key(), 1) is None and cache.stats()['size'] == 0
+    cache.put(key(), 0, 'stale')
+    assert cache.get(key(), 1) is None
+    cache.put(key(), 1, 'new')
+    assert cache.get(key(), 1) == 'new'
+
+
+def test_results_expire():
+    cache = ResultCache(1, ttl=0.05)
+    cache.put(key(), 0, 'result')
+    assert cache.get(key(), 0) == 'result'
+    time.sleep(0.1)
+    assert cache.get(key(), 0) is None and cache.stats()['size'] == 0
+
+
+# the least recently used results go first once the bytes held pass the budget
+def test_bounded_by_bytes():
+    result = list(range(1000))
+    cache = ResultCache(2.5 * size_of(result) / MEGABYTE)
+    for _i in range(3):
+        cache.put(key(VECTORS[_i]), 0, result)
+        cache.get(key(VECTORS[0]), 0)
+    assert cache.get(key(VECTORS[0]), 0) == result and cache.get(key(VECTORS[1]), 0) is None
+    assert cache.get(key(VECTORS[2]), 0) == result
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] <= cache.stats()['capacity']
+    cache.put(key(VECTORS[3]), 0, list(range(100000)))
+    assert cache.get(key(VECTORS[3]), 0) is None
+
+
+def test_keys_tell_queries_apart():
+    keys = {
+        key(),
+        key(VECTORS[1]),
+        ResultCache.key('find_documents', VECTORS[:1], Metric.COSINE, 3),
+        ResultCache.key('find_documents', VECTORS[:1], Metric.EUCLIDEAN, 4),
+        ResultCache.key('vector_query', VECTORS[:1], Metric.EUCLIDEAN, 3),
+        key(query='age == $1', query_params=[1]),
+        key(query='age == $1', query_params=[2]),
+        key(projection=Projection(['id'])),
+        key(projection=Projection(['id', 'distance'])),
+        key(search=SearchOptions({'nprobe': 2})),
+    }
+    assert len(keys) == 10
+    # vectors of equal values make one key whatever their dtype
+    assert key(VECTORS[0].astype(numpy.float32)) == key(VECTORS[0].astype(numpy.float32).astype(numpy.float64))
+
+
+# repeated queries are answered from the cache until a write of any kind changes what they would find
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_engine_invalidates_on_writes(tmp_path, db_engine):
+    async def main():
+        engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=str(tmp_path), result_cache_mb=1)
+        await engine.recover()
+        await engine.create_many(VECTORS[:10], [{'i': _i, 'age': _i % 2} for _i in range(10)], indices=['age'])
+
+        async def query() -> list[int]:
+            found = await engine.find_documents_by_vector_indexed('age == 1', VECTORS[1], Metric.EUCLIDEAN, 20)
+            return sorted(_document['i'] for _document, _ in found)
+
+        answers = [await query(), await query()]
+        hits = (await engine.insight())['result_cache']['hits']
+        await engine.create(VECTORS[11], {'i': 11, 'age': 1}, indices=['age'])
+        answers.append(await query())
+        await engine.remove_by_vector(VECTORS[1])
+        answers.append(await query())
+        await engine.mod_doc_by_vector(VECTORS[3], 'age', 0)
+        answers.append(await query())
+        await engine.indexed_remove('age == 0')
+        answers.append(await query())
+        await engine.create_index('i', 'range')
+        answers.append(await query())
+        return answers, hits, (await engine.insight())['result_cache']
+
+    answers, hits, stats = asyncio.run(main())
+    assert answers == [
+        [1, 3, 5, 7, 9], [1, 3, 5, 7, 9], [1, 3, 5, 7, 9, 11], [3, 5, 7, 9, 11], [5, 7, 9, 11], [5, 7, 9, 11],
+        [5, 7, 9, 11]
+    ]
+    assert hits == 1 and stats['hits'] == 1 and stats['misses'] == 6
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import numpy
+import pytest
+
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric
+from bhakti.util.rwlock import RWLock
+
+ENGINES = {DBEngine.DIPAMKARA: DipamkaraEngine, DBEngine.FLAT: FlatEngine}
+
+
+async def hold(lock: RWLock, mode: str, events: list, name: str, seconds: float = 0.05):
+    async with getattr(lock, mode)():
+        events.append((name, 'in', lock.readers, lock.writing))
+        await asyncio.sleep(seconds)
+        events.append((name, 'out'))
+
+
+def test_readers_share_the_lock():
+    async def main():
+        lock, events = RWLock(), list()
+        await asyncio.gather(*[hold(lock, 'read', events, f'r{_i}') for _i in range(3)])
+        return events
+
+    events = asyncio.run(main())
+    assert [_event[1] for _event in events] == ['in'] * 3 + ['out'] * 3
+    assert [_event[2] for _event in events[:3]] == [1, 2, 3]
+
+
+def test_writers_are_exclusive():
+    async def main():
+        lock, events = RWLock(), list()
+        await asyncio.gather(
+            hold(lock, 'write', events, 'w0'), hold(lock, 'read', events, 'r0'), hold(lock, 'write', events, 'w1')
+        )
+        return events
+
+    events = asyncio.run(main())
+    assert [_event[1] for _event in events] == ['in', 'out'] * 3
+    assert all(_event[2] == 0 and _event[3] for _event in events if _event[0][0] == 'w' and _event[1] == 'in')
+
+
+# readers arriving after a waiting writer go after it
+def test_waiting_writer_holds_new_readers_back():
+    async def main():
+        lock, events = RWLock(), list()
+        first = asyncio.create_task(hold(lock, 'read', events, 'r0'))
+        await asyncio.sleep(0.01)
+        writer = asyncio.create_task(hold(lock, 'write', events, 'w0'))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(first, writer, hold(lock, 'read', events, 'r1'))
+        return [_event[0] for _event in events if _event[1] == 'in']
+
+    assert asyncio.run(main()) == ['r0', 'w0', 'r1']
+
+
+def test_cancelled_writer_lets_readers_in():
+    async def main():
+        lock, events = RWLock(), list()
+        first = asyncio.create_task(hold(lock, 'read', events, 'r0', 0.1))
+        await asyncio.sleep(0.01)
+        writer = asyncio.create_task(hold(lock, 'write', events, 'w0'))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(hold(lock, 'read', events, 'r1'))
+        await asyncio.sleep(0.01)
+        writer.cancel()
+        await asyncio.gather(first, second)
+        return [_event[0] for _event in events if _event[1] == 'in'], events
+
+    entered, events = asyncio.run(main())
+    assert entered == ['r0', 'r1'] and events.index(('r1', 'out')) < events.index(('r0', 'out'))
+
+
+# a long scan runs on the engine threads, the event loop keeps ticking meanwhile
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_scans_leave_the_event_loop_free(tmp_path, db_engine):
+    rng = numpy.random.default_rng(0)
+    vectors, queries = rng.standard_normal((5000, 32)), rng.standard_normal((4000, 32))
+
+    async def tick(done: asyncio.Event) -> float:
+        longest, last = 0.0, time.monotonic()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            longest, last = max(longest, time.monotonic() - last), time.monotonic()
+        return longest
+
+    async def main():
+        engine = ENGINES[db_engine](dimension=32, archive_path=str(tmp_path))
+        await engine.recover()
+        await engine.create_many(vectors, [{'i': _i} for _i in range(len(vectors))])
+        done = asyncio.Event()
+        ticking = asyncio.create_task(tick(done))
+        start = time.monotonic()
+        for _ in range(3):
+            await engine.vector_query_batch(queries, Metric.EUCLIDEAN, 10)
+        elapsed = time.monotonic() - start
+        done.set()
+        return elapsed, await ticking
+
+    elapsed, longest = asyncio.run(main())
+    assert longest < elapsed / 3
+
+
+# writes and reads issued together all complete, the writes are serialized and every one lands
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_reads_and_writes_interleave(tmp_path, db_engine):
+    vectors = numpy.random.default_rng(0).standard_normal((60, 4))
+
+    async def main():
+        engine = ENGINES[db_engine](dimension=4, archive_path=str(tmp_path), thread_pool_size=4)
+        await engine.recover()
+
+        async def write(i: int):
+            return await engine.create(vectors[i], {'i': i})
+
+        async def read():
+            return await engine.find_documents_by_vector(vectors[0], Metric.EUCLIDEAN, len(vectors))
+
+        results = await asyncio.gather(*[write(_i) if _i % 2 == 0 else read() for _i in range(len(vectors))])
+        return results, await read()
+
+    results, final = asyncio.run(main())
+    assert all(results[_i] is True for _i in range(0, len(vectors), 2))
+    for _read in results[1::2]:
+        assert all(_document['i'] % 2 == 0 for _document, _ in _read)
+    assert sorted(_document['i'] for _document, _ in final) == list(range(0, len(vectors), 2))
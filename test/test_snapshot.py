@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+
+import numpy
+
+from bhakti.database import DipamkaraEngine, Metric, VectorDtype
+from bhakti.database.snapshot import Snapshot, SNAPSHOT_DIR, SNAPSHOT_MANIFEST, SNAPSHOT_FORMAT
+
+DIMENSION = 4
+
+
+def manifest_of(path: str) -> dict:
+    with open(os.path.join(path, SNAPSHOT_DIR, SNAPSHOT_MANIFEST), 'r') as file:
+        return json.loads(file.read())
+
+
+def test_snapshot_rewrites_only_touched_segments(tmp_path):
+    path = str(tmp_path)
+    vectors = numpy.arange(40, dtype=numpy.float64).reshape(10, DIMENSION)
+
+    async def main():
+        engine = DipamkaraEngine(dimension=DIMENSION, archive_path=path, wal=True, dtype=VectorDtype.FLOAT16)
+        await engine.recover()
+        await engine.create_many(vectors, [{'i': _i} for _i in range(10)], indices=['i'])
+        await engine.save()
+        before = manifest_of(path)
+        await engine.mod_doc_by_vector(vectors[3], 'i', 30)
+        await engine.save()
+        return before, manifest_of(path)
+
+    before, after = asyncio.run(main())
+    assert after['format'] == SNAPSHOT_FORMAT
+    assert after['dtype'] == VectorDtype.FLOAT16.value
+    changed = [_segment for _segment, _generation in after['files'].items() if before['files'][_segment] != _generation]
+    assert len(changed) == 1
+    # superseded segment files are dropped
+    names = set(os.listdir(os.path.join(path, SNAPSHOT_DIR)))
+    assert names == {SNAPSHOT_MANIFEST} | {f'{_segment}.{_generation}' for _segment, _generation in after['files'].items()}
+
+
+def test_snapshot_restores_documents_and_indices(tmp_path):
+    path = str(tmp_path)
+    vectors = numpy.arange(40, dtype=numpy.float64).reshape(10, DIMENSION)
+
+    async def write():
+        engine = DipamkaraEngine(dimension=DIMENSION, archive_path=path, wal=True)
+        await engine.recover()
+        await engine.create_many(vectors, [{'i': _i, 'g': _i % 3} for _i in range(10)], indices=['g'])
+        await engine.create_index('i', 'range')
+        await engine.remove_by_vector(vectors[4])
+        await engine.save()
+
+    async def read():
+        engine = DipamkaraEngine(dimension=DIMENSION, archive_path=path, wal=True)
+        await engine.recover()
+        return await engine.find_documents_by_vector_indexed('i > 2 && g == 1', vectors[0], Metric.EUCLIDEAN, 10)
+
+    asyncio.run(write())
+    snapshot = Snapshot(path)
+    assert snapshot.keyed_by_id
+    members, inverted_index, ranges = snapshot.load()
+    assert len(members) == 9
+    assert set(inverted_index.keys()) == {'g', 'i'}
+    assert ranges == ['i']
+    assert sorted(_document['i'] for _document, _ in asyncio.run(read())) == [7]
+
+
+def test_load_changed_reads_only_moved_segments(tmp_path):
+    snapshot = Snapshot(str(tmp_path))
+    snapshot.commit(1, {0: ({0: 'a'}, {}), 1: ({1: 'b'}, {})}, [], [], 'float32', durable=False)
+    files, _, _, _ = snapshot.load_changed({})
+    snapshot.commit(2, {1: ({1: 'c'}, {'x': {1: 7}})}, ['x'], [], 'float32', durable=False)
+    files_after, segments, indices, _ = snapshot.load_changed(files)
+    assert files_after == {'0': 1, '1': 2}
+    assert segments == {1: ({1: 'c'}, {'x': {1: 7}})}
+    assert indices == ['x']
+    assert Snapshot(str(tmp_path)).dtype == 'float32'
+
+
+def test_older_snapshot_never_overwrites_newer_segments(tmp_path):
+    snapshot = Snapshot(str(tmp_path))
+    snapshot.commit(2, {0: ({0: 'new'}, {})}, ['x'], [], 'float64', durable=False)
+    snapshot.commit(1, {0: ({0: 'old'}, {}), 1: ({1: 'b'}, {})}, [], [], 'float64', durable=False)
+    members, _, _ = snapshot.load()
+    assert members == {0: 'new', 1: 'b'}
+    assert manifest_of(str(tmp_path))['indices'] == ['x']
@@ -0,0 +1,90 @@
+import asyncio
+
+import numpy
+import pytest
+
+from bhakti.client.bhakti_client import BhaktiClient
+from bhakti.const import PROTOCOL_EOF, PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2
+from bhakti.database import DBEngine, DipamkaraEngine, FlatEngine, Metric
+
+DIMENSION = 4
+ENGINES = {DBEngine.DIPAMKARA: DipamkaraEngine, DBEngine.FLAT: FlatEngine}
+VECTORS = numpy.random.default_rng(0).standard_normal((40, DIMENSION))
+
+
+async def open_engine(db_engine: DBEngine, path: str) -> DipamkaraEngine | FlatEngine:
+    engine = ENGINES[db_engine](dimension=DIMENSION, archive_path=path)
+    await engine.recover()
+    await engine.create_many(VECTORS, [{'i': _i} for _i in range(len(VECTORS))])
+    return engine
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_chunks_add_up_to_the_result(tmp_path, db_engine, chunk_size):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        chunks = [
+            _chunk async for _chunk in
+            engine.iter_documents_by_vector(VECTORS[3], Metric.EUCLIDEAN, 30, chunk_size=chunk_size)
+        ]
+        return chunks, await engine.find_documents_by_vector(VECTORS[3], Metric.EUCLIDEAN, 30)
+
+    chunks, documents = asyncio.run(main())
+    assert [len(_chunk) for _chunk in chunks[:-1]] == [chunk_size] * (len(chunks) - 1)
+    assert [_found for _chunk in chunks for _found in _chunk] == documents
+
+
+# documents are read chunk by chunk, one removed meanwhile is no longer returned
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_documents_removed_while_streaming_are_skipped(tmp_path, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        nearest = [_document['i'] for _document, _ in
+                   await engine.find_documents_by_vector(VECTORS[3], Metric.EUCLIDEAN, 10)]
+        found = list()
+        async for _chunk in engine.iter_documents_by_vector(VECTORS[3], Metric.EUCLIDEAN, 10, chunk_size=2):
+            if not found:
+                await engine.remove_by_vector(VECTORS[nearest[5]])
+                # a row moved into the removed one
+                await engine.remove_by_vector(VECTORS[nearest[9]])
+            found.extend(_document['i'] for _document, _ in _chunk)
+        return nearest, found
+
+    nearest, found = asyncio.run(main())
+    assert found == nearest[:5] + nearest[6:9]
+
+
+@pytest.mark.parametrize('protocol', [PROTOCOL_EOF, PROTOCOL_FRAME_V1, PROTOCOL_FRAME_V2])
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_client_streams_over_every_protocol(tmp_path, serving, db_engine, protocol):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        async with serving(engine) as port:
+            async with BhaktiClient(port=port, db_engine=db_engine, protocol=protocol) as client:
+                streamed = [
+                    _found async for _found in
+                    client.iter_documents_by_vector(VECTORS[3], Metric.EUCLIDEAN, 25, chunk_size=4)
+                ]
+                # the connection serves requests after a stream
+                return streamed, await client.find_documents_by_vector(VECTORS[3], Metric.EUCLIDEAN, 25)
+
+    streamed, documents = asyncio.run(main())
+    assert len(streamed) == 25
+    assert [(_document, float(_distance)) for _document, _distance in streamed] == [
+        (_document, float(_distance)) for _document, _distance in documents
+    ]
+
+
+@pytest.mark.parametrize('db_engine', ENGINES.keys())
+def test_stream_left_early_on_a_multiplexed_channel(tmp_path, serving, db_engine):
+    async def main():
+        engine = await open_engine(db_engine, str(tmp_path))
+        async with serving(engine) as port:
+            async with BhaktiClient(port=port, db_engine=db_engine, protocol=PROTOCOL_FRAME_V2) as client:
+                async for _ in client.iter_documents_by_vector(VECTORS[0], Metric.EUCLIDEAN, 40, chunk_size=1):
+                    break
+                return await client.vector_query(VECTORS[5], Metric.EUCLIDEAN, 1)
+
+    (nearest,) = asyncio.run(main())
+    numpy.testing.assert_allclose(nearest[0], VECTORS[5], rtol=1e-6)
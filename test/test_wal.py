@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import numpy
+import pytest
+
+from bhakti.database import DipamkaraEngine, FlatEngine, Metric
+from bhakti.database.wal import WriteAheadLog, WAL_FILE, WAL_OP
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIMENSION = 4
+
+# writes through the engine, then dies without saving or closing anything
+CRASH = '''
+import asyncio, os, sys
+import numpy
+from bhakti.database import DipamkaraEngine, FlatEngine
+
+async def main(engine, path):
+    engine = {'dipamkara': DipamkaraEngine, 'flat': FlatEngine}[engine](dimension=4, archive_path=path, wal=True)
+    await engine.recover()
+    vectors = numpy.arange(40, dtype=numpy.float64).reshape(10, 4)
+    await engine.create_many(vectors[:8], [{'i': _i, 'g': _i % 2} for _i in range(8)], indices=['g'])
+    await engine.create(vectors[8], {'i': 8, 'g': 0}, indices=['g'])
+    await engine.remove_by_vector(vectors[1])
+    await engine.mod_doc_by_vector(vectors[2], 'g', 1)
+    await engine.create_index('i', 'range')
+    os._exit(0)
+
+asyncio.run(main(sys.argv[1], sys.argv[2]))
+'''
+
+
+def test_records_round_trip(tmp_path):
+    async def main():
+        wal = WriteAheadLog(str(tmp_path / WAL_FILE), commit_interval=0.01)
+        await asyncio.gather(*(wal.append({WAL_OP: 'create', 'i': _i}) for _i in range(5)))
+        return wal.records()
+
+    assert [_record['i'] for _record in asyncio.run(main())] == list(range(5))
+
+
+def test_group_commit_shares_one_fsync(tmp_path, monkeypatch):
+    fsyncs = list()
+    monkeypatch.setattr(os, 'fsync', lambda fd: fsyncs.append(fd))
+
+    async def main():
+        wal = WriteAheadLog(str(tmp_path / WAL_FILE), commit_interval=0.05, commit_size=1 << 20)
+        await asyncio.gather(*(wal.append({WAL_OP: 'create', 'i': _i}) for _i in range(20)))
+
+    asyncio.run(main())
+    assert len(fsyncs) == 1
+
+
+def test_commit_size_flushes_before_the_window(tmp_path):
+    async def main():
+        wal = WriteAheadLog(str(tmp_path / WAL_FILE), commit_interval=60, commit_size=1)
+        await asyncio.wait_for(wal.append({WAL_OP: 'create'}), 5)
+        return wal.records()
+
+    assert asyncio.run(main()) == [{WAL_OP: 'create'}]
+
+
+def test_torn_record_ends_the_log(tmp_path):
+    path = str(tmp_path / WAL_FILE)
+
+    async def main():
+        wal = WriteAheadLog(path, commit_interval=0.01)
+        await wal.append({WAL_OP: 'create', 'i': 0})
+
+    asyncio.run(main())
+    with open(f'{path}.0', 'ab') as file:
+        file.write(b'{"op": "crea')
+    assert WriteAheadLog(path).records() == [{WAL_OP: 'create', 'i': 0}]
+
+
+def test_rotate_and_discard(tmp_path):
+    async def main():
+        wal = WriteAheadLog(str(tmp_path / WAL_FILE), commit_interval=0.01)
+        await wal.append({WAL_OP: 'create', 'i': 0})
+        seq = await wal.rotate()
+        await wal.append({WAL_OP: 'create', 'i': 1})
+        wal.discard(seq)
+        return wal.records()
+
+    assert asyncio.run(main()) == [{WAL_OP: 'create', 'i': 1}]
+
+
+@pytest.mark.parametrize('engine', ['dipamkara', 'flat'])
+def test_replay_after_exit(tmp_path, engine):
+    path = str(tmp_path)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    subprocess.run([sys.executable, '-c', CRASH, engine, path], env=env, check=True, timeout=120)
+    assert WriteAheadLog(os.path.join(path, WAL_FILE)).records()
+
+    async def main():
+        recovered = {'dipamkara': DipamkaraEngine, 'flat': FlatEngine}[engine](
+            dimension=DIMENSION, archive_path=path, wal=True
+        )
+        await recovered.recover()
+        vectors = numpy.arange(40, dtype=numpy.float64).reshape(10, DIMENSION)
+        found = await recovered.find_documents_by_vector_indexed('i >= 0', vectors[0], Metric.EUCLIDEAN, 10)
+        odd = await recovered.find_documents_by_vector_indexed('g == 1', vectors[0], Metric.EUCLIDEAN, 10)
+        # the vector is known once again, a second create is refused
+        created = await recovered.create_many(vectors[8:], [{'i': 8, 'g': 0}, {'i': 9, 'g': 1}])
+        return found, odd, created
+
+    found, odd, created = asyncio.run(main())
+    assert sorted(_document['i'] for _document, _ in found) == [0, 2, 3, 4, 5, 6, 7, 8]
+    assert sorted(_document['i'] for _document, _ in odd) == [2, 3, 5, 7]
+    assert created == [False, True]
+
+
+@pytest.mark.parametrize('engine', ['dipamkara', 'flat'])
+def test_save_drops_the_log(tmp_path, engine):
+    path = str(tmp_path)
+
+    async def main():
+        saved = {'dipamkara': DipamkaraEngine, 'flat': FlatEngine}[engine](
+            dimension=DIMENSION, archive_path=path, wal=True
+        )
+        await saved.recover()
+        await saved.create(numpy.ones(DIMENSION), {'i': 0})
+        await saved.save()
+
+    asyncio.run(main())
+    assert WriteAheadLog(os.path.join(path, WAL_FILE)).records() == list()
+
+
+def test_log_holds_json_lines(tmp_path):
+    path = str(tmp_path)
+
+    async def main():
+        engine = DipamkaraEngine(dimension=DIMENSION, archive_path=path, wal=True)
+        await engine.recover()
+        await engine.create(numpy.ones(DIMENSION), {'i': 0})
+
+    asyncio.run(main())
+    lines = list()
+    for _entry in sorted(os.listdir(path)):
+        if _entry.startswith(f'{WAL_FILE}.'):
+            with open(os.path.join(path, _entry), 'rb') as file:
+                lines += [json.loads(_line) for _line in file]
+    assert [_line[WAL_OP] for _line in lines] == ['create']